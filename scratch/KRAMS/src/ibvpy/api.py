@@ -2,12 +2,17 @@
 from core.ibvp_solve import IBVPSolve
 from core.ibv_model import IBVModel
 from core.tloop import TLine, TLoop
+from core.iter_control import IterControl, IterControlLineSearch, IterControlArcLength
+from core.parallel_executor import ParallelExecutor
+from core.tloop_checkpoint import TLoopCheckpoint
 from core.i_tstepper_eval import ITStepperEval
 from core.tstepper_eval import TStepperEval
 from core.tstepper import TStepper
 from core.rtrace_eval import RTraceEval
 from core.rtrace import RTrace
 from core.rtrace_mngr import RTraceMngr
+from core.rtrace_store import RTraceStore, RTraceStoreNPZ, RTraceStoreHDF5
+from core.rtrace_worker import RTraceWorker
 from core.scontext import SContext
 from core.i_bcond import IBCond
 from core.i_sdomain import ISDomain
@@ -27,3 +32,4 @@ from mesh.fe_refinement_grid import FERefinementGrid, FERefinementGrid as FEPatc
 from mesh.fe_grid import FEGrid
 from mesh.fe_grid_idx_slice import FEGridIdxSlice
 from mesh.fe_grid_ls_slice import FEGridLevelSetSlice
+from mesh.spatial_index import SpatialIndex
@@ -0,0 +1,85 @@
+from numpy import zeros, hstack, outer, dot, sqrt, linalg, allclose
+import unittest
+
+from ibvpy.mesh.fe_domain import FEDomain
+from ibvpy.mesh.fe_refinement_grid import FERefinementGrid
+from ibvpy.mesh.fe_grid import FEGrid
+from ibvpy.fets.fets1D.fets1D2l import FETS1D2L
+from ibvpy.fets.fets2D.fets2D4q import FETS2D4Q
+from ibvpy.mats.mats1D.mats1D_elastic.mats1D_elastic import MATS1DElastic
+from ibvpy.mats.mats2D.mats2D_elastic.mats2D_elastic import MATS2DElastic
+
+from rt_nonlocal_averaging import RTUAvg, QuarticAF, LinearAF
+
+def get_C_ref( rt, n_dofs ):
+    '''Assemble the averaging matrix node by node
+    summing over all integration points of the grid.
+    '''
+    fets_eval = rt.fets_eval
+    dim = fets_eval.n_nodal_dofs
+    fe_subgrid = rt.sd.fe_subgrids[0]
+    X_pnt = fe_subgrid.dof_grid.cell_grid.point_X_arr
+    n_x = X_pnt.shape[1]
+    ip_coords = fets_eval.ip_coords
+    ip_weights = fets_eval.ip_weights.flatten()
+    N_mtx = [ fets_eval.get_N_mtx( r_pnt ) for r_pnt in ip_coords ]
+    J_det = fe_subgrid.dots.J_det_grid
+    ip_X = [ fets_eval.get_vtk_r_glb_arr( X_mtx, ip_coords )[:, :n_x]
+             for X_mtx in fe_subgrid.elem_X_map ]
+
+    C = zeros( ( n_dofs, n_dofs ) )
+    for i, x_pnt in enumerate( X_pnt ):
+        terms = []
+        for e, dofs in enumerate( fe_subgrid.elem_dof_map ):
+            for ip in range( len( ip_coords ) ):
+                arm = ip_X[e][ip] - x_pnt
+                value = rt.avg_fn.get_value( sqrt( dot( arm, arm ) ) ) * \
+                    ip_weights[ip] * J_det[e, ip]
+                if value != 0.:
+                    terms.append( ( value, arm, dofs, N_mtx[ip] ) )
+        if rt.avg_fn.correction:
+            A = zeros( ( n_x + 1, n_x + 1 ) )
+            for value, arm, dofs, N in terms:
+                a = hstack( [ 1., arm ] )
+                A += value * outer( a, a )
+            b = zeros( ( n_x + 1, ) )
+            b[0] = 1.
+            params = linalg.solve( A, b )
+            factors = [ value * ( params[0] + dot( params[1:], arm ) )
+                        for value, arm, dofs, N in terms ]
+        else:
+            r_00 = sum( [ value for value, arm, dofs, N in terms ] )
+            factors = [ value / r_00 for value, arm, dofs, N in terms ]
+        for f, ( value, arm, dofs, N ) in zip( factors, terms ):
+            for k in range( dim ):
+                C[ i * dim + k, dofs ] += f * N[k]
+    return C
+
+class TestRTUAvg( unittest.TestCase ):
+    '''
+    Assembly of the averaging matrix compared with the node-wise reference.
+    '''
+    def get_rt( self, fets_eval, avg_fn, **kw ):
+        fe_domain = FEDomain()
+        fe_level = FERefinementGrid( domain = fe_domain, fets_eval = fets_eval )
+        FEGrid( fets_eval = fets_eval, level = fe_level, **kw )
+        return RTUAvg( sd = fe_level, avg_fn = avg_fn ), fe_domain.n_dofs
+
+    def assert_C_mtx( self, fets_eval, radius, **kw ):
+        for af_class in [ QuarticAF, LinearAF ]:
+            for correction in [ False, True ]:
+                avg_fn = af_class( radius = radius, correction = correction )
+                rt, n_dofs = self.get_rt( fets_eval, avg_fn, **kw )
+                C_mtx = rt.get_C_mtx( n_dofs ).toarray()
+                self.assertTrue( allclose( C_mtx, get_C_ref( rt, n_dofs ) ) )
+
+    def test_C_mtx_1D( self ):
+        self.assert_C_mtx( FETS1D2L( mats_eval = MATS1DElastic() ), 0.35,
+                           coord_max = ( 1., 0., 0. ), shape = ( 6, ) )
+
+    def test_C_mtx_2D( self ):
+        self.assert_C_mtx( FETS2D4Q( mats_eval = MATS2DElastic() ), 0.45,
+                           coord_max = ( 1., 1., 0. ), shape = ( 3, 3 ) )
+
+if __name__ == "__main__":
+    unittest.main()
@@ -7,12 +7,13 @@ from enthought.traits.api import \
      Dict
 
 from numpy import frompyfunc, array, hstack, zeros, sum as np_sum, linalg, \
-    arange, tile, zeros_like, float_, frompyfunc, linspace
+    arange, float_, frompyfunc, linspace, where, repeat, \
+    sqrt, bincount, einsum, fabs as nfabs
 
 from math import fabs
 
-from scipy.spatial.distance import cdist
-from scipy.sparse import csr_matrix, coo_matrix
+from scipy.spatial import cKDTree
+from scipy.sparse import csr_matrix, kron, identity
 
 from time import time
 
@@ -26,6 +27,11 @@ class AveragingFunction( HasTraits ):
     def get_value( self, dist ):
         raise NotImplementedError
 
+    def get_value_arr( self, dist_arr ):
+        '''Evaluate the function for an array of distances.
+        '''
+        return array( frompyfunc( self.get_value, 1, 1 )( dist_arr ), dtype = float )
+
     def plot( self, axes, center = 0 ):
         vfn = frompyfunc( self.get_value, 1, 1 )
         xdata = linspace( -self.radius, self.radius, 40 ) * 1.2
@@ -40,6 +46,10 @@ class QuarticAF( AveragingFunction ):
         else:
             return ( ( 1 - ( dist / self.radius ) ** 2 ) ** 2 ) ** 2
 
+    def get_value_arr( self, dist_arr ):
+        return where( nfabs( dist_arr ) < self.radius,
+                      ( ( 1 - ( dist_arr / self.radius ) ** 2 ) ** 2 ) ** 2, 0. )
+
 class LinearAF( AveragingFunction ):
 
     def get_value( self, dist ):
@@ -48,6 +58,10 @@ class LinearAF( AveragingFunction ):
         else:
             return ( 1. / self.radius ) * ( 1 - dist / self.radius )
 
+    def get_value_arr( self, dist_arr ):
+        return where( nfabs( dist_arr ) < self.radius,
+                      ( 1. / self.radius ) * ( 1 - dist_arr / self.radius ), 0. )
+
 
 class RTUAvg( RTraceDomain ):
 
@@ -56,9 +70,24 @@ class RTUAvg( RTraceDomain ):
     n_dofs = Int( 0 )
 
     def get_C_data( self ):
-
-        a_fn = frompyfunc( self.avg_fn.get_value, 1, 1 )
-
+        '''Return the lists with data, column and row indices
+        of the averaging matrix.
+        '''
+        C_mtx = self.get_C_mtx().tocoo()
+        return [ C_mtx.data ], [ C_mtx.col ], [ C_mtx.row ]
+
+    def get_C_mtx( self, n_dofs = None ):
+        '''Assemble the averaging matrix in CSR format.
+
+        The rows i * dim + k correspond to the nodes of the grid,
+        the columns to the dofs of the elements. The integration points 
+        of all elements are mapped to global coordinates at once, 
+        the integration points within the radius of the nodes are found 
+        using a KD-tree. The weights of the integration points 
+        are collected in the sparse matrix W ( n_nodes, n_ips ) that is 
+        multiplied with the sparse interpolation matrix of the integration 
+        points N ( n_ips * dim, n_dofs ).
+        '''
         dim = self.fets_eval.n_nodal_dofs #TODO:find better way
 
         #@todo: hack, works just with one fe_grid, 
@@ -67,131 +96,103 @@ class RTUAvg( RTraceDomain ):
         fe_subgrid = self.sd.fe_subgrids[0]
 
         X_pnt = fe_subgrid.dof_grid.cell_grid.point_X_arr
+        n_nodes, n_x = X_pnt.shape
 
         ip_coords = self.fets_eval.ip_coords
         n_ip = len( ip_coords )
         ip_weights = self.fets_eval.ip_weights
-        data, row, col = [], [], []
 
-        #if the same integration scheme is used the N matrices can be evaluated 
-        #just once - shape(n_ip,dims, dofs)
+        # global coordinates of the integration points of the active elements
+        # ( elems, n_ip, n_x )
+        #
+        X_el = fe_subgrid.elem_X_map
+        if self.fets_eval.dim_slice:
+            X_el = X_el[:, :, self.fets_eval.dim_slice]
+        N_geo = array( [ self.fets_eval.get_N_geo_mtx( r_pnt )[0] for r_pnt in ip_coords ] )
+        ip_X = einsum( 'ig,egd->eid', N_geo, X_el ).reshape( -1, n_x )
+        n_elems = X_el.shape[0]
+        n_ips = n_elems * n_ip
+
+        # integration weight of the integration points ( elems * n_ip )
+        #
+        J_det = fe_subgrid.dots.J_det_grid   # ( elems, n_ip )
+        w_ip = ( ip_weights.flatten()[None, :] * J_det ).flatten()
+
+        # pairs of nodes and integration points within the radius
+        #
+        ip_tree = cKDTree( ip_X )
+        ip_lists = ip_tree.query_ball_point( X_pnt, self.avg_fn.radius )
+        n_pairs = array( [ len( ips ) for ips in ip_lists ], dtype = int )
+        node_idx = repeat( arange( n_nodes ), n_pairs )
+        ip_idx = array( hstack( [ ips for ips in ip_lists ] + [ [] ] ), dtype = int )
+
+        # Get the distance between the nodes and the interacting ips
+        #
+        arm = ip_X[ ip_idx ] - X_pnt[ node_idx ]
+        dist = sqrt( ( arm ** 2 ).sum( axis = 1 ) )
+
+        # Value of the weighting function
+        #
+        values = self.avg_fn.get_value_arr( dist ) * w_ip[ ip_idx ]
+
+        r_00 = bincount( node_idx, values, minlength = n_nodes )
+        valid = r_00 > 0.
+
+        if self.avg_fn.correction:
+            r_01 = array( [ bincount( node_idx, values * arm[:, a], minlength = n_nodes )
+                            for a in range( n_x ) ] ).T
+            R_11 = array( [ [ bincount( node_idx, values * arm[:, a] * arm[:, b],
+                                        minlength = n_nodes )
+                              for b in range( n_x ) ] for a in range( n_x ) ] ).transpose( 2, 0, 1 )
+            #evaluate the correcting factors for all nodes
+            A = zeros( ( n_nodes, n_x + 1, n_x + 1 ) )
+            A[:, 0, 0] = r_00
+            A[:, 0, 1:] = r_01
+            A[:, 1:, 0] = r_01
+            A[:, 1:, 1:] = R_11
+            b = zeros( ( n_nodes, n_x + 1 ), dtype = float )
+            b[:, 0] = 1.
+            params = zeros( ( n_nodes, n_x + 1 ), dtype = float )
+            params[ valid ] = linalg.solve( A[ valid ], b[ valid, :, None ] )[..., 0]
+            p0 = params[:, 0]
+            p1 = params[:, 1:]
+            m_correction = np_sum( p1[ node_idx ] * arm, axis = 1 )
+            coeffs = values * ( p0[ node_idx ] + m_correction )
+        else:
+            p0 = zeros( ( n_nodes, ), dtype = float )
+            p0[ valid ] = 1. / r_00[ valid ]
+            coeffs = values * p0[ node_idx ]
+
+        W_mtx = csr_matrix( ( coeffs, ( node_idx, ip_idx ) ), shape = ( n_nodes, n_ips ) )
+
+        # interpolation of the nodal values in the integration points 
+        # ( n_ips * dim, n_dofs ), row ip * dim + k
         #
         e_ip_N_mtx = array( [self.fets_eval.get_N_mtx( r_pnt ) for r_pnt in ip_coords] )
         n_elem_dofs = e_ip_N_mtx.shape[2]
-
-        #Loop over all nodes 
-        for i, x_pnt in enumerate( X_pnt ):
-
-            #print 'x_pnt ', x_pnt
-
-            #Use LS to find the elements inside the radius
-            #TODO: make it for all subgrids
-            #TODO:check leaking
-            #
-            # - check the dimensionality of sd and use the corresponding dimension of level set function
-            # sd.n_dim
-#            level_set = self.sd\
-#                        ['(X-%(x)f)**2 + (Y-%(y)f)**2 - %(r)f**2'\
-#                        % {'x': x_pnt[0], 'y': x_pnt[1], 'r':self.avg_fn.radius}]
-            level_set = fe_subgrid['(X-%(x)f)**2 - %(r)f**2'\
-                        % { 'x' : x_pnt[0], 'r' : self.avg_fn.radius } ]
-            # print '(X-%(x)f)**2 - %(r)f**2' % { 'x' : x_pnt[0], 'r' : self.avg_fn.radius }
-            active_elems = hstack( ( level_set.elems, level_set.neg_elems ) )
-            n_a_elems = active_elems.size
-            if n_a_elems == 0:
-                'WARNING - Radius too small!'
-
-            # print 'active_elements', active_elems
-
-            # Generate the IP coords for all active elems            
-            # element transformation have to be used due distorted meshes
-            #
-            elems_ip_coords = zeros( ( n_a_elems, n_ip, dim ), dtype = float )
-            elems_dof_map = zeros( ( n_a_elems, n_elem_dofs ), dtype = int )
-            for j, e_id in enumerate( active_elems ):
-                X_mtx = fe_subgrid.elements[e_id].point_X_arr
-                elems_ip_coords[j, :] = \
-                            self.fets_eval.get_vtk_r_glb_arr( X_mtx, ip_coords )
-                elems_dof_map[j, :] = \
-                        fe_subgrid.elements[e_id].dofs
-
-            # print 'elem_ip_coords', elems_ip_coords
-            # Get the distance between the current ip and the interacting ips
-            #
-            arm = elems_ip_coords - x_pnt[None, None, :]
-            dist = cdist( x_pnt[None, :], elems_ip_coords.\
-                         reshape( n_a_elems * n_ip, dim ) ).\
-                         reshape( n_a_elems, n_ip )
-
-            # print 'distances', dist
-            # Value of the weighting function
-            #
-            alpha = a_fn( dist )   # ( elems,n_ip )
-            # print 'alpha'
-            # print alpha
-            J_det = fe_subgrid.dots.J_det_grid[active_elems]   # ( elems, n_ip )
-
-            values = ( ip_weights.T * J_det ) * alpha #( elems, n_ip )
-
-            # print 'values'
-            # print values
-
-            r_00 = values.sum()
-
-            if self.avg_fn.correction:
-                r_01 = np_sum( np_sum( values[..., None] * arm, axis = 1 ), axis = 0 )
-                outer_p = arm[..., None, :]*arm[..., None] # outer product (elems,n_ip, dims, dims)
-
-                # TODO:is summing over more dims ad once posible?
-                R_11 = np_sum( np_sum( values[..., None, None] * outer_p, axis = 1 ), axis = 0 )
-                #evaluate the correcting factors
-                A = zeros( ( dim + 1, dim + 1 ) )
-                A[0, 0] = r_00
-                A[0, 1:] = r_01
-                A[1:, 0] = r_01
-                A[1:, 1:] = R_11
-                b = zeros( ( dim + 1 ), dtype = float )
-                b[0] = 1.
-                params = linalg.solve( A, b )
-                #print 'check ',dot(A,params)
-                p0 = params[0]
-                p1 = params[1:]
-                # print 'p0', p0
-                # print 'p1', p1
-                m_correction = np_sum( p1[None, None, :] * arm, axis = 2 ) # (elem,n_ip)
-                c_elem = np_sum( ( values * ( p0 + m_correction ) )[..., None, None] * \
-                         e_ip_N_mtx[None, ...], axis = 1 )
-            else:
-                p0 = 1. / r_00
-
-                # print 'p0'
-                # print p0
-
-                # print 'e_ip_N_mtx'
-                # print e_ip_N_mtx[None, ...]
-
-                c_elem = np_sum( ( values * p0 )[..., None, None] * e_ip_N_mtx[None, ...], axis = 1 )
-
-            # print 'c_elem'
-            # print c_elem.flatten()
-
-            data.append( c_elem.flatten() )
-            col.append( tile( elems_dof_map, dim ).flatten() )
-            row.append( ( ( i * dim ) + zeros_like( c_elem ) + \
-                        arange( dim, dtype = int )[None, :, None] ).flatten() )
-
-        return data, col, row
+        elem_dof_map = fe_subgrid.elem_dof_map
+        N_row = ( arange( n_ips * dim ).reshape( n_elems, n_ip, dim, 1 ) + \
+                  zeros( ( 1, 1, 1, n_elem_dofs ), dtype = int ) )
+        N_col = ( elem_dof_map[:, None, None, :] + \
+                  zeros( ( 1, n_ip, dim, 1 ), dtype = int ) )
+        N_data = e_ip_N_mtx[None, ...] + zeros( ( n_elems, 1, 1, 1 ) )
+        n_cols = elem_dof_map.max() + 1
+        if n_dofs != None:
+            n_cols = n_dofs
+        N_mtx = csr_matrix( ( N_data.flatten(), ( N_row.flatten(), N_col.flatten() ) ),
+                            shape = ( n_ips * dim, n_cols ) )
+
+        C_mtx = ( kron( W_mtx, identity( dim ), format = 'csr' ) * N_mtx ).tocoo()
+        n_rows = n_nodes * dim
+        if n_dofs != None:
+            n_rows = n_dofs
+        return csr_matrix( ( C_mtx.data, ( C_mtx.row, C_mtx.col ) ),
+                           shape = ( n_rows, n_cols ), dtype = float_ )
 
     C_mtx = Property
     @cached_property
     def _get_C_mtx( self ):
-        n_dofs = self.n_dofs
-        _data, _col, _row = self.get_C_data()
-        return coo_matrix( ( array( hstack( _data ), dtype = 'float_' ),
-                             ( array( hstack( _row ), dtype = 'float_' ),
-                               array( hstack( _col ), dtype = 'float_' ) ) ),
-                           shape = ( n_dofs, n_dofs ), dtype = float_
-                            ).tocsr()
+        return self.get_C_mtx( self.n_dofs )
 
     def __call__( self, U_k ):
         return [], {'eps_avg' : self.C_mtx * U_k.T }
@@ -228,26 +229,16 @@ class RTNonlocalAvg( RTraceDomainList ):
         if self.verbose_time:
             t1 = time()
 
-        data = []
-        col = []
-        row = []
+        C_mtx = csr_matrix( ( n_dofs, n_dofs ), dtype = float_ )
         for sf in self.subfields:
-            _data, _col, _row = sf.get_C_data()
-            data += _data
-            col += _col
-            row += _row
-
-        data = hstack( data )
-        row = hstack( row )
-        col = hstack( col )
+            C_mtx = C_mtx + sf.get_C_mtx( n_dofs )
 
         if self.verbose_time:
             t2 = time()
             diff = t2 - t1
             print "Averaging Matrix: %8.2f sec" % diff
 
-        return coo_matrix( ( data, ( row, col ) ),
-                           shape = ( n_dofs, n_dofs ), dtype = float_ ).tocsr()
+        return C_mtx
 
     def __call__( self, U_k ):
         return [], {'eps_avg' : self.C_mtx * U_k.T }
@@ -0,0 +1,338 @@
+
+from numpy import array, allclose, linspace, arctan, exp
+import unittest
+import tempfile
+import shutil
+import os
+
+from ibvpy.api import \
+    TStepper as TS, TLoop, TLine, BCDof, RTraceGraph
+from ibvpy.core.iter_control import \
+    IterControl, IterControlLineSearch, IterControlArcLength
+from ibvpy.core.parallel_executor import ParallelExecutor
+from ibvpy.core.rtrace_store import RTraceStoreNPZ, RTraceStoreHDF5
+from ibvpy.core.tloop_checkpoint import TLoopCheckpoint
+from ibvpy.core.rtrace_worker import RTraceWorker
+from ibvpy.mats.mats1D.mats1D_elastic.mats1D_elastic import MATS1DElastic
+from ibvpy.mats.mats1D.mats1D_plastic.mats1D_plastic import MATS1DPlastic
+
+from ibvpy.mesh.fe_grid import FEGrid
+from ibvpy.fets.fets1D.fets1D2l import FETS1D2L
+from mathkit.mfn.mfn_line.mfn_line import MFnLineArray
+
+def get_bar_tstepper( **kw ):
+    '''Return the time stepper of a clamped elastic bar
+    loaded by a force at the right end.
+    [0]-[1]-[2]-[3]-[4]-[5]-[6]-[7]-[8]-[9]-[10]
+    u[0] = 0, R[10] = t
+    '''
+    fets_eval = FETS1D2L( mats_eval = MATS1DElastic( E = 10. ) )
+    domain = FEGrid( coord_max = ( 10., 0., 0. ),
+                     shape = ( 10, ),
+                     fets_eval = fets_eval )
+    return TS( sdomain = domain,
+               bcond_list = [ BCDof( var = 'u', dof = 0, value = 0. ),
+                              BCDof( var = 'f', dof = 10, value = 1. ) ],
+               **kw )
+
+class TestIterControl( unittest.TestCase ):
+    '''
+    Test the strategies of the equilibrium iteration
+    on a clamped bar loaded by a force at the right end.
+    '''
+    def get_tloop( self, iter_control, step = 0.25, **kw ):
+        ts = get_bar_tstepper( **kw )
+        return TLoop( tstepper = ts, iter_control = iter_control,
+                      tline = TLine( min = 0.0, step = step, max = 1.0 ) )
+
+    def test_newton( self ):
+        tloop = self.get_tloop( IterControl() )
+        u = tloop.eval()
+        self.assertAlmostEqual( u[10], 1.0 )
+        self.assertEqual( len( tloop.step_stats ), 5 )
+        self.assertTrue( allclose( tloop.get_step_stats( 't' ),
+                                   [ 0., 0.25, 0.5, 0.75, 1.0 ] ) )
+        self.assertEqual( tloop.n_rejected_steps, 0 )
+
+    def test_line_search( self ):
+        tloop = self.get_tloop( IterControlLineSearch(),
+                                constraint_handling = 'eliminate' )
+        u = tloop.eval()
+        self.assertAlmostEqual( u[10], 1.0 )
+        self.assertEqual( tloop.get_step_stats( 'n_extra_evals' ).sum(), 0 )
+
+    def test_arc_length( self ):
+        '''The arc length of a linear problem corresponds
+        to the load controlled step.
+        '''
+        for handling in [ 'modify', 'eliminate' ]:
+            tloop = self.get_tloop( IterControlArcLength(),
+                                    constraint_handling = handling )
+            u = tloop.eval()
+            self.assertTrue( allclose( tloop.get_step_stats( 't' ),
+                                       [ 0., 0.25, 0.5, 0.75, 1.0 ] ) )
+            self.assertAlmostEqual( u[10], tloop.t_n )
+
+    def get_nonlinear_tloop( self, iter_control, xdata, ydata, step, **kw ):
+        '''Single element of unit length with the nonlinear
+        elastic stress-strain curve, loaded by a force at the right end.
+        '''
+        curve = MFnLineArray( xdata = xdata, ydata = ydata )
+        fets_eval = FETS1D2L( mats_eval = MATS1DElastic( stress_strain_curve = curve ) )
+        domain = FEGrid( coord_max = ( 1., 0., 0. ),
+                         shape = ( 1, ),
+                         fets_eval = fets_eval )
+        ts = TS( sdomain = domain,
+                 bcond_list = [ BCDof( var = 'u', dof = 0, value = 0. ),
+                                BCDof( var = 'f', dof = 1, value = 1. ) ],
+                 **kw )
+        return TLoop( tstepper = ts, iter_control = iter_control,
+                      tline = TLine( min = 0.0, step = step, max = 1.0 ) )
+
+    def test_line_search_backtracking( self ):
+        '''The tangent in the predictor (flat at the origin) overshoots
+        into the flat part of the S-shaped curve, the full Newton corrections
+        oscillate without convergence, the scaled ones converge.
+        '''
+        xdata = linspace( -50., 50., 2001 )
+        ydata = arctan( xdata - 2. ) + arctan( 2. )
+        F = arctan( 1. ) + arctan( 2. )
+        tloop = self.get_nonlinear_tloop( IterControlLineSearch(), xdata, ydata / F, 1.0,
+                                          constraint_handling = 'eliminate' )
+        u = tloop.eval()
+        self.assertAlmostEqual( u[1], 3.0 )
+        self.assertTrue( tloop.get_step_stats( 'n_extra_evals' ).sum() > 0 )
+        self.assertEqual( tloop.n_rejected_steps, 0 )
+
+    def test_arc_length_softening( self ):
+        '''The arc length control follows the descending branch
+        of the softening curve behind the limit point.
+        '''
+        xdata = linspace( -1., 5., 121 )
+        ydata = xdata * exp( -xdata )
+        tloop = self.get_nonlinear_tloop( IterControlArcLength(), xdata, ydata, 0.1 )
+
+        def stop():
+            if tloop.U_k[1] > 2.0:
+                tloop.user_wants_abort = True
+        tloop.on_accept_time_step = stop
+
+        u = tloop.eval()
+        t_arr = tloop.get_step_stats( 't' )
+        # limit point at u = 1
+        self.assertAlmostEqual( t_arr.max(), exp( -1. ), 2 )
+        self.assertTrue( u[1] > 2.0 )
+        self.assertTrue( tloop.t_n < t_arr.max() - 0.05 )
+        self.assertAlmostEqual( tloop.t_n, u[1] * exp( -u[1] ), 3 )
+
+    def test_step_scale( self ):
+        iter_control = IterControl( n_iter_desired = 4 )
+        self.assertAlmostEqual( iter_control.get_step_scale( 4 ), 1.0 )
+        self.assertAlmostEqual( iter_control.get_step_scale( 1 ), 2.0 )
+        self.assertAlmostEqual( iter_control.get_step_scale( 16 ), 0.5 )
+        self.assertAlmostEqual( IterControl().get_step_scale( 16 ), 1.0 )
+
+class TestParallelExecutor( unittest.TestCase ):
+    '''
+    Evaluation of the element partitions in parallel processes.
+    '''
+    def get_u( self, executor ):
+        ts = get_bar_tstepper( executor = executor )
+        tloop = TLoop( tstepper = ts,
+                       tline = TLine( min = 0.0, step = 0.5, max = 1.0 ) )
+        u = tloop.eval().copy()
+        if executor != None:
+            executor.reset()
+        return u, ts.F_int.copy()
+
+    def test_partitions( self ):
+        executor = ParallelExecutor( n_partitions = 4 )
+        self.assertEqual( executor.get_partitions( 10 ),
+                          [ ( 0, 2 ), ( 2, 5 ), ( 5, 7 ), ( 7, 10 ) ] )
+        self.assertEqual( executor.get_partitions( 2 ), [ ( 0, 1 ), ( 1, 2 ) ] )
+
+    def test_parameter_change( self ):
+        '''The workers evaluate the material parameters changed
+        after their start.
+        '''
+        executor = ParallelExecutor( n_workers = 2, n_partitions = 2 )
+        ts = get_bar_tstepper( executor = executor )
+        ts.setup()
+        U_k = linspace( 0., 1., 11 )
+        d_U = U_k.copy()
+        try:
+            F_1, K_1 = ts.tse_integ.get_corr_pred( ts.sctx, U_k, d_U, 0., 1. )
+            F_1 = F_1.copy()
+            ts.sdomain.fets_eval.mats_eval.E = 20.
+            F_2, K_2 = ts.tse_integ.get_corr_pred( ts.sctx, U_k, d_U, 0., 1. )
+        finally:
+            executor.reset()
+        self.assertTrue( allclose( F_1[ [0, 10] ], [ -1., 1. ] ) )
+        self.assertTrue( allclose( F_2, 2 * F_1 ) )
+
+    def test_reproducible( self ):
+        '''The result does not depend on the number of workers.
+        '''
+        u_ref, F_ref = self.get_u( None )
+        u_1, F_1 = self.get_u( ParallelExecutor( n_workers = 1, n_partitions = 4 ) )
+        u_3, F_3 = self.get_u( ParallelExecutor( n_workers = 3, n_partitions = 4 ) )
+        self.assertTrue( allclose( u_ref, u_1 ) )
+        self.assertTrue( ( u_1 == u_3 ).all() )
+        self.assertTrue( ( F_1 == F_3 ).all() )
+
+class TestRTraceStore( unittest.TestCase ):
+    '''
+    Recording of the time history in the result store.
+    '''
+    def setUp( self ):
+        self.dir = tempfile.mkdtemp()
+
+    def tearDown( self ):
+        shutil.rmtree( self.dir )
+
+    def test_npz( self ):
+        for compress in [ True, False ]:
+            store = RTraceStoreNPZ( file = os.path.join( self.dir, 'res' ),
+                                    chunk_size = 2, compress = compress )
+            ts = get_bar_tstepper()
+            ts.rtrace_mngr.store = store
+            tloop = TLoop( tstepper = ts,
+                           tline = TLine( min = 0.0, step = 0.25, max = 1.0 ) )
+            u = tloop.eval()
+
+            # reopen the store as in a new session
+            #
+            store = RTraceStoreNPZ( file = os.path.join( self.dir, 'res' ) )
+            store.open()
+            self.assertTrue( allclose( store.t_arr, [ 0., 0.25, 0.5, 0.75, 1.0 ] ) )
+            self.assertTrue( allclose( store.get_values( 'U' ), u ) )
+            U_hist = store.get_history( 'U' )
+            self.assertEqual( U_hist.shape, ( 5, 11 ) )
+            self.assertTrue( allclose( U_hist[:, 10], store.t_arr ) )
+            self.assertEqual( store.get_step( 0.7 ), 3 )
+            self.assertTrue( 'state' in store.keys )
+
+    def test_hdf5( self ):
+        try:
+            import h5py
+        except ImportError:
+            self.skipTest( 'h5py not available' )
+        file_name = os.path.join( self.dir, 'res.h5' )
+        store = RTraceStoreHDF5( file = file_name, chunk_size = 2 )
+        ts = get_bar_tstepper()
+        ts.rtrace_mngr.store = store
+        tloop = TLoop( tstepper = ts,
+                       tline = TLine( min = 0.0, step = 0.25, max = 1.0 ) )
+        u = tloop.eval()
+        store.close()
+
+        # the buffered steps of a chunk must keep their own values
+        #
+        store = RTraceStoreHDF5( file = file_name )
+        store.open()
+        self.assertTrue( allclose( store.t_arr, [ 0., 0.25, 0.5, 0.75, 1.0 ] ) )
+        self.assertTrue( allclose( store.get_values( 'U' ), u ) )
+        U_hist = store.get_history( 'U' )
+        self.assertEqual( U_hist.shape, ( 5, 11 ) )
+        self.assertTrue( allclose( U_hist[:, 10], store.t_arr ) )
+        store.close()
+
+class TestTLoopCheckpoint( unittest.TestCase ):
+    '''
+    Restart of an interrupted computation from the snapshot.
+    '''
+    def setUp( self ):
+        self.dir = tempfile.mkdtemp()
+
+    def tearDown( self ):
+        shutil.rmtree( self.dir )
+
+    def get_tloop( self, t_max, **kw ):
+        return TLoop( tstepper = get_bar_tstepper(),
+                      tline = TLine( min = 0.0, step = 0.25, max = t_max ), **kw )
+
+    def test_resume( self ):
+        u_ref = self.get_tloop( 1.0 ).eval().copy()
+
+        file_name = os.path.join( self.dir, 'snapshot.npz' )
+        tloop = self.get_tloop( 0.5, checkpoint = TLoopCheckpoint( file = file_name,
+                                                                   n_steps = 1 ) )
+        tloop.eval()
+
+        tloop = self.get_tloop( 1.0 )
+        u = tloop.resume( file_name )
+        self.assertTrue( allclose( u, u_ref ) )
+        self.assertTrue( allclose( tloop.get_step_stats( 't' ),
+                                   [ 0., 0.25, 0.5, 0.75, 1.0 ] ) )
+
+    def get_plastic_tloop( self, t_max, **kw ):
+        '''Bar loaded beyond the yield limit up to t = 0.5 and unloaded.
+        '''
+        fets_eval = FETS1D2L( mats_eval = MATS1DPlastic( E = 10., sigma_y = 1.,
+                                                         K_bar = 1., H_bar = 1. ) )
+        domain = FEGrid( coord_max = ( 10., 0., 0. ),
+                         shape = ( 10, ),
+                         fets_eval = fets_eval )
+        ts = TS( sdomain = domain,
+                 bcond_list = [ BCDof( var = 'u', dof = 0, value = 0. ),
+                                BCDof( var = 'u', dof = 10, value = 2.,
+                                       time_function = lambda t: 1. - abs( 1. - 2. * t ) ) ] )
+        return TLoop( tstepper = ts,
+                      tline = TLine( min = 0.0, step = 0.125, max = t_max ), **kw )
+
+    def test_resume_plastic( self ):
+        '''The plastic strains of the loading are restored
+        for the unloading branch.
+        '''
+        tloop = self.get_plastic_tloop( 1.0 )
+        tloop.eval()
+        F_ref = tloop.tstepper.F_int.copy()
+        state_ref = tloop.rtrace_mngr.get_state_arrays()['state'].copy()
+        # residual force of the plastic bar
+        self.assertTrue( abs( F_ref[10] ) > 0.1 )
+
+        file_name = os.path.join( self.dir, 'snapshot.npz' )
+        tloop = self.get_plastic_tloop( 0.5, checkpoint = TLoopCheckpoint( file = file_name,
+                                                                           n_steps = 1 ) )
+        tloop.eval()
+
+        tloop = self.get_plastic_tloop( 1.0 )
+        tloop.resume( file_name )
+        self.assertTrue( allclose( tloop.tstepper.F_int, F_ref ) )
+        self.assertTrue( allclose( tloop.rtrace_mngr.get_state_arrays()['state'],
+                                   state_ref ) )
+
+    def test_write_error( self ):
+        '''The failure of the writing thread is raised in the time loop.
+        '''
+        checkpoint = TLoopCheckpoint( file = os.path.join( self.dir, 'missing',
+                                                           'snapshot.npz' ) )
+        checkpoint.write( { 't' : 0.5 } )
+        self.assertRaises( IOError, checkpoint.finish )
+        # the error is raised only once
+        checkpoint.finish()
+
+class TestRTraceWorker( unittest.TestCase ):
+    '''
+    Evaluation of the response traces in the worker process.
+    '''
+    def get_trace( self, **kw ):
+        ts = get_bar_tstepper( rtrace_list = [ RTraceGraph( name = 'Fi,right over u_right',
+                                                            var_y = 'F_int', idx_y = 0,
+                                                            var_x = 'U_k', idx_x = 10 ) ] )
+        ts.rtrace_mngr.rtrace_worker = RTraceWorker( queue_size = 1 )
+        tloop = TLoop( tstepper = ts,
+                       tline = TLine( min = 0.0, step = 0.1, max = 1.0 ), **kw )
+        tloop.eval()
+        self.assertFalse( ts.rtrace_mngr.is_async )
+        return ts.rtrace_mngr[ 'Fi,right over u_right' ]
+
+    def test_async( self ):
+        rt_sync = self.get_trace( sync_resp_tracing = True )
+        rt_async = self.get_trace( sync_resp_tracing = False )
+        self.assertEqual( len( rt_async._xdata ), 11 )
+        self.assertTrue( allclose( array( rt_sync._xdata ), array( rt_async._xdata ) ) )
+        self.assertTrue( allclose( array( rt_sync._ydata ), array( rt_async._ydata ) ) )
+
+if __name__ == "__main__":
+    unittest.main()
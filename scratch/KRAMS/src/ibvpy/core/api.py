@@ -4,4 +4,10 @@ from ibvp_solve import IBVPSolve
 
 from tloop import TLine, TLoop
 
+from iter_control import IterControl, IterControlLineSearch, IterControlArcLength
+
+from parallel_executor import ParallelExecutor
+
+from tloop_checkpoint import TLoopCheckpoint
+
 from tstepper import TStepper
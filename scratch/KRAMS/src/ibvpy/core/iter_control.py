@@ -0,0 +1,254 @@
+
+from enthought.traits.api import HasTraits, WeakRef, Int, Float, Array
+from numpy import dot, sqrt, zeros_like
+from scipy.linalg import norm
+
+class IterControl( HasTraits ):
+    '''
+    Control of the equilibrium iteration within a time step.
+
+    The default implementation is the Newton-Raphson scheme
+    (modified if requested, see TLoop.modified_newton_k). The strategy
+    is invoked by the time loop at the following positions:
+    (1) at the beginning of the (possibly repeated) time step (begin_step)
+    (2) to check the convergence of the iteration (is_converged)
+    (3) to correct the control variable using the system matrix with
+        the included constraints (correct)
+    (4) after the equilibrium has been accepted (end_step)
+    (5) to predict the size of the next time step from the number
+        of iterations needed in the current one (get_step_scale)
+    '''
+
+    tloop = WeakRef()
+
+    # Desired number of iterations within a time step. If nonzero,
+    # the time step is scaled by the factor
+    # ( n_iter_desired / n_iter ) ** step_scale_exponent
+    # limited to the range [ step_scale_min, step_scale_max ]
+    #
+    n_iter_desired = Int( 0 )
+    step_scale_exponent = Float( 0.5 )
+    step_scale_min = Float( 0.5 )
+    step_scale_max = Float( 2.0 )
+
+    # Number of additional evaluations of the residuum within the current
+    # time step (e.g. the rejected trial states of the line search).
+    #
+    n_extra_evals = Int( 0 )
+
+    def begin_step( self ):
+        '''Prepare the iteration within a time step.'''
+        self.n_extra_evals = 0
+
+    def is_converged( self, step_flag ):
+        '''Decide whether the equilibrium has been reached.'''
+        tloop = self.tloop
+        return tloop.norm < tloop.tolerance
+
+    def correct( self, K, step_flag ):
+        '''Solve for the correction and update the control variables
+        tloop.U_k, tloop.d_U (and tloop.t_n1).
+
+        Return the pair ( K, R ) if the system has already been evaluated
+        for the corrected state (including the constraints), otherwise None.
+        '''
+        tloop = self.tloop
+        tloop.d_U = K.solve()  # DG_k * d_U = r
+        tloop.U_k += tloop.d_U
+        return None
+
+    def end_step( self ):
+        '''Called after the equilibrium has been accepted.'''
+        pass
+
+    def get_state( self ):
+        '''Values to be kept in the snapshot of the time loop.'''
+        return {}
+
+    def set_state( self, state ):
+        pass
+
+    def get_step_scale( self, n_iter ):
+        '''Scale the time step according to the number of iterations.'''
+        if self.n_iter_desired <= 0:
+            return 1.0
+        scale = ( float( self.n_iter_desired ) / max( n_iter, 1 ) ) ** \
+            self.step_scale_exponent
+        return min( max( scale, self.step_scale_min ), self.step_scale_max )
+
+class IterControlLineSearch( IterControl ):
+    '''
+    Newton-Raphson scheme with backtracking line search.
+
+    The correction d_U is scaled by s = 1, ls_factor, ls_factor**2, ...
+    until the norm of the residuum decreases sufficiently
+
+        norm( R( U_k + s * d_U ) ) <= ( 1 - ls_c * s ) * norm( R( U_k ) )
+
+    or the maximum number of reductions ls_max has been reached.
+    The last evaluated state is handed over to the next iteration so that
+    the additional evaluations are only needed for the rejected trial states.
+    The predictor is not scaled as it contains the increments
+    of the prescribed values.
+    '''
+    ls_max = Int( 4 )
+    ls_factor = Float( 0.5 )
+    ls_c = Float( 1e-4 )
+
+    def correct( self, K, step_flag ):
+        tloop = self.tloop
+        d_U = K.solve()
+        if step_flag == 'predictor':
+            tloop.d_U = d_U
+            tloop.U_k += d_U
+            return None
+
+        norm_0 = tloop.norm
+        U_0 = tloop.U_k.copy()
+        s = 1.0
+        for i in range( self.ls_max + 1 ):
+            tloop.d_U = s * d_U
+            tloop.U_k[:] = U_0 + tloop.d_U
+            K, R = tloop.eval_residual( 'corrector' )
+            if norm( R ) <= ( 1.0 - self.ls_c * s ) * norm_0 or \
+                i == self.ls_max:
+                break
+            self.n_extra_evals += 1
+            s *= self.ls_factor
+        return K, R
+
+class IterControlArcLength( IterControl ):
+    '''
+    Arc-length method (Riks, Crisfield) with the time as the load factor.
+
+    The load factor is identified with the target time t_n1 of the time
+    loop, i.e. the loads are given by the natural boundary conditions
+    and their time functions. In every iteration, the corrections
+    for the residuum and for the load vector q = dF_ext/dt are obtained
+    and combined so that the increment of the control variable
+    within the time step satisfies the (cylindrical) arc-length condition
+
+        Delta_U . Delta_U = Delta_l**2
+
+    The arc length is derived from the time step of the time loop as
+    Delta_l = dl_dt * ( t_n1 - t_n ). If not specified, dl_dt is set
+    to the norm of the tangential displacement for the unit load factor
+    in the first step, so that the first step corresponds to the load
+    controlled one. Thus, the adaptation of the time step (on failure
+    of the iteration, step size prediction) applies to the arc length.
+
+    The essential boundary conditions must be homogeneous (their values
+    are not scaled by the load factor). A time step with zero length
+    (e.g. the initial state) is solved with the load control.
+    '''
+    # arc length per unit time step
+    #
+    dl_dt = Float( 0.0 )
+
+    # time increment used to get the load vector q by finite differences
+    #
+    dt_load = Float( 1e-6 )
+
+    # increment of the control variable within the time step
+    #
+    Delta_U = Array( float )
+
+    # increment of the control variable within the last accepted time step
+    # (determines the direction of the predictor)
+    #
+    Delta_U_prev = Array( float )
+
+    _d_t = Float( 0.0 )
+    _dl = Float( 0.0 )
+    _load_control = False
+
+    def begin_step( self ):
+        super( IterControlArcLength, self ).begin_step()
+        tloop = self.tloop
+        d_t = tloop.t_n1 - tloop.t_n
+        self._load_control = ( d_t == 0.0 )
+        if self._load_control:
+            return
+        self._d_t = d_t
+        self._dl = self.dl_dt * d_t
+        # restart the step from the last equilibrium and let the load
+        # factor be determined by the arc-length condition
+        #
+        tloop.U_k[:] = tloop.U_n
+        tloop.t_n1 = tloop.t_n
+        self.Delta_U = zeros_like( tloop.U_k )
+        if self.Delta_U_prev.shape != tloop.U_k.shape:
+            self.Delta_U_prev = zeros_like( tloop.U_k )
+
+    def is_converged( self, step_flag ):
+        if self._load_control or step_flag == 'corrector':
+            return super( IterControlArcLength, self ).is_converged( step_flag )
+        return False
+
+    def get_load_derivative( self ):
+        '''Derivative of the external forces with respect to the load factor.
+        '''
+        tloop = self.tloop
+        tstepper = tloop.tstepper
+        t = tloop.t_n1
+        return ( tstepper.get_load_vector( t + self.dt_load ) -
+                 tstepper.get_load_vector( t ) ) / self.dt_load
+
+    def correct( self, K, step_flag ):
+        if self._load_control:
+            return super( IterControlArcLength, self ).correct( K, step_flag )
+
+        tloop = self.tloop
+        d_U_R = K.solve()
+        d_U_q = K.solve_additional( self.get_load_derivative() )
+        norm_q = norm( d_U_q )
+        if norm_q == 0.0:
+            raise ValueError, \
+                'arc-length control requires a load given by the natural ' \
+                'boundary conditions'
+
+        if step_flag == 'predictor':
+            if self.dl_dt == 0.0:
+                self.dl_dt = norm_q
+                self._dl = self.dl_dt * self._d_t
+            d_lambda = self._dl / norm_q
+            if dot( self.Delta_U_prev, d_U_q ) < 0.0:
+                d_lambda = -d_lambda
+        else:
+            # d_lambda from the quadratic arc-length condition
+            # ( Delta_U + d_U_R + d_lambda * d_U_q )**2 = Delta_l**2
+            #
+            Delta_U_R = self.Delta_U + d_U_R
+            a = dot( d_U_q, d_U_q )
+            b = 2.0 * dot( Delta_U_R, d_U_q )
+            c = dot( Delta_U_R, Delta_U_R ) - self._dl ** 2
+            disc = b * b - 4.0 * a * c
+            if disc < 0.0:
+                # no intersection with the arc - take the closest point
+                d_lambda = -b / ( 2.0 * a )
+            else:
+                # choose the root keeping the direction of the increment
+                roots = [ ( -b + sqrt( disc ) ) / ( 2.0 * a ),
+                          ( -b - sqrt( disc ) ) / ( 2.0 * a ) ]
+                cos = [ dot( self.Delta_U, Delta_U_R + root * d_U_q )
+                        for root in roots ]
+                d_lambda = roots[ cos.index( max( cos ) ) ]
+
+        d_U = d_U_R + d_lambda * d_U_q
+        self.Delta_U = self.Delta_U + d_U
+        tloop.d_U = d_U
+        tloop.U_k += d_U
+        tloop.t_n1 += d_lambda
+        return None
+
+    def end_step( self ):
+        if not self._load_control:
+            self.Delta_U_prev = self.Delta_U
+
+    def get_state( self ):
+        return { 'dl_dt' : self.dl_dt,
+                 'Delta_U_prev' : self.Delta_U_prev }
+
+    def set_state( self, state ):
+        self.dl_dt = float( state['dl_dt'] )
+        self.Delta_U_prev = state['Delta_U_prev']
@@ -0,0 +1,210 @@
+
+from enthought.traits.api import HasTraits, Int, Any, Dict
+
+from numpy import frombuffer, float_
+
+from mathkit.matrix_la.sys_mtx_array import SysMtxArray
+
+import multiprocessing
+
+#-------------------------------------------------------------------------------
+# Evaluation contexts shared with the worker processes
+#-------------------------------------------------------------------------------
+#
+# The workers are forked from the main process so that they inherit
+# the evaluators (dots) with the mesh, the element formulation and
+# the cached geometry matrices. The values changing within the
+# computation (control variable, its increment, state array, element
+# matrices and internal forces) are exchanged through shared memory.
+#
+_contexts = {}
+
+def shared_array( shape ):
+    '''Return a zeroed array in the shared memory
+    that is visible to the forked worker processes.
+    '''
+    size = 1
+    for n in shape:
+        size *= n
+    raw = multiprocessing.RawArray( 'd', max( size, 1 ) )
+    return frombuffer( raw, dtype = float_ )[ :size ].reshape( shape )
+
+def _eval_partition( task ):
+    '''Evaluate a partition of the elements in the worker process.
+    '''
+    key, p, e_min, e_max, tn, tn1, update_state_on = task
+    ctx = _contexts[ key ]
+    sctx = ctx['sctx']
+    sctx.update_state_on = update_state_on
+    F_p = ctx['F_parts'][ p ]
+    F_p[:] = 0.0
+    ctx['dots'].get_corr_pred_range( sctx, slice( e_min, e_max ),
+                                     ctx['U'], ctx['d_U'], ctx['state'],
+                                     ctx['k_arr'], F_p, tn, tn1 )
+    return p
+
+class ParallelExecutor( HasTraits ):
+    '''
+    Evaluate the elements of a domain in a pool of worker processes.
+
+    The elements of the domain are split into n_partitions contiguous
+    partitions. Each partition is evaluated by the method
+    get_corr_pred_range of the domain evaluator (DOTSEval, XDOTSEval)
+    writing the element matrices into the shared array of element matrices
+    and the internal forces into a separate shared vector of the partition.
+    The vectors of the partitions are finally summed in the order
+    of the partitions. Since the partitioning does not depend on the
+    number of workers, the results are identical for any n_workers.
+    With n_workers <= 1 the partitions are evaluated in the main process.
+
+    The worker processes are forked at the first evaluation of a domain
+    and inherit the state of the model at that time. The workers are
+    restarted (the context is rebuilt) if the model changes after the fork:
+    change of a trait of the element formulation or of its material model,
+    replacement of the element formulation,
+    of the geometry of the domain (+changed_geometry) or of the structure
+    (new array of element matrices), or a new spatial context.
+    The time stepper resets the executor in the setup of the computation.
+    '''
+
+    # number of worker processes
+    #
+    n_workers = Int
+    def _n_workers_default( self ):
+        return multiprocessing.cpu_count()
+
+    # number of partitions of the domain (limited by the number of elements)
+    #
+    n_partitions = Int( 32 )
+
+    _pool = Any
+
+    # keys of the evaluation contexts registered by this executor
+    #
+    _keys = Dict
+
+    def reset( self ):
+        '''Terminate the worker processes and release the shared buffers.
+        '''
+        if self._pool != None:
+            self._pool.terminate()
+            self._pool.join()
+            self._pool = None
+        for key in self._keys:
+            self._release_context( key )
+        self._keys = {}
+
+    def _watch_model( self, ctx ):
+        '''Mark the context as changed upon a change of the model.
+        '''
+        def model_changed():
+            ctx['changed'] = True
+        dots = ctx['dots']
+        fets_eval = dots.fets_eval
+        watched = [ ( fets_eval, None ),
+                    ( dots.sdomain, 'fets_eval' ),
+                    ( dots.sdomain, '+changed_geometry' ) ]
+        mats_eval = getattr( fets_eval, 'mats_eval', None )
+        if mats_eval != None:
+            watched.append( ( mats_eval, None ) )
+        for obj, name in watched:
+            obj.on_trait_change( model_changed, name )
+        ctx['watched'] = ( model_changed, watched )
+
+    def _release_context( self, key ):
+        '''Remove the context and stop watching its model.
+        '''
+        ctx = _contexts.pop( key, None )
+        if ctx != None:
+            model_changed, watched = ctx['watched']
+            for obj, name in watched:
+                obj.on_trait_change( model_changed, name, remove = True )
+
+    def get_partitions( self, n_elems ):
+        '''Return the bounds of the contiguous partitions of n_elems.
+        '''
+        n_p = max( min( self.n_partitions, n_elems ), 1 )
+        bounds = [ ( p * n_elems ) // n_p for p in range( n_p + 1 ) ]
+        return zip( bounds[:-1], bounds[1:] )
+
+    def _get_context( self, dots, sctx ):
+        '''Get the evaluation context of the domain, set it up
+        if the model has changed since the fork of the workers.
+        '''
+        key = id( dots )
+        k_arr = dots.k_arr
+        state_array = dots.state_array
+        n_dofs = dots.sdomain.tstepper.U_k.shape[0]
+        ctx = _contexts.get( key, None )
+        if ctx != None and not ctx['changed'] and \
+            ctx['sctx'] is sctx and ctx['k_arr_src'] is k_arr and \
+            ctx['state'].shape == state_array.shape and \
+            ctx['U'].shape[0] == n_dofs:
+            return key, ctx
+
+        # (re)construct the shared buffers - the workers must be restarted
+        # to get the new context
+        #
+        if self._pool != None:
+            self._pool.terminate()
+            self._pool.join()
+            self._pool = None
+        self._release_context( key )
+
+        # cached geometry matrices are evaluated before the fork
+        # so that they are not constructed in every worker
+        #
+        if dots.cache_geo_matrices and len( dots.sdomain.elements ) != 0:
+            B_mtx_grid = dots.B_mtx_grid
+            J_det_grid = dots.J_det_grid
+
+        partitions = self.get_partitions( len( dots.sdomain.elements ) )
+        ctx = { 'dots'       : dots,
+                'sctx'       : sctx,
+                'k_arr_src'  : k_arr,
+                'k_arr'      : shared_array( k_arr.shape ),
+                'U'          : shared_array( ( n_dofs, ) ),
+                'd_U'        : shared_array( ( n_dofs, ) ),
+                'state'      : shared_array( state_array.shape ),
+                'F_parts'    : shared_array( ( len( partitions ), n_dofs ) ),
+                'partitions' : partitions,
+                'changed'    : False }
+        self._watch_model( ctx )
+        _contexts[ key ] = ctx
+        self._keys[ key ] = True
+        return key, ctx
+
+    def get_corr_pred( self, dots, sctx, tn, tn1, F_int ):
+        '''Evaluate the element matrices and add the internal forces
+        of the domain evaluator dots to F_int.
+        '''
+        key, ctx = self._get_context( dots, sctx )
+
+        tstepper = dots.sdomain.tstepper
+        ctx['U'][:] = tstepper.U_k
+        ctx['d_U'][:] = tstepper.d_U
+        state_array = dots.state_array
+        ctx['state'][:] = state_array
+
+        k_arr = ctx['k_arr']
+        k_arr[...] = 0.0
+
+        tasks = [ ( key, p, e_min, e_max, tn, tn1, sctx.update_state_on )
+                  for p, ( e_min, e_max ) in enumerate( ctx['partitions'] ) ]
+
+        if self.n_workers > 1 and len( tasks ) > 1:
+            if self._pool == None:
+                self._pool = multiprocessing.Pool( self.n_workers )
+            self._pool.map( _eval_partition, tasks )
+        else:
+            for task in tasks:
+                _eval_partition( task )
+
+        # return the updated state and reduce the internal forces
+        # in the fixed order of the partitions
+        #
+        state_array[:] = ctx['state']
+        for F_p in ctx['F_parts']:
+            F_int += F_p
+
+        return SysMtxArray( mtx_arr = k_arr, dof_map_arr = dots.sdomain.elem_dof_map )
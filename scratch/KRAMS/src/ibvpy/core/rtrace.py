@@ -22,7 +22,12 @@ class RTrace( HasTraits ):
     name = Str( 'unnamed' )
     update_on = Enum( 'update', 'iteration' )
     clear_on = Enum( 'never', 'update' )
-    save_on = Enum( None )
+    save_on = Enum( None, 'update' )
+
+    # the values can be evaluated in a separate process and transferred
+    # (see get_current_values, RTraceWorker)
+    #
+    supports_async = Bool( False )
 
     #sctx = WeakRef( SContext )
     rmgr = WeakRef()
@@ -50,6 +55,45 @@ class RTrace( HasTraits ):
     def add_current_displ( self, sctx, U_k ):#TODO: to avoid class checking in rmngr - UGLY
         pass
 
+    def get_store_values( self ):
+        '''
+        Return the dictionary of the values recorded in the current step
+        to be kept in the result store (see RTraceStore).
+        '''
+        return {}
+
+    def load_store_values( self, store, step ):
+        '''
+        Restore the values recorded in the step from the result store.
+        '''
+        pass
+
+    def get_current_values( self ):
+        '''
+        Return the dictionary of the values obtained by the last call
+        to add_current_values (transferred from the RTraceWorker).
+        '''
+        return {}
+
+    def set_current_values( self, values ):
+        '''
+        Take over the values evaluated by the RTraceWorker.
+        '''
+        pass
+
+    def get_buffers( self ):
+        '''
+        Return the dictionary of the recorded values kept in memory
+        (included in the snapshot of the time loop).
+        '''
+        return {}
+
+    def set_buffers( self, buffers ):
+        '''
+        Restore the values from the snapshot of the time loop.
+        '''
+        pass
+
     def register_mv_pipelines( self, e ):
         '''
         Eventually register pipeline components within the mayavi sceen.
@@ -49,4 +49,34 @@ class RTraceEval( HasTraits ):
 
         return val
 
+    # Bulk evaluation for arrays of elements and points
+    #
+    # The spatial context specifies the elements (sctx.e_arr) and the
+    # local coordinates of the points within the elements (sctx.r_arr)
+    # together with the integration points providing the state
+    # of the material in each point (sctx.ip_map). The mapping
+    # u_mapping_batch extracts the values for all the elements
+    # and may add further data to the context (e.g. the nodal coordinates
+    # sctx.X_el and the state of the material points sctx.mats_state_batch).
+    # The evaluator eval_batch returns the values in all the points
+    # with the shape ( n_elems, n_pnts ) + value shape.
+    #
+    u_mapping_batch = Callable
+    eval_batch = Callable
+
+    def call_batch( self, sctx, u ):
+        '''Evaluate the variable in all the elements and points specified
+        in the spatial context. Return None if the bulk evaluation
+        is not available.
+        '''
+        if not self.eval_batch:
+            return None
+        if self.u_mapping:
+            if not self.u_mapping_batch:
+                return None
+            u = self.u_mapping_batch( sctx, u )
+            if u is None:
+                return None
+        return self.eval_batch( sctx, u )
+
 
@@ -19,6 +19,8 @@ from enthought.traits.ui.tabular_adapter \
 from numpy import zeros, float_
 from ibv_resource import IBVResource
 from rtrace import RTrace
+from rtrace_store import RTraceStore
+from rtrace_worker import RTraceWorker
 
 #----------------------------------------------------------------------------------
 # Tabular Adapter Definition 
@@ -99,6 +101,41 @@ class RTraceMngr( IBVResource ):
 
     timer = Instance( Any )
 
+    # Result store receiving the values of the accepted time steps
+    # - the control variable U, the values of the response traces
+    # with save_on = 'update' and, if store_state is set,
+    # the state arrays of the time stepper evaluators (as present
+    # at the time of recording, see the note in TLoop.eval).
+    # If not specified, the traces with save_on = 'update' write
+    # their data using their write method.
+    #
+    store = Instance( RTraceStore )
+
+    store_state = Bool( True )
+
+    # Evaluation of the traces in a separate process (see RTraceWorker)
+    # used by the time loop if sync_resp_tracing is off
+    #
+    rtrace_worker = Instance( RTraceWorker )
+
+    is_async = Property
+    def _get_is_async( self ):
+        return self.rtrace_worker != None and self.rtrace_worker.active
+
+    def start_async( self, tloop ):
+        if self.rtrace_worker != None:
+            self.rtrace_worker.start( tloop )
+
+    def stop_async( self ):
+        if self.rtrace_worker != None:
+            self.rtrace_worker.stop()
+
+    def wait( self ):
+        '''Wait until the traces evaluated asynchronously are complete.
+        '''
+        if self.is_async:
+            self.rtrace_worker.collect()
+
     def __init__( self, **kwtraits ):
         super( RTraceMngr, self ).__init__( **kwtraits )
         self.timer = None
@@ -127,23 +164,146 @@ class RTraceMngr( IBVResource ):
     def get_values( self ):
         return self.rtrace_bound_list
 
-    def record_iter( self, sctx, U_k, *args, **kw ):
-        for rte in self.get_values():
-            if rte.update_on == 'iteration':
-                rte.add_current_values( sctx, U_k,
-                                       *self.tstepper.args, **self.tstepper.kw )
-                rte.add_current_displ( sctx, U_k )
+    def get_traces( self, supports_async = None ):
+        '''Return the list of ( index, rtrace ) pairs, if specified, only those
+        with the supports_async flag equal to the argument.
+        '''
+        return [ ( i, rte ) for i, rte in enumerate( self.get_values() )
+                 if supports_async == None or rte.supports_async == supports_async ]
 
-    def record_equilibrium( self, sctx, U_k ):
-        for rte in self.get_values():
-            if rte.update_on == 'update':
+    def eval_values( self, update_on, sctx, U_k, traces ):
+        '''Evaluate the traces recorded on update_on and return
+        their current values ( dictionary index -> values ).
+        '''
+        values = {}
+        for i, rte in traces:
+            if rte.update_on == update_on:
                 rte.add_current_values( sctx, U_k,
                                        *self.tstepper.args, **self.tstepper.kw )
                 rte.add_current_displ( sctx, U_k )
+                values[ i ] = rte.get_current_values()
+        return values
+
+    def record_iter( self, sctx, U_k, *args, **kw ):
+        if self.is_async:
+            # copy the model only if there is something to evaluate
+            #
+            if len( [ rte for i, rte in self.get_traces( True )
+                      if rte.update_on == 'iteration' ] ) > 0:
+                self.rtrace_worker.submit( 'iteration', self.get_snapshot( U_k ), {} )
+            self.eval_values( 'iteration', sctx, U_k, self.get_traces( False ) )
+        else:
+            self.eval_values( 'iteration', sctx, U_k, self.get_traces() )
+
+    def record_equilibrium( self, sctx, U_k, t = 0.0 ):
+        if self.is_async:
+            traces = self.get_traces( False )
+            self.eval_values( 'update', sctx, U_k, traces )
+            store_values = self._finish_traces( traces )
+            self.rtrace_worker.submit( 'update', self.get_snapshot( U_k, t ),
+                                       store_values )
+        else:
+            traces = self.get_traces()
+            self.eval_values( 'update', sctx, U_k, traces )
+            store_values = self._finish_traces( traces )
+            self._store_step( t, U_k, self.get_state_arrays(), store_values )
+
+    def apply_values( self, update_on, snapshot, values, store_values ):
+        '''Pass the values evaluated by the worker to the traces.
+        '''
+        traces = self.get_traces( True )
+        for i, rte in traces:
+            if i in values:
+                rte.set_current_values( values[ i ] )
+        if update_on == 'update':
+            store_values.update( self._finish_traces( traces ) )
+            state_arrays = dict( [ ( key, snapshot[ key ] )
+                                   for key in self.get_state_arrays().keys() ] )
+            self._store_step( snapshot['t'], snapshot['U_k'], state_arrays,
+                              store_values )
+
+    def _finish_traces( self, traces ):
+        '''Write and clear the traces after the equilibrium,
+        return their values to be stored.
+        '''
+        store_values = {}
+        for i, rte in traces:
             if rte.save_on == 'update':
-                rte.write()
+                if self.store != None:
+                    store_values.update( rte.get_store_values() )
+                else:
+                    rte.write()
             if rte.clear_on == 'update':
                 rte.clear()
+        return store_values
+
+    def _store_step( self, t, U_k, state_arrays, store_values ):
+        if self.store == None:
+            return
+        store_values[ 'U' ] = U_k
+        if self.store_state:
+            store_values.update( state_arrays )
+        self.store.append( t, store_values )
+
+    def get_snapshot( self, U_k, t = None ):
+        '''Copy the data of the model accessed by the trace evaluators
+        (see RTraceWorker).
+        '''
+        tstepper = self.tstepper
+        if t == None:
+            tloop = getattr( tstepper, 'tloop', None )
+            t = tloop and tloop.t_n1 or 0.0
+        snapshot = { 't' : t,
+                     'U_k' : U_k.copy(),
+                     'F_ext' : tstepper.F_ext.copy() }
+        F_int = getattr( tstepper, 'F_int', None )
+        if F_int is not None:
+            snapshot['F_int'] = F_int.copy()
+        for key, state_array in self.get_state_arrays().items():
+            snapshot[ key ] = state_array.copy()
+        return snapshot
+
+    def get_state_arrays( self ):
+        '''Return the state arrays of the domain evaluators
+        (keys state, state.0, state.1, ... for a list of domains).
+        '''
+        tse_integ = self.tstepper.tse_integ
+        dots_list = getattr( tse_integ, 'dots_list', None )
+        if dots_list == None:
+            dots_list = [ tse_integ ]
+            keys = [ 'state' ]
+        else:
+            keys = [ 'state.%d' % i for i in range( len( dots_list ) ) ]
+        state_arrays = {}
+        for key, dots in zip( keys, dots_list ):
+            state_array = getattr( dots, 'state_array', None )
+            if state_array is not None:
+                state_arrays[ key ] = state_array
+        return state_arrays
+
+    def open_store( self, new = True ):
+        '''Start a new history in the result store or continue
+        the existing one.
+        '''
+        if self.store == None:
+            return
+        if new:
+            self.store.create()
+        else:
+            self.store.open()
+
+    def flush_store( self ):
+        if self.store != None:
+            self.store.flush()
+
+    def load_step( self, step = -1 ):
+        '''Restore the values of the response traces recorded
+        in the step of the result store (post-processing
+        of a stored computation). Return the control variable.
+        '''
+        for rte in self.get_values():
+            rte.load_store_values( self.store, step )
+        return self.store.get_values( 'U', step )
 
     def clear( self, e = None ):
         for rte in self.get_values():
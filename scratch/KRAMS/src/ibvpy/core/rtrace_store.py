@@ -0,0 +1,417 @@
+
+from enthought.traits.api import \
+    HasTraits, Str, Int, Bool, List, Dict, Any, Property
+
+from numpy import \
+    array, searchsorted, save, load, savez, savez_compressed, \
+    float_, int_, concatenate, argmin, fabs
+
+import os
+
+#-------------------------------------------------------------------------------
+# RTraceStore - persistent storage of the recorded time history
+#-------------------------------------------------------------------------------
+
+class RTraceStore( HasTraits ):
+    '''
+    Storage of the values recorded in the accepted time steps.
+
+    The values of a time step are supplied as a dictionary of arrays
+    (control variable, fields of the response traces, state arrays)
+    and appended to the storage together with the time. The history
+    is indexed by the time step. A variable need not be present in every
+    time step, its values are associated with the steps in which
+    they were recorded.
+
+    The values are collected in chunks of chunk_size steps and written
+    when the chunk is complete or on flush. The stored data can be read
+    in a new session (e.g. for post-processing without repeating
+    the computation) by opening the store with the same file name.
+    '''
+
+    # name of the file (directory) containing the data
+    #
+    file = Str
+
+    # number of time steps collected in a chunk
+    #
+    chunk_size = Int( 10 )
+
+    # compress the chunks
+    #
+    compress = Bool( True )
+
+    def create( self ):
+        '''Start a new history, discard the data present in the file.'''
+        raise NotImplementedError
+
+    def open( self ):
+        '''Open an existing history for reading and appending.'''
+        raise NotImplementedError
+
+    def append( self, t, values ):
+        '''Append the values ( dictionary of arrays ) of the time step t.'''
+        raise NotImplementedError
+
+    def flush( self ):
+        '''Write the values collected so far.'''
+        raise NotImplementedError
+
+    def close( self ):
+        self.flush()
+
+    # times of the recorded steps
+    #
+    t_arr = Property
+    def _get_t_arr( self ):
+        raise NotImplementedError
+
+    n_steps = Property
+    def _get_n_steps( self ):
+        return len( self.t_arr )
+
+    keys = Property
+    def _get_keys( self ):
+        raise NotImplementedError
+
+    def get_steps( self, key ):
+        '''Indices of the time steps containing the variable.'''
+        raise NotImplementedError
+
+    def get_values( self, key, step = -1 ):
+        '''Values of the variable in the time step, None if the variable
+        has not been recorded in that step.'''
+        raise NotImplementedError
+
+    def get_history( self, key ):
+        '''Array of all the recorded values of the variable
+        ( n_recorded_steps, ... ), the steps are given by get_steps.'''
+        raise NotImplementedError
+
+    def truncate( self, n_steps ):
+        '''Discard the steps following the first n_steps
+        (restart of the computation from a snapshot).
+        '''
+        t_arr = self.t_arr
+        if n_steps >= len( t_arr ):
+            return
+        history = {}
+        for key in self.keys:
+            steps = self.get_steps( key )
+            n = ( steps < n_steps ).sum()
+            history[ key ] = ( steps[:n], array( self.get_history( key )[:n] ) )
+        self.create()
+        for step in range( n_steps ):
+            values = {}
+            for key, ( steps, vals ) in history.items():
+                entry = searchsorted( steps, step )
+                if entry < len( steps ) and steps[ entry ] == step:
+                    values[ key ] = vals[ entry ]
+            self.append( t_arr[ step ], values )
+        self.flush()
+
+    def get_step( self, t ):
+        '''Index of the recorded time step closest to the time t.'''
+        return int( argmin( fabs( self.t_arr - t ) ) )
+
+    def _get_step_idx( self, step ):
+        if step < 0:
+            step += self.n_steps
+        if step < 0 or step >= self.n_steps:
+            raise IndexError, 'time step %d not in the store' % step
+        return step
+
+class RTraceStoreNPZ( RTraceStore ):
+    '''
+    Result store in a directory of numpy files.
+
+    Each chunk of a variable is stored in a separate file, as a compressed
+    npz file or as a npy file that is memory mapped when read.
+    The index file (index.npz) contains the times, the names
+    of the variables and the position of their chunks in the history.
+    It is replaced on every flush, so that the data written until the
+    last flush remain readable when the computation is interrupted.
+    '''
+    # history of the times
+    _t_list = List
+
+    # names of the variables in the order of registration
+    _keys = List
+
+    # per variable - steps of the recorded entries
+    _steps = Dict
+
+    # per variable - index of the first entry of each chunk
+    _chunk_offsets = Dict
+
+    # per variable - entries of the current chunk not written yet
+    _buffer = Dict
+
+    # chunks loaded in the current session
+    _chunk_cache = Dict
+
+    def _get_file_name( self, name ):
+        return os.path.join( self.file, name )
+
+    def _get_chunk_file( self, v_id, c_id ):
+        ext = self.compress and 'npz' or 'npy'
+        return self._get_file_name( 'v%03d_%05d.%s' % ( v_id, c_id, ext ) )
+
+    def create( self ):
+        if not os.path.exists( self.file ):
+            os.makedirs( self.file )
+        for name in os.listdir( self.file ):
+            if name == 'index.npz' or name.startswith( 'v' ) and \
+                os.path.splitext( name )[1] in [ '.npz', '.npy' ]:
+                os.remove( self._get_file_name( name ) )
+        self._t_list = []
+        self._keys = []
+        self._steps = {}
+        self._chunk_offsets = {}
+        self._buffer = {}
+        self._chunk_cache = {}
+        self.flush()
+
+    def open( self ):
+        index = load( self._get_file_name( 'index.npz' ) )
+        self.chunk_size = int( index['chunk_size'] )
+        self.compress = bool( index['compress'] )
+        self._t_list = list( index['t'] )
+        self._keys = [ str( key ) for key in index['keys'] ]
+        self._steps = {}
+        self._chunk_offsets = {}
+        self._buffer = {}
+        self._chunk_cache = {}
+        for v_id, key in enumerate( self._keys ):
+            self._steps[ key ] = list( index[ 'steps_%d' % v_id ] )
+            self._chunk_offsets[ key ] = list( index[ 'chunks_%d' % v_id ] )
+            self._buffer[ key ] = []
+            # continue the last (possibly incomplete) chunk
+            n_entries = len( self._steps[ key ] )
+            offset = self._chunk_offsets[ key ][-1]
+            if n_entries - offset < self.chunk_size and n_entries > offset:
+                c_id = len( self._chunk_offsets[ key ] ) - 1
+                self._buffer[ key ] = list( self._load_chunk( key, c_id ) )
+            elif n_entries > offset:
+                self._chunk_offsets[ key ].append( n_entries )
+        index.close()
+
+    def append( self, t, values ):
+        step = len( self._t_list )
+        self._t_list.append( float( t ) )
+        for key, value in values.items():
+            value = array( value )
+            if key not in self._steps:
+                self._keys.append( key )
+                self._steps[ key ] = []
+                self._chunk_offsets[ key ] = [ 0 ]
+                self._buffer[ key ] = []
+            buffer = self._buffer[ key ]
+            # start a new chunk if the shape of the variable has changed
+            #
+            if len( buffer ) > 0 and buffer[0].shape != value.shape:
+                self._write_chunk( key )
+                self._chunk_offsets[ key ].append( len( self._steps[ key ] ) )
+                del buffer[:]
+            buffer.append( value )
+            self._steps[ key ].append( step )
+            if len( buffer ) == self.chunk_size:
+                self._write_chunk( key )
+                self._chunk_offsets[ key ].append( len( self._steps[ key ] ) )
+                del buffer[:]
+                self._write_index()
+
+    def _write_chunk( self, key ):
+        v_id = self._keys.index( key )
+        c_id = len( self._chunk_offsets[ key ] ) - 1
+        chunk = array( self._buffer[ key ] )
+        file_name = self._get_chunk_file( v_id, c_id )
+        if self.compress:
+            savez_compressed( file_name, chunk )
+        else:
+            save( file_name, chunk )
+        self._chunk_cache.pop( ( key, c_id ), None )
+
+    def _write_index( self ):
+        index = { 't' : array( self._t_list, dtype = float_ ),
+                  'keys' : array( self._keys, dtype = str ),
+                  'chunk_size' : array( self.chunk_size ),
+                  'compress' : array( self.compress ) }
+        for v_id, key in enumerate( self._keys ):
+            index[ 'steps_%d' % v_id ] = array( self._steps[ key ], dtype = int_ )
+            offsets = self._chunk_offsets[ key ]
+            if len( self._buffer[ key ] ) == 0 and len( offsets ) > 1:
+                # the empty current chunk is not written
+                offsets = offsets[:-1]
+            index[ 'chunks_%d' % v_id ] = array( offsets, dtype = int_ )
+        # replace the index at once
+        #
+        tmp_name = self._get_file_name( 'index_tmp.npz' )
+        savez( tmp_name, **index )
+        index_name = self._get_file_name( 'index.npz' )
+        if os.name == 'nt' and os.path.exists( index_name ):
+            os.remove( index_name )
+        os.rename( tmp_name, index_name )
+
+    def flush( self ):
+        for key in self._keys:
+            if len( self._buffer[ key ] ) > 0:
+                self._write_chunk( key )
+        self._write_index()
+
+    def _get_t_arr( self ):
+        return array( self._t_list, dtype = float_ )
+
+    def _get_keys( self ):
+        return list( self._keys )
+
+    def get_steps( self, key ):
+        return array( self._steps[ key ], dtype = int_ )
+
+    def _load_chunk( self, key, c_id ):
+        '''Load the chunk, use the values of the current chunk
+        if they have not been written yet.
+        '''
+        if c_id == len( self._chunk_offsets[ key ] ) - 1 and len( self._buffer[ key ] ) > 0:
+            return array( self._buffer[ key ] )
+        chunk = self._chunk_cache.get( ( key, c_id ), None )
+        if chunk is None:
+            file_name = self._get_chunk_file( self._keys.index( key ), c_id )
+            if self.compress:
+                chunk = load( file_name )['arr_0']
+            else:
+                chunk = load( file_name, mmap_mode = 'r' )
+            self._chunk_cache[ ( key, c_id ) ] = chunk
+        return chunk
+
+    def get_values( self, key, step = -1 ):
+        step = self._get_step_idx( step )
+        steps = self._steps[ key ]
+        entry = searchsorted( steps, step )
+        if entry == len( steps ) or steps[ entry ] != step:
+            return None
+        c_id = searchsorted( self._chunk_offsets[ key ], entry, side = 'right' ) - 1
+        return self._load_chunk( key, c_id )[ entry - self._chunk_offsets[ key ][ c_id ] ]
+
+    def get_history( self, key ):
+        n_entries = len( self._steps[ key ] )
+        chunks = [ self._load_chunk( key, c_id )
+                   for c_id, offset in enumerate( self._chunk_offsets[ key ] )
+                   if offset < n_entries ]
+        return concatenate( chunks )
+
+class RTraceStoreHDF5( RTraceStore ):
+    '''
+    Result store in a HDF5 file (requires h5py).
+
+    Every variable is stored in a group containing the dataset of the
+    values, chunked along the time steps and compressed, and the dataset
+    of the recorded steps. The datasets are read lazily - the values
+    of a time step are loaded on request. The shape of a variable
+    must be constant during the history.
+    '''
+
+    _h5 = Any
+
+    _buffer = Dict
+
+    _buffer_steps = Dict
+
+    _t_buffer = List
+
+    def _open_file( self, mode ):
+        import h5py
+        if self._h5 != None:
+            self._h5.close()
+        self._h5 = h5py.File( self.file, mode )
+        self._buffer = {}
+        self._buffer_steps = {}
+        self._t_buffer = []
+
+    def create( self ):
+        self._open_file( 'w' )
+        self._h5.create_dataset( 't', shape = ( 0, ), maxshape = ( None, ),
+                                 dtype = float_, chunks = ( self.chunk_size, ) )
+
+    def open( self ):
+        self._open_file( 'a' )
+
+    def _append_data( self, ds, values ):
+        n = ds.shape[0]
+        ds.resize( ( n + len( values ), ) + ds.shape[1:] )
+        ds[ n: ] = values
+
+    def append( self, t, values ):
+        step = self._h5['t'].shape[0] + len( self._t_buffer )
+        self._t_buffer.append( float( t ) )
+        for key, value in values.items():
+            # copy - the arrays of the time stepper are updated in place
+            #
+            value = array( value )
+            if key not in self._buffer:
+                self._buffer[ key ] = []
+                self._buffer_steps[ key ] = []
+            self._buffer[ key ].append( value )
+            self._buffer_steps[ key ].append( step )
+        if len( self._t_buffer ) >= self.chunk_size:
+            self.flush()
+
+    def flush( self ):
+        if self._h5 == None:
+            return
+        h5 = self._h5
+        for key, values in self._buffer.items():
+            if len( values ) == 0:
+                continue
+            if key not in h5:
+                shape = values[0].shape
+                grp = h5.create_group( key )
+                grp.create_dataset( 'values', shape = ( 0, ) + shape,
+                                    maxshape = ( None, ) + shape,
+                                    dtype = values[0].dtype,
+                                    chunks = ( self.chunk_size, ) + shape,
+                                    compression = self.compress and 'gzip' or None )
+                grp.create_dataset( 'steps', shape = ( 0, ), maxshape = ( None, ),
+                                    dtype = int_, chunks = ( self.chunk_size, ) )
+            grp = h5[ key ]
+            if grp['values'].shape[1:] != values[0].shape:
+                raise ValueError, 'variable %s changed its shape from %s to %s' % \
+                    ( key, grp['values'].shape[1:], values[0].shape )
+            self._append_data( grp['values'], array( values ) )
+            self._append_data( grp['steps'], array( self._buffer_steps[ key ] ) )
+            self._buffer[ key ] = []
+            self._buffer_steps[ key ] = []
+        if len( self._t_buffer ) > 0:
+            self._append_data( h5['t'], array( self._t_buffer ) )
+            self._t_buffer = []
+        h5.flush()
+
+    def close( self ):
+        self.flush()
+        if self._h5 != None:
+            self._h5.close()
+            self._h5 = None
+
+    def _get_t_arr( self ):
+        self.flush()
+        return self._h5['t'][:]
+
+    def _get_keys( self ):
+        self.flush()
+        return [ str( key ) for key in self._h5.keys() if key != 't' ]
+
+    def get_steps( self, key ):
+        self.flush()
+        return self._h5[ key ]['steps'][:]
+
+    def get_values( self, key, step = -1 ):
+        step = self._get_step_idx( step )
+        steps = self.get_steps( key )
+        entry = searchsorted( steps, step )
+        if entry == len( steps ) or steps[ entry ] != step:
+            return None
+        return self._h5[ key ]['values'][ entry ]
+
+    def get_history( self, key ):
+        self.flush()
+        return self._h5[ key ]['values'][:]
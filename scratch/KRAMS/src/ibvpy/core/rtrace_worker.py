@@ -0,0 +1,161 @@
+
+from enthought.traits.api import HasTraits, Int, Float, Any, List, Bool
+
+from Queue import Empty, Full
+import multiprocessing
+import traceback
+import os
+
+class RTraceWorker( HasTraits ):
+    '''
+    Evaluation of the response traces in a separate process.
+
+    The worker process is forked at the beginning of the computation
+    (TLoop.eval) and inherits the model. The time loop hands over
+    the snapshots of the recorded states (time, control variable, state
+    arrays of the domains and the resultant vectors) through a bounded
+    queue, so that the time loop is blocked if the worker falls behind
+    by more than queue_size snapshots (backpressure). The worker loads
+    the snapshot into its copy of the model, evaluates the traces and
+    returns their current values (RTrace.get_current_values). These are
+    passed to the traces in the main process in the order of recording
+    (RTraceMngr.apply_values).
+
+    Only the traces supporting the transfer of their values
+    (RTrace.supports_async) are evaluated in the worker, the others are
+    evaluated in the main process. Without fork (e.g. on Windows)
+    the traces are evaluated synchronously.
+
+    An exception raised in the worker is passed back and raised again
+    by the time loop (as RuntimeError with the traceback of the worker).
+    The time loop also stops waiting if the worker process has died.
+    '''
+
+    # maximum number of snapshots waiting for the evaluation
+    #
+    queue_size = Int( 4 )
+
+    # interval [s] of checking the worker process while waiting for it
+    #
+    poll_interval = Float( 1.0 )
+
+    active = Bool( False )
+
+    _process = Any
+
+    _tasks = Any
+
+    _results = Any
+
+    # snapshots handed over to the worker but not yet applied
+    #
+    _pending = List
+
+    _rtrace_mngr = Any
+
+    def start( self, tloop ):
+        '''Fork the worker process, return False if not available.
+        '''
+        self.stop()
+        if not hasattr( os, 'fork' ):
+            return False
+        self._rtrace_mngr = tloop.rtrace_mngr
+        self._tasks = multiprocessing.Queue( self.queue_size )
+        self._results = multiprocessing.Queue()
+        self._pending = []
+        self._process = multiprocessing.Process( target = self._run,
+                                                 args = ( tloop, ) )
+        self._process.daemon = True
+        self._process.start()
+        self.active = True
+        return True
+
+    def _run( self, tloop ):
+        '''Evaluation loop of the worker process.
+        '''
+        tstepper = tloop.tstepper
+        rtrace_mngr = tstepper.rtrace_mngr
+        while True:
+            task = self._tasks.get()
+            if task == None:
+                break
+            try:
+                update_on, snapshot = task
+                tloop.t_n1 = snapshot['t']
+                U_k = tstepper.U_k
+                U_k[:] = snapshot['U_k']
+                for key, state_array in rtrace_mngr.get_state_arrays().items():
+                    state_array[:] = snapshot[ key ]
+                if 'F_int' in snapshot:
+                    tstepper.F_int = snapshot['F_int']
+                tstepper.F_ext[:] = snapshot['F_ext']
+                sctx = tstepper.sctx
+                sctx.update_state_on = False
+                values = rtrace_mngr.eval_values( update_on, sctx, U_k,
+                                                  rtrace_mngr.get_traces( True ) )
+            except Exception:
+                # the exception itself need not be picklable
+                self._results.put( ( traceback.format_exc(), None ) )
+                break
+            self._results.put( ( None, values ) )
+
+    def submit( self, update_on, snapshot, store_values ):
+        '''Hand over the snapshot, wait if the queue is full.
+        The values of the synchronously evaluated traces to be stored
+        (store_values) are kept until the snapshot has been evaluated.
+        '''
+        self.collect( block = False )
+        self._pending.append( ( update_on, snapshot, store_values ) )
+        while True:
+            try:
+                self._tasks.put( ( update_on, snapshot ), True, self.poll_interval )
+                return
+            except Full:
+                # the worker may have failed meanwhile
+                self.collect( block = False )
+                self._check_alive()
+
+    def collect( self, block = True ):
+        '''Apply the values returned by the worker, wait for all
+        of them if block is set.
+        '''
+        while len( self._pending ) > 0:
+            if not block and self._results.empty():
+                return
+            try:
+                error, values = self._results.get( True, self.poll_interval )
+            except Empty:
+                self._check_alive()
+                continue
+            if error != None:
+                self._terminate()
+                raise RuntimeError, 'evaluation of the response traces failed:\n' + error
+            update_on, snapshot, store_values = self._pending.pop( 0 )
+            self._rtrace_mngr.apply_values( update_on, snapshot, values, store_values )
+
+    def _check_alive( self ):
+        if not self._process.is_alive() and self._results.empty():
+            exitcode = self._process.exitcode
+            self._terminate()
+            raise RuntimeError, 'response trace worker terminated (exit code %s)' % exitcode
+
+    def _terminate( self ):
+        '''Discard the pending snapshots and kill the worker.
+        '''
+        self._pending = []
+        if self._process.is_alive():
+            self._process.terminate()
+        self._process.join()
+        self._process = None
+        self.active = False
+
+    def stop( self ):
+        '''Apply the remaining values and terminate the worker.
+        '''
+        if not self.active:
+            return
+        self.collect()
+        self._tasks.put( None )
+        self._process.join()
+        self._process = None
+        self.active = False
@@ -39,6 +39,8 @@ from scipy.linalg import norm, solve
 
 from ibvpy.core.rtrace_mngr import RTraceMngr
 from ibvpy.core.astrategy import AStrategyBase
+from ibvpy.core.iter_control import IterControl
+from ibvpy.core.tloop_checkpoint import TLoopCheckpoint, load_snapshot
 
 from threading import Thread
 import time
@@ -206,6 +208,29 @@ class TLoop( IBVResource ):
     RESETMAX = Int( 10 )
     tolerance = Float( 1e-8 )
 
+    # Modified Newton-Raphson scheme - the factorization of the system
+    # matrix is refreshed at the beginning of each time step and then
+    # after every modified_newton_k iterations. The value 1 corresponds
+    # to the full Newton-Raphson scheme. Only effective with a solver
+    # supporting the reuse of the factorization (see TStepper.solver).
+    #
+    modified_newton_k = Int( 1 )
+
+    # Control of the equilibrium iteration within a time step
+    # (Newton-Raphson, line search, arc-length, see iter_control)
+    #
+    iter_control = Instance( IterControl )
+    def _iter_control_default( self ):
+        return IterControl()
+
+    # Periodic snapshots of the computation (see resume)
+    #
+    checkpoint = Instance( TLoopCheckpoint )
+
+    # snapshot to continue from in the next call to eval
+    #
+    _snapshot = Any
+
     # 
     #
     adap = Trait( AStrategyBase() )
@@ -226,6 +251,10 @@ class TLoop( IBVResource ):
                  'U_k'         : lambda sctx, U_k, *args, **kw: self.U_k,
         }
 
+    # If off, the response traces are refreshed in the user interface
+    # by a timer and, if a worker is specified (rtrace_mngr.rtrace_worker),
+    # they are evaluated asynchronously in a separate process.
+    #
     sync_resp_tracing = Bool( False )
 
     def __init__( self, *args, **kwtraits ):
@@ -285,10 +314,66 @@ class TLoop( IBVResource ):
         self.tot_k = 0.0
         self.ttot_k = 0.0
         self.norm = 1.0
+        self.step_stats = []
+        self.n_rejected_steps = 0
         self._reset = False
 
     debug = Bool( False )
 
+    #-------------------------------------------------------------------
+    # Statistics of the time steps
+    #-------------------------------------------------------------------
+
+    # List of dictionaries with the entries for each accepted time step
+    # 't'             - time (load factor) of the equilibrium
+    # 'd_t'           - length of the time step
+    # 'n_iter'        - number of iterations in the accepted attempt
+    # 'n_rejected'    - number of rejected attempts (restarts of the step)
+    # 'n_extra_evals' - additional evaluations required by the iteration
+    #                   control (e.g. line search)
+    # 'time'          - computation time including the rejected attempts
+    #
+    step_stats = List
+
+    # total number of rejected attempts
+    #
+    n_rejected_steps = Int( 0 )
+
+    def get_step_stats( self, key ):
+        '''Return the array of the values of the step statistics
+        for the specified key.
+        '''
+        return array( [ stats[ key ] for stats in self.step_stats ] )
+
+    def _record_step_stats( self ):
+        self.step_stats.append( { 't' : self.t_n1,
+                                  'd_t' : self.t_n1 - self.t_n,
+                                  'n_iter' : self.k,
+                                  'n_rejected' : self._n_rejected_step,
+                                  'n_extra_evals' : self.iter_control.n_extra_evals,
+                                  'time' : time.time() - self._step_start } )
+        self._n_rejected_step = 0
+        self._step_start = time.time()
+
+    def _reject_step( self ):
+        self._n_rejected_step += 1
+        self.n_rejected_steps += 1
+
+    def eval_residual( self, step_flag ):
+        '''Evaluate the system matrix and the residuum for the current
+        state of the control variables (U_k, d_U, t_n1) and include 
+        the constraints in the system. 
+
+        Used by the iteration control to evaluate trial states.
+        '''
+        K, R = self.tstepper.eval( step_flag,
+                                   self.U_k,
+                                   self.d_U,
+                                   self.t_n,
+                                   self.t_n1 )
+        K.apply_constraints( R )
+        return K, R
+
     def get_initial_state( self ):
         self.setup()
         self.t_n1 = self.t_n
@@ -308,25 +393,41 @@ class TLoop( IBVResource ):
 
         adap = self.adap
         tstepper = self.tstepper
+        iter_control = self.iter_control
+        iter_control.tloop = self
         self.setup()
 
-        self.t_n1 = self.t_n
-        self.U_k[:] = self.U_n[:]
-        self.d_U[:] = 0.0
-        self.norm = 1
-
-        if self.DT:
-            self.d_t = self.DT
-            warn( 'DEPRECATED: DT attribute of tloop should not be used'
-                 'set the step attribute of TLine instead', DeprecationWarning )
+        if self._snapshot != None:
+            self._set_snapshot( self._snapshot )
+            self._snapshot = None
         else:
-            self.d_t = self.tline.step
+            self.rtrace_mngr.open_store()
+
+            self.t_n1 = self.t_n
+            self.U_k[:] = self.U_n[:]
+            self.d_U[:] = 0.0
+            self.norm = 1
+
+            if self.DT:
+                self.d_t = self.DT
+                warn( 'DEPRECATED: DT attribute of tloop should not be used'
+                     'set the step attribute of TLine instead', DeprecationWarning )
+            else:
+                self.d_t = self.tline.step
+
+            self.ls_counter = -1
 
-        self.ls_counter = -1
+        if self.checkpoint != None:
+            self.checkpoint.start()
+
+        if not self.sync_resp_tracing:
+            self.rtrace_mngr.start_async( self )
 
         # Measure computation time
 
         self.eval_timer.reset()
+        self._n_rejected_step = 0
+        self._step_start = time.time()
 
         if self.verbose_load_step:
             print '======= Time range: %g -> %g =========' % ( self.tline.min, self.tline.max )
@@ -340,6 +441,7 @@ class TLoop( IBVResource ):
                 not self.user_wants_abort:
 
             self.adap.begin_time_step( self.t_n1 )
+            iter_control.begin_step()
 
             self.iter_timer.reset()
 
@@ -351,6 +453,7 @@ class TLoop( IBVResource ):
             self.report_load_step_start()
             self.k = 0
             step_flag = 'predictor'
+            K_R = None
             while self.k < self.KMAX:
 
                 self.report_iteration()
@@ -364,12 +467,20 @@ class TLoop( IBVResource ):
                 # Extract the matrix representation of the time t_n1
                 # stepper for the given time and control variable u
                 #
-                self.crpr_timer.reset()
-                K, R = tstepper.eval( step_flag,
-                                      self.U_k,
-                                      self.d_U,
-                                      self.t_n,
-                                      self.t_n1 )
+                if K_R == None:
+                    self.crpr_timer.reset()
+                    K, R = tstepper.eval( step_flag,
+                                          self.U_k,
+                                          self.d_U,
+                                          self.t_n,
+                                          self.t_n1 )
+                    constrained = False
+                else:
+                    # the state has already been evaluated 
+                    # by the iteration control
+                    K, R = K_R
+                    K_R = None
+                    constrained = True
 
                 if self.debug:
                     print 'K\n', K
@@ -388,6 +499,8 @@ class TLoop( IBVResource ):
                     self.t_n1 = self.t_n + self.d_t
                     step_flag = 'predictor'
                     self.k = 0
+                    self._reject_step()
+                    iter_control.begin_step()
 
                     if LOGGING_ON:
                         log.info( "redo time step" )
@@ -396,7 +509,8 @@ class TLoop( IBVResource ):
                 # the residuum must now learn about its constraints
                 # so that the constrained equations are marked as fulfilled
                 #
-                K.apply_constraints( R )
+                if not constrained:
+                    K.apply_constraints( R )
 
                 if self.debug:
                     print 'constrained K\n', K
@@ -407,14 +521,20 @@ class TLoop( IBVResource ):
                 if self.debug:
                     print 'Norm:', self.norm
 
-                if self.norm < self.tolerance:  # convergence satisfied
+                if iter_control.is_converged( step_flag ): # convergence satisfied
                     self.n_reset = 0
                     if LOGGING_ON:
                         log.info( "time step equilibrated in %d step(s)", self.k )
                     break                        # update_switch -> on
 
                 self.solv_timer.reset()
-                self.d_U = K.solve()  # DG_k * d_U = r
+                if step_flag == 'predictor' or \
+                    self.k % self.modified_newton_k == 0:
+                    K.refresh_solver()
+
+                # solve for the correction and update U_k, d_U (and t_n1)
+                #
+                K_R = iter_control.correct( K, step_flag )
 
                 if self.debug:
                     print 'd_U\n', self.d_U
@@ -422,8 +542,6 @@ class TLoop( IBVResource ):
                 self.solv_timer.record()
                 #self.solv_timer.report()
 
-                self.U_k += self.d_U
-
                 self.k += 1
                 self.tot_k += 1
                 self.ttot_k += 1
@@ -434,6 +552,7 @@ class TLoop( IBVResource ):
                 if LOGGING_ON:
                     log.info( "no convergence reached - refinement in time" )
                 self.n_reset = self.n_reset + 1  # adaptive strategy halving d_t
+                self._reject_step()
                 if self.n_reset > self.RESETMAX: # max number of resets achieved
 
                     # Handle this situation with an exception with an
@@ -441,6 +560,11 @@ class TLoop( IBVResource ):
                     # iteration process
                     #
                     # @TODO raise the NoConvergence exception
+                    self.rtrace_mngr.stop_async()
+                    # keep the steps accepted so far
+                    self.rtrace_mngr.flush_store()
+                    if self.checkpoint != None:
+                        self.checkpoint.finish()
                     if not self.sync_resp_tracing:
                         self.rtrace_mngr.stop_timer()
                         self.rtrace_mngr.timer_tick()
@@ -463,19 +587,28 @@ class TLoop( IBVResource ):
             if adap.ehandler_needed(): # explicit adaptations 
                 if adap.ehandler_accept():  # accept equilibrium?
                     self.accept_time_step() # register the state and response
+                    iter_control.end_step()
+                    self._record_step_stats()
                 adap.ehandler_invoke()
             else:
                 self.accept_time_step()
+                iter_control.end_step()
+                self._record_step_stats()
                 self.adap.end_time_step( self.t_n1 )
 
-                # Set new target time
-                self.d_t *= adap.ehandler_get_scale()
+                # Set new target time (including the prediction 
+                # of the step size by the iteration control)
+                self.d_t *= adap.ehandler_get_scale() * \
+                    iter_control.get_step_scale( self.k )
                 self.t_n = self.t_n1
                 self.t_n1 = self.t_n + self.d_t
                 self.tline.val = self.t_n1
 
                 self.report_load_step_end()
 
+                if self.checkpoint != None:
+                    self.checkpoint.step_accepted( self )
+
 
         # Hack to get the state variables in the last time step.
         # This invokes the update state operator in the
@@ -493,6 +626,11 @@ class TLoop( IBVResource ):
 #                          self.t_n1 )
 #        self.accept_time_step()
 
+        self.rtrace_mngr.stop_async()
+        self.rtrace_mngr.flush_store()
+        if self.checkpoint != None:
+            self.checkpoint.finish()
+
         # Report computation time
         #
         self.eval_timer.record()
@@ -507,6 +645,90 @@ class TLoop( IBVResource ):
 #        print 'U_k at the end of tloop.eval: U_k', self.U_k
         return self.U_k
 
+    #-------------------------------------------------------------------
+    # Checkpoint and restart
+    #-------------------------------------------------------------------
+    def get_snapshot( self ):
+        '''Return the state of the computation after the accepted time step
+        as a dictionary of arrays (see TLoopCheckpoint).
+
+        The state of the material points is completed lazily by the first
+        evaluation of the next step (sctx.update_state_on), so that the
+        increment d_U and the update flag are included as well.
+        The boundary conditions are given by the time t_n.
+        '''
+        self.rtrace_mngr.wait()
+        snapshot = { 't_n' : self.t_n,
+                     'd_t' : self.d_t,
+                     'U_n' : self.U_n,
+                     'd_U' : self.d_U,
+                     'update_state_on' : bool( self.tstepper.sctx.update_state_on ),
+                     'ls_counter' : self.ls_counter,
+                     'tot_k' : self.tot_k,
+                     'n_rejected_steps' : self.n_rejected_steps }
+        if len( self.step_stats ) > 0:
+            for key in self.step_stats[0].keys():
+                snapshot[ 'step_stats.' + key ] = self.get_step_stats( key )
+        for key, value in self.iter_control.get_state().items():
+            snapshot[ 'iter_control.' + key ] = value
+        rtrace_mngr = self.rtrace_mngr
+        for key, state_array in rtrace_mngr.get_state_arrays().items():
+            snapshot[ key ] = state_array
+        for i, rtrace in enumerate( rtrace_mngr.get_values() ):
+            for key, value in rtrace.get_buffers().items():
+                snapshot[ 'rtrace.%d.%s' % ( i, key ) ] = value
+        if rtrace_mngr.store != None:
+            snapshot[ 'store_n_steps' ] = rtrace_mngr.store.n_steps
+        return snapshot
+
+    def _set_snapshot( self, snapshot ):
+        '''Restore the state of the computation from the snapshot.
+        '''
+        self.t_n = float( snapshot['t_n'] )
+        self.d_t = float( snapshot['d_t'] )
+        self.t_n1 = self.t_n + self.d_t
+        self.tline.val = self.t_n1
+        self.U_n = snapshot['U_n'].copy()
+        self.U_k[:] = self.U_n
+        self.d_U[:] = snapshot['d_U']
+        self.tstepper.sctx.update_state_on = bool( snapshot['update_state_on'] )
+        self.norm = 1
+        self.ls_counter = int( snapshot['ls_counter'] )
+        self.tot_k = float( snapshot['tot_k'] )
+        self.n_rejected_steps = int( snapshot['n_rejected_steps'] )
+
+        stats_keys = [ key[ len( 'step_stats.' ): ] for key in snapshot.keys()
+                       if key.startswith( 'step_stats.' ) ]
+        if len( stats_keys ) > 0:
+            n_stats = len( snapshot[ 'step_stats.' + stats_keys[0] ] )
+            self.step_stats = [ dict( [ ( key, snapshot[ 'step_stats.' + key ][ i ].item() )
+                                        for key in stats_keys ] )
+                                for i in range( n_stats ) ]
+        self.iter_control.set_state( self._get_snapshot_group( snapshot, 'iter_control.' ) )
+
+        rtrace_mngr = self.rtrace_mngr
+        for key, state_array in rtrace_mngr.get_state_arrays().items():
+            state_array[:] = snapshot[ key ]
+        for i, rtrace in enumerate( rtrace_mngr.get_values() ):
+            rtrace.set_buffers( self._get_snapshot_group( snapshot, 'rtrace.%d.' % i ) )
+        if rtrace_mngr.store != None:
+            rtrace_mngr.open_store( new = False )
+            rtrace_mngr.store.truncate( int( snapshot.get( 'store_n_steps', 0 ) ) )
+
+    def _get_snapshot_group( self, snapshot, prefix ):
+        return dict( [ ( key[ len( prefix ): ], value )
+                       for key, value in snapshot.items()
+                       if key.startswith( prefix ) ] )
+
+    def resume( self, file_name ):
+        '''Continue the computation from the snapshot written
+        by the checkpoint (the model must be constructed
+        in the same way as in the interrupted computation).
+        '''
+        self._snapshot = load_snapshot( file_name )
+        self._reset = True
+        return self.eval()
+
     on_accept_time_step = Callable( lambda : None )
 
     def accept_time_step( self ):
@@ -532,7 +754,7 @@ class TLoop( IBVResource ):
         '''Record current state in the state array.
         '''
         self.rtrace_mngr_timer.reset()
-        self.rtrace_mngr.record_equilibrium( self.tstepper.sctx, self.U_k )
+        self.rtrace_mngr.record_equilibrium( self.tstepper.sctx, self.U_k, self.t_n1 )
         self.rtrace_mngr_timer.record()
 
     verbose_load_step = Bool( True )
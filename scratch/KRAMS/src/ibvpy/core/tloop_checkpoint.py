@@ -0,0 +1,149 @@
+
+from enthought.traits.api import \
+    HasTraits, Str, Int, Float, Bool, List, Any
+
+from numpy import asarray, load, savez, savez_compressed
+
+from threading import Thread
+import time
+import sys
+import os
+
+def load_snapshot( file_name ):
+    '''Read the snapshot written by TLoopCheckpoint
+    and return it as a dictionary of arrays.
+    '''
+    npz = load( file_name )
+    snapshot = dict( [ ( key, npz[ key ] ) for key in npz.files ] )
+    npz.close()
+    return snapshot
+
+class TLoopCheckpoint( HasTraits ):
+    '''
+    Periodic snapshots of the time loop enabling the restart
+    of an interrupted computation (see TLoop.resume).
+
+    A snapshot is written every n_steps accepted time steps and/or
+    after interval seconds since the last one. The values supplied
+    by the time loop (TLoop.get_snapshot) are copied into one of two
+    buffers and written to the file by a background thread, so that the
+    computation continues during the writing. The time loop is only
+    blocked if the buffer to be filled is still being written. The writing
+    threads are chained so that the snapshots are written in the order
+    of their creation. The file is replaced at once, an interrupted
+    writing leaves the previous snapshot intact. An exception raised
+    by the writing thread is raised again by the next write or by finish.
+    '''
+
+    # snapshot file (numpy npz format)
+    #
+    file = Str
+
+    # write a snapshot every n_steps accepted steps (0 - not used)
+    #
+    n_steps = Int( 0 )
+
+    # write a snapshot after interval seconds (0 - not used)
+    #
+    interval = Float( 0.0 )
+
+    compress = Bool( False )
+
+    _buffers = List
+    def __buffers_default( self ):
+        return [ {}, {} ]
+
+    _threads = List
+    def __threads_default( self ):
+        return [ None, None ]
+
+    _idx = Int( 0 )
+
+    _n_accepted = Int( 0 )
+
+    _last_time = Float( 0.0 )
+
+    # exception info of the failed writing
+    #
+    _error = Any
+
+    def start( self ):
+        '''Start counting the accepted steps.'''
+        self._n_accepted = 0
+        self._last_time = time.time()
+
+    def is_due( self ):
+        if self.n_steps > 0 and self._n_accepted >= self.n_steps:
+            return True
+        if self.interval > 0 and time.time() - self._last_time >= self.interval:
+            return True
+        return False
+
+    def step_accepted( self, tloop ):
+        '''Register the accepted step, write the snapshot if due.
+        '''
+        self._n_accepted += 1
+        if self.is_due():
+            self.write( tloop.get_snapshot() )
+
+    def write( self, snapshot ):
+        '''Copy the snapshot into the free buffer and start the writing.
+        '''
+        idx = self._idx
+        if self._threads[ idx ] != None:
+            self._threads[ idx ].join()
+        self._check_error()
+        buffer = self._buffers[ idx ]
+        for key in buffer.keys():
+            if key not in snapshot:
+                del buffer[ key ]
+        for key, value in snapshot.items():
+            value = asarray( value )
+            buf = buffer.get( key, None )
+            if buf is None or buf.shape != value.shape or buf.dtype != value.dtype:
+                buffer[ key ] = value.copy()
+            else:
+                buf[...] = value
+        thread = Thread( target = self._write_buffer,
+                         args = ( buffer, self._threads[ 1 - idx ] ) )
+        thread.start()
+        self._threads[ idx ] = thread
+        self._idx = 1 - idx
+        self._n_accepted = 0
+        self._last_time = time.time()
+
+    def _write_buffer( self, buffer, prev_thread ):
+        if prev_thread != None:
+            prev_thread.join()
+        if self._error != None:
+            # keep the last valid snapshot
+            return
+        try:
+            tmp_name = self.file + '.tmp'
+            f = open( tmp_name, 'wb' )
+            try:
+                if self.compress:
+                    savez_compressed( f, **buffer )
+                else:
+                    savez( f, **buffer )
+            finally:
+                f.close()
+            if os.name == 'nt' and os.path.exists( self.file ):
+                os.remove( self.file )
+            os.rename( tmp_name, self.file )
+        except:
+            self._error = sys.exc_info()
+
+    def _check_error( self ):
+        '''Raise the exception of the failed writing thread.'''
+        if self._error != None:
+            exc_type, exc_value, exc_tb = self._error
+            self._error = None
+            raise exc_type, exc_value, exc_tb
+
+    def finish( self ):
+        '''Wait until the snapshots are written.'''
+        for thread in self._threads:
+            if thread != None:
+                thread.join()
+        self._check_error()
@@ -26,6 +26,8 @@ from ibv_resource import IBVResource
 from tstepper_eval import ITStepperEval
 from mathkit.matrix_la.sys_mtx_assembly import SysMtxAssembly
 from mathkit.matrix_la.sys_mtx_assembly import SysMtxArray
+from mathkit.matrix_la.lin_solver import LinSolver
+from parallel_executor import ParallelExecutor
 
 from ibvpy.mesh.fe_domain import FEDomain
 from ibvpy.mesh.fe_refinement_grid import FERefinementGrid
@@ -180,6 +182,30 @@ class TStepper( IBVResource ):
 
     dof_resultants = Bool( True )
 
+    # Format of the system matrix used by the linear solver
+    # (see SysMtxAssembly.matrix_type). The 'csr' format reuses the sparsity
+    # pattern between the iterations until the structure of the domain changes.
+    #
+    matrix_type = Enum( 'coord', 'dense', 'csr' )
+
+    # Solution strategy for the linear system (see SysMtxAssembly.solver)
+    # e.g. LinSolverLU reusing the factorization in the modified
+    # Newton-Raphson scheme (TLoop.modified_newton_k).
+    #
+    solver = Instance( LinSolver )
+
+    # Handling of the essential boundary conditions in the system matrix
+    # (see SysMtxAssembly.constraint_handling). With 'eliminate' the
+    # constrained dofs are removed from the solved system.
+    #
+    constraint_handling = Enum( 'modify', 'eliminate' )
+
+    # Evaluation of the elements in parallel processes over the partitions
+    # of the domain (see ParallelExecutor). If None, the elements
+    # are evaluated sequentially.
+    #
+    executor = Instance( ParallelExecutor )
+
     rte_dict = Property( Dict, depends_on = 'tse' )
     @cached_property
     def _get_rte_dict( self ):
@@ -210,6 +236,18 @@ class TStepper( IBVResource ):
     def new_resp_var( self ):
         return self.tse_integ.new_resp_var()
 
+    def get_load_vector( self, t ):
+        '''Return the vector of external forces given by the natural
+        boundary conditions at the time t.
+
+        Note that the values of the essential boundary conditions
+        are set to zero (corrector) as a side effect.
+        '''
+        F_ext = self.new_resp_var()
+        F_ext[:] = 0.0
+        self.bcond_mngr.apply( 'corrector', self.sctx, self.K, F_ext, t, t )
+        return F_ext
+
     U_k = Property( depends_on = '_sdomain.changed_structure' )
     @cached_property
     def _get_U_k( self ):
@@ -265,9 +303,16 @@ class TStepper( IBVResource ):
         #
         self.rtrace_mngr.setup( self.sdomain )
 
+        # Restart the worker processes so that they get the current model
+        #
+        if self.executor != None:
+            self.executor.reset()
+
         # Set up the system matrix
         #
-        self.K = SysMtxAssembly()
+        self.K = SysMtxAssembly( matrix_type = self.matrix_type,
+                                 solver = self.solver,
+                                 constraint_handling = self.constraint_handling )
 
         # Register the essential boundary conditions in the system matrix
         #
@@ -289,6 +334,14 @@ class TStepper( IBVResource ):
         self.args = []
 
 
+    @on_trait_change( '_sdomain.changed_structure' )
+    def _reset_sys_mtx_structure( self ):
+        '''Invalidate the sparsity pattern cached in the system matrix.
+        '''
+        K = getattr( self, 'K', None )
+        if K != None:
+            K.changed_structure = True
+
     def eval( self, step_flag, U_k, d_U, t_n, t_n1 ):
         '''Get the tangential operator (system matrix) and residuum
         associated with the current time step.
@@ -407,6 +460,10 @@ class TStepper( IBVResource ):
         self.sctx.update_state_on = True
         #self.tse_integ.update_state( sctx, U )
 
+        # accept the trial state of the batch evaluated material points
+        #
+        self.tse_integ.commit_state()
+
     def register_mv_pipelines( self, e ):
         '''Register the visualization pipelines in mayavi engine
         '''
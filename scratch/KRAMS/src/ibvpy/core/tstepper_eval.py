@@ -55,6 +55,13 @@ class TStepperEval( HasTraits ):
         '''
         pass
     
+    def commit_state( self ):
+        '''
+        Accept the trial values of the state variables
+        (called upon an accepted time step).
+        '''
+        pass
+
     def apply_constraints( self, K ):
         '''
         Apply implicity constraints associated with internal mappings
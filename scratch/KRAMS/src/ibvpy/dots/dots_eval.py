@@ -14,7 +14,7 @@ from enthought.traits.ui.menu import \
 
 from numpy import \
      zeros, float_, ix_, meshgrid, repeat, arange, array, dot, \
-     tensordot, sum
+     tensordot, sum, einsum, bincount, ndarray
 
 from ibvpy.core.i_tstepper_eval import \
      ITStepperEval
@@ -25,6 +25,7 @@ from ibvpy.core.rtrace_eval import RTraceEval
 from ibvpy.fets.i_fets_eval import IFETSEval
 from mathkit.matrix_la.sys_mtx_array import SysMtxArray
 from ibvpy.mesh.i_fe_uniform_domain import IFEUniformDomain
+from ibvpy.mats.mats_state_arrays import MATSStateArrays
 
 from time import time
 
@@ -74,14 +75,30 @@ class DOTSEval( TStepperEval ):
     B_mtx_grid = Property( Array, depends_on = 'sdomain.changed_structure,sdomain.+changed_geometry' )
     @cached_property
     def _get_B_mtx_grid( self ):
-        return self.sdomain.apply_on_ip_grid( self.fets_eval.get_B_mtx,
-                                              self.fets_eval.ip_coords )
+        X_el = self._get_elem_X_map()
+        if X_el is None:
+            return self.sdomain.apply_on_ip_grid( self.fets_eval.get_B_mtx,
+                                                  self.fets_eval.ip_coords )
+        return self.fets_eval.get_B_mtx_grid( X_el )
 
     J_det_grid = Property( Array, depends_on = 'sdomain.changed_structure,sdomain.+changed_geometry' )
     @cached_property
     def _get_J_det_grid( self ):
-        return self.sdomain.apply_on_ip_grid( self.fets_eval.get_J_det,
-                                              self.fets_eval.ip_coords )
+        X_el = self._get_elem_X_map()
+        if X_el is None:
+            return self.sdomain.apply_on_ip_grid( self.fets_eval.get_J_det,
+                                                  self.fets_eval.ip_coords )
+        return self.fets_eval.get_J_det_grid( X_el )
+
+    def _get_elem_X_map( self ):
+        '''Nodal coordinates of all elements ( n_elems, n_geo_r, n_dims )
+        for the batched construction of the geometry matrices
+        (see FETSEval.get_B_mtx_grid), None if not available.
+        '''
+        X_el = getattr( self.sdomain, 'elem_X_map', None )
+        if not isinstance( X_el, ndarray ) or X_el.ndim != 3 or X_el.shape[0] == 0:
+            return None
+        return X_el
 
     state_array_size = Property( depends_on = 'sdomain.changed_structure' )
     @cached_property
@@ -98,12 +115,37 @@ class DOTSEval( TStepperEval ):
     def get_state_array_size( self ):
         return 0
 
-    state_array = Property( Array, depends_on = 'sdomain.changed_structure,sdomain.+changed_geometry' )
+    # Storage of the state variables of all material points
+    # (committed and trial buffers - see MATSStateArrays)
+    #
+    mats_state = Property( Instance( MATSStateArrays ),
+                           depends_on = 'sdomain.changed_structure,sdomain.+changed_geometry' )
     @cached_property
-    def _get_state_array( self ):
-        state_array = zeros( ( self.state_array_size, ), dtype = 'float_' )
-        e_arr_size = self.fets_eval.get_state_array_size()
+    def _get_mats_state( self ):
+        fets_eval = self.fets_eval
+        n_elems = self.sdomain.n_elems
+        e_arr_size = fets_eval.get_state_array_size()
 
+        # Use the state variables declared by the material model if the
+        # element state array consists of the material point arrays only.
+        # Otherwise, keep the state array of the element as a single variable.
+        #
+        mats_state = None
+        mats_eval = getattr( fets_eval, 'mats_eval', None )
+        if mats_eval != None and e_arr_size > 0:
+            m_arr_size = fets_eval.m_arr_size
+            if m_arr_size > 0 and e_arr_size % m_arr_size == 0:
+                mats_state = MATSStateArrays( var_shapes = mats_eval.get_state_var_shapes(),
+                                              n_elems = n_elems,
+                                              n_ip = e_arr_size / m_arr_size )
+                if mats_state.n_vals != m_arr_size:
+                    mats_state = None
+        if mats_state == None:
+            mats_state = MATSStateArrays( var_shapes = [ ( 'state_array', ( e_arr_size, ) ) ],
+                                          n_elems = n_elems,
+                                          n_ip = 1 )
+
+        state_array = mats_state.committed_array
         sctx = self.sdomain.domain.new_scontext()
         # Run the setup of sub-evaluator
         #
@@ -111,29 +153,144 @@ class DOTSEval( TStepperEval ):
             sctx.elem = elem
             sctx.elem_state_array = state_array[ e_id * e_arr_size : ( e_id + 1 ) * e_arr_size ]
             self.fets_eval.setup( sctx )
-        return state_array
+        return mats_state
+
+    # flat array of the committed state of all material points
+    #
+    state_array = Property( Array )
+    def _get_state_array( self ):
+        return self.mats_state.committed_array
+
+    def commit_state( self ):
+        '''Accept the trial state of the material points.
+
+        Only the batch evaluation writes the trial state, the pointwise
+        evaluation updates the committed state in place (sctx.update_state_on).
+        '''
+        if self._is_batch_applicable( {} ):
+            self.mats_state.commit()
+
+    # Evaluate all integration points of the domain in a single call
+    # of the material model - applicable for material models supporting
+    # the batch evaluation (MATSEval.supports_batch) combined with 
+    # the standard numerical quadrature of FETSEval.
+    # Off by default - the pointwise evaluation is used
+    # unless the batch evaluation is explicitly switched on.
+    #
+    batch_eval = Bool( False )
+
+    def _is_batch_applicable( self, kw ):
+        # subclasses redefining the integration use the pointwise evaluation
+        #
+        if self.__class__.get_corr_pred.im_func is not DOTSEval.get_corr_pred.im_func:
+            return False
+        fets_eval = self.fets_eval
+        mats_eval = getattr( fets_eval, 'mats_eval', None )
+        if not self.batch_eval or mats_eval == None or \
+            not mats_eval.supports_batch or mats_eval.initial_strain or \
+            kw.get( 'eps_avg', None ) != None or self.sdomain.elem_dof_map.shape[0] == 0:
+            return False
+        # the element formulation must not redefine the quadrature
+        #
+        from ibvpy.fets.fets_eval import FETSEval
+        fets_class = fets_eval.__class__
+        return fets_class.get_corr_pred.im_func is FETSEval.get_corr_pred.im_func and \
+            fets_class.get_mtrl_corr_pred.im_func is FETSEval.get_mtrl_corr_pred.im_func
+
+    def get_corr_pred_batch( self, sctx, tn, tn1, F_int ):
+        '''Evaluate the element stiffness matrices and internal forces
+        of all elements at once.
+
+        The strains, stresses and state variables are stored in arrays
+        with the shape (n_elems, n_ip, ...). The integration over the element 
+        domain is performed using the cached B_mtx_grid and J_det_grid. 
+        '''
+        fets_eval = self.fets_eval
+        elem_dof_map = self.sdomain.elem_dof_map
+
+        tstepper = self.sdomain.tstepper
+        u_arr = tstepper.U_k[ elem_dof_map ]
+        d_u_arr = tstepper.d_U[ elem_dof_map ]
+
+        # B_mtx_grid - ( n_elems, n_ip, n_eps, n_e_dofs )
+        # J_det_grid - ( n_elems, n_ip )
+        #
+        B_mtx_grid = self.B_mtx_grid
+        Jw_grid = self.J_det_grid * fets_eval.ip_weights[None, :]
+        n_elems, n_ip = Jw_grid.shape
+
+        eps_arr = einsum( 'eimd,ed->eim', B_mtx_grid, u_arr )
+        d_eps_arr = einsum( 'eimd,ed->eim', B_mtx_grid, d_u_arr )
+
+        # state variables ( n_elems, n_ip, ... ) - the material model
+        # assigns the trial state that is accepted in commit_state
+        #
+        sig_arr, D_arr = fets_eval.mats_eval.get_corr_pred_batch( sctx, eps_arr, d_eps_arr,
+                                                                   tn, tn1, self.mats_state )
+
+        # D * B weighted with the integration weights and jacobi determinant
+        #
+        if D_arr.ndim == 2:
+            DB_grid = einsum( 'mn,eind->eimd', D_arr, B_mtx_grid )
+        else:
+            DB_grid = einsum( 'eimn,eind->eimd', D_arr, B_mtx_grid )
+        DB_grid *= Jw_grid[:, :, None, None]
+
+        k_arr = self.k_arr
+        k_arr[...] = einsum( 'eimd,eimf->edf', B_mtx_grid, DB_grid )
+
+        f_arr = einsum( 'eimd,eim->ed', B_mtx_grid, sig_arr * Jw_grid[:, :, None] )
+        F_int += bincount( elem_dof_map.flatten(), weights = f_arr.flatten(),
+                           minlength = F_int.shape[0] )
+
+        return SysMtxArray( mtx_arr = k_arr, dof_map_arr = elem_dof_map )
 
     def get_corr_pred( self, sctx, u, du, tn, tn1, F_int, *args, **kw ):
 
+        if self._is_batch_applicable( kw ):
+            return self.get_corr_pred_batch( sctx, tn, tn1, F_int )
+
+        tstepper = self.sdomain.tstepper
+
+        # distribute the element loop to the partitions of the domain
+        # (see TStepper.executor)
+        #
+        executor = getattr( tstepper, 'executor', None )
+        if executor != None and len( args ) == 0 and \
+            kw.get( 'eps_avg', None ) == None:
+            return executor.get_corr_pred( self, sctx, tn, tn1, F_int )
+
         # in order to avoid allocation of the array in every time step 
         # of the computation
         k_arr = self.k_arr
         k_arr[...] = 0.0
+
+        self.get_corr_pred_range( sctx, slice( 0, len( self.sdomain.elements ) ),
+                                  tstepper.U_k, tstepper.d_U, self.state_array,
+                                  k_arr, F_int, tn, tn1, **kw )
+
+        return SysMtxArray( mtx_arr = k_arr, dof_map_arr = self.sdomain.elem_dof_map )
+
+    def get_corr_pred_range( self, sctx, elems, U, d_U, state_array,
+                             k_arr, F_int, tn, tn1, **kw ):
+        '''Evaluate the elements within the slice elems of the element list.
+
+        The element matrices are written into k_arr, the internal
+        forces are added to F_int. The state of the material points
+        is taken from (and updated in) the supplied state_array
+        so that the method can be applied to the partitions
+        of the domain in separate processes (see ParallelExecutor).
+        '''
         e_arr_size = self.fets_eval.get_state_array_size()
 
-        if self.cache_geo_matrices and len( self.sdomain.elements ) != 0:#build in control that there is at least one active elem
+        elements = self.sdomain.elements
+        if self.cache_geo_matrices and len( elements ) != 0:#build in control that there is at least one active elem
             B_mtx_grid = self.B_mtx_grid
             J_det_grid = self.J_det_grid
 
         Be_mtx_grid = None
         Je_det_grid = None
 
-        state_array = self.state_array
-
-        tstepper = self.sdomain.tstepper
-        U = tstepper.U_k
-        d_U = tstepper.d_U
-
         # generic arguments to be pushed through the loop levels
         args_fets = []
         kw_fets = {}
@@ -141,8 +298,9 @@ class DOTSEval( TStepperEval ):
         if U_avg_k != None:
             u_avg_arr = U_avg_k[ self.sdomain.elem_dof_map ]
 
-        for e_id, elem in enumerate( self.sdomain.elements ):
+        for e_id in range( *elems.indices( len( elements ) ) ):
 
+            elem = elements[ e_id ]
             ix = elem.get_dof_map()
             sctx.elem = elem
             sctx.elem_state_array = state_array[ e_id * e_arr_size : ( e_id + 1 ) * e_arr_size ]
@@ -164,13 +322,50 @@ class DOTSEval( TStepperEval ):
             k_arr[ e_id ] = k
             F_int[ ix_( ix ) ] += f
 
-        return SysMtxArray( mtx_arr = k_arr, dof_map_arr = self.sdomain.elem_dof_map )
-
     def map_u( self, sctx, U ):
         ix = sctx.elem.get_dof_map()
         u = U[ix]
         return u
 
+    def _is_inherited( self, *names ):
+        for name in names:
+            if getattr( self.__class__, name ).im_func is not \
+                getattr( DOTSEval, name ).im_func:
+                return False
+        return True
+
+    def map_u_batch( self, sctx, U ):
+        '''Gather the element values of the elements sctx.e_arr
+        ( n_elems, n_e_dofs ) for the bulk evaluation of the response traces
+        (see RTraceEval.call_batch). Set the nodal coordinates sctx.X_el and
+        the committed state of the points sctx.ip_map in sctx.mats_state_batch.
+        '''
+        if not self._is_inherited( 'map_u', 'get_vtk_r_arr', 'get_vtk_pnt_ip_map' ):
+            return None
+        X_el = self._get_elem_X_map()
+        if X_el is None or X_el.shape[0] != len( self.sdomain.elements ):
+            return None
+        e_arr = sctx.e_arr
+        sctx.X_el = X_el[ e_arr ]
+        sctx.mats_state_batch = self._get_mats_state_batch( e_arr, sctx.ip_map )
+        return U[ self.sdomain.elem_dof_map[ e_arr ] ]
+
+    def _get_mats_state_batch( self, e_arr, ip_map ):
+        '''Copy of the committed state variables in the integration points
+        ip_map of the elements e_arr, None if the state is not
+        structured by the material model.
+        '''
+        mats_state = self.mats_state
+        mats_eval = getattr( self.fets_eval, 'mats_eval', None )
+        if mats_eval == None or \
+            mats_state.var_shapes != mats_eval.get_state_var_shapes():
+            return None
+        state_batch = MATSStateArrays( var_shapes = mats_state.var_shapes,
+                                       n_elems = len( e_arr ),
+                                       n_ip = len( ip_map ) )
+        state_batch.buffers[0][...] = mats_state.buffers[0][ e_arr ][:, ip_map, :]
+        return state_batch
+
     # @todo: Jakub remove this - specific to two field problems
     # Should be a tracer assocated with the element.
     def get_eps_m( self, sctx, u ):
@@ -220,6 +415,8 @@ class DOTSEval( TStepperEval ):
             rte_dict[ key ] = RTraceEvalUDomainFieldVar( name = key,
                                                          u_mapping = self.map_u,
                                                          eval = eval,
+                                                         u_mapping_batch = self.map_u_batch,
+                                                         eval_batch = getattr( eval, 'call_batch', None ),
                                                          fets_eval = self.fets_eval )
         return rte_dict
 
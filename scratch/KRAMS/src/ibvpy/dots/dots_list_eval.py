@@ -66,6 +66,10 @@ class DOTSListEval( TStepperEval ):
         for dots_eval in self.dots_list:
             dots_eval.apply_constraints( K )
 
+    def commit_state( self ):
+        for dots_eval in self.dots_list:
+            dots_eval.commit_state()
+
     def get_corr_pred( self, sctx, U, d_U, tn, tn1, *args, **kw ):
 
         K = self.K
@@ -44,6 +44,7 @@ class SubDOTSEval( TStepperEval ):
     state_array_size = Delegate( 'dots_integ' )
     state_array = Delegate( 'dots_integ' )
     setup = Delegate( 'dots_integ' )
+    commit_state = Delegate( 'dots_integ' )
     get_corr_pred = Delegate( 'dots_integ' )
     map_u = Delegate( 'dots_integ' )
     rte_dict = Delegate( 'dots_integ' )
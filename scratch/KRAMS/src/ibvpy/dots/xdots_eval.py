@@ -16,16 +16,40 @@ from ibvpy.mats.mats2D.mats2D_tensor import map2d_eps_eng_to_mtx
 from ibvpy.mats.mats3D.mats3D_tensor import map3d_eps_eng_to_mtx
 
 from numpy import ix_, frompyfunc, array, abs, vstack, linalg, dot, ones, hstack, \
-    arange, zeros_like, zeros, repeat, meshgrid, isinf, where, copy
+    arange, zeros_like, zeros, repeat, meshgrid, isinf, where, copy, allclose, \
+    searchsorted, ma
 
 from enthought.tvtk.api import tvtk
 from tvtk_classes import tvtk_helper
 #from enthought.tvtk.tvtk_classes import tvtk_helper
 
+def map_ip_state( state_to, r_to, state_from, r_from, m_arr_size ):
+    '''Assign the state of the nearest point r_from to each point r_to.
+    '''
+    dist = ( ( r_to[:, None, :] - r_from[None, :, :] ) ** 2 ).sum( axis = 2 )
+    nearest = dist.argmin( axis = 1 )
+    state_from = state_from.reshape( r_from.shape[0], m_arr_size )
+    state_to.reshape( r_to.shape[0], m_arr_size )[...] = state_from[ nearest ]
+
 class XDOTSEval( DOTSEval ):
     '''
     Domain with uniform FE-time-step-eval.
     '''
+
+    # Incremental update of the integration structure 
+    # (see FELSDomain.narrow_band) - the triangulation and integration
+    # points of the elements with unchanged intersection are reused
+    # 
+    incremental = Property
+    def _get_incremental( self ):
+        return getattr( self.sdomain, 'narrow_band', 0 ) > 0
+
+    # triangulations and integration points of the elements 
+    # from the last evaluation
+    #
+    _triangulation_cache = Dict
+    _integ_cache = Dict
+
     elem_r_contours = Property( depends_on = 'sdomain.changed_structure' )
     @cached_property
     def _get_elem_r_contours( self ):
@@ -81,12 +105,26 @@ class XDOTSEval( DOTSEval ):
         In 3D - does not work - probably some topological info needs to be added.
         '''
         division = []
-        for pos_r, neg_r, i_r in  zip( self.elem_r_contours[0],
-                                       self.elem_r_contours[1],
-                                       self.elem_r_contours[2] ):#TODO:this can be done better
+        incremental = self.incremental
+        triangulation_cache = {}
+        for elem, pos_r, neg_r, i_r in  zip( self.sdomain.elems,
+                                             self.elem_r_contours[0],
+                                             self.elem_r_contours[1],
+                                             self.elem_r_contours[2] ):#TODO:this can be done better
             point_set = [vstack( ( pos_r, i_r ) ),
                          vstack( ( neg_r, i_r ) )]
-            division.append( self.fets_eval.get_triangulation( point_set ) )
+            if incremental:
+                key = point_set[0].tostring() + '|' + point_set[1].tostring()
+                cached = self._triangulation_cache.get( elem, None )
+                if cached != None and cached[0] == key:
+                    triangulation_cache[ elem ] = cached
+                    division.append( cached[1] )
+                    continue
+            triangulation = self.fets_eval.get_triangulation( point_set )
+            if incremental:
+                triangulation_cache[ elem ] = ( key, triangulation )
+            division.append( triangulation )
+        self._triangulation_cache = triangulation_cache
         return division
 
     def get_eps( self, sctx, u ):
@@ -302,15 +340,27 @@ class XDOTSEval( DOTSEval ):
         ip_coo_list = []
         ip_wei_list = []
         ip_offset = 0
-
-        for elem_triangles in self.elem_triangulation:
-            ip_coords = self.fets_eval.get_ip_coords( elem_triangles,
-                                                      self.fets_eval.int_order )
+        incremental = self.incremental
+        integ_cache = {}
+
+        for elem, elem_triangles in zip( self.sdomain.elems,
+                                         self.elem_triangulation ):
+            cached = self._integ_cache.get( elem, None )
+            if incremental and cached != None and cached[0] is elem_triangles:
+                # unchanged triangulation - reuse the integration points
+                ip_coords, ip_weights = cached[1:]
+            else:
+                ip_coords = self.fets_eval.get_ip_coords( elem_triangles,
+                                                          self.fets_eval.int_order )
+                ip_weights = self.fets_eval.get_ip_weights( elem_triangles,
+                                                            self.fets_eval.int_order )
+            if incremental:
+                integ_cache[ elem ] = ( elem_triangles, ip_coords, ip_weights )
             ip_offset += ip_coords.shape[0]
             ip_off_list.append( ip_offset )
             ip_coo_list.append( ip_coords )
-            ip_wei_list.append( self.fets_eval.get_ip_weights( elem_triangles,
-                                                               self.fets_eval.int_order ) )
+            ip_wei_list.append( ip_weights )
+        self._integ_cache = integ_cache
         ip_off_arr = array( ip_off_list, dtype = int )
 
         # handle the case of empty domain
@@ -575,6 +625,26 @@ class XDOTSEval( DOTSEval ):
     old_state_end_elem_grid = Array
     old_state_array = Array
     old_state_grid_ix = Tuple
+    old_ip_coords = Array
+
+    # State of the parent grid before the change of the level set 
+    # (tuple of the active cells, fets_eval and the state array)
+    # used to initialize the state of the newly intersected elements 
+    # in the incremental mode.
+    #
+    _parent_state = Any
+
+    @on_trait_change( 'sdomain.changed_structure' )
+    def _record_parent_state( self ):
+        if not self.incremental:
+            return
+        parent = getattr( self.sdomain, 'fe_grid', None )
+        if parent == None or not hasattr( parent, 'activation_map' ):
+            return
+        parent_dots = parent.dots
+        self._parent_state = ( parent.idx_active_elems,
+                               parent_dots.fets_eval,
+                               parent_dots.state_array )
 
     state_array = Property( Array, depends_on = 'sdomain.changed_structure' )
     @cached_property
@@ -612,9 +682,10 @@ class XDOTSEval( DOTSEval ):
             # the elements in the new grid might get masked so that they should
             # be skipped - what should happen with their state - actually
             # a state transfer should be started.
-            for new_masked, ns, ne, os, oe in zip( new_start_arr.mask,
-                                               new_start_arr, new_end_arr,
-                                               old_start_arr, old_end_arr ):
+            m = mats_arr_size
+            for new_masked, ns, ne, os, oe in zip( ma.getmaskarray( new_start_arr ),
+                                                   new_start_arr, new_end_arr,
+                                                   old_start_arr, old_end_arr ):
                 if new_masked:
                     # The element has been overloaded - the old state must be
                     # transfered to the new state - this depends on the adaptive
@@ -623,10 +694,23 @@ class XDOTSEval( DOTSEval ):
                     # start vector - or the old values could be reused as start
                     # value.
                     pass
-                else:
+                elif ne - ns == oe - os and \
+                    allclose( self.ip_coords[ns:ne], self.old_ip_coords[os:oe] ):
                     # The element is present also in the changed grid - copy
                     # the state to its new place in the state array
-                    state_array[ns:ne] = self.old_state_array[os:oe]
+                    state_array[ns * m:ne * m] = self.old_state_array[os * m:oe * m]
+                else:
+                    # The element has been triangulated anew - assign the state
+                    # of the nearest old integration point
+                    map_ip_state( state_array[ns * m:ne * m], self.ip_coords[ns:ne],
+                                  self.old_state_array[os * m:oe * m],
+                                  self.old_ip_coords[os:oe], m )
+
+        # Initialize the elements newly intersected by the level set
+        # with the state of the nearest integration point in the parent grid
+        if self._parent_state != None:
+            self._transfer_parent_state( state_array )
+            self._parent_state = None
 
         # backup the reference to an array for the case the discretization
         # changes and transfer of state variables is reguired
@@ -634,11 +718,43 @@ class XDOTSEval( DOTSEval ):
         self.old_state_start_elem_grid = self.state_start_elem_grid
         self.old_state_end_elem_grid = self.state_end_elem_grid
         self.old_state_grid_ix = self.sdomain.intg_grid_ix
+        self.old_ip_coords = self.ip_coords
 
         # return the new state array
         #
         return state_array
 
+    def _transfer_parent_state( self, state_array ):
+        '''Assign the state of the parent elements to the elements 
+        that were not integrated in this domain before.
+        '''
+        p_elems, p_fets_eval, p_state_array = self._parent_state
+        m = self.fets_eval.m_arr_size
+        if p_fets_eval.m_arr_size != m or len( p_elems ) == 0:
+            return
+        p_e_arr_size = p_fets_eval.get_state_array_size()
+        n_dims = self.ip_coords.shape[1]
+        p_ip_coords = array( p_fets_eval.ip_coords )[:, :n_dims]
+        if p_ip_coords.shape[0] * m != p_e_arr_size:
+            return
+
+        # elements integrated in this domain before the change
+        old_elems = []
+        if len( self.old_state_array ):
+            old_elems = self.sdomain.fe_grid.ls_elem_grid[ self.old_state_grid_ix ]
+        old_elems = set( array( old_elems ).flatten() )
+
+        for e_id, elem in enumerate( self.sdomain.elems ):
+            if elem in old_elems:
+                continue
+            p_id = searchsorted( p_elems, elem )
+            if p_id == len( p_elems ) or p_elems[ p_id ] != elem:
+                continue
+            ip0, ip1 = self.ip_offset[ e_id ], self.ip_offset[ e_id + 1 ]
+            map_ip_state( state_array[ ip0 * m:ip1 * m ], self.ip_coords[ ip0:ip1 ],
+                          p_state_array[ p_id * p_e_arr_size:( p_id + 1 ) * p_e_arr_size ],
+                          p_ip_coords, m )
+
     def get_elem_state_array( self, e_id ):
         '''
         used for response tracing
@@ -650,10 +766,31 @@ class XDOTSEval( DOTSEval ):
 
     def get_corr_pred( self, sctx, u, du, tn, tn1, F_int ):
 
+        tstepper = self.sdomain.tstepper
+
+        # distribute the element loop to the partitions of the domain
+        # (see TStepper.executor)
+        #
+        executor = getattr( tstepper, 'executor', None )
+        if executor != None:
+            return executor.get_corr_pred( self, sctx, tn, tn1, F_int )
+
         # in order to avoid allocation of the array in every time step 
         # of the computation
         k_arr = self.k_arr
         k_arr[...] = 0.0
+
+        self.get_corr_pred_range( sctx, slice( 0, len( self.sdomain.elements ) ),
+                                  tstepper.U_k, tstepper.d_U, self.state_array,
+                                  k_arr, F_int, tn, tn1 )
+
+        return SysMtxArray( mtx_arr = k_arr, dof_map_arr = self.sdomain.elem_dof_map )
+
+    def get_corr_pred_range( self, sctx, elems, U, d_U, state_array,
+                             k_arr, F_int, tn, tn1, **kw ):
+        '''Evaluate the elements within the slice elems of the element list
+        (see DOTSEval.get_corr_pred_range).
+        '''
         #k_con = zeros( ( self.fets_eval.n_e_dofs, self.fets_eval.n_e_dofs ) )
         mats_arr_size = self.fets_eval.m_arr_size
 
@@ -667,18 +804,12 @@ class XDOTSEval( DOTSEval ):
         Be_mtx_grid = None
         Je_det_grid = None
 
-        state_array = self.state_array
-
-        tstepper = self.sdomain.tstepper
-        U = tstepper.U_k
-        d_U = tstepper.d_U
-
-        for e_id, elem, ip_addr0, ip_addr1, ip_disc_addr0, ip_disc_addr1  in zip( self.sdomain.idx_active_elems,
-                                                                                  self.sdomain.elements,
-                                                                                  self.ip_offset[:-1],
-                                                                                  self.ip_offset[1:],
-                                                                                  self.ip_disc_offset[:-1],
-                                                                                  self.ip_disc_offset[1:] ):
+        for e_id, elem, ip_addr0, ip_addr1, ip_disc_addr0, ip_disc_addr1  in zip( self.sdomain.idx_active_elems[ elems ],
+                                                                                  self.sdomain.elements[ elems ],
+                                                                                  self.ip_offset[:-1][ elems ],
+                                                                                  self.ip_offset[1:][ elems ],
+                                                                                  self.ip_disc_offset[:-1][ elems ],
+                                                                                  self.ip_disc_offset[1:][ elems ] ):
             ip_slice = slice( ip_addr0, ip_addr1 )
             ip_disc_slice = slice( ip_disc_addr0, ip_disc_addr1 )
             ix = elem.get_dof_map()
@@ -703,13 +834,8 @@ class XDOTSEval( DOTSEval ):
                                                  ip_coords = self.ip_coords[ip_slice],
                                                  ip_weights = self.ip_weights[ip_slice] )
 
-            id = [0, 2, 8, 10]
-            #print 'k before \n',k[meshgrid(id,id)]
-            #print 'k before \n',k
             k_arr[ e_id ] = k
-            #k_con[:, :] = k
             F_int[ ix_( ix ) ] += f
-            #print 'f before \n',F_int
             if self.fets_eval.nip_disc:
                 k_c, f_int_c = self.fets_eval.get_corr_pred_disc( sctx, U[ ix_( ix ) ],
                                                                  B_mtx_grid = Be_disc_grid,
@@ -717,10 +843,5 @@ class XDOTSEval( DOTSEval ):
                                                                  ip_coords = self.ip_disc_coords[ip_disc_slice],
                                                                  ip_weights = self.ip_disc_weights[ip_disc_slice] )
                 k_arr[ e_id ] += k_c
-                #print 'f_int_c ',f_int_c
                 F_int[ ix_( ix ) ] += f_int_c
 
-            #print 'k_con ', k_con
-            #print 'K__mtx', k_arr
-
-        return SysMtxArray( mtx_arr = k_arr, dof_map_arr = self.sdomain.elem_dof_map )
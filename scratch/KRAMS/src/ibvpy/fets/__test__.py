@@ -0,0 +1,99 @@
+
+import unittest
+
+from numpy import allclose, random, concatenate, zeros
+
+from ibvpy.core.scontext import SContext
+from ibvpy.mesh.fe_grid import FEGrid
+from ibvpy.fets.fets1D.fets1D2l import FETS1D2L
+from ibvpy.fets.fets2D.fets2D4q import FETS2D4Q
+from ibvpy.fets.fets2D.fets2D9q import FETS2D9Q
+from ibvpy.fets.fets3D.fets3D8h import FETS3D8H
+from ibvpy.mats.mats1D.mats1D_elastic.mats1D_elastic import MATS1DElastic
+from ibvpy.mats.mats2D.mats2D_elastic.mats2D_elastic import MATS2DElastic
+from ibvpy.mats.mats3D.mats3D_elastic.mats3D_elastic import MATS3DElastic
+
+class TestGeoGrid( unittest.TestCase ):
+    '''
+    Batched construction of the kinematic matrices and jacobi
+    determinants from the tabulated shape functions.
+    '''
+    def assert_geo_grid( self, fets_eval, shape ):
+        domain = FEGrid( coord_max = ( 1., 1., 1. ),
+                         shape = shape,
+                         fets_eval = fets_eval )
+        # distorted element geometry
+        X_el = domain.elem_X_map + \
+            random.uniform( -0.05, 0.05, domain.elem_X_map.shape )
+        self.assertTrue( fets_eval.is_geo_batch_applicable( X_el ) )
+        B_mtx_grid = fets_eval.get_B_mtx_grid( X_el )
+        J_det_grid = fets_eval.get_J_det_grid( X_el )
+        for el in [ 0, X_el.shape[0] - 1 ]:
+            for ip, r_pnt in enumerate( fets_eval.ip_coords ):
+                self.assertTrue( allclose( B_mtx_grid[ el, ip ],
+                                           fets_eval.get_B_mtx( r_pnt, X_el[ el ] ) ) )
+                self.assertAlmostEqual( J_det_grid[ el, ip ],
+                                        fets_eval.get_J_det( r_pnt, X_el[ el ] ) )
+
+    def test_fets1D2l( self ):
+        self.assert_geo_grid( FETS1D2L( mats_eval = MATS1DElastic() ), ( 3, ) )
+
+    def test_fets2D4q( self ):
+        self.assert_geo_grid( FETS2D4Q( mats_eval = MATS2DElastic() ), ( 3, 2 ) )
+
+    def test_fets2D9q( self ):
+        self.assert_geo_grid( FETS2D9Q( mats_eval = MATS2DElastic() ), ( 2, 2 ) )
+
+    def test_fets3D8h( self ):
+        self.assert_geo_grid( FETS3D8H( mats_eval = MATS3DElastic() ), ( 2, 2, 2 ) )
+
+    def test_geo_batch_layout( self ):
+        '''The applicability is decided for each layout of the nodal
+        coordinates, degenerate elements are not used for the decision.
+        '''
+        fets_eval = FETS2D4Q( mats_eval = MATS2DElastic() )
+        domain = FEGrid( coord_max = ( 1., 1., 0. ),
+                         shape = ( 3, 2 ),
+                         fets_eval = fets_eval )
+        X_el = domain.elem_X_map.copy()
+        X_el3 = concatenate( [ X_el, zeros( X_el.shape[:2] + ( 1, ) ) ], axis = 2 )
+        self.assertFalse( fets_eval.is_geo_batch_applicable( X_el3 ) )
+        X_el[0] = X_el[0, 0]
+        self.assertTrue( fets_eval.is_geo_batch_applicable( X_el ) )
+
+    def test_shared_tables( self ):
+        '''The tables are constructed once per class and integration scheme.
+        '''
+        fets_1 = FETS2D4Q( mats_eval = MATS2DElastic() )
+        fets_2 = FETS2D4Q( mats_eval = MATS2DElastic() )
+        self.assertTrue( fets_1.ip_tables is fets_2.ip_tables )
+        fets_2.ngp_r = 3
+        self.assertFalse( fets_1.ip_tables is fets_2.ip_tables )
+
+class TestFieldBatch( unittest.TestCase ):
+    '''
+    Bulk evaluation of the fields in the points of all elements
+    compared with the pointwise evaluation.
+    '''
+    def test_fets2D4q( self ):
+        fets_eval = FETS2D4Q( mats_eval = MATS2DElastic() )
+        domain = FEGrid( coord_max = ( 2., 1., 0. ),
+                         shape = ( 2, 2 ),
+                         fets_eval = fets_eval )
+        sctx = SContext()
+        sctx.X_el = domain.elem_X_map
+        sctx.r_arr = fets_eval.vtk_r_arr
+        u_arr = random.uniform( -1., 1., ( sctx.X_el.shape[0], fets_eval.n_e_dofs ) )
+        u_batch = fets_eval.get_u_batch( sctx, u_arr )
+        eps_batch = fets_eval.get_eps1t_mtx33_batch( sctx, u_arr )
+        for el in range( sctx.X_el.shape[0] ):
+            sctx.X = sctx.X_el[ el ]
+            for p, r_pnt in enumerate( sctx.r_arr ):
+                sctx.loc = r_pnt
+                self.assertTrue( allclose( u_batch[ el, p ],
+                                           fets_eval.get_u( sctx, u_arr[ el ] ) ) )
+                self.assertTrue( allclose( eps_batch[ el, p ],
+                                           fets_eval.get_eps1t_mtx33( sctx, u_arr[ el ] ) ) )
+
+if __name__ == "__main__":
+    unittest.main()
@@ -10,7 +10,7 @@ from enthought.traits.ui.api import \
 
 from numpy import \
      array, zeros, float_, dot, hstack, arange, argmin, broadcast_arrays, c_, \
-     zeros_like
+     zeros_like, einsum, allclose, linalg, unique, fabs
 
 from scipy.linalg import \
      det
@@ -25,7 +25,7 @@ from ibvpy.core.tstepper_eval import \
      TStepperEval
 
 from ibvpy.mats.mats_eval import \
-    IMATSEval
+    IMATSEval, get_eng_to_mtx_map
 
 from ibvpy.dots.dots_eval import \
     DOTSEval
@@ -58,6 +58,15 @@ def oriented_3d_array( arr, axis ):
     _arr = array( arr, dtype = 'float_' )
     return _arr[ tuple( shape ) ]
 
+#-------------------------------------------------------------------
+# Tables of the shape functions at the integration points
+#-------------------------------------------------------------------
+#
+# The tables are shared by all the instances of a FETSEval class
+# with the same integration scheme (see FETSEval.ip_tables).
+#
+_IP_TABLES = {}
+
 #-------------------------------------------------------------------
 # FETSEval - general implementation of the fe-numerical quadrature
 #-------------------------------------------------------------------
@@ -292,6 +301,164 @@ class FETSEval( TStepperEval ):
         nt = self.ngp_t
         return [nr, ns, nt]
     #-----------------------------------------------------------------------------------
+    # SHAPE FUNCTIONS AT THE INTEGRATION POINTS
+    #-----------------------------------------------------------------------------------
+    #
+    # The values of the geometry shape functions and the derivatives of the
+    # geometry and field shape functions are evaluated once per class
+    # and integration scheme. They are used to construct the kinematic
+    # matrices and jacobi determinants of many elements at once
+    # using their nodal coordinates with the shape ( n_elems, n_geo_r, n_dims ).
+    #
+    ip_tables = Property( depends_on = 'ngp_r,ngp_s,ngp_t' )
+    @cached_property
+    def _get_ip_tables( self ):
+        return self.get_r_tables( self.ip_coords )
+
+    def get_r_tables( self, r_arr ):
+        '''Return the tables of the shape functions evaluated
+        in the local coordinates r_arr ( n_pnts, 3 ).
+        '''
+        r_arr = array( r_arr, dtype = 'float_' )
+        key = ( self.__class__, r_arr.shape, r_arr.tostring(),
+                self.geo_r.tostring(), self.dof_r.tostring() )
+        tables = _IP_TABLES.get( key, None )
+        if tables == None:
+            tables = { 'N_geo' : self._get_r_table( 'get_N_geo_mtx', r_arr ),
+                       'dNr_geo' : self._get_r_table( 'get_dNr_geo_mtx', r_arr ),
+                       'N' : self._get_r_table( 'get_N_mtx', r_arr ),
+                       'dNr' : self._get_r_table( 'get_dNr_mtx', r_arr ) }
+            _IP_TABLES[ key ] = tables
+        return tables
+
+    def _get_r_table( self, method_name, r_arr ):
+        '''Evaluate the method at all the points, return None
+        if the method is not provided by the element formulation.
+        '''
+        method = getattr( self, method_name, None )
+        if method == None:
+            return None
+        try:
+            return array( [ method( r_pnt ) for r_pnt in r_arr ], dtype = 'float_' )
+        except NotImplementedError:
+            return None
+
+    def _get_tables( self, r_arr ):
+        if r_arr is None:
+            return self.ip_tables
+        return self.get_r_tables( r_arr )
+
+    def get_J_mtx_grid( self, X_el, r_arr = None ):
+        '''Jacobi matrices at the integration points (or at the points r_arr)
+        of the elements with the nodal coordinates X_el ( n_elems, n_ip, n_dims, n_dims ).
+        '''
+        return einsum( 'imn,enj->eimj', self._get_tables( r_arr )['dNr_geo'], X_el )
+
+    def get_J_det_grid( self, X_el, r_arr = None ):
+        '''Jacobi determinants at the integration points (or at the points r_arr)
+        of the elements with the nodal coordinates X_el ( n_elems, n_ip ).
+        '''
+        if not self.is_geo_batch_applicable( X_el ):
+            return self._apply_on_X_el( self.get_J_det, X_el, r_arr )
+        return linalg.det( self.get_J_mtx_grid( X_el, r_arr ) )
+
+    def get_B_mtx_grid( self, X_el, r_arr = None ):
+        '''Kinematic matrices at the integration points (or at the points r_arr)
+        of the elements with the nodal coordinates X_el ( n_elems, n_ip, n_eps, n_e_dofs ).
+        '''
+        if not self.is_geo_batch_applicable( X_el ):
+            return self._apply_on_X_el( self.get_B_mtx, X_el, r_arr )
+        return self._get_B_mtx_grid( X_el, r_arr )
+
+    def _get_B_mtx_grid( self, X_el, r_arr = None ):
+        inv_J_grid = linalg.inv( self.get_J_mtx_grid( X_el, r_arr ) )
+        dNx_grid = einsum( 'eimk,ikn->eimn', inv_J_grid, self._get_tables( r_arr )['dNr'] )
+        return self.map_dNx_to_B_mtx( dNx_grid )
+
+    def map_dNx_to_B_mtx( self, dNx_grid ):
+        '''Arrange the derivatives of the shape functions with respect
+        to the global coordinates ( ..., n_dims, n_dof_r ) into the kinematic
+        matrices ( ..., n_eps, n_e_dofs ) - the ordering of the engineering
+        strain components corresponds to the one used by the material models.
+        Return None if the element uses another kinematic mapping.
+        '''
+        n_dims, n_nodes = dNx_grid.shape[-2:]
+        n_nodal_dofs = self.n_nodal_dofs
+        if n_nodal_dofs == 1:
+            return dNx_grid.copy()
+        if n_nodal_dofs != n_dims or n_dims not in [ 2, 3 ]:
+            return None
+        # pairs of derivatives ( direction, displacement component )
+        # contributing to the strain components
+        #
+        if n_dims == 2:
+            eps_map = [ [ ( 0, 0 ) ], [ ( 1, 1 ) ], [ ( 1, 0 ), ( 0, 1 ) ] ]
+        else:
+            eps_map = [ [ ( 0, 0 ) ], [ ( 1, 1 ) ], [ ( 2, 2 ) ],
+                        [ ( 2, 1 ), ( 1, 2 ) ], [ ( 2, 0 ), ( 0, 2 ) ],
+                        [ ( 1, 0 ), ( 0, 1 ) ] ]
+        B_mtx_grid = zeros( dNx_grid.shape[:-2] + ( len( eps_map ), n_nodes * n_dims ),
+                            dtype = 'float_' )
+        for eps_idx, pairs in enumerate( eps_map ):
+            for k, d in pairs:
+                B_mtx_grid[ ..., eps_idx, d::n_dims ] = dNx_grid[ ..., k, : ]
+        return B_mtx_grid
+
+    def is_geo_batch_applicable( self, X_el ):
+        '''Check whether the batched construction of the kinematic matrices
+        reproduces the methods get_B_mtx and get_J_det of the element.
+
+        The check is done once per element class, integration scheme
+        and layout of the nodal coordinates ( n_geo_r, n_dims ) by comparing
+        the results for a sample of the non-degenerate elements in X_el
+        (first, middle and last element).
+        '''
+        flags = self.ip_tables.setdefault( 'geo_batch', {} )
+        layout = X_el.shape[1:]
+        flag = flags.get( layout, None )
+        if flag != None:
+            return flag
+        n_elems = X_el.shape[0]
+        if n_elems == 0:
+            return False
+        tables = self.ip_tables
+        flag = False
+        if tables['dNr_geo'] is not None and tables['dNr'] is not None:
+            X_mtx = X_el[ unique( [ 0, n_elems // 2, n_elems - 1 ] ) ]
+            try:
+                J_det_grid = linalg.det( self.get_J_mtx_grid( X_mtx ) )
+                regular = ( fabs( J_det_grid ) > 0.0 ).all( axis = 1 )
+                if not regular.any():
+                    # undecided - all the sample elements are degenerate
+                    return False
+                X_mtx = X_mtx[ regular ]
+                J_det_grid = J_det_grid[ regular ]
+                B_mtx_grid = self._get_B_mtx_grid( X_mtx )
+                B_ref = self._apply_on_X_el( self.get_B_mtx, X_mtx )
+                J_ref = self._apply_on_X_el( self.get_J_det, X_mtx )
+                flag = B_mtx_grid is not None and \
+                    B_mtx_grid.shape == B_ref.shape and allclose( B_mtx_grid, B_ref ) and \
+                    J_det_grid.shape == J_ref.shape and allclose( J_det_grid, J_ref )
+            except ( ValueError, IndexError, linalg.LinAlgError ):
+                flag = False
+        flags[ layout ] = flag
+        return flag
+
+    def _apply_on_X_el( self, fn, X_el, r_arr = None ):
+        '''Evaluate fn( r_pnt, X_mtx ) for all integration points
+        (or the points r_arr) and elements.
+        '''
+        ip_coords = self.ip_coords
+        if r_arr is not None:
+            ip_coords = r_arr
+        out_single = fn( ip_coords[0], X_el[0] )
+        out_grid = zeros( ( X_el.shape[0], ip_coords.shape[0], ) + out_single.shape )
+        for el in range( X_el.shape[0] ):
+            for ip in range( ip_coords.shape[0] ):
+                out_grid[ el, ip, ... ] = fn( ip_coords[ip], X_el[el] )
+        return out_grid
+
+    #-----------------------------------------------------------------------------------
     # SUBSPACE INTEGRATION
     #-----------------------------------------------------------------------------------
     #
@@ -399,6 +566,25 @@ class FETSEval( TStepperEval ):
         #print "mapping ",dot( self.get_N_geo_mtx(r_pnt)[0], X_mtx )," ", r_pnt
         return dot( self.get_N_geo_mtx( r_pnt )[0], X_mtx )
 
+    def map_X2r( self, X_pnt, X_mtx, tol = 1e-10, max_iter = 20 ):
+        '''
+        Map the global coords to local (inverse of map_r2X)
+        using the Newton iteration starting from the element center.
+        @param X_pnt: global coords
+        @param X_mtx: matrix of the global coords of geo nodes
+        '''
+        n_dims = self.get_dNr_geo_mtx( zeros( ( 3, ), dtype = 'float_' ) ).shape[0]
+        r_pnt = zeros( ( 3, ), dtype = 'float_' )
+        X_pnt = X_pnt[:X_mtx.shape[1]]
+        for k in range( max_iter ):
+            R = self.map_r2X( r_pnt, X_mtx ) - X_pnt
+            J_mtx = self.get_J_mtx( r_pnt, X_mtx )
+            d_r = linalg.lstsq( J_mtx.T, R )[0]
+            r_pnt[:n_dims] -= d_r
+            if linalg.norm( d_r ) < tol:
+                break
+        return r_pnt[:n_dims]
+
     # Number of element DOFs
     #
     n_e_dofs = Int
@@ -678,6 +864,56 @@ class FETSEval( TStepperEval ):
         N_mtx = self.get_N_mtx( sctx.loc )
         return dot( N_mtx, u )
 
+    #-------------------------------------------------------------------------------
+    # Batch evaluation of the fields in the points sctx.r_arr of the elements
+    # with the nodal coordinates sctx.X_el (see RTraceEval.call_batch)
+    #-------------------------------------------------------------------------------
+    def _is_inherited( self, *names ):
+        '''Check that the methods are not redefined by the element formulation.
+        '''
+        for name in names:
+            if getattr( self.__class__, name ).im_func is not \
+                getattr( FETSEval, name ).im_func:
+                return False
+        return True
+
+    def get_u_batch( self, sctx, u_arr ):
+        '''Field values for the element values u_arr ( n_elems, n_e_dofs ).
+        '''
+        if not self._is_inherited( 'get_u' ):
+            return None
+        N_mtx_arr = self.get_r_tables( sctx.r_arr )['N']
+        if N_mtx_arr is None:
+            return None
+        return einsum( 'pnd,ed->epn', N_mtx_arr, u_arr )
+
+    def get_eps1t_eng_batch( self, sctx, u_arr ):
+        '''Engineering strains ( n_elems, n_pnts, n_eps ) for the element
+        values u_arr ( n_elems, n_e_dofs ), the initial strain
+        is not supported.
+        '''
+        if self.mats_eval.initial_strain or \
+            not self._is_inherited( 'get_eps_eng', 'get_eps0_eng', 'get_eps1t_eng' ) or \
+            not self.is_geo_batch_applicable( sctx.X_el ):
+            return None
+        B_mtx_grid = self._get_B_mtx_grid( sctx.X_el, sctx.r_arr )
+        return einsum( 'epmd,ed->epm', B_mtx_grid, u_arr )
+
+    def get_eps1t_mtx33_batch( self, sctx, u_arr ):
+        '''Strain tensors ( n_elems, n_pnts, 3, 3 ) for the element
+        values u_arr ( n_elems, n_e_dofs ).
+        '''
+        if not self._is_inherited( 'get_eps_mtx33', 'get_eps0_mtx33', 'get_eps1t_mtx33' ):
+            return None
+        eps_arr = self.get_eps1t_eng_batch( sctx, u_arr )
+        if eps_arr is None:
+            return None
+        T = get_eng_to_mtx_map( self.mats_eval.map_eps_eng_to_mtx, eps_arr.shape[-1] )
+        eps_mtx33_arr = zeros( eps_arr.shape[:-1] + ( 3, 3 ), dtype = 'float_' )
+        eps_mtx33_arr[..., self.dim_slice, self.dim_slice] = \
+            einsum( 'kij,...k->...ij', T, eps_arr )
+        return eps_mtx33_arr
+
     debug_on = Bool( False )
     def _debug_rte_dict( self ):
         '''
@@ -719,12 +955,17 @@ class FETSEval( TStepperEval ):
             #
             rte_dict[ key ] = RTraceEvalElemFieldVar( name = key,
                                                       u_mapping = self.get_eps1t_eng,
-                                                      eval = v_eval )
+                                                      eval = v_eval,
+                                                      u_mapping_batch = self.get_eps1t_eng_batch,
+                                                      eval_batch = self.mats_eval.get_rte_batch( key ) )
 
-        rte_dict.update( {'eps_app' : RTraceEvalElemFieldVar( eval = self.get_eps_mtx33 ),
+        rte_dict.update( {'eps_app' : RTraceEvalElemFieldVar( eval = self.get_eps_mtx33,
+                                                              eval_batch = self.get_eps1t_mtx33_batch ),
                           'eps0_app' : RTraceEvalElemFieldVar( eval = self.get_eps0_mtx33 ),
-                          'eps1t_app' : RTraceEvalElemFieldVar( eval = self.get_eps1t_mtx33 ),
-                          'u'   : RTraceEvalElemFieldVar( eval = self.get_u )} )
+                          'eps1t_app' : RTraceEvalElemFieldVar( eval = self.get_eps1t_mtx33,
+                                                                eval_batch = self.get_eps1t_mtx33_batch ),
+                          'u'   : RTraceEvalElemFieldVar( eval = self.get_u,
+                                                          eval_batch = self.get_u_batch )} )
 
         return rte_dict
 
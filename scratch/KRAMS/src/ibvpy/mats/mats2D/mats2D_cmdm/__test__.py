@@ -13,10 +13,19 @@
 # Created on Aug 18, 2009 by: rch
 
 from mats2D_cmdm import \
-    MATS2DMicroplaneDamage, PhiFnStrainSoftening
+    MATS2DMicroplaneDamage, PhiFnStrainSoftening, PhiFnStrainHardening, \
+    PhiFnStrainHardeningLinear
 
 from ibvpy.mats.mats2D.__test__ import TestMATS2D
 
+from ibvpy.core.scontext import SContext
+
+from ibvpy.mats.mats_state_arrays import MATSStateArrays
+
+from numpy import array, zeros, zeros_like, allclose, copy, linspace, outer, ones
+
+import unittest
+
 class TestMATS2DMicroplaneDamageCompliance( TestMATS2D ):
     '''Instantiation of the material tests in 2D for the compliance version.
     '''
@@ -94,6 +103,60 @@ class TestMATS2DMicroplaneDamageStiffness( TestMATS2D ):
                                         ivar = 'fracture_energy',
                                         n_steps = 3, load = 0.01 )
 
+class TestMATS2DMicroplaneDamageBatch( unittest.TestCase ):
+
+    def test_phi_fn_arr(self):
+        '''Array evaluation of the damage functions equals the pointwise one.
+        '''
+        e_max_arr = outer( ones( 2 ), linspace( 0, 0.01, 28 ) )
+        for phi_fn in [ PhiFnStrainHardening(),
+                        PhiFnStrainHardeningLinear( alpha = 0.1, beta = 0.05 ) ]:
+            n_c = len( phi_fn.identify_parameters() )
+            c_list = [ linspace( 0.8, 1.2, 28 ) ] * n_c
+            phi_arr = phi_fn.get_value_arr( e_max_arr, *c_list )
+            for i in range( 2 ):
+                for j in range( 28 ):
+                    phi = phi_fn.get_value( e_max_arr[i, j],
+                                            *[ c[j] for c in c_list ] )
+                    self.assertAlmostEqual( phi, phi_arr[i, j] )
+
+    def test_batch_eval(self):
+        '''Batch evaluation delivers the same response as the pointwise one.
+        '''
+        eps_arr = array( [[[ 1e-5, 2e-5, 0.5e-5 ], [ 1e-4, -2e-5, 3e-5 ]],
+                          [[ 4e-4, 1e-4, -2e-4 ], [ -3e-4, 5e-4, 1e-4 ]]],
+                         dtype = 'float_' )
+        for model_version in [ 'compliance', 'stiffness' ]:
+            for symmetrization in [ 'product-type', 'sum-type' ]:
+                mats_eval = MATS2DMicroplaneDamage( E = 34000, nu = 0.25,
+                                                    model_version = model_version,
+                                                    symmetrization = symmetrization,
+                                                    phi_fn = PhiFnStrainSoftening(
+                                                                  G_f = 0.001117,
+                                                                  f_t = 2.8968,
+                                                                  md = 0.0,
+                                                                  h = 1.0 ) )
+                sctx = SContext()
+                sctx.update_state_on = False
+                state = MATSStateArrays( var_shapes = mats_eval.get_state_var_shapes(),
+                                         n_elems = 2, n_ip = 2 )
+                # damage from the loading history
+                e_max_arr = state.committed['e_max']
+                e_max_arr[1, :, ::2] = 2e-4
+                sig_arr, D_arr = mats_eval.get_corr_pred_batch( sctx, eps_arr,
+                                                                zeros_like( eps_arr ),
+                                                                0, 0, state )
+                for e in range( 2 ):
+                    for ip in range( 2 ):
+                        sctx.mats_state_array = copy( e_max_arr[e, ip] )
+                        sig, D = mats_eval.get_corr_pred( sctx, eps_arr[e, ip],
+                                                          zeros( 3 ), 0, 0 )
+                        self.assertTrue( allclose( sig, sig_arr[e, ip] ) )
+                        self.assertTrue( allclose( D, D_arr[e, ip] ) )
+                        # the trial state includes the current strain
+                        self.assertTrue( allclose( state.trial['e_max'][e, ip],
+                            mats_eval._get_state_variables( sctx, eps_arr[e, ip] ) ) )
+
 if __name__ == "__main__":
     import unittest
     import sys;sys.argv = ['', 'TestMATS2DMicroplaneDamageStiffness.test_symmetry_shear_stiffness']    
@@ -12,7 +12,7 @@ from numpy import \
      array, ones, zeros, outer, inner, transpose, dot, frompyfunc, \
      fabs, sqrt, linspace, vdot, identity, tensordot, \
      sin as nsin, meshgrid, float_, ix_, \
-     vstack, hstack, sqrt as arr_sqrt
+     vstack, hstack, sqrt as arr_sqrt, einsum
 
 from math import pi as Pi, cos, sin, exp, sqrt as scalar_sqrt
 
@@ -115,6 +115,15 @@ class MATS2DElastic( MATS2DEval ):
 
         return  sigma, self.D_el
 
+    supports_batch = True
+
+    def get_corr_pred_batch( self, sctx, eps_arr, d_eps_arr, tn, tn1, state ):
+        '''
+        Corrector predictor computation for an array of material points.
+        '''
+        sig_arr = einsum( 'mn,...n->...m', self.D_el, eps_arr )
+        return sig_arr, self.D_el
+
     #---------------------------------------------------------------------------------------------
     # Subsidiary methods realizing configurable features
     #---------------------------------------------------------------------------------------------
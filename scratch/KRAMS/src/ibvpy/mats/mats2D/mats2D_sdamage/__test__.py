@@ -15,9 +15,27 @@
 from mats2D_sdamage import \
     MATS2DScalarDamage
 
+from strain_norm2d import \
+    Euclidean, Energy, Mises, Rankine, Mazars
+
 from ibvpy.mats.mats2D.__test__ import \
     TestMATS2D
 
+from ibvpy.core.scontext import SContext
+
+from ibvpy.mats.mats_state_arrays import MATSStateArrays
+
+from ibvpy.api import \
+    TStepper as TS, TLoop, TLine, BCSlice
+
+from ibvpy.mesh.fe_grid import FEGrid
+
+from ibvpy.fets.fets2D.fets2D4q import FETS2D4Q
+
+from numpy import array, zeros, zeros_like, allclose
+
+import unittest
+
 class TestMATS2DScalarDamage( TestMATS2D ):
 
     def _mats_eval_default(self):
@@ -39,7 +57,75 @@ class TestMATS2DScalarDamage( TestMATS2D ):
         # @todo - check this, it does not seem to be correct.
         self.assert_stress_value( [ 1.9378035241758689, 0, 0, 0 ],
                                     n_steps = 1, load = 0.0001 )
-        
+
+
+class TestMATS2DScalarDamageBatch( unittest.TestCase ):
+
+    def test_batch_eval(self):
+        '''Batch evaluation delivers the same response as the pointwise one.
+        '''
+        eps_arr = array( [[[ 1e-5, 2e-5, 0.5e-5 ], [ 1e-4, -2e-5, 3e-5 ]],
+                          [[ 4e-4, 1e-4, -2e-4 ], [ -3e-4, 5e-4, 1e-4 ]]],
+                         dtype = 'float_' )
+        for strain_norm in [ Euclidean(), Energy(), Mises(), Rankine(), Mazars() ]:
+            mats_eval = MATS2DScalarDamage( E = 34000, nu = 0.25,
+                                            strain_norm = strain_norm )
+            sctx = SContext()
+            sctx.update_state_on = False
+            state = MATSStateArrays( var_shapes = mats_eval.get_state_var_shapes(),
+                                     n_elems = 2, n_ip = 2 )
+            sig_arr, D_arr = mats_eval.get_corr_pred_batch( sctx, eps_arr,
+                                                            zeros_like( eps_arr ),
+                                                            0, 0, state )
+            for e in range( 2 ):
+                for ip in range( 2 ):
+                    sctx.mats_state_array = zeros( 2, dtype = 'float_' )
+                    sig, D = mats_eval.get_corr_pred( sctx, eps_arr[e, ip],
+                                                      zeros( 3 ), 0, 0 )
+                    self.assertTrue( allclose( sig, sig_arr[e, ip] ) )
+                    self.assertTrue( allclose( D, D_arr[e, ip] ) )
+
+    def test_commit_state(self):
+        '''Accepting the trial state swaps the state buffers.
+        '''
+        eps_arr = array( [[[ 4e-4, 1e-4, -2e-4 ]]], dtype = 'float_' )
+        mats_eval = MATS2DScalarDamage( E = 34000, nu = 0.25 )
+        sctx = SContext()
+        state = MATSStateArrays( var_shapes = mats_eval.get_state_var_shapes(),
+                                 n_elems = 1, n_ip = 1 )
+        mats_eval.get_corr_pred_batch( sctx, eps_arr, eps_arr, 0, 0, state )
+        omega_trial = state.trial['omega'].copy()
+        self.assertTrue( omega_trial[0, 0] > 0 )
+        self.assertEqual( state.committed['omega'][0, 0], 0 )
+        state.commit()
+        self.assertTrue( allclose( state.committed['omega'], omega_trial ) )
+        self.assertEqual( state.committed_array[1], omega_trial[0, 0] )
+        # unloading does not reduce the committed damage
+        sig_arr, D_arr = mats_eval.get_corr_pred_batch( sctx, zeros_like( eps_arr ),
+                                                        eps_arr, 0, 0, state )
+        self.assertTrue( allclose( state.trial['omega'], omega_trial ) )
+
+    def test_domain_batch_eval(self):
+        '''The domain switched to the batch evaluation
+        delivers the same response as the pointwise one.
+        '''
+        U_list = []
+        for batch_eval in [ False, True ]:
+            fets_eval = FETS2D4Q( mats_eval = MATS2DScalarDamage( E = 34000, nu = 0.25 ) )
+            domain = FEGrid( coord_max = ( 1., 1., 0. ),
+                             shape = ( 2, 2 ),
+                             fets_eval = fets_eval )
+            domain.dots.batch_eval = batch_eval
+            ts = TS( sdomain = domain,
+                     bcond_list = [ BCSlice( var = 'u', dims = [0, 1], value = 0.,
+                                             slice = domain[0, :, 0, :] ),
+                                    BCSlice( var = 'u', dims = [0], value = 4e-4,
+                                             slice = domain[-1, :, -1, :] ) ] )
+            tloop = TLoop( tstepper = ts,
+                           tline = TLine( min = 0.0, step = 0.25, max = 1.0 ) )
+            U_list.append( tloop.eval().copy() )
+        self.assertTrue( allclose( U_list[0], U_list[1] ) )
+
 if __name__ == "__main__":
     import unittest
     import sys;sys.argv = ['', 'TestMATS2DScalarDamage.test_stress_value'] 
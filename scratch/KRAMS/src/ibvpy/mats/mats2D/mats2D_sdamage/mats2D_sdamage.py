@@ -8,7 +8,7 @@ from enthought.traits.ui.api import \
      Item, View, VSplit, Group, Spring
 
 from numpy import \
-     array, zeros, dot, float_
+     array, zeros, dot, float_, einsum, where, maximum, exp as arr_exp
 
 from math import pi as Pi, cos, sin, exp
 
@@ -120,6 +120,13 @@ class MATS2DScalarDamage( MATS2DEval ):
         '''
         return 2
 
+    def get_state_var_shapes( self ):
+        '''
+        Return the state variables of a material point
+        (maximum equivalent strain and damage)
+        '''
+        return [ ( 'e_max', () ), ( 'omega', () ) ]
+
     def setup( self, sctx ):
         '''
         Intialize state variables.
@@ -181,9 +188,52 @@ class MATS2DScalarDamage( MATS2DEval ):
         # You print the stress you just computed and the value of the apparent E
         return  sigma, D_e_dam
 
+    supports_batch = True
+
+    def get_corr_pred_batch( self, sctx, eps_arr, d_eps_arr, tn, tn1, state ):
+        '''
+        Corrector predictor computation for an array of material points
+        (secant stiffness).
+        @param state MATSStateArrays with the variables e_max and omega
+        '''
+        committed = state.committed
+        e_max, omega = self._get_state_variables_batch( committed['e_max'],
+                                                        committed['omega'],
+                                                        eps_arr )
+        trial = state.trial
+        trial['e_max'][...] = e_max
+        trial['omega'][...] = omega
+
+        D_arr = ( 1 - omega )[..., None, None] * self.D_el
+        sig_arr = einsum( '...mn,...n->...m', D_arr, eps_arr )
+
+        return sig_arr, D_arr
+
     #--------------------------------------------------------------------------
     # Subsidiary methods realizing configurable features
     #--------------------------------------------------------------------------
+    def _get_state_variables_batch( self, e_max, omega, eps_arr ):
+        eps_eqv = self.strain_norm.get_eps_eqv_arr( eps_arr,
+                                                    self.D_el,
+                                                    self.E,
+                                                    self.nu )
+        f_trial = eps_eqv - e_max
+        e_max = maximum( eps_eqv, e_max )
+        omega = where( f_trial > 0, self._get_omega_arr( e_max ), omega )
+        return e_max, omega
+
+    def _get_omega_arr( self, kappa ):
+        '''
+        Return the damage parameter for an array of kappa values
+        (see _get_omega)
+        '''
+        epsilon_0 = self.epsilon_0
+        epsilon_f = self.epsilon_f
+        kappa_0 = maximum( kappa, epsilon_0 )
+        omega = 1. - epsilon_0 / kappa_0 * arr_exp( -1 * ( kappa_0 - epsilon_0 ) / \
+                                                    ( epsilon_f - epsilon_0 ) )
+        return where( kappa >= epsilon_0, omega, 0. )
+
     def _get_state_variables( self, sctx, eps_app_eng ):
         e_max = sctx.mats_state_array[0]
         omega = sctx.mats_state_array[1]
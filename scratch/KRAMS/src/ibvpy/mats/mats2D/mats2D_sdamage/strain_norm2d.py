@@ -1,7 +1,8 @@
 from enthought.traits.api import HasTraits, Float
 from enthought.traits.ui.api import View, Item
 
-from numpy import where, zeros, dot, diag, linalg
+from numpy import where, zeros, dot, diag, linalg, einsum, \
+    sqrt as arr_sqrt, maximum
 from ibvpy.mats.mats2D.mats2D_tensor import map2d_sig_eng_to_mtx
 
 #from numpy.dual import *
@@ -16,6 +17,13 @@ class IStrainNorm2D(HasTraits):
     def get_dede(self,epsilon, D_el, E, nu):
         raise NotImplementedError
 
+    def get_eps_eqv_arr(self, eps_arr, D_el, E, nu):
+        '''
+        Returns equivalent strain for an array of strains (..., 3)
+        (used for the batch evaluation of the damage model).
+        '''
+        raise NotImplementedError
+
 #from the maple shit damage_model_2D_euclidean_local_Code
 class Euclidean(IStrainNorm2D):
 
@@ -31,6 +39,9 @@ class Euclidean(IStrainNorm2D):
         '''
         return float(sqrt(dot(dot(epsilon, self.P_I), epsilon.T))-kappa)
 
+    def get_eps_eqv_arr(self, eps_arr, D_el, E, nu):
+        return arr_sqrt(einsum('...i,ij,...j->...', eps_arr, self.P_I, eps_arr))
+
     def get_dede(self, epsilon, D_el, E, nu):
         dede = zeros(3)
         t1 = pow(epsilon[0], 2.)
@@ -51,6 +62,9 @@ class Energy(IStrainNorm2D):
     def get_f_trial(self, epsilon, D_el, E, nu, kappa):
         #print "time %8.2f sec"%diff
         return sqrt(1./E* dot(dot(epsilon,D_el), epsilon.T))-kappa
+
+    def get_eps_eqv_arr(self, eps_arr, D_el, E, nu):
+        return arr_sqrt(1./E * einsum('...i,ij,...j->...', eps_arr, D_el, eps_arr))
                      
     def get_dede(self, epsilon, D_el, E, nu):
         dede = zeros(3)
@@ -91,6 +105,15 @@ class Mises(IStrainNorm2D):
         t31 = sqrt((t10 / t11 * t14) + 12. * self.k * (t16 /2. + t18 /2. + t20 / 4. - t14 / 6.) / t26)
         t34 = (t1 * t2 * t4 / t6) /2. + t4 * t31 /2.
         return t34 - kappa
+
+    def get_eps_eqv_arr(self, eps_arr, D_el, E, nu):
+        k = self.k
+        e0, e1, e2 = eps_arr[...,0], eps_arr[...,1], eps_arr[...,2]
+        t2 = e0 + e1
+        t14 = t2 * t2
+        t31 = arr_sqrt((k - 1.)**2 / (1. - 2. * nu)**2 * t14 + 
+                       12. * k * (e0**2 / 2. + e1**2 / 2. + e2**2 / 4. - t14 / 6.) / (1. + nu)**2)
+        return ((k - 1.) * t2 / k / (1. - 2. * nu)) / 2. + t31 / k / 2.
     
     def get_dede(self, epsilon, D_el, E, nu):
         dede = zeros(3)
@@ -127,6 +150,15 @@ class Rankine(IStrainNorm2D):
         sigma_I = linalg.eigh(map2d_sig_eng_to_mtx(dot(D_el,epsilon)))[0]#main stresses
         eps_eqv = linalg.norm(where(sigma_I >= 0., sigma_I, zeros(2)))/E#positive part and norm
         return eps_eqv  - kappa
+
+    def get_eps_eqv_arr(self, eps_arr, D_el, E, nu):
+        sig_arr = einsum('ij,...j->...i', D_el, eps_arr)
+        # closed form of the principal stresses in 2D
+        s_mid = (sig_arr[...,0] + sig_arr[...,1]) / 2.
+        s_rad = arr_sqrt(((sig_arr[...,0] - sig_arr[...,1]) / 2.)**2 + sig_arr[...,2]**2)
+        sig_1 = maximum(s_mid + s_rad, 0.)
+        sig_2 = maximum(s_mid - s_rad, 0.)
+        return arr_sqrt(sig_1**2 + sig_2**2) / E
     
     def get_dede(self, epsilon, D_el, E, nu):
         dede = zeros(3)
@@ -165,6 +197,10 @@ class Mazars(IStrainNorm2D):
         epsilon_pp = where(epsilon >= 0., epsilon, zeros(3))
         return sqrt(1./E* dot(dot(epsilon_pp,D_el), epsilon_pp.T))-kappa
 
+    def get_eps_eqv_arr(self, eps_arr, D_el, E, nu):
+        eps_pp = maximum(eps_arr, 0.)
+        return arr_sqrt(1./E * einsum('...i,ij,...j->...', eps_pp, D_el, eps_pp))
+
 
     
     def get_dede(self, epsilon, D_el, E, nu):
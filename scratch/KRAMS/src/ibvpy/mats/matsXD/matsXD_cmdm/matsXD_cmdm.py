@@ -15,16 +15,19 @@
 from enthought.traits.api import \
      Array, Bool, Callable, Enum, Float, HasTraits, \
      Instance, Int, Trait, Range, HasTraits, on_trait_change, Event, \
-     implements, Dict, Property, cached_property, Delegate, Self
+     implements, Dict, Property, cached_property, Delegate, Self, TraitError
 
 from enthought.traits.ui.api import \
      Item, View, HSplit, VSplit, VGroup, Group, Spring, Include
 
 from numpy import \
-     array, ones, zeros, outer, inner, transpose, dot, frompyfunc, \
-     fabs, linspace, vdot, identity, tensordot, \
+     array, arange, ones, zeros, outer, inner, transpose, dot, frompyfunc, \
+     fabs, linspace, vdot, identity, tensordot, where, \
      sin as nsin, meshgrid, float_, ix_, \
-     vstack, hstack, sqrt as arr_sqrt, swapaxes, copy
+     vstack, hstack, sqrt as arr_sqrt, swapaxes, copy, einsum
+
+from numpy.linalg import \
+    eigh as arr_eigh, inv as arr_inv
 
 from math import \
     pi as Pi, cos, sin, exp, sqrt as scalar_sqrt
@@ -124,6 +127,9 @@ class MATSXDMicroplaneDamage( PolarDiscr ):
         # strains reached in the loading history are saved
         return self.n_mp
 
+    def get_state_var_shapes( self ):
+        return [ ( 'e_max', ( self.n_mp, ) ) ]
+
     D4_e = Property
     def _get_D4_e( self ):
         '''
@@ -155,7 +161,61 @@ class MATSXDMicroplaneDamage( PolarDiscr ):
         return identity( self.n_dim )
 
     #-----------------------------------------------------------------------------
-    # MICROPLANE-DISCRETIZATION RELATED METHOD 
+    # Index tables of the engineering notation
+    #-----------------------------------------------------------------------------
+    # The tensor mappings (map_eps_eng_to_mtx, map_tns4_to_tns2, compliance_mapping)
+    # supplied by the dimensional subclasses operate on a single material point.
+    # The index tables below realize the same mappings for arrays with arbitrary
+    # leading dimensions (..., n_eng) or (..., n_dim, n_dim, n_dim, n_dim).
+    #
+    eng_idx_map = Property( depends_on = 'n_dim' )
+    @cached_property
+    def _get_eng_idx_map( self ):
+        '''
+        Return the tensor index pairs (i,j) of the engineering components,
+        the engineering index of each tensor component and the factors
+        between the tensorial and engineering shear components.
+        '''
+        if self.n_dim == 2:
+            ij_arr = array( [[0, 0], [1, 1], [0, 1]] )
+        elif self.n_dim == 3:
+            ij_arr = array( [[0, 0], [1, 1], [2, 2], [1, 2], [0, 2], [0, 1]] )
+        else:
+            raise TraitError, 'Unsupported dimension %d' % self.n_dim
+        n_dim = self.n_dim
+        mn_idx = zeros( ( n_dim, n_dim ), dtype = int )
+        mn_idx[ ij_arr[:, 0], ij_arr[:, 1] ] = arange( ij_arr.shape[0] )
+        mn_idx[ ij_arr[:, 1], ij_arr[:, 0] ] = arange( ij_arr.shape[0] )
+        # tensorial strain = engineering strain * eps_factor
+        eps_factor = ( identity( n_dim ) + 1. ) / 2.
+        # factors of the compliance mapping (1 normal, 2 shear components)
+        shear_factor = where( ij_arr[:, 0] == ij_arr[:, 1], 1., 2. )
+        return ij_arr, mn_idx, eps_factor, shear_factor
+
+    def _map_eps_eng_to_mtx_arr( self, eps_eng ):
+        '''
+        Switch from engineering notation to tensor notation for an array of strains
+        '''
+        ij_arr, mn_idx, eps_factor, shear_factor = self.eng_idx_map
+        return eps_eng[..., mn_idx] * eps_factor
+
+    def _map_tns4_to_tns2_arr( self, tns4 ):
+        '''
+        Map an array of fourth order tensors to matrices assuming minor and major symmetry
+        '''
+        ij_arr = self.eng_idx_map[0]
+        i, j = ij_arr[:, 0], ij_arr[:, 1]
+        return tns4[..., i[:, None], j[:, None], i[None, :], j[None, :]]
+
+    def _compliance_mapping_arr( self, C2 ):
+        '''
+        Apply the compliance mapping to an array of compliance matrices
+        '''
+        shear_factor = self.eng_idx_map[3]
+        return C2 * outer( shear_factor, shear_factor )
+
+    #-----------------------------------------------------------------------------
+    # MICROPLANE-DISCRETIZATION RELATED METHOD
     #-----------------------------------------------------------------------------
     # get the dyadic product of the microplane normals
     # the array of microplane normals is implemented 
@@ -181,33 +241,34 @@ class MATSXDMicroplaneDamage( PolarDiscr ):
         tensor 'C_mdm', e.g. the construction of the damage effect tensor 'M4'.
         '''
         # Switch from engineering notation to tensor notation for the apparent strains
-        eps_mtx = self.map_eps_eng_to_mtx( eps_eng )
+        # (the strain may be supplied for an array of material points (..., n_eng))
+        eps_mtx = self._map_eps_eng_to_mtx_arr( eps_eng )
         # Projection of apparent strain onto the individual microplanes
         # slower: e_vct_arr = array( [ dot( eps_mtx, mpn ) for mpn in self._MPN ] )
         # slower: e_vct_arr = transpose( dot( eps_mtx, transpose(self._MPN) ))
         # due to the symmetry of the strain tensor eps_mtx = transpose(eps_mtx) and so this is equal
-        e_vct_arr = dot( self._MPN, eps_mtx )
+        # to e_vct_arr = dot( self._MPN, eps_mtx ) for a single material point
+        e_vct_arr = einsum( 'pj,...jk->...pk', self._MPN, eps_mtx )
         return e_vct_arr
 
     def _get_e_equiv_arr( self, e_vct_arr ):
         '''
-        Returns a list of the microplane equivalent strains 
+        Returns a list of the microplane equivalent strains
         based on the list of microplane strain vectors
+        (shape (..., n_mp, n_dim) -> (..., n_mp))
         '''
         # magnitude of the normal strain vector for each microplane
-        #@todo: faster numpy functionality possible?
-        e_N_arr = array( [ dot( e_vct, mpn ) for e_vct, mpn in zip( e_vct_arr, self._MPN ) ] )
+        e_N_arr = einsum( '...pi,pi->...p', e_vct_arr, self._MPN )
         # positive part of the normal strain magnitude for each microplane
         e_N_pos_arr = ( fabs( e_N_arr ) + e_N_arr ) / 2
         # normal strain vector for each microplane
-        #@todo: faster numpy functionality possible?
-        e_N_vct_arr = array( [ self._MPN[i, :] * e_N_arr[i] for i in range( 0, self.n_mp ) ] )
+        e_N_vct_arr = e_N_arr[..., None] * self._MPN
         # tangent strain ratio
         c_T = self.c_T
         # tangential strain vector for each microplane
         e_T_vct_arr = e_vct_arr - e_N_vct_arr
         # squared tangential strain vector for each microplane
-        e_TT_arr = array( [ inner( e_T_vct, e_T_vct ) for e_T_vct in e_T_vct_arr ] )
+        e_TT_arr = einsum( '...pi,...pi->...p', e_T_vct_arr, e_T_vct_arr )
         # equivalent strain for each microplane
         e_equiv_arr = arr_sqrt( e_N_pos_arr * e_N_pos_arr + c_T * e_TT_arr )
         return e_equiv_arr
@@ -240,12 +301,29 @@ class MATSXDMicroplaneDamage( PolarDiscr ):
         e_max_arr_new = self._get_e_max( e_equiv_arr, e_max_arr_old )
         return e_max_arr_new
 
+    def _get_state_variables_batch( self, e_max_arr, eps_arr ):
+        '''
+        Returns the maximum equivalent microplane strains for an array
+        of material points (..., n_mp) without modifying the supplied e_max_arr.
+        '''
+        e_vct_arr = self._get_e_vct_arr( eps_arr )
+        e_equiv_arr = self._get_e_equiv_arr( e_vct_arr )
+        return self._get_e_max( e_equiv_arr, e_max_arr )
+
     def _get_phi_arr( self, sctx, eps_app_eng ):
         '''
         Returns a list of the integrity factors for all microplanes.
         '''
         e_max_arr = self._get_state_variables( sctx, eps_app_eng )
-        return self.get_phi_arr( sctx, e_max_arr )
+        return self._get_phi_arr_from_e_max( sctx, e_max_arr )
+
+    def _get_phi_arr_from_e_max( self, sctx, e_max_arr ):
+        '''
+        Returns the integrity factors for the maximum equivalent microplane
+        strains (..., n_mp). The coefficients of the varied parameters
+        (n_mp) are broadcasted over the leading dimensions.
+        '''
+        return array( self.get_phi_arr( sctx, e_max_arr ), dtype = float_ )
 
     def _get_phi_mtx( self, sctx, eps_app_eng ):
         '''
@@ -253,14 +331,15 @@ class MATSXDMicroplaneDamage( PolarDiscr ):
         '''
         # scalar integrity factor for each microplane
         phi_arr = self._get_phi_arr( sctx, eps_app_eng )
-        # integration terms for each microplanes
-        #@todo: faster numpy functionality possible?
-        phi_mtx_arr = array( [ phi_arr[i] * self._MPNN[i, :, :] * self._MPW[i]
-                                for i in range( 0, self.n_mp ) ] )
-        # sum of contributions from all microplanes
-        # sum over the first dimension (over the microplanes)
-        phi_mtx = phi_mtx_arr.sum( 0 )
-        return phi_mtx
+        return self._get_phi_mtx_arr( phi_arr )
+
+    def _get_phi_mtx_arr( self, phi_arr ):
+        '''
+        Returns the 2nd order damage tensor for the integrity factors (..., n_mp)
+        '''
+        # sum of contributions from all microplanes:
+        # phi_mtx = sum_p phi_p * MPNN_p * MPW_p
+        return einsum( '...p,pij->...ij', phi_arr * self._MPW, self._MPNN )
 
     def _get_psi_mtx( self, sctx, eps_app_eng ):
         '''
@@ -268,41 +347,44 @@ class MATSXDMicroplaneDamage( PolarDiscr ):
         '''
         # scalar integrity factor for each microplane
         phi_arr = self._get_phi_arr( sctx, eps_app_eng )
-        # integration terms for each microplanes
+        return self._get_psi_mtx_arr( phi_arr )
 
-        psi_mtx_arr = array( [ 1. / phi_arr[i] * self._MPNN[i, :, :] * self._MPW[i]
-                                for i in range( 0, self.n_mp ) ] )
+    def _get_psi_mtx_arr( self, phi_arr ):
+        '''
+        Returns the 2nd order damage effect tensor for the integrity factors (..., n_mp)
+        '''
+        # sum of contributions from all microplanes:
+        # psi_mtx = sum_p 1/phi_p * MPNN_p * MPW_p
+        return einsum( '...p,pij->...ij', self._MPW / phi_arr, self._MPNN )
 
-        # sum of contributions from all microplanes
-        # sum over the first dimension (over the microplanes)
-        psi_mtx = psi_mtx_arr.sum( 0 )
-        return psi_mtx
+    #-----------------------------------------------------------------------------------------------------
+    # Damage tensors of 4th order
+    #-----------------------------------------------------------------------------------------------------
+    # The methods accept a single 2nd order tensor (n_dim, n_dim) or an array
+    # of tensors (..., n_dim, n_dim) and return the 4th order tensors with the
+    # same leading dimensions.
+    #
+    def _get_sqrt_tns( self, tns2 ):
+        '''
+        Tensorial square root of a symmetric positive definite 2nd order tensor
+        evaluated in the principle coordinates.
+        '''
+        # Get the principle directions (batched eigendecomposition):
+        eig_value, eig_mtx = arr_eigh( tns2 )
+        # transform the square root of the principle values back to x-y-coordinates:
+        # w_ij = sum_k V_ik * sqrt( lambda_k ) * V_jk
+        return einsum( '...ik,...k,...jk->...ij',
+                       eig_mtx, arr_sqrt( eig_value ), eig_mtx )
 
     def _get_beta_tns_product_type( self, phi_mtx ):
         '''
         Returns the 4th order damage tensor 'beta4' using product-type symmetrization
         (cf. [Baz97], Eq.(87))
         '''
-        n_dim = self.n_dim
-        # Get the direction of the principle damage coordinates (pdc):
-        phi_eig_value, phi_eig_mtx = eigh( phi_mtx )
-        phi_eig_value_real = array( [ pe.real for pe in phi_eig_value] )
-        # transform phi_mtx to PDC:
-        # (assure that besides the diagonal the entries are exactly zero)
-        phi_pdc_mtx = zeros( ( n_dim, n_dim ), dtype = float )
-        for i in range( n_dim ):
-            phi_pdc_mtx[i, i] = phi_eig_value_real[i]
         # w_mtx = tensorial square root of the second order damage tensor:
-        w_pdc_mtx = arr_sqrt( phi_pdc_mtx )
-#        print "w_pdc_mtx", w_pdc_mtx
-        # transform the matrix w back to x-y-coordinates:
-        w_mtx = dot( dot( phi_eig_mtx, w_pdc_mtx ), transpose( phi_eig_mtx ) )
+        w_mtx = self._get_sqrt_tns( phi_mtx )
         # beta_ijkl = w_ik * w_jl (cf. [Baz 97])
-        # exploiting numpy-functionality (faster).
-        # Method 'outer' returns beta_ijkl = w_ij * w_kl,
-        # therefore the axis j and k need to be swapped
-        beta4_ = outer( w_mtx, w_mtx ).reshape( n_dim, n_dim, n_dim, n_dim )
-        beta4 = beta4_.swapaxes( 1, 2 )
+        beta4 = einsum( '...ik,...jl->...ijkl', w_mtx, w_mtx )
         return beta4
 
     def _get_beta_tns_sum_type( self, phi_mtx ):
@@ -310,64 +392,40 @@ class MATSXDMicroplaneDamage( PolarDiscr ):
         Returns the 4th order damage tensor 'beta4' using sum-type symmetrization
         (cf. [Jir99], Eq.(21))
         '''
-        n_dim = self.n_dim
         delta = self.identity_tns
 
         # The following line correspond to the tensorial expression:
-        # 
+        #
         #        beta4 = zeros((n_dim,n_dim,n_dim,n_dim),dtype=float)
         #        for i in range(0,n_dim):
         #            for j in range(0,n_dim):
         #                for k in range(0,n_dim):
         #                    for l in range(0,n_dim):
         #                        beta4[i,j,k,l] = 0.25 * ( phi_mtx[i,k] * delta[j,l] + phi_mtx[i,l] * delta[j,k] +\
-        #                                                  phi_mtx[j,k] * delta[i,l] + phi_mtx[j,l] * delta[i,k] ) 
-        #        
-
-        # use numpy functionality to evaluate [Jir99], Eq.(21) 
-        beta_ijkl = outer( phi_mtx, delta ).reshape( n_dim, n_dim, n_dim, n_dim )
-        beta_ikjl = beta_ijkl.swapaxes( 1, 2 )
-        beta_iljk = beta_ikjl.swapaxes( 2, 3 )
-        beta_jlik = beta_iljk.swapaxes( 0, 1 )
-        beta_jkil = beta_jlik.swapaxes( 2, 3 )
-        beta4 = 0.25 * ( beta_ikjl + beta_iljk + beta_jkil + beta_jlik )
-
+        #                                                  phi_mtx[j,k] * delta[i,l] + phi_mtx[j,l] * delta[i,k] )
+        #
+        beta4 = 0.25 * ( einsum( '...ik,jl->...ijkl', phi_mtx, delta ) +
+                         einsum( '...il,jk->...ijkl', phi_mtx, delta ) +
+                         einsum( '...jk,il->...ijkl', phi_mtx, delta ) +
+                         einsum( '...jl,ik->...ijkl', phi_mtx, delta ) )
         return beta4
 
     def _get_M_tns_product_type( self, psi_mtx ):
         '''
         Returns the 4th order damage effect tensor 'M4' using product-type symmetrization
         '''
-        n_dim = self.n_dim
-        # Get the direction orthogonal to the principle damage coordinates (pdc):
-        # @todo: is this direction orthogonal? Which one do we want?
-        psi_eig_value, psi_eig_mtx = eigh( psi_mtx )
-        psi_eig_value_real = array( [ pe.real for pe in psi_eig_value] )
-        # transform phi_mtx to PDC:
-        # (assure that besides the diagonal the entries are exactly zero)
-        psi_pdc_mtx = zeros( ( n_dim, n_dim ), dtype = float )
-        for i in range( n_dim ):
-            psi_pdc_mtx[i, i] = psi_eig_value_real[i]
         # second order damage effect tensor:
-        w_hat_pdc_mtx = arr_sqrt( psi_pdc_mtx )
-#        print "w_hat_pdc_mtx", w_hat_pdc_mtx
-        # transform the matrix w back to x-y-coordinates:
-        w_hat_mtx = dot( dot( psi_eig_mtx, w_hat_pdc_mtx ), transpose( psi_eig_mtx ) )
-#        print "w_hat_mtx", w_hat_mtx
+        # @todo: is this direction orthogonal? Which one do we want?
+        w_hat_mtx = self._get_sqrt_tns( psi_mtx )
         # M_ijkl = w_hat_ik * w_hat_lj (cf. Eq.(5.62) Script Prag Jirasek (2007))
-        #        = w_hat_ik * w_hat_jl (w is a symmetric tensor) 
-        # Exploiting numpy-functionality using the
-        # method 'outer' (returns M_ijkl = w_hat_ij * w_hat_kl),
-        # therefore the axis j and k need to be swapped
-        M4_ = outer( w_hat_mtx, w_hat_mtx ).reshape( n_dim, n_dim, n_dim, n_dim )
-        M4 = M4_.swapaxes( 1, 2 )
+        #        = w_hat_ik * w_hat_jl (w is a symmetric tensor)
+        M4 = einsum( '...ik,...jl->...ijkl', w_hat_mtx, w_hat_mtx )
         return M4
 
     def _get_M_tns_sum_type( self, psi_mtx ):
         '''
         Returns the 4th order damage effect tensor 'M4' using sum-type symmetrization
         '''
-        n_dim = self.n_dim
         delta = self.identity_tns
 
         # The line below corresponds to the tensorial expression
@@ -379,16 +437,11 @@ class MATSXDMicroplaneDamage( PolarDiscr ):
         #                for k in range(0,n_dim):
         #                    for l in range(0,n_dim):
         #                        M4[i,j,k,l] = 0.25 * ( psi_mtx[i,k] * delta[j,l] + psi_mtx[i,l] * delta[j,k] +\
-        #                                               psi_mtx[j,k] * delta[i,l] + psi_mtx[j,l] * delta[i,k] ) 
-
-        # use numpy functionality to evaluate [Jir99], Eq.(21) 
-        M_ijkl = outer( psi_mtx, delta ).reshape( n_dim, n_dim, n_dim, n_dim )
-        M_ikjl = M_ijkl.swapaxes( 1, 2 )
-        M_iljk = M_ikjl.swapaxes( 2, 3 )
-        M_jlik = M_iljk.swapaxes( 0, 1 )
-        M_jkil = M_jlik.swapaxes( 2, 3 )
-        M4 = 0.25 * ( M_ikjl + M_iljk + M_jkil + M_jlik )
-
+        #                                               psi_mtx[j,k] * delta[i,l] + psi_mtx[j,l] * delta[i,k] )
+        M4 = 0.25 * ( einsum( '...ik,jl->...ijkl', psi_mtx, delta ) +
+                      einsum( '...il,jk->...ijkl', psi_mtx, delta ) +
+                      einsum( '...jk,il->...ijkl', psi_mtx, delta ) +
+                      einsum( '...jl,ik->...ijkl', psi_mtx, delta ) )
         return M4
 
     #--------------------------------------------------------------------------------
@@ -460,34 +513,53 @@ class MATSXDMicroplaneDamage( PolarDiscr ):
             h = self.get_regularizing_length( sctx, eps_app_eng )
             self.phi_fn.h = h
 
+        e_max_arr = self._get_state_variables( sctx, eps_avg )
+        D2_mdm = self._get_D2_mdm( sctx, e_max_arr )
+
+        #----------------------------------------------------------------------------------------
+        # Return stresses (corrector) and damaged secant stiffness matrix (predictor)
+        #----------------------------------------------------------------------------------------
+
+        sig_eng = tensordot( D2_mdm, eps_app_eng, [[1], [0]] )
+        return sig_eng, D2_mdm
+
+    def _get_D2_mdm( self, sctx, e_max_arr ):
+        '''
+        Returns the damaged secant stiffness matrix for the maximum equivalent
+        microplane strains e_max_arr (n_mp) of a single material point
+        or for an array of material points (..., n_mp).
+        '''
+        # integrity factor for each microplane
+        phi_arr = self._get_phi_arr_from_e_max( sctx, e_max_arr )
+
         #------------------------------------------------------------------------------------------------
         # stiffness version:
         #------------------------------------------------------------------------------------------------
         if self.model_version == 'stiffness' :
 
             #------------------------------------------------------------------------------------
-            # Damage tensor (2th order):  
+            # Damage tensor (2th order):
             #------------------------------------------------------------------------------------
 
-            phi_mtx = self._get_phi_mtx( sctx, eps_avg )
-
+            phi_mtx = self._get_phi_mtx_arr( phi_arr )
 
             #------------------------------------------------------------------------------------
-            # Damage tensor (4th order) using product- or sum-type symmetrization: 
+            # Damage tensor (4th order) using product- or sum-type symmetrization:
             #------------------------------------------------------------------------------------
             beta4 = self._get_beta_tns( phi_mtx )
 
             #-------------------------------------------------------------------------------------
             # Damaged stiffness tensor calculated based on the damage tensor beta4:
             #-------------------------------------------------------------------------------------
-            # (cf. [Jir99] Eq.(7): C = beta * D_e * beta^T), 
+            # (cf. [Jir99] Eq.(7): C = beta * D_e * beta^T),
             # minor symmetry is tacitly assumed ! (i.e. beta_ijkl = beta_jilk)
-            D4_mdm = tensordot( beta4, tensordot( self.D4_e, beta4, [[2, 3], [2, 3]] ), [[2, 3], [0, 1]] )
+            D4_beta = einsum( 'abkl,...ijkl->...abij', self.D4_e, beta4 )
+            D4_mdm = einsum( '...pqab,...abij->...pqij', beta4, D4_beta )
 
             #-------------------------------------------------------------------------------------
             # Reduction of the fourth order tensor to a matrix assuming minor and major symmetry:
             #-------------------------------------------------------------------------------------
-            D2_mdm = self.map_tns4_to_tns2( D4_mdm )
+            D2_mdm = self._map_tns4_to_tns2_arr( D4_mdm )
 
         #------------------------------------------------------------------------------------------------
         # compliance version:
@@ -495,36 +567,61 @@ class MATSXDMicroplaneDamage( PolarDiscr ):
         elif self.model_version == 'compliance' :
 
             #------------------------------------------------------------------------------------
-            # Damage effect tensor (2th order):  
+            # Damage effect tensor (2th order):
             #------------------------------------------------------------------------------------
 
-            psi_mtx = self._get_psi_mtx( sctx, eps_avg )
-
+            psi_mtx = self._get_psi_mtx_arr( phi_arr )
 
             #------------------------------------------------------------------------------------
-            # Damage effect tensor (4th order) using product- or sum-type-symmetrization:  
+            # Damage effect tensor (4th order) using product- or sum-type-symmetrization:
             #------------------------------------------------------------------------------------
             M4 = self._get_M_tns( psi_mtx )
 
             #-------------------------------------------------------------------------------------
             # Damaged compliance tensor calculated based on the damage effect tensor M4:
             #-------------------------------------------------------------------------------------
-            # (cf. [Jir99] Eq.(8): C = M^T * C_e * M, 
+            # (cf. [Jir99] Eq.(8): C = M^T * C_e * M,
             # minor symmetry is tacitly assumed ! (i.e. M_ijkl = M_jilk)
-            C4_mdm = tensordot( M4, tensordot( self.C4_e, M4, [[2, 3], [0, 1]] ), [[0, 1], [0, 1]] )
+            C4_M = einsum( 'abcd,...cdkl->...abkl', self.C4_e, M4 )
+            C4_mdm = einsum( '...abij,...abkl->...ijkl', M4, C4_M )
 
             #-------------------------------------------------------------------------------------
-            # Reduction of the fourth order tensor to a matrix assuming minor and major symmetry: 
+            # Reduction of the fourth order tensor to a matrix assuming minor and major symmetry:
             #-------------------------------------------------------------------------------------
-            C2_mdm = self.map_tns4_to_tns2( C4_mdm )
-            D2_mdm = inv( self.compliance_mapping( C2_mdm ) )
+            C2_mdm = self._map_tns4_to_tns2_arr( C4_mdm )
+            D2_mdm = arr_inv( self._compliance_mapping_arr( C2_mdm ) )
 
-        #----------------------------------------------------------------------------------------
-        # Return stresses (corrector) and damaged secant stiffness matrix (predictor)
-        #----------------------------------------------------------------------------------------
+        return D2_mdm
 
-        sig_eng = tensordot( D2_mdm, eps_app_eng, [[1], [0]] )
-        return sig_eng, D2_mdm
+    #-----------------------------------------------------------------------------------------------------
+    # Evaluation of an array of material points
+    #-----------------------------------------------------------------------------------------------------
+    # The regularization requires the spatial context of the individual
+    # material point (element length) - the batch evaluation is not applicable then.
+    #
+    supports_batch = Property( depends_on = 'regularization' )
+    def _get_supports_batch( self ):
+        return not self.regularization
+
+    def get_corr_pred_batch( self, sctx, eps_arr, d_eps_arr, tn, tn1, state ):
+        '''
+        Corrector predictor computation for an array of material points.
+        @param eps_arr engineering strains (..., n_eng)
+        @param state MATSStateArrays with the maximum equivalent
+            microplane strains e_max (..., n_mp)
+        '''
+        e_max_arr = self._get_state_variables_batch( state.committed['e_max'], eps_arr )
+        state.trial['e_max'][...] = e_max_arr
+
+        if self.elastic_debug:
+            D2_e = copy( self.D2_e )
+            sig_arr = einsum( 'mn,...n->...m', D2_e, eps_arr )
+            return sig_arr, D2_e
+
+        D2_mdm = self._get_D2_mdm( sctx, e_max_arr )
+
+        sig_arr = einsum( '...mn,...n->...m', D2_mdm, eps_arr )
+        return sig_arr, D2_mdm
 
     #---------------------------------------------------------------------------------------------
     # Control variables and update state method
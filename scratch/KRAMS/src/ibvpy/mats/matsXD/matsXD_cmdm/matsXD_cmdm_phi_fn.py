@@ -24,7 +24,7 @@ from numpy import \
      array, ones, zeros, outer, inner, transpose, dot, frompyfunc, \
      fabs, sqrt, linspace, vdot, identity, tensordot, where, trapz, \
      sin as nsin, meshgrid, float_, ix_, \
-     vstack, hstack, sqrt as arr_sqrt
+     vstack, hstack, sqrt as arr_sqrt, exp as arr_exp, asarray
      
 from mathkit.mfn.mfn_line.mfn_line import MFnLineArray     
 
@@ -106,6 +106,15 @@ class PhiFnBase( HasStrictTraits ):
                 params.append( name )
         return params
 
+    def get_value_arr( self, e_max_arr, *c_list ):
+        '''
+        Evaluate the integrity for an array of maximum strains,
+        the coefficients in c_list are broadcasted against e_max_arr.
+        Evaluates get_value pointwise unless overloaded.
+        '''
+        phi_fn_vectorized = frompyfunc( self.get_value, 1 + len( c_list ), 1 )
+        return array( phi_fn_vectorized( e_max_arr, *c_list ), dtype = float_ )
+
     def fit_params( self, *params ):
         '''Possiblity to adapt the microplane-related 
         material paramters based on the integral characteric specification.
@@ -128,6 +137,23 @@ class PhiFnGeneral( PhiFnBase ):
         '''
         return self.mfn.get_value( e_max )
 
+    def get_value_arr( self, e_max_arr, *c_list ):
+        '''
+        Evaluate the integrity for an array of maximum strains
+        (linear interpolation as in MFnLineArray.get_value).
+        '''
+        e_max = asarray( e_max_arr, dtype = float_ )
+        xdata = self.mfn.xdata
+        ydata = self.mfn.ydata
+        x2idx = xdata.searchsorted( e_max )
+        x2idx = where( x2idx == len( xdata ), x2idx - 1, x2idx )
+        x1idx = x2idx - 1
+        x1 = xdata[ x1idx ]
+        dx = xdata[ x2idx ] - x1
+        y1 = ydata[ x1idx ]
+        dy = ydata[ x2idx ] - y1
+        return y1 + dy / dx * ( e_max - x1 )
+
     def get_integ( self, e_max, *c_list ):
         '''
         Evaluate the integrity of a particular microplane.
@@ -218,6 +244,18 @@ class PhiFnGeneralExtended( PhiFnGeneral ):
         else:
             return 1e-50
 
+    def get_value_arr( self, e_max_arr, *c_list ):
+        '''
+        Evaluate the integrity for an array of maximum strains.
+        '''
+        e_max = asarray( e_max_arr, dtype = float_ )
+        eps_last = self.mfn.xdata[-1]
+        phi_last = self.mfn.ydata[-1]
+        eps_fail = eps_last * self.factor_eps_fail
+        phi_arr = super( PhiFnGeneralExtended, self ).get_value_arr( e_max, *c_list )
+        return where( e_max <= eps_last, phi_arr,
+                      where( e_max < eps_fail, phi_last, 1e-50 ) )
+
     def get_plot_range( self ):
         '''plot the extended phi function'''
         return self.mfn.xdata[0], self.mfn.xdata[-1] * self.factor_eps_fail * 1.1
@@ -328,6 +366,21 @@ class PhiFnStrainSoftening( PhiFnBase ):
         else:
             return sqrt( Epp / e_max * exp( -(e_max-Epp)/Efp ))    
 
+    def get_value_arr( self, e_max_arr, *c_list ):
+        '''
+        Evaluate the integrity for an array of maximum strains.
+        '''
+        if len( c_list ) == 0:
+            c_list = [1.,1.]
+        e_max = asarray( e_max_arr, dtype = float_ )
+        Epp = self.Epp * c_list[0]
+        Efp = self.Efp * c_list[1]
+        undamaged = e_max <= Epp
+        # avoid the evaluation of the softening branch below the onset of damage
+        e_dmg = where( undamaged, Epp, e_max )
+        return where( undamaged, 1.0,
+                      arr_sqrt( Epp / e_dmg * arr_exp( -( e_dmg - Epp ) / Efp ) ) )
+
     def __call__( self, e_max, *c_list ):
         return self.get_value( e_max, *c_list )
     
@@ -445,6 +498,49 @@ class PhiFnStrainHardeningLinear( PhiFnBase ):
             return sqrt( 1.0+E_m*(-E_f*rho*epsilon+epsilon*rho*rho*E_f+beta*sigma_0-beta*
                                   sigma_0*rho-epsilon*E_m+2.0*epsilon*rho*E_m-epsilon*rho*rho*E_m)/
                                   pow(rho * E_f + E_m-rho*E_m,2.0)/epsilon )
+
+    def get_value_arr( self, e_max_arr, *c_list ):
+        '''
+        Evaluate the integrity for an array of maximum strains.
+        '''
+        if len( c_list ) == 0:
+            c_list = [1.,1.,1.,1.,1.,1.,1.]
+        e_max = asarray( e_max_arr, dtype = float_ )
+
+        E_f     = self.E_f    * c_list[0]
+        E_m     = self.E_m    * c_list[1]
+        rho     = self.rho    * c_list[2]
+        sigma_0 = self.sigma_0 * c_list[3]
+        alpha   = self.alpha   * c_list[4]
+        beta    = self.beta    * c_list[5]
+        Elimit  = self.Elimit  * c_list[6]
+        #
+        E_c = E_m * ( 1 - rho ) + E_f * rho
+
+        epsilon_0 = sigma_0 / E_c
+
+        undamaged = e_max <= epsilon_0
+        failed = e_max >= Elimit
+
+        epsilon_1 = sigma_0 * ( -rho * E_f - E_m + rho * E_m + rho * E_f * \
+                              alpha + beta * E_m - beta * E_m * rho ) / \
+                              ( rho * E_f + E_m - rho * E_m ) / rho / E_f / \
+                              ( alpha - 1.0 );
+
+        # avoid the evaluation of the branches below the onset of damage
+        epsilon = where( undamaged, epsilon_0, e_max )
+
+        phi_1 = arr_sqrt( 1.0+(sigma_0*rho*E_f+sigma_0*E_m-sigma_0*rho*E_m+rho*rho*E_f*E_f*
+                alpha*epsilon+rho*E_f*alpha*epsilon*E_m-rho*rho*E_f*alpha*epsilon*E_m-rho*E_f*
+                alpha*sigma_0-epsilon*rho*rho*E_f*E_f-2.0*epsilon*rho*E_f*E_m+2.0*epsilon*rho*
+                rho*E_f*E_m-epsilon*E_m*E_m+2.0*epsilon*rho*E_m*E_m-epsilon*rho*rho*E_m*E_m)/
+                (rho*E_f+E_m-rho*E_m)**2/epsilon )
+        phi_2 = arr_sqrt( 1.0+E_m*(-E_f*rho*epsilon+epsilon*rho*rho*E_f+beta*sigma_0-beta*
+                                   sigma_0*rho-epsilon*E_m+2.0*epsilon*rho*E_m-epsilon*rho*rho*E_m)/
+                                   (rho * E_f + E_m-rho*E_m)**2/epsilon )
+        return where( undamaged, 1.0,
+                      where( failed, 1.e-100,
+                             where( epsilon < epsilon_1, phi_1, phi_2 ) ) )
         
 
     def __call__( self, e_max, *c_list ):
@@ -556,6 +652,24 @@ class PhiFnStrainHardening( PhiFnBase ):
         else:
             return (1-Dfp) * sqrt( Epp / e_max * exp( -(e_max-Epp)/Efp )) + Dfp
 
+    def get_value_arr( self, e_max_arr, *c_list ):
+        '''
+        Evaluate the integrity for an array of maximum strains.
+        '''
+        if len( c_list ) == 0:
+            c_list = [1.,1.,1.,1.]
+        e_max = asarray( e_max_arr, dtype = float_ )
+        Epp    = self.Epp    * c_list[0]
+        Efp    = self.Efp    * c_list[1]
+        Dfp    = self.Dfp    * c_list[2]
+        Elimit = self.Elimit * c_list[3]
+        #
+        undamaged = e_max <= Epp
+        # avoid the evaluation of the softening branch below the onset of damage
+        e_dmg = where( undamaged, Epp, e_max )
+        phi = ( 1 - Dfp ) * arr_sqrt( Epp / e_dmg * arr_exp( -( e_dmg - Epp ) / Efp ) ) + Dfp
+        return where( undamaged, 1.0, where( e_max >= Elimit, 1.e-100, phi ) )
+
     def __call__( self, e_max, *c_list ):
         return self.get_value( e_max, *c_list )
 
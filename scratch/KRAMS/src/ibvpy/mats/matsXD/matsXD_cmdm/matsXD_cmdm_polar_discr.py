@@ -229,13 +229,11 @@ class PolarDiscr( HasTraits ):
         Return the damage coefficients
         '''
         # gather the coefficients for parameters depending on the orientation
-        carr_list = [self.varpars[key].polar_fn_vectorized( self.alpha_list )
-                     for key in self.phi_fn.identify_parameters() ]
-        # vectorize the damage function evaluation
-        n_arr = 1 + len( carr_list )
-        phi_fn_vectorized = frompyfunc( self.phi_fn.get_value, n_arr, 1 )
+        carr_list = [ array( self.varpars[key].polar_fn_vectorized( self.alpha_list ),
+                             dtype = float_ )
+                      for key in self.phi_fn.identify_parameters() ]
         # damage parameter for each microplane
-        return phi_fn_vectorized( e_max_arr, *carr_list )
+        return self.phi_fn.get_value_arr( e_max_arr, *carr_list )
 
 
     def get_polar_fn_fracture_energy_arr( self, sctx, e_max_arr ):
@@ -12,9 +12,16 @@ from ibvpy.core.tstepper_eval import \
      TStepperEval
 
 from numpy import zeros, linalg, tensordot, dot, min, max, argmax, array, pi, \
-    append
+    append, identity, einsum, zeros_like
 from scipy.linalg import eigh
 
+def get_eng_to_mtx_map( map_eng_to_mtx, n_eng ):
+    '''Return the array T ( n_eng, n_dims, n_dims ) of the linear mapping
+    between the engineering and tensorial notation so that
+    map_eng_to_mtx( eng ) = einsum( 'kij,k->ij', T, eng ).
+    '''
+    return array( [ map_eng_to_mtx( e ) for e in identity( n_eng ) ], dtype = 'float_' )
+
 #-------------------------------------------------------------------
 # IMATSEval - interface for fe-numerical quadrature
 #-------------------------------------------------------------------
@@ -71,9 +78,46 @@ class MATSEval( HasStrictTraits, TStepperEval ):
     def get_state_array_size( self ):
         return 0
 
+    def get_state_var_shapes( self ):
+        '''
+        Return the list of ( name, shape ) pairs of the state variables
+        in a single material point. The order corresponds to the layout
+        of the state array (see MATSStateArrays). By default, the whole
+        state array of the material point is returned as a single variable.
+        '''
+        size = self.get_state_array_size()
+        if size == 0:
+            return []
+        return [ ( 'state_array', ( size, ) ) ]
+
     def setup( self, sctx ):
         pass
 
+    #---------------------------------------------------------------------------------------------
+    # Batch evaluation of all material points of a domain
+    #---------------------------------------------------------------------------------------------
+    # Models implementing get_corr_pred_batch set the flag supports_batch
+    # to True. The integrator (DOTSEval) then evaluates all the integration
+    # points of all elements in a single call instead of looping over them.
+    #
+    supports_batch = False
+
+    def get_corr_pred_batch( self, sctx, eps_arr, d_eps_arr, tn, tn1, state ):
+        '''
+        Corrector predictor computation for an array of material points.
+
+        @param eps_arr engineering strains with the shape (n_elems, n_ip, n_eps)
+        @param d_eps_arr strain increments with the same shape
+        @param state MATSStateArrays - the committed state variables
+            are read from state.committed, all the variables of state.trial
+            must be assigned
+
+        Returns the stresses (n_elems, n_ip, n_eps) and the stiffness
+        (n_elems, n_ip, n_eps, n_eps) or (n_eps, n_eps) if it is equal
+        in all points.
+        '''
+        raise NotImplementedError
+
     explorer_rtrace_list = Property
     @cached_property
     def _get_explorer_rtrace_list( self ):
@@ -148,6 +192,45 @@ class MATSEval( HasStrictTraits, TStepperEval ):
         e_tensor[:self.n_dims, :self.n_dims] = self.map_eps_eng_to_mtx( eps_app_eng )
         return e_tensor
 
+    #---------------------------------------------------------------------------------------------
+    # Batch versions of the response trace evaluators
+    #---------------------------------------------------------------------------------------------
+    # The strains are supplied as an array with the shape ( n_elems, n_pnts, n_eps ),
+    # the state variables of the points in sctx.mats_state_batch (MATSStateArrays).
+    #
+    def get_rte_batch( self, key ):
+        '''Return the batch version of the response trace evaluator
+        registered in rte_dict under the key, None if not available.
+        '''
+        v_eval = self.rte_dict.get( key, None )
+        fn = getattr( v_eval, 'im_func', None )
+        if fn is MATSEval.get_eps_app.im_func:
+            return self.get_eps_app_batch
+        if fn is MATSEval.get_sig_app.im_func and self.supports_batch:
+            return self.get_sig_app_batch
+        return None
+
+    def get_sig_app_batch( self, sctx, eps_arr ):
+        state = getattr( sctx, 'mats_state_batch', None )
+        if state is None:
+            return None
+        sig_arr, D_arr = self.get_corr_pred_batch( sctx, eps_arr, zeros_like( eps_arr ),
+                                                   0, 0, state )
+        return self._map_eng_to_tensor_batch( self.map_sig_eng_to_mtx, sig_arr )
+
+    def get_eps_app_batch( self, sctx, eps_arr ):
+        return self._map_eng_to_tensor_batch( self.map_eps_eng_to_mtx, eps_arr )
+
+    def _map_eng_to_tensor_batch( self, map_eng_to_mtx, eng_arr ):
+        '''Apply the mapping of the engineering values to the tensor
+        to the array of values ( ..., n_eng ) - return ( ..., 3, 3 ).
+        '''
+        n_dims = int( self.n_dims )
+        T = get_eng_to_mtx_map( map_eng_to_mtx, eng_arr.shape[-1] )
+        tensor_arr = zeros( eng_arr.shape[:-1] + ( 3, 3 ), dtype = 'float_' )
+        tensor_arr[..., :n_dims, :n_dims] = einsum( 'kij,...k->...ij', T, eng_arr )
+        return tensor_arr
+
     # This is only relevant for strain softening models
     #
     def get_regularizing_length( self, sctx, eps_app_eng, *args, **kw ):
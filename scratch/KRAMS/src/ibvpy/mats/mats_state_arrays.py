@@ -0,0 +1,97 @@
+from enthought.traits.api import \
+     HasTraits, Int, List, Bool, Property, cached_property
+
+from numpy import zeros, prod
+
+#-------------------------------------------------------------------
+# MATSStateArrays - history variables of all material points of a domain
+#-------------------------------------------------------------------
+
+class MATSStateArrays( HasTraits ):
+    '''
+    Structure-of-arrays storage of the history variables.
+
+    The state variables declared by the material model
+    (MATSEval.get_state_var_shapes) are accessible by name as arrays
+    with the shape (n_elems, n_ip) + var_shape. They are views into
+    a buffer with the shape (n_elems, n_ip, n_vals) so that the flat
+    layout of the state array used in the pointwise evaluation
+    (sctx.elem_state_array, sctx.mats_state_array) is preserved.
+
+    Two buffers are kept - the committed one representing the state
+    of the last equilibrated time step and the trial one written by
+    the batch evaluation of the material model (get_corr_pred_batch)
+    in every iteration. The model must assign all the trial variables
+    using the committed values. Accepting the time step (commit)
+    then just swaps the buffers.
+    '''
+    # list of ( name, shape ) pairs specifying the state variables
+    # of a single material point
+    #
+    var_shapes = List
+
+    n_elems = Int
+
+    n_ip = Int
+
+    # number of values of all the state variables in a material point
+    #
+    n_vals = Property( Int, depends_on = 'var_shapes' )
+    @cached_property
+    def _get_n_vals( self ):
+        return sum( [ int( prod( shape ) ) for name, shape in self.var_shapes ] )
+
+    # the buffers [ committed, trial ]
+    #
+    buffers = Property( depends_on = 'var_shapes,n_elems,n_ip' )
+    @cached_property
+    def _get_buffers( self ):
+        shape = ( self.n_elems, self.n_ip, self.n_vals )
+        return [ zeros( shape, dtype = 'float_' ),
+                 zeros( shape, dtype = 'float_' ) ]
+
+    # flag indicating that the trial buffer has been handed out
+    # since the last commit
+    #
+    trial_modified = Bool( False )
+
+    def _get_views( self, buffer ):
+        views = {}
+        offset = 0
+        for name, shape in self.var_shapes:
+            size = int( prod( shape ) )
+            views[ name ] = buffer[ :, :, offset:offset + size ].reshape(
+                ( self.n_elems, self.n_ip ) + tuple( shape ) )
+            offset += size
+        return views
+
+    committed = Property
+    def _get_committed( self ):
+        '''Dictionary of the committed state variables.
+        '''
+        return self._get_views( self.buffers[0] )
+
+    trial = Property
+    def _get_trial( self ):
+        '''Dictionary of the trial state variables
+        (to be assigned by the material model).
+        '''
+        self.trial_modified = True
+        return self._get_views( self.buffers[1] )
+
+    committed_array = Property
+    def _get_committed_array( self ):
+        '''Flat view of the committed buffer (layout of the state array).
+        '''
+        return self.buffers[0].reshape( -1 )
+
+    def commit( self ):
+        '''Accept the trial state by swapping the buffers.
+
+        If the trial buffer has not been written since the last commit
+        (pointwise evaluation updating the committed state in place),
+        the buffers are left untouched.
+        '''
+        if self.trial_modified:
+            self.buffers.reverse()
+            self.trial_modified = False
@@ -10,7 +10,14 @@ from ibvpy.mesh.fe_grid import FEGrid
 from ibvpy.fets.fets2D.fets2D4q import FETS2D4Q
 from ibvpy.fets.fets3D.fets3D8h import FETS3D8H
 from ibvpy.mats.mats2D.mats2D_elastic.mats2D_elastic import MATS2DElastic
-from numpy import array
+from ibvpy.mesh.cell_grid.cell_grid import CellGrid
+from ibvpy.mesh.cell_grid.cell_spec import CellSpec
+from ibvpy.mesh.cell_grid.dof_grid import DofCellGrid
+from ibvpy.mesh.fe_ls_domain import FELSDomain
+from ibvpy.mats.mats2D.mats2D_plastic.mats2D_plastic import MATS2DPlastic
+from ibvpy.fets.fets_ls.fets_crack import FETSCrack
+from ibvpy.dots.xdots_eval import map_ip_state
+from numpy import array, unique, where, random, arange, zeros, allclose, sin, pi
 
 class FEDomainDynamicDofMap( unittest.TestCase ):
     '''
@@ -102,6 +109,19 @@ class FEDomainGeoMap( unittest.TestCase ):
         for e_, e_ex_ in zip( elem_X_map.flatten() , egm ):
             self.assertAlmostEqual( e_, e_ex_ )
 
+    def test_elements( self ):
+        '''Test the element views backed by the element arrays.
+        '''
+        elements = self.g1.elements
+        self.assertEqual( len( elements ), 4 )
+        self.assertTrue( ( elements[3].get_dof_map() == self.g1.elem_dof_map[3] ).all() )
+        self.assertTrue( ( elements[-1].get_X_mtx() == self.g1.elem_X_map[3] ).all() )
+        for e_id, elem in enumerate( elements ):
+            self.assertTrue( ( elem.get_x_mtx() == self.g1.elem_x_map[ e_id ] ).all() )
+        sub = elements[ array( [ True, False, False, True ] ) ]
+        self.assertEqual( len( sub ), 2 )
+        self.assertTrue( ( sub.dof_map == self.g1.elem_dof_map[ [ 0, 3 ] ] ).all() )
+        self.assertEqual( len( elements[1:3] ), 2 )
 
 class FEDomainSliceTest( unittest.TestCase ):
     '''
@@ -146,3 +166,232 @@ class FEDomainSliceTest( unittest.TestCase ):
         fe_grid_slice = self.grid[0, :, :, 0   , :, :] # yz plane  1
         for dof_, dof_ex_ in zip( result[2].flatten() , fe_grid_slice.dofs.flatten() ):
             self.assertAlmostEqual( dof_, dof_ex_ )
+
+class CellGridTopologyTest( unittest.TestCase ):
+    '''
+    Test the topology index of the cell grid.
+    '''
+    def setUp( self ):
+        '''
+        Construct a (3,4) grid of cells with a node in the middle.
+        '''
+        self.cell_grid = CellGrid( shape = ( 3, 4 ),
+                                   grid_cell_spec = CellSpec( node_coords = [[-1, -1],
+                                                                             [1, -1],
+                                                                             [0, 0],
+                                                                             [1, 1],
+                                                                             [-1, 1]] ) )
+        self.dof_grid = DofCellGrid( cell_grid = self.cell_grid,
+                                     n_nodal_dofs = 2,
+                                     dof_offset = 100 )
+
+    def test_dofs( self ):
+        '''The doffed nodes are numbered in ascending order,
+        the unused nodes get -1 (shifted by the dof_offset).
+        '''
+        doffed_nodes = unique( self.cell_grid.cell_node_map.flatten() )
+        dofs = self.dof_grid.dofs
+        self.assertEqual( self.dof_grid.n_dofs, 2 * len( doffed_nodes ) )
+        self.assertEqual( list( dofs[ doffed_nodes, 1 ] ),
+                          range( 101, 101 + 2 * len( doffed_nodes ), 2 ) )
+        self.assertTrue( ( dofs[ self.cell_grid.point_grid_size - 2 ] == 99 ).all() )
+
+    def test_cell_idx_arr( self ):
+        idx_arr = self.cell_grid.get_cell_idx_arr( [ 0, 5, 11 ] )
+        self.assertEqual( idx_arr.tolist(), [ [0, 0], [1, 1], [2, 3] ] )
+
+class FELSDomainNarrowBandTest( unittest.TestCase ):
+    '''
+    Incremental evaluation of the level set within the narrow band
+    compared with the evaluation on the whole grid.
+    '''
+    def test_moving_front( self ):
+        fets_eval = FETS2D4Q( mats_eval = MATS2DElastic() )
+        fe_grid = FEGrid( coord_max = ( 1., 1., 0. ),
+                          shape = ( 10, 10 ),
+                          fets_eval = fets_eval )
+        ls_band = FELSDomain( fe_grid = fe_grid, narrow_band = 1,
+                              ls_function = lambda X, Y: Y - 0.52 )
+        ls_full = FELSDomain( fe_grid = fe_grid,
+                              ls_function = lambda X, Y: Y - 0.52 )
+        for y in [ 0.55, 0.61, 0.68, 0.71 ]:
+            ls_function = lambda X, Y, y = y: Y - y - 0.1 * X
+            ls_band.ls_function = ls_function
+            ls_full.ls_function = ls_function
+            self.assertTrue( ( ls_band.ls_edge_sum_grid ==
+                               ls_full.ls_edge_sum_grid ).all() )
+            self.assertEqual( list( ls_band.elems ), list( ls_full.elems ) )
+
+    def test_front_leaving_band( self ):
+        '''The front moving farther than the narrow band
+        triggers the evaluation on the whole grid.
+        '''
+        fets_eval = FETS2D4Q( mats_eval = MATS2DElastic() )
+        fe_grid = FEGrid( coord_max = ( 1., 1., 0. ),
+                          shape = ( 10, 10 ),
+                          fets_eval = fets_eval )
+        ls_band = FELSDomain( fe_grid = fe_grid, narrow_band = 1,
+                              ls_function = lambda X, Y: Y - 0.22 )
+        ls_full = FELSDomain( fe_grid = fe_grid,
+                              ls_function = lambda X, Y: Y - 0.22 )
+        ls_band.ls_edge_sum_grid
+        for ls_function in [ lambda X, Y: Y - 0.81, lambda X, Y: X - 0.47 ]:
+            ls_band.ls_function = ls_function
+            ls_full.ls_function = ls_function
+            self.assertTrue( ( ls_band.ls_edge_sum_grid ==
+                               ls_full.ls_edge_sum_grid ).all() )
+            self.assertEqual( list( ls_band.elems ), list( ls_full.elems ) )
+
+    def test_intersection_reuse( self ):
+        '''The intersection points are reused for the same level set 
+        function only (not for a new function with the same nodal values).
+        '''
+        fets_eval = FETS2D4Q( mats_eval = MATS2DElastic() )
+        fe_grid = FEGrid( coord_max = ( 1., 1., 0. ),
+                          shape = ( 10, 10 ),
+                          fets_eval = fets_eval )
+        ls_band = FELSDomain( fe_grid = fe_grid, narrow_band = 1,
+                              ls_function = lambda X, Y: Y - 0.55 )
+        ls_band.ls_intersection_r
+        cache = dict( ls_band._ls_intersection_cache )
+        ls_band.bls_function = lambda X, Y: 0.45 - X
+        ls_band.ls_intersection_r
+        self.assertTrue( len( ls_band._ls_intersection_cache ) > 0 )
+        for elem, inter_pts in ls_band._ls_intersection_cache.items():
+            self.assertTrue( inter_pts is cache[ elem ] )
+        ls_function = lambda X, Y: Y - 0.55 + 0.02 * sin( 10 * pi * Y )
+        ls_band.ls_function = ls_function
+        ls_full = FELSDomain( fe_grid = fe_grid, ls_function = ls_function,
+                              bls_function = lambda X, Y: 0.45 - X )
+        self.assertTrue( allclose( ls_band.ls_intersection_r,
+                                   ls_full.ls_intersection_r ) )
+
+class FEGridSpatialIndexTest( unittest.TestCase ):
+    '''
+    Spatial queries using the bucket grid of a regular grid
+    and the KD-tree of a transformed grid.
+    '''
+    def setUp( self ):
+        fets_eval = FETS2D4Q( mats_eval = MATS2DElastic() )
+        self.fe_grid = FEGrid( coord_max = ( 2., 1., 0. ),
+                               shape = ( 8, 5 ),
+                               fets_eval = fets_eval )
+        # identical geometry defined through a transformation
+        self.fe_tgrid = FEGrid( coord_max = ( 2., 1., 0. ),
+                                shape = ( 8, 5 ),
+                                geo_transform = lambda x: x.copy(),
+                                fets_eval = fets_eval )
+
+    def test_elems_at( self ):
+        X_arr = random.uniform( -0.1, 1.1, ( 50, 2 ) ) * [ 2., 1. ]
+        elems = self.fe_grid.get_elems_at( X_arr )
+        self.assertEqual( list( elems ), list( self.fe_tgrid.get_elems_at( X_arr ) ) )
+        X_el = self.fe_grid.geo_grid.elem_X_map
+        for X_pnt, e in zip( X_arr, elems ):
+            if e < 0:
+                self.assertTrue( ( X_pnt < 0 ).any() or ( X_pnt > [ 2., 1. ] ).any() )
+            else:
+                self.assertTrue( ( X_el[ e ].min( axis = 0 ) <= X_pnt ).all() )
+                self.assertTrue( ( X_el[ e ].max( axis = 0 ) >= X_pnt ).all() )
+
+    def test_radius( self ):
+        # point in the middle of the cell ( 2, 2 )
+        elems = self.fe_grid.get_elems_in_radius( [ 0.625, 0.5 ], 0.05 )
+        self.assertEqual( list( elems ), [ 12 ] )
+        elems = self.fe_grid.get_elems_in_radius( [ 0.625, 0.5 ], 0.2 )
+        self.assertEqual( list( elems ), [ 6, 7, 8, 11, 12, 13, 16, 17, 18 ] )
+        self.assertEqual( list( elems ),
+                          list( self.fe_tgrid.get_elems_in_radius( [ 0.625, 0.5 ], 0.2 ) ) )
+        self.assertEqual( list( self.fe_grid.get_subgrid( ( [ 0.3, 0.3 ], [ 0.4, 0.5 ] ) ) ),
+                          [ 6, 7 ] )
+        nodes = self.fe_grid.get_enclosed_nodes( lambda X, Y: ( X - 1. ) ** 2 + ( Y - 0.4 ) ** 2 - 0.01,
+                                                 ( [ 0.9, 0.3 ], [ 1.1, 0.5 ] ) )
+        self.assertEqual( list( nodes ), [ 26 ] )
+
+    def test_refinement_grid( self ):
+        '''The elements of a refinement grid are numbered through
+        its subgrids, the index follows the addition of a subgrid.
+        '''
+        fets_eval = FETS2D4Q( mats_eval = MATS2DElastic() )
+        fe_level = FERefinementGrid( domain = FEDomain(), fets_eval = fets_eval )
+        FEGrid( coord_max = ( 1., 1., 0. ), shape = ( 2, 2 ),
+                fets_eval = fets_eval, level = fe_level )
+        self.assertEqual( list( fe_level.get_elems_at( [ [ 0.75, 0.25 ], [ 1.5, 0.5 ] ] ) ),
+                          [ 2, -1 ] )
+        FEGrid( coord_min = ( 1., 0., 0. ), coord_max = ( 2., 1., 0. ), shape = ( 2, 2 ),
+                fets_eval = fets_eval, level = fe_level )
+        self.assertEqual( list( fe_level.get_elems_at( [ [ 0.75, 0.25 ], [ 1.25, 0.75 ] ] ) ),
+                          [ 2, 5 ] )
+        self.assertEqual( list( fe_level.get_subgrid( ( [ 0.9, 0.6 ], [ 1.1, 0.7 ] ) ) ),
+                          [ 3, 5 ] )
+
+class XDOTSEvalIncrementalTest( unittest.TestCase ):
+    '''
+    Reuse of the integration structure and transfer of the state
+    of the extended domain for a growing crack.
+    '''
+    def setUp( self ):
+        fets_eval = FETS2D4Q( mats_eval = MATS2DPlastic( E = 1., nu = 0. ) )
+        xfets_eval = FETSCrack( parent_fets = fets_eval, int_order = 3 )
+        fe_domain = FEDomain()
+        fe_level = FERefinementGrid( domain = fe_domain, fets_eval = fets_eval )
+        self.fe_grid = FEGrid( coord_max = ( 1., 1. ),
+                               shape = ( 4, 4 ),
+                               fets_eval = fets_eval,
+                               level = fe_level )
+        self.fe_xdomain = FELSDomain( domain = fe_domain,
+                                      fets_eval = xfets_eval,
+                                      fe_grid = self.fe_grid,
+                                      narrow_band = 1,
+                                      ls_function = lambda X, Y: X - 0.52,
+                                      bls_function = lambda X, Y: 0.45 - Y )
+        self.fe_xdomain.deactivate_intg_elems_in_parent()
+
+    def grow_crack( self ):
+        self.fe_xdomain.bls_function = lambda X, Y: 0.7 - Y
+
+    def test_map_ip_state( self ):
+        r_from = array( [ [ -0.5, 0. ], [ 0.5, 0. ] ] )
+        state_from = arange( 4, dtype = float )
+        r_to = array( [ [ 0.4, 0.1 ], [ -0.9, 0.3 ], [ 0.6, -0.5 ] ] )
+        state_to = zeros( 6 )
+        map_ip_state( state_to, r_to, state_from, r_from, 2 )
+        self.assertEqual( list( state_to ), [ 2., 3., 0., 1., 2., 3. ] )
+
+    def test_triangulation_reuse( self ):
+        xdots = self.fe_xdomain.dots
+        old = dict( zip( self.fe_xdomain.elems, xdots.elem_triangulation ) )
+        self.grow_crack()
+        new = dict( zip( self.fe_xdomain.elems, xdots.elem_triangulation ) )
+        common = set( old.keys() ) & set( new.keys() )
+        self.assertTrue( len( common ) > 0 )
+        self.assertTrue( len( set( new.keys() ) - common ) > 0 )
+        for elem in common:
+            self.assertTrue( new[ elem ] is old[ elem ] )
+
+    def test_state_transfer( self ):
+        xdots = self.fe_xdomain.dots
+        m = xdots.fets_eval.m_arr_size
+        old_elems = list( self.fe_xdomain.elems )
+        # state of the extended elements and of the parent grid
+        xdots.state_array[:] = arange( xdots.state_array.shape[0] )
+        old_state = {}
+        for e_id, elem in enumerate( old_elems ):
+            ip0, ip1 = xdots.ip_offset[ e_id ], xdots.ip_offset[ e_id + 1 ]
+            old_state[ elem ] = xdots.state_array[ ip0 * m:ip1 * m ].copy()
+        self.fe_grid.dots.state_array[:] = -1.0
+
+        self.grow_crack()
+        state_array = xdots.state_array
+        n_new = 0
+        for e_id, elem in enumerate( self.fe_xdomain.elems ):
+            ip0, ip1 = xdots.ip_offset[ e_id ], xdots.ip_offset[ e_id + 1 ]
+            elem_state = state_array[ ip0 * m:ip1 * m ]
+            if elem in old_state:
+                # the element kept its integration points
+                self.assertTrue( allclose( elem_state, old_state[ elem ] ) )
+            else:
+                # newly intersected element inherits the parent state
+                n_new += 1
+                self.assertTrue( allclose( elem_state, -1.0 ) )
+        self.assertTrue( n_new > 0 )
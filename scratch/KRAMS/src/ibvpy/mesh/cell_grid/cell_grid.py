@@ -16,7 +16,7 @@ from ibvpy.core.sdomain import \
 from numpy import \
     array, unique, min, max, mgrid, ogrid, c_, alltrue, repeat, ix_, \
     arange, ones, zeros, multiply, sort, index_exp, indices, add, hstack, \
-    frompyfunc
+    frompyfunc, asarray
 
 from ibvpy.plugins.mayavi.pipelines import \
     MVPolyData, MVPointLabels, MVStructuredGrid
@@ -196,6 +196,18 @@ class CellGrid( SDomain ):
         idx_tuple[ self.n_dims - 1 ] = roof
         return tuple( idx_tuple )
 
+    def get_cell_idx_arr( self, offsets ):
+        '''Get the addresses of several cells within the cell grid.
+        Returns an array( n, n_dims ) with the index tuples in rows.
+        '''
+        shape = self.cell_idx_grid_shape
+        roof = array( offsets, dtype = int ).flatten()
+        idx_arr = zeros( ( roof.shape[0], len( shape ) ), dtype = int )
+        for i in range( len( shape ) - 1, -1, -1 ):
+            idx_arr[:, i] = roof % shape[i]
+            roof = roof / shape[i]
+        return idx_arr
+
     def get_cell_offset( self, idx_tuple ):
         '''Get the index of the cell within the flattened list.
         '''
@@ -382,9 +394,11 @@ class CellGrid( SDomain ):
         position within the returned array defines the index of the cell. 
         '''
         vertex_idx_grid = self.vertex_idx_grid
-        cutoff_last = [ slice( 0, -1 ) for i in range( self.n_dims ) ]
+        cutoff_last = tuple( [ slice( 0, -1 ) for i in range( self.n_dims ) ] )
         base_node_grid = vertex_idx_grid[ cutoff_last ]
-        return sort( base_node_grid.flatten() )
+        # the offsets of the vertex grid increase along each axis
+        # so that the flattened grid is already sorted
+        return base_node_grid.flatten()
 
     cell_node_map = Property( depends_on = 'shape,grid_cell_spec.+' )
     @cached_property
@@ -416,6 +430,69 @@ class CellGrid( SDomain ):
         new_shape = tuple( self.shape ) + self.cell_node_map.shape[1:]
         return self.cell_node_map.reshape( new_shape )
 
+    #-----------------------------------------------------------------------------
+    # Topology index - boundary lists and cell masks derived by integer 
+    # arithmetic on the regular index space of the grid. The arrays are
+    # constructed on the first access and used by the dof accessors 
+    # and the level set queries.
+    #-----------------------------------------------------------------------------
+    boundary_nodes = Property( depends_on = 'shape,grid_cell_spec.+' )
+    @cached_property
+    def _get_boundary_nodes( self ):
+        '''Points at the faces of the grid - list with an array of points 
+        for each face ordered as the boundary_slices.
+        '''
+        point_idx_grid = self.point_idx_grid
+        return [ point_idx_grid[ s ].flatten()
+                 for s in self._get_face_slices( point_idx_grid.ndim ) ]
+
+    def get_vertex_cells( self, vertex_mask ):
+        '''Get the boolean cell grid marking the cells with at least 
+        one vertex marked in the vertex_mask (shaped as the vertex_idx_grid).
+        '''
+        cell_mask = asarray( vertex_mask ).astype( bool )
+        n_dims = cell_mask.ndim
+        for i in range( n_dims ):
+            lo, hi = self._get_axis_slices( n_dims, i )
+            cell_mask = cell_mask[ lo ] | cell_mask[ hi ]
+        return cell_mask
+
+    def get_edge_cells( self, axis, edge_mask ):
+        '''Get the boolean cell grid marking the cells with at least 
+        one of the edges along the axis marked in the edge_mask.
+        
+        The edge_mask is shaped as the vertex_idx_grid reduced by one 
+        along the axis, i.e. the entry [ i, j ] of an edge_mask along 
+        the first axis marks the edge between the vertices [ i, j ] 
+        and [ i + 1, j ].
+        '''
+        cell_mask = asarray( edge_mask ).astype( bool )
+        n_dims = cell_mask.ndim
+        for i in range( n_dims ):
+            if i != axis:
+                lo, hi = self._get_axis_slices( n_dims, i )
+                cell_mask = cell_mask[ lo ] | cell_mask[ hi ]
+        return cell_mask
+
+    def _get_axis_slices( self, n_dims, axis ):
+        '''Get the slices cutting off the last and the first entry 
+        along the axis, respectively.
+        '''
+        lo = [ slice( None ) for j in range( n_dims ) ]
+        hi = [ slice( None ) for j in range( n_dims ) ]
+        lo[ axis ] = slice( 0, -1 )
+        hi[ axis ] = slice( 1, None )
+        return tuple( lo ), tuple( hi )
+
+    def _get_face_slices( self, n_dims ):
+        slices = []
+        for i in range( n_dims ):
+            for idx in [ 0, -1 ]:
+                s = [ slice( None ) for j in range( n_dims ) ]
+                s[i] = idx
+                slices.append( tuple( s ) )
+        return slices
+
     def get_cell_point_x_arr( self, cell_idx ):
         '''Return the node coordinates included in the cell cell_idx. 
         '''
@@ -437,15 +514,7 @@ class CellGrid( SDomain ):
         '''Get the slices to get the boundary nodes.
         '''
         # slices must correspond to the dimensions
-        slices = []
-        for i in range( self.n_dims ):
-            s_low = [ slice( None ) for j in range( self.n_dims ) ]
-            s_low[i] = 0
-            s_high = [ slice( None ) for j in range( self.n_dims ) ]
-            s_high[i] = -1
-            slices.append( s_low )
-            slices.append( s_high )
-        return slices
+        return self._get_face_slices( self.n_dims )
 
     #--------------------------------------------------------------------------
     # Wrappers exporting the grid date to mayavi pipelines
@@ -16,7 +16,7 @@ from ibvpy.core.sdomain import \
 from numpy import \
     array, unique, min, max, mgrid, ogrid, c_, alltrue, repeat, ix_, \
     arange, ones, zeros, multiply, sort, index_exp, hstack, where, \
-    intersect1d, intersect1d_nu, copy, vstack
+    intersect1d, intersect1d_nu, copy, vstack, cumsum, asarray
 
 from ibvpy.plugins.mayavi.pipelines import \
     MVPolyData, MVPointLabels, MVStructuredGrid
@@ -50,13 +50,24 @@ class DofCellGrid( SDomain ):
     #-------------------------------------------------------------------------
     # Generation methods for geometry and index maps
     #-------------------------------------------------------------------------
+    # Boolean array marking the points of the cell_grid used by the cells.
+    # Only these points get the DOFs. The mask is constructed by marking 
+    # the entries of the cell_node_map, i.e. without sorting the nodes.
+    #
+    doffed_node_mask = Property( depends_on = 'cell_grid.shape,cell_grid.grid_cell_spec' )
+    @cached_property
+    def _get_doffed_node_mask( self ):
+        doffed_node_mask = zeros( ( self.cell_grid.point_grid_size, ), dtype = bool )
+        doffed_node_mask[ self.cell_node_map.flatten() ] = True
+        return doffed_node_mask
+
     n_dofs = Property( depends_on = 'cell_grid.shape,n_nodal_dofs,dof_offset' )
+    @cached_property
     def _get_n_dofs( self ):
         '''
         Get the total number of DOFs
         '''
-        unique_cell_nodes = unique( self.cell_node_map.flatten() )
-        n_unique_nodes = len( unique_cell_nodes )
+        n_unique_nodes = self.doffed_node_mask.sum()
         return n_unique_nodes * self.n_nodal_dofs
 
     dofs = Property( depends_on = 'cell_grid.shape,n_nodal_dofs,dof_offset' )
@@ -65,14 +76,8 @@ class DofCellGrid( SDomain ):
         '''
         Construct the point grid underlying the mesh grid structure.
         '''
-        cell_node_map = self.cell_node_map
-
-        unique_cell_nodes = unique( cell_node_map.flatten() )
-        n_unique_nodes = len( unique_cell_nodes )
-
+        doffed_node_mask = self.doffed_node_mask
         n_nodal_dofs = self.n_nodal_dofs
-        n_nodes = self.cell_grid.point_grid_size
-        node_dof_array = repeat( -1, n_nodes * n_nodal_dofs ).reshape( n_nodes, n_nodal_dofs )
 
         # Enumerate the DOFs in the mesh. The result is an array with n_nodes rows  
         # and n_nodal_dofs columns
@@ -80,9 +85,13 @@ class DofCellGrid( SDomain ):
         # A = array( [[ 0, 1 ],
         #             [ 2, 3 ],
         #             [ 4, 5 ]] );
+        #
+        # The doffed nodes are numbered in ascending order by the running 
+        # count of the mask, unused nodes get -1.
         # 
-        node_dof_array[ index_exp[ unique_cell_nodes ] ] = \
-            arange( n_unique_nodes * n_nodal_dofs ).reshape( n_unique_nodes, n_nodal_dofs )
+        node_nums = cumsum( doffed_node_mask ) - 1
+        node_dof_array = node_nums[:, None] * n_nodal_dofs + arange( n_nodal_dofs )[None, :]
+        node_dof_array[ ~doffed_node_mask ] = -1
 
         # add the dof_offset before returning the array
         #
@@ -93,21 +102,14 @@ class DofCellGrid( SDomain ):
         '''
         Get the indices of nodes containing DOFs. 
         '''
-        cell_node_map = self.cell_node_map
-
-        unique_cell_nodes = unique( cell_node_map.flatten() )
-
-        n_nodes = self.cell_grid.point_grid_size
-        doffed_nodes = repeat( -1, n_nodes )
-
-        doffed_nodes[ index_exp[ unique_cell_nodes ] ] = 1
-        return where( doffed_nodes > 0 )
+        return where( self.doffed_node_mask )
 
     #-----------------------------------------------------------------
     # Elementwise-representation of dofs
     #-----------------------------------------------------------------
 
-    cell_dof_map = Property( depends_on = 'cell_grid.shape,n_nodal_dofs' )
+    cell_dof_map = Property( depends_on = 'cell_grid.shape,n_nodal_dofs,dof_offset' )
+    @cached_property
     def _get_cell_dof_map( self ):
         return self.dofs[ index_exp[self.cell_grid.cell_node_map] ]
 
@@ -118,7 +120,7 @@ class DofCellGrid( SDomain ):
     def get_cell_dofs( self, cell_idx ):
         return self.cell_dof_map[ cell_idx ]
 
-    elem_dof_map = Property( depends_on = 'cell_grid.shape,n_nodal_dofs' )
+    elem_dof_map = Property( depends_on = 'cell_grid.shape,n_nodal_dofs,dof_offset' )
     @cached_property
     def _get_elem_dof_map( self ):
         el_dof_map = copy( self.cell_dof_map )
@@ -146,15 +148,15 @@ class DofCellGrid( SDomain ):
         '''Get the dof numbers and associated coordinates
         given the array of nodes.
         '''
-        doffed_nodes = self._get_doffed_nodes()
-        intersect_nodes = intersect1d_nu( nodes, doffed_nodes )
+        nodes = unique( asarray( nodes ).flatten() )
+        intersect_nodes = nodes[ self.doffed_node_mask[ nodes ] ]
         return ( self.dofs[ index_exp[ intersect_nodes ] ],
                 self.cell_grid.point_X_arr[  index_exp[ intersect_nodes] ] )
 
     def get_boundary_dofs( self ):
         '''Get the boundary dofs and the associated coordinates
         '''
-        nodes = [ self.cell_grid.point_idx_grid[s] for s in self.cell_grid.boundary_slices ]
+        nodes = self.cell_grid.boundary_nodes
         dofs, coords = [], []
         for n in nodes:
             d, c = self._get_dofs_for_nodes( n )
@@ -132,35 +132,42 @@ class GeoCellGrid( SDomain ):
             e_exp = array( e_idx, dtype = int ).transpose()
             return ( e_exp[0, :], e_exp[1, :] )
 
-    def get_intersected_cells( self, ls_function, ls_mask_function = None ):
-
-        if self.n_dims == 1:
-            e_idx = self._get_transiting_edges_1d( ls_function, ls_mask_function )
-        else:
-            e_idx = self._get_transiting_edges( ls_function, ls_mask_function )
-        return unique( self.cell_grid.cell_idx_grid[ e_idx ] )
-
-    def get_negative_cells( self, ls_function ):
-        vect_fn = frompyfunc( ls_function, self.n_dims, 1 )
+    def _get_vertex_ls( self, ls_function ):
+        '''Evaluate the level set function in the vertices.
+        '''
         X_pnt = self.cell_grid.vertex_X_grid
-        ls = vect_fn( *X_pnt )
-
-        cutoff_slices = [ slice( 0, -1 ) for i in range( self.n_dims ) ]
+        vect_fn = frompyfunc( ls_function, self.n_dims, 1 )
+        return array( vect_fn( *X_pnt ), dtype = 'float_' )
 
-        ls = ls[ cutoff_slices ]
+    def _get_intersected_cell_mask( self, ls ):
+        '''Get the boolean cell grid marking the cells with an edge 
+        transited by the level set (ls - values in the vertices).
+        '''
+        cell_grid = self.cell_grid
+        cell_mask = zeros( cell_grid.cell_idx_grid_shape, dtype = bool )
+        for axis in range( ls.ndim ):
+            lo, hi = cell_grid._get_axis_slices( ls.ndim, axis )
+            cell_mask |= cell_grid.get_edge_cells( axis, ls[ lo ] * ls[ hi ] <= 0 )
+        return cell_mask
 
-        neg_idx = where( ls < 0 )
-        negative = unique( self.cell_grid.cell_idx_grid[ neg_idx ] )
+    def get_intersected_cells( self, ls_function, ls_mask_function = None ):
+        '''Get the cells with an edge transited by the level set.
+        '''
+        ls = self._get_vertex_ls( ls_function )
+        cell_mask = self._get_intersected_cell_mask( ls )
+        return self.cell_grid.cell_idx_grid[ cell_mask ]
 
-        intersected = unique( self.get_intersected_cells( ls_function ) )
+    def get_negative_cells( self, ls_function ):
+        '''Get the cells with negative level set in the base node 
+        that are not intersected by the level set.
+        '''
+        ls = self._get_vertex_ls( ls_function )
 
-        remaining = list( negative )
-        for i in intersected:
-            try: remaining.remove( i )
-            except: ValueError
+        cutoff_slices = tuple( [ slice( 0, -1 ) for i in range( self.n_dims ) ] )
 
-        remaining = array( remaining, dtype = int )
-        return remaining
+        cell_mask = ls[ cutoff_slices ] < 0
+        cell_mask &= ~self._get_intersected_cell_mask( ls )
+        return self.cell_grid.cell_idx_grid[ cell_mask ]
 
     #--------------------------------------------------------------------------------
     # Visualization of level sets
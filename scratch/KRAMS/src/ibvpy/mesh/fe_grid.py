@@ -16,7 +16,8 @@ from ibvpy.mesh.cell_grid.cell_grid import CellGrid
 from ibvpy.mesh.cell_grid.cell_spec import CellSpec
 from ibvpy.mesh.cell_grid.cell_array import ICellView, CellView, CellArray, ICellArraySource
 
-from numpy import copy, zeros, array_equal, repeat, arange, frompyfunc, array, cos, sin
+from numpy import copy, zeros, array_equal, repeat, arange, frompyfunc, array, cos, sin, \
+    integer
 
 from i_fe_uniform_domain import IFEUniformDomain
 from ibvpy.mesh.fe_subdomain import FESubDomain
@@ -30,6 +31,7 @@ from ibvpy.rtrace.rt_domain_field import RTraceDomainField
 from fe_grid_activation_map import FEGridActivationMap
 from fe_grid_idx_slice import FEGridIdxSlice
 from fe_grid_ls_slice import FEGridLevelSetSlice
+from spatial_index import SpatialIndex
 from math import pi
 #-----------------------------------------------------------------------------
 # Adaptor for tables showing the cell point distributions 
@@ -94,6 +96,69 @@ class MElem( HasTraits ):
     def __str__( self ):
         return 'points:\n%s\ndofs %s' % ( self.point_X_arr, self.dofs )
 
+#-------------------------------------------------------------------
+# MElemArray - elements of a domain backed by the element arrays
+#-------------------------------------------------------------------
+
+class MElemView( object ):
+    '''
+    View to a single element of the MElemArray providing
+    the interface of MElem. The arrays are views into the element
+    arrays of the domain.
+    '''
+    __slots__ = ( 'dofs', 'point_X_arr', 'point_x_arr' )
+
+    def __init__( self, dofs, point_X_arr, point_x_arr ):
+        self.dofs = dofs
+        self.point_X_arr = point_X_arr
+        self.point_x_arr = point_x_arr
+
+    def get_X_mtx( self ):
+        return self.point_X_arr
+
+    def get_x_mtx( self ):
+        return self.point_x_arr
+
+    def get_dof_map( self ):
+        return self.dofs
+
+    def __str__( self ):
+        return 'points:\n%s\ndofs %s' % ( self.point_X_arr, self.dofs )
+
+class MElemArray( object ):
+    '''
+    Collection of the elements of a domain defined by the arrays
+    of the element dofs ( n_elems, n_e_dofs ) and of the nodal
+    coordinates in the initial and current configuration
+    ( n_elems, n_geo_r, n_dims ).
+
+    The collection replaces the list of MElem instances. Indexing with
+    an integer returns a view to the single element (MElemView)
+    constructed on demand. Indexing with a slice, an index array or
+    a boolean mask returns the collection of the selected elements
+    so that the element arrays (dof_map, X_map, x_map) can be
+    processed at once.
+    '''
+    def __init__( self, dof_map, X_map, x_map ):
+        self.dof_map = dof_map
+        self.X_map = X_map
+        self.x_map = x_map
+
+    def __len__( self ):
+        return self.dof_map.shape[0]
+
+    def __getitem__( self, idx ):
+        if isinstance( idx, ( int, long, integer ) ):
+            return MElemView( self.dof_map[ idx ], self.X_map[ idx ], self.x_map[ idx ] )
+        return MElemArray( self.dof_map[ idx ], self.X_map[ idx ], self.x_map[ idx ] )
+
+    def __iter__( self ):
+        for dofs, point_X_arr, point_x_arr in zip( self.dof_map, self.X_map, self.x_map ):
+            yield MElemView( dofs, point_X_arr, point_x_arr )
+
+    def __str__( self ):
+        return 'elements: %d' % len( self )
+
 class FEGrid( FEGridActivationMap ):
     '''Structured FEGrid consisting of potentially independent 
     dof_grid and geo_grid.
@@ -384,17 +449,11 @@ class FEGrid( FEGridActivationMap ):
     def _get_n_active_elems( self ):
         return self.elem_dof_map.shape[0]
 
-    elements = Property( List, depends_on = \
+    elements = Property( depends_on = \
                        'fets_eval.dof_r,fets_eval.geo_r,shape+,coord_min,coord_max,fets_eval.n_nodal_dofs,dof_offset, changed_structure' )
     @cached_property
     def _get_elements( self ):
-        return [MElem( dofs = dofs,
-                       point_X_arr = point_X_arr,
-                       point_x_arr = point_x_arr )
-                for dofs, point_X_arr, point_x_arr
-                in zip( self.elem_dof_map,
-                        self.elem_X_map,
-                        self.elem_x_map ) ]
+        return MElemArray( self.elem_dof_map, self.elem_X_map, self.elem_x_map )
 
     def apply_on_ip_grid( self, fn, ip_mask ):
         '''
@@ -527,22 +586,69 @@ class FEGrid( FEGridActivationMap ):
         '''
 
 
-    def get_enclosed_nodes( self, e_domain ):
+    def get_enclosed_nodes( self, e_domain, bounding_box = None ):
         '''
-        Get elements that are inside of the e_domain.
-        The elements are not intersected by the boundaries of the e_domain.
+        Get nodes that are inside of the e_domain.
         
-        The e_domain must be at least the same dimension as the grid.
-        The e_domain must have an operator inside/outside to decide about
-        whether or not a point is included.
+        The e_domain is a level set function of the coordinates 
+        (X, Y, Z), the nodes with non-positive values are included.
+        If the bounding_box ( X_min, X_max ) of the e_domain is specified,
+        only the nodes within the box are evaluated.
         
-        The method returns an array of element numbers within the specified e_domain.  
+        The method returns an array of node numbers within the specified e_domain.  
         '''
+        if bounding_box == None:
+            nodes = arange( self.X_dof_arr.shape[0] )
+        else:
+            nodes = self.spatial_index.get_nodes_in_box( *bounding_box )
+        if len( nodes ) == 0:
+            return nodes
+        X_arr = self.X_dof_arr[ nodes ]
+        vect_fn = frompyfunc( e_domain, X_arr.shape[1], 1 )
+        ls_arr = array( vect_fn( *X_arr.T ), dtype = float )
+        return nodes[ ls_arr <= 0 ]
 
     def get_subgrid( self, bounding_box ):
         '''
-        Return subgrid with base_node number 
+        Return the elements (cell offsets) intersecting 
+        the bounding_box ( X_min, X_max ).
+        '''
+        return self.spatial_index.get_elems_in_box( *bounding_box )
+
+    #-------------------------------------------------------------
+    # Spatial queries 
+    #-------------------------------------------------------------
+    # The elements are identified by their cell offsets in the grid 
+    # (including the deactivated elements)
+    #
+    spatial_index = Property( depends_on = \
+                       'fets_eval.dof_r,fets_eval.geo_r,shape+,coord_min+,coord_max+,fets_eval.n_nodal_dofs,dof_offset,geo_transform' )
+    @cached_property
+    def _get_spatial_index( self ):
+        spatial_index = SpatialIndex( elem_X_map = self.geo_grid.elem_X_map,
+                                      node_X_arr = self.X_dof_arr,
+                                      fets_eval = self.fets_eval )
+        if not self.geo_transform:
+            # regular grid - the cells are used as buckets
+            spatial_index.set( grid_shape = self.geo_grid.cell_grid.cell_idx_grid_shape,
+                               coord_min = self.coord_min,
+                               coord_max = self.coord_max )
+        return spatial_index
+
+    def get_elems_at( self, X_arr ):
+        '''Return the elements containing the points X_arr (-1 if outside).
+        '''
+        return self.spatial_index.get_elems_at( X_arr )
+
+    def get_elems_in_radius( self, X_pnt, radius ):
+        '''Return the elements within the radius from the point(s) X_pnt.
+        '''
+        return self.spatial_index.get_elems_in_radius( X_pnt, radius )
+
+    def get_nodes_in_radius( self, X_pnt, radius ):
+        '''Return the nodes within the radius from the point(s) X_pnt.
         '''
+        return self.spatial_index.get_nodes_in_radius( X_pnt, radius )
 
     def get_ls_value( self, X_pnt ):
         #@TODO: make it work for 3d
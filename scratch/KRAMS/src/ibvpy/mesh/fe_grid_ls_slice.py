@@ -98,53 +98,23 @@ class FEGridLevelSetSlice( HasTraits ):
         The tip elems should be removed from the level set alone.
         
         '''
-        ls_mask = self.fe_grid.get_ls_mask( self.ls_mask_function )
-        # get the nodes having True value
-
-        masked_nodes = argwhere( ls_mask )
-        # find out the element associated with these nodes
-
-        neighbour_idx = array( [[-1, -1],
-                                    [-1, 0],
-                                    [0, -1],
-                                    [0, 0] ], dtype = int )
-
-        # get for each node the neighbors
-        e_arr = masked_nodes[ :, None, :] + neighbour_idx[ None, :, : ]
+        cell_grid = self.fe_grid.geo_grid.cell_grid
 
-        # get for each node the corresponding neighbors
-        e_flattened = [ e_arr[:, :, idx].flatten() for idx in range( e_arr.shape[2] ) ]
-        e_masked = c_[ tuple( e_flattened ) ]
+        # get the vertices having True value and mark the cells 
+        # containing them (elements containing a node outside 
+        # the level set domain)
+        # 
+        ls_mask = self.fe_grid.get_ls_mask( self.ls_mask_function )
+        masked_cells = cell_grid.get_vertex_cells( ls_mask ).flatten()
 
         # find the intersection with the level set
         intersected_elem_offsets = self.fe_grid.get_intersected_elems( self.ls_function )
 
-        # get the indices of the intersected by the level set
-        # this should be done more efficiently 
-        e_ls = array( [ self.fe_grid.geo_grid.cell_grid.get_cell_idx( offset )
-                                 for offset in intersected_elem_offsets ], dtype = int )
-
-        # make a broadcasted comparison between the masked elements 
-        # (elements containing a node outside outside the level set domain)
-        # and elements intersected by the level set.
-        # 
-        broadcasted_compare = ( e_ls == e_masked[:, None, :] )
-
-        # along the axis 2 - there is a comparison of the coordinates 
-        # - if all are True, then all coordinates are equal - this 
-        # is detected by the boolean product (logical and along axis 2)
-        # 
-        logical_and_along_ax2 = broadcasted_compare.prod( axis = 2, dtype = bool )
-
-        # along the axis 0 - there is a each-with-each comparison
-        # - if one of the entries is True, then the second list contains
-        #   the same entry as well. This is detected by the sum operator 
-        #  (logical or along axis 0)  
-        logical_or_along_ax0 = logical_and_along_ax2.sum( axis = 0, dtype = bool )
-
-        #res = ( e_ls == e_masked[:, None, :] ).prod( axis = 2, dtype = bool ).sum( axis = 0, dtype = bool )
-
-        return e_ls[ logical_or_along_ax0 ]
+        # choose the masked elements intersected by the level set
+        # and return their indices within the cell grid
+        #
+        tip_offsets = intersected_elem_offsets[ masked_cells[ intersected_elem_offsets ] ]
+        return cell_grid.get_cell_idx_arr( tip_offsets )
 
     elems = Property( Array( int ) )
     def _get_elems( self ):
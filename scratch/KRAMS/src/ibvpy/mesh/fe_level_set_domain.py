@@ -21,7 +21,7 @@ from ibvpy.core.sdomain import \
 
 from mathkit.level_set.level_set import ILevelSetFn, SinLSF
 
-from fe_grid import FEGrid, MElem
+from fe_grid import FEGrid, MElemArray
 
 from ibvpy.plugins.mayavi.pipelines import \
     MVPolyData, MVPointLabels, MVStructuredGrid
@@ -132,17 +132,14 @@ class FELevelSetDomain( SDomain ):
         '''
         elem_dof_map = self.source_domain.elem_dof_map[self.elem_intersection]
 
-    elements = Property( List, depends_on = \
+    elements = Property( depends_on = \
                        'ls_function,source_domain.+' )
     @cached_property
     def _get_elements( self ):
         ## - need a separate enumeration of nodes - define separate n_extension_dofs
-        return [MElem( dofs = dofs, point_X_arr = point_X_arr, point_x_arr = point_x_arr )
-                for dofs, point_X_arr, point_x_arr
-                in zip( self.source_domain.elem_dof_map[self.elem_intersection],
-                        self.source_domain.elem_X_map[self.elem_intersection],
-                        self.source_domain.elem_X_map[self.elem_intersection]
-                        ) ]
+        return MElemArray( self.source_domain.elem_dof_map[self.elem_intersection],
+                           self.source_domain.elem_X_map[self.elem_intersection],
+                           self.source_domain.elem_X_map[self.elem_intersection] )
     shape = Property
     def _get_shape( self ):
         return len( self.elements )
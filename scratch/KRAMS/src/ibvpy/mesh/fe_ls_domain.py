@@ -22,7 +22,7 @@ from ibvpy.core.sdomain import \
 
 from mathkit.level_set.level_set import ILevelSetFn, SinLSF
 
-from fe_grid import MElem
+from fe_grid import MElemArray
 from ibvpy.dots.xdots_eval import XDOTSEval
 from fe_subdomain import FESubDomain
 from fe_domain import FEDomain
@@ -75,6 +75,39 @@ def edge_sum( b_arr ):
 
     return b_arr
 
+def dilate( b_arr, n_layers ):
+    '''Extend the True entries of the boolean grid by n_layers 
+    of neighbors in each dimension (including the diagonal neighbors).
+    '''
+    n_dims = len( b_arr.shape )
+    sl, sr = slice( None, -1 ), slice( 1, None )
+    for layer in range( n_layers ):
+        for i in range( n_dims ):
+            slice_l = [ slice( None ) for j in range( n_dims ) ]
+            slice_r = [ slice( None ) for j in range( n_dims ) ]
+            slice_l[ i ] = sl
+            slice_r[ i ] = sr
+            d_arr = b_arr.copy()
+            d_arr[ tuple( slice_l ) ] |= b_arr[ tuple( slice_r ) ]
+            d_arr[ tuple( slice_r ) ] |= b_arr[ tuple( slice_l ) ]
+            b_arr = d_arr
+    return b_arr
+
+def cell_to_vertex_mask( c_arr ):
+    '''Mark the vertices of the marked cells.
+
+    The cell grid [n,n,n] is expanded to the vertex grid [n+1,n+1,n+1]
+    (inverse operation to edge_sum).
+    '''
+    n_dims = len( c_arr.shape )
+    v_arr = zeros( tuple( [ n + 1 for n in c_arr.shape ] ), dtype = bool )
+    # loop over the 2**n_dims corners of the cells
+    for corner in range( 2 ** n_dims ):
+        offsets = [ ( corner >> i ) & 1 for i in range( n_dims ) ]
+        v_slice = tuple( [ slice( o, o + n ) for o, n in zip( offsets, c_arr.shape ) ] )
+        v_arr[ v_slice ] |= c_arr
+    return v_arr
+
 def get_intersect_pt( fn, args ):
     try:
         return brentq( fn, -1, 1, args = args )
@@ -92,6 +125,35 @@ class FELSDomain( FESubDomain ):
 
     rt_tol = Float( 0.0001 )
 
+    # Incremental update of the level sets. With narrow_band > 0, 
+    # a change of the level set function is only evaluated in the vertices 
+    # of the cells within narrow_band layers around the cells intersected 
+    # by the previous level set. The intersection points of the elements 
+    # are reused as long as the level set function and its parameters 
+    # do not change, e.g. if only the boundary level set moves (also 
+    # the integration structures in XDOTSEval). This assumes that the level set 
+    # changes only in the vicinity of its zero contour (e.g. propagating 
+    # crack) and moves by less than narrow_band elements per change. 
+    # With narrow_band = 0 the level sets are evaluated on the whole grid.
+    #
+    narrow_band = Int( 0 )
+
+    # signs of the level sets in the vertices from the last evaluation
+    #
+    _ls_vertex_grid = Any
+    _bls_vertex_grid = Any
+
+    # intersection points of the elements and the key 
+    # of the level set function used to evaluate them
+    #
+    _ls_intersection_cache = Dict
+    _ls_intersection_key = Any
+
+    @on_trait_change( 'shape_changed,fe_grid.coord_min,fe_grid.coord_max,fe_grid.geo_transform' )
+    def _reset_ls_intersection_cache( self ):
+        self._ls_intersection_cache = {}
+        self._ls_intersection_key = None
+
     # specialized label
     _tree_label = Str( 'extension domain' )
 
@@ -170,16 +232,41 @@ class FELSDomain( FESubDomain ):
     #---------------------------------------------------------------------
     # Grids with the values of the level sets
     #---------------------------------------------------------------------
+    def _get_vertex_signs( self, fn, prev_vertex_grid ):
+        '''Evaluate the sign of the function fn in the vertices of the grid.
+
+        In the incremental mode (narrow_band > 0) only the vertices within 
+        the narrow band around the cells intersected by the previous level set 
+        (prev_vertex_grid) are evaluated, the other vertices keep their sign.
+        If a vertex at the border of the band changes its sign, the level set
+        may have left the band and all vertices are evaluated.
+        '''
+        X_grid = self.fe_grid.dof_vertex_X_grid
+        if self.narrow_band > 0 and prev_vertex_grid is not None and \
+            prev_vertex_grid.shape == X_grid.shape[1:]:
+            n_dims = len( prev_vertex_grid.shape )
+            front = nfabs( edge_sum( prev_vertex_grid ) ) < 2 ** n_dims
+            if front.any():
+                band = cell_to_vertex_mask( dilate( front, self.narrow_band ) )
+                vertex_grid = prev_vertex_grid.copy()
+                vertex_grid[ band ] = sign( array( fn( *[ X[ band ] for X in X_grid ] ),
+                                                   dtype = float ) )
+                band_border = logical_and( band, dilate( band == False, 1 ) )
+                if not ( vertex_grid[ band_border ] !=
+                         prev_vertex_grid[ band_border ] ).any():
+                    return vertex_grid
+        return sign( array( fn( *X_grid ), dtype = float ) )
+
     bls_edge_sum_grid = Property( depends_on = '+shape_changed, bls_function' )
     @cached_property
     def _get_bls_edge_sum_grid( self ):
 
-        X_grid = self.fe_grid.dof_vertex_X_grid
-
         # evaluate the boundary operator - with a result boolean array
         # in the corner nodes.
         #
-        b_vertex_grid = sign( self.bls_function( *X_grid ) )
+        b_vertex_grid = self._get_vertex_signs( self.bls_function,
+                                                self._bls_vertex_grid )
+        self._bls_vertex_grid = b_vertex_grid
 
         return edge_sum( b_vertex_grid )
 
@@ -187,16 +274,11 @@ class FELSDomain( FESubDomain ):
     @cached_property
     def _get_ls_edge_sum_grid( self ):
 
-        X_grid = self.fe_grid.dof_vertex_X_grid
-
-        # find the indices of the elems
-
-        ls_function = self.ls_function
-
-        n_dims = X_grid.shape[0]
+        n_dims = self.fe_grid.dof_vertex_X_grid.shape[0]
 
-        vect_fn = frompyfunc( ls_function, n_dims, 1 )
-        ls_vertex_grid = sign( vect_fn( *X_grid ) )
+        vect_fn = frompyfunc( self.ls_function, n_dims, 1 )
+        ls_vertex_grid = self._get_vertex_signs( vect_fn, self._ls_vertex_grid )
+        self._ls_vertex_grid = ls_vertex_grid
 
         return array( edge_sum( ls_vertex_grid ), dtype = float )
 
@@ -533,9 +615,7 @@ class FELSDomain( FESubDomain ):
         elem_dof_map = self.elem_dof_map
         elem_X_map = self.elem_X_map
         elem_x_map = self.elem_x_map
-        return [MElem( dofs = dofs, point_X_arr = point_X_arr, point_x_arr = point_x_arr )
-                for dofs, point_X_arr, point_x_arr
-                in zip( elem_dof_map, elem_X_map, elem_x_map ) ]
+        return MElemArray( elem_dof_map, elem_X_map, elem_x_map )
 
     #-----------------------------------------------------------------------------
     # Methods required by XDOTS
@@ -559,14 +639,16 @@ class FELSDomain( FESubDomain ):
         ls_function = self.ls_function
         n_dims = X_arr.shape[1]
 
-        vect_fn = frompyfunc( ls_function, n_dims, 1 )
-        ls_vertex_grid = sign( vect_fn( *X_arr.T ) )
-
-        # select the affected elements from the ls_vertex_grid
+        # evaluate the level set only in the nodes of the affected elements
+        #
+        elem_nodes = self.elem_node_map[ self.elems ]
+        nodes = unique( elem_nodes.flatten() )
 
-        elem_node_map = self.elem_node_map
+        vect_fn = frompyfunc( ls_function, n_dims, 1 )
+        ls_vertex_grid = zeros( ( X_arr.shape[0], ), dtype = float )
+        ls_vertex_grid[ nodes ] = sign( array( vect_fn( *X_arr[ nodes ].T ), dtype = float ) )
 
-        return ls_vertex_grid[ elem_node_map[ self.elems] ]
+        return ls_vertex_grid[ elem_nodes ]
 
     def get_cell_point_X_arr( self, elem ):
         return self.fe_grid.get_cell_point_X_arr( elem )
@@ -579,8 +661,24 @@ class FELSDomain( FESubDomain ):
         # fe_grid_slice.r_i # intersecting points
         i_elements = self.elems
         el_pnts = []
+        incremental = self.narrow_band > 0
+        ls_intersection_cache = {}
+        prev_cache = {}
+        if incremental:
+            # reuse the intersection points of the elements if the level set 
+            # function has not changed (e.g. only the boundary level set moved)
+            ls_key = self._get_ls_fn_key()
+            prev_key = self._ls_intersection_key
+            if prev_key != None and prev_key[0] is ls_key[0] and \
+                prev_key[1] == ls_key[1]:
+                prev_cache = self._ls_intersection_cache
         for elem in i_elements:
             inter_pts = []
+            if elem in prev_cache:
+                inter_pts = prev_cache[ elem ]
+                ls_intersection_cache[ elem ] = inter_pts
+                el_pnts.append( inter_pts )
+                continue
             #X_mtx = self.elements[elem].get_X_mtx() # skips deactivated elements
             X_mtx = self.get_cell_point_X_arr( elem )
             dim = X_mtx.shape[1]#TODO:merge 1 and 2d
@@ -599,9 +697,28 @@ class FELSDomain( FESubDomain ):
                         inter_pts.append( [r_coord, c_coord] )
             elif dim == 3:
                 raise NotImplementedError, 'not available for 3D yet'
+            if incremental:
+                ls_intersection_cache[ elem ] = inter_pts
             el_pnts.append( inter_pts )
+        if incremental:
+            self._ls_intersection_cache = ls_intersection_cache
+            self._ls_intersection_key = ls_key
         return array( el_pnts )
 
+    def _get_ls_fn_key( self ):
+        '''Level set function and the representation of its parameters
+        (default arguments, closure variables, traits of the level set object)
+        identifying unchanged intersections.
+        '''
+        ls_function = self.ls_function
+        closure = getattr( ls_function, 'func_closure', None ) or []
+        params = [ getattr( ls_function, 'func_defaults', None ),
+                   [ cell.cell_contents for cell in closure ] ]
+        ls_object = getattr( ls_function, 'im_self', ls_function )
+        if isinstance( ls_object, HasTraits ):
+            params.append( ls_object.trait_get( *ls_object.copyable_trait_names() ) )
+        return ls_function, repr( params )
+
     def ls_fn_r( self, r, s, X_mtx ):#TODO:dimensionless treatment
         ls_function = self.ls_function
         X_pnt = self.fe_grid.fets_eval.map_r2X( [r, s], X_mtx )
@@ -17,7 +17,8 @@ from ibvpy.core.sdomain import \
 
 from ibvpy.fets.i_fets_eval     import IFETSEval
 from mathkit.level_set.level_set import ILevelSetFn, SinLSF
-from fe_grid  import FEGrid, MElem, point_list_tabular_editor
+from fe_grid  import FEGrid, MElemArray, point_list_tabular_editor
+from spatial_index import SpatialIndex
 from fe_subdomain    import FESubDomain
 from fe_refinement_level import FERefinementLevel
 from i_fe_uniform_domain import IFEUniformDomain
@@ -193,6 +194,40 @@ class FERefinementGrid( FERefinementLevel ):
         return vstack( [ fe_subgrid.elem_x_map
                         for fe_subgrid in self.fe_subgrids ] )
 
+    #-------------------------------------------------------------
+    # Spatial queries - the elements are identified by their rows
+    # in elem_X_map (subgrids in their order). The KD-tree of the
+    # element centers is used as the subgrids are not regular.
+    # The refinement of the subgrids is not signaled to this grid,
+    # the index is rebuilt when the element coordinates differ.
+    #-------------------------------------------------------------
+
+    _spatial_index = Instance( SpatialIndex )
+
+    spatial_index = Property
+    def _get_spatial_index( self ):
+        elem_X_map = self.elem_X_map
+        if self._spatial_index == None or \
+            not array_equal( self._spatial_index.elem_X_map, elem_X_map ):
+            self._spatial_index = SpatialIndex( elem_X_map = elem_X_map,
+                                                fets_eval = self.fets_eval )
+        return self._spatial_index
+
+    def get_elems_at( self, X_arr ):
+        '''Return the elements containing the points X_arr (-1 if outside).
+        '''
+        return self.spatial_index.get_elems_at( X_arr )
+
+    def get_elems_in_radius( self, X_pnt, radius ):
+        '''Return the elements within the radius from the point(s) X_pnt.
+        '''
+        return self.spatial_index.get_elems_in_radius( X_pnt, radius )
+
+    def get_subgrid( self, bounding_box ):
+        '''Return the elements intersecting the bounding box.
+        '''
+        return self.spatial_index.get_elems_in_box( *bounding_box )
+
     def deactivate( self, idx ):
         '''Deactivate the specified element.
         
@@ -302,15 +337,13 @@ class FERefinementGrid( FERefinementLevel ):
         n_elem_arr = array( [ subgrid.n_active_elems for subgrid in self.fe_subgrids ], dtype = 'int' )
         return sum( n_elem_arr )
 
-    elements = Property( List, depends_on = \
+    elements = Property( depends_on = \
                        'changed_structure,+changed_geometry,+changed_formulation,+changed_context' )
     @cached_property
     def _get_elements( self ):
         '''The active list of elements to be included in the spatial integration'''
         # only active elements are returned
-        return [MElem( dofs = dofs, point_X_arr = point_X_arr, point_x_arr = point_x_arr )
-                for dofs, point_X_arr, point_x_arr in zip( self.elem_dof_map,
-                                         self.elem_X_map, self.elem_x_map ) ]
+        return MElemArray( self.elem_dof_map, self.elem_X_map, self.elem_x_map )
 
     def apply_on_ip_grid( self, fn, ip_mask ):
         '''
@@ -0,0 +1,253 @@
+
+from enthought.traits.api import \
+    HasTraits, Array, Int, Float, Any, Property, cached_property
+
+from numpy import \
+    array, asarray, zeros, ones, floor, clip, sqrt, dot, maximum, fabs, \
+    logical_and, cumprod, indices, hstack, repeat, arange
+
+from scipy.spatial import cKDTree
+
+#--------------------------------------------------------------------------
+# SpatialIndex
+#--------------------------------------------------------------------------
+class SpatialIndex( HasTraits ):
+    '''
+    Spatial index of the elements and nodes of a domain answering
+    point location, radius and box queries.
+
+    The elements are given by the coordinates of their geometry nodes
+    (elem_X_map), the nodes by their coordinates (node_X_arr).
+
+    For a regular grid (grid_shape, coord_min and coord_max specified,
+    no geometry transformation) the cells are used as a uniform bucket
+    grid - the cell containing a point is obtained directly from its
+    coordinates. Otherwise, the candidate elements are found using
+    a KD-tree of the element centers and checked against the bounding boxes
+    of the elements. If fets_eval is supplied, the point location
+    is checked exactly using the inverse mapping of the element geometry.
+
+    All queries accept an array of points ( n_pnts, n_dims ) as well and
+    return the results for each point (batch evaluation).
+    '''
+
+    # element geometry ( n_elems, n_geo_r, n_dims )
+    #
+    elem_X_map = Array( float )
+
+    # node coordinates ( n_nodes, n_dims )
+    #
+    node_X_arr = Array( float )
+
+    # specification of the regular grid
+    #
+    grid_shape = Array( int )
+    coord_min = Array( float )
+    coord_max = Array( float )
+
+    # element type used for the exact point location
+    #
+    fets_eval = Any
+
+    # tolerance of the point location in the local coordinates
+    #
+    tol = Float( 1e-8 )
+
+    n_dims = Property
+    def _get_n_dims( self ):
+        return self.elem_X_map.shape[2]
+
+    is_regular = Property
+    def _get_is_regular( self ):
+        return len( self.grid_shape ) > 0
+
+    #-------------------------------------------------------------------------
+    # Auxiliary data
+    #-------------------------------------------------------------------------
+    elem_bbox = Property( depends_on = 'elem_X_map' )
+    @cached_property
+    def _get_elem_bbox( self ):
+        '''Bounding boxes of the elements ( X_min, X_max ).
+        '''
+        return self.elem_X_map.min( axis = 1 ), self.elem_X_map.max( axis = 1 )
+
+    elem_tree = Property( depends_on = 'elem_X_map' )
+    @cached_property
+    def _get_elem_tree( self ):
+        '''KD-tree of the element centers and the radius of the largest
+        bounding box around its center.
+        '''
+        X_min, X_max = self.elem_bbox
+        X_c = ( X_min + X_max ) / 2.
+        r_max = sqrt( ( ( X_max - X_c ) ** 2 ).sum( axis = 1 ) ).max()
+        return cKDTree( X_c ), r_max
+
+    node_tree = Property( depends_on = 'node_X_arr' )
+    @cached_property
+    def _get_node_tree( self ):
+        return cKDTree( self.node_X_arr )
+
+    cell_size = Property( depends_on = 'grid_shape,coord_min,coord_max' )
+    @cached_property
+    def _get_cell_size( self ):
+        n_dims = len( self.grid_shape )
+        return ( self.coord_max[:n_dims] - self.coord_min[:n_dims] ) / self.grid_shape
+
+    cell_strides = Property( depends_on = 'grid_shape' )
+    @cached_property
+    def _get_cell_strides( self ):
+        '''Multipliers converting the cell index to the offset.
+        '''
+        return hstack( [ cumprod( self.grid_shape[:0:-1] )[::-1], [ 1 ] ] ).astype( int )
+
+    #-------------------------------------------------------------------------
+    # Queries
+    #-------------------------------------------------------------------------
+    def get_elems_at( self, X_arr ):
+        '''Return the elements containing the points X_arr ( n_pnts, n_dims ),
+        -1 for the points outside of the domain.
+        '''
+        X_arr = asarray( X_arr, dtype = float )
+        if len( X_arr.shape ) == 1:
+            return self.get_elems_at( X_arr[None, :] )[0]
+        X_arr = X_arr[:, :self.n_dims]
+        if self.is_regular:
+            return self._get_grid_cells_at( X_arr )
+
+        tree, r_max = self.elem_tree
+        n_pnts = X_arr.shape[0]
+        elems = -ones( ( n_pnts, ), dtype = int )
+        if n_pnts == 0:
+            return elems
+
+        # pairs of the points and the candidate elements
+        #
+        cand_lists = tree.query_ball_point( X_arr, r_max * ( 1 + self.tol ) )
+        n_cands = array( [ len( cands ) for cands in cand_lists ], dtype = int )
+        if n_cands.sum() == 0:
+            return elems
+        pnts = repeat( arange( n_pnts ), n_cands )
+        cands = hstack( [ cands for cands in cand_lists if len( cands ) > 0 ] ).astype( int )
+
+        # bounding box test of all pairs
+        #
+        inside = self._inside_bbox( X_arr[ pnts ], cands )
+        pnts, cands = pnts[ inside ], cands[ inside ]
+
+        if self.fets_eval == None:
+            # first candidate of each point
+            elems[ pnts[::-1] ] = cands[::-1]
+            return elems
+
+        for i, e in zip( pnts, cands ):
+            if elems[ i ] < 0 and self._inside_elem( X_arr[ i ], e ):
+                elems[ i ] = e
+        return elems
+
+    def get_elems_in_radius( self, X_pnt, radius ):
+        '''Return the elements with a distance less or equal
+        to the radius from the point X_pnt.
+        For an array of points return the list of element arrays.
+        '''
+        X_pnt = asarray( X_pnt, dtype = float )
+        if len( X_pnt.shape ) == 2:
+            return [ self.get_elems_in_radius( X, radius ) for X in X_pnt ]
+        X_pnt = X_pnt[:self.n_dims]
+        candidates = self._get_candidate_elems( X_pnt - radius, X_pnt + radius )
+        X_min, X_max = self.elem_bbox
+        # distance between the point and the bounding boxes
+        d = maximum( maximum( X_min[ candidates ] - X_pnt, X_pnt - X_max[ candidates ] ), 0. )
+        return candidates[ ( d ** 2 ).sum( axis = 1 ) <= radius ** 2 ]
+
+    def get_elems_in_box( self, X_min, X_max ):
+        '''Return the elements intersecting the box [ X_min, X_max ].
+        '''
+        n_dims = self.n_dims
+        X_min = asarray( X_min, dtype = float )[:n_dims]
+        X_max = asarray( X_max, dtype = float )[:n_dims]
+        candidates = self._get_candidate_elems( X_min, X_max )
+        E_min, E_max = self.elem_bbox
+        overlap = logical_and( E_min[ candidates ] <= X_max, E_max[ candidates ] >= X_min )
+        return candidates[ overlap.all( axis = 1 ) ]
+
+    def get_nodes_in_radius( self, X_pnt, radius ):
+        '''Return the nodes with a distance less or equal
+        to the radius from the point X_pnt.
+        For an array of points return the list of node arrays.
+        '''
+        X_pnt = asarray( X_pnt, dtype = float )
+        if len( X_pnt.shape ) == 2:
+            return [ self.get_nodes_in_radius( X, radius ) for X in X_pnt ]
+        nodes = self.node_tree.query_ball_point( X_pnt[:self.node_X_arr.shape[1]], radius )
+        return array( sorted( nodes ), dtype = int )
+
+    def get_nodes_in_box( self, X_min, X_max ):
+        '''Return the nodes within the box [ X_min, X_max ].
+        '''
+        n_dims = self.node_X_arr.shape[1]
+        X_min = asarray( X_min, dtype = float )[:n_dims]
+        X_max = asarray( X_max, dtype = float )[:n_dims]
+        X_c = ( X_min + X_max ) / 2.
+        r = sqrt( ( ( X_max - X_c ) ** 2 ).sum() )
+        nodes = array( sorted( self.node_tree.query_ball_point( X_c, r ) ), dtype = int )
+        if len( nodes ) == 0:
+            return nodes
+        X_n = self.node_X_arr[ nodes ]
+        inside = logical_and( X_n >= X_min, X_n <= X_max ).all( axis = 1 )
+        return nodes[ inside ]
+
+    #-------------------------------------------------------------------------
+    # Implementation
+    #-------------------------------------------------------------------------
+    def _get_grid_cells_at( self, X_arr ):
+        '''Locate the points in the regular grid.
+        '''
+        n_dims = len( self.grid_shape )
+        h = self.cell_size
+        rel = ( X_arr - self.coord_min[:n_dims] ) / h
+        outside = logical_and( rel >= -self.tol,
+                               rel <= self.grid_shape + self.tol ).all( axis = 1 ) == False
+        idx = clip( floor( rel ).astype( int ), 0, self.grid_shape - 1 )
+        elems = dot( idx, self.cell_strides )
+        elems[ outside ] = -1
+        return elems
+
+    def _get_candidate_elems( self, X_min, X_max ):
+        '''Return the elements possibly intersecting the box [ X_min, X_max ].
+        '''
+        if self.is_regular:
+            # range of the cell indices covered by the box
+            n_dims = len( self.grid_shape )
+            h = self.cell_size
+            c_min = self.coord_min[:n_dims]
+            i_min = clip( floor( ( X_min - c_min ) / h ).astype( int ) - 1,
+                          0, self.grid_shape - 1 )
+            i_max = clip( floor( ( X_max - c_min ) / h ).astype( int ) + 1,
+                          0, self.grid_shape - 1 )
+            if ( ( X_max - c_min ) / h < -self.tol ).any() or \
+                ( ( X_min - c_min ) / h > self.grid_shape + self.tol ).any():
+                return zeros( ( 0, ), dtype = int )
+            idx = indices( i_max - i_min + 1 ).reshape( n_dims, -1 ).T + i_min
+            return dot( idx, self.cell_strides )
+
+        tree, r_max = self.elem_tree
+        X_c = ( X_min + X_max ) / 2.
+        r = sqrt( ( ( X_max - X_c ) ** 2 ).sum() ) + r_max
+        return array( sorted( tree.query_ball_point( X_c, r * ( 1 + self.tol ) ) ), dtype = int )
+
+    def _inside_bbox( self, X_pnt, elems ):
+        '''Check whether the point(s) X_pnt lie within the bounding
+        boxes of the elements.
+        '''
+        X_min, X_max = self.elem_bbox
+        eps = self.tol * ( X_max[ elems ] - X_min[ elems ] )
+        return logical_and( X_min[ elems ] - eps <= X_pnt,
+                            X_max[ elems ] + eps >= X_pnt ).all( axis = 1 )
+
+    def _inside_elem( self, X_pnt, elem ):
+        '''Check whether the point lies within the element.
+        '''
+        if self.fets_eval == None:
+            return True
+        r_pnt = self.fets_eval.map_X2r( X_pnt, self.elem_X_map[ elem ] )
+        return ( fabs( r_pnt ) <= 1. + self.tol ).all()
@@ -20,7 +20,7 @@ from ibvpy.core.sdomain import \
 
 from mathkit.level_set.level_set import ILevelSetFn, SinLSF
 
-from fe_grid import MElem
+from fe_grid import MElemArray
 from ibvpy.dots.xdots_eval import XDOTSEval
 from fe_subdomain import FESubDomain
 from fe_domain import FEDomain
@@ -304,9 +304,7 @@ class XFESubDomain( FESubDomain ):
         elem_dof_map = self.elem_dof_map
         elem_X_map = self.elem_X_map
         elem_x_map = self.elem_x_map
-        return [MElem( dofs = dofs, point_X_arr = point_X_arr, point_x_arr = point_x_arr )
-                for dofs, point_X_arr, point_x_arr
-                in zip( elem_dof_map, elem_X_map, elem_x_map ) ]
+        return MElemArray( elem_dof_map, elem_X_map, elem_x_map )
 
     elem_dof_map = Property( depends_on = '_slice, boundary' )
     @cached_property
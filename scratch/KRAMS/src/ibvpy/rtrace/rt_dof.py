@@ -117,6 +117,46 @@ class RTraceGraph( RTrace ):
         self._xdata.append( copy( x ) )
         self._ydata.append( copy( y ) )
 
+    def get_store_values( self ):
+        if len( self._xdata ) == 0:
+            return {}
+        return { self.name + '.x' : self._xdata[-1],
+                 self.name + '.y' : self._ydata[-1] }
+
+    def load_store_values( self, store, step ):
+        '''Restore the graph up to the step.
+        '''
+        key_x, key_y = self.name + '.x', self.name + '.y'
+        if key_x not in store.keys:
+            return
+        n = ( store.get_steps( key_x ) <= step % store.n_steps ).sum()
+        self._xdata = list( store.get_history( key_x )[:n] )
+        self._ydata = list( store.get_history( key_y )[:n] )
+        self.redraw()
+
+    supports_async = Bool( True )
+
+    def get_current_values( self ):
+        if len( self._xdata ) == 0:
+            return {}
+        return { 'x' : self._xdata[-1],
+                 'y' : self._ydata[-1] }
+
+    def set_current_values( self, values ):
+        if 'x' in values:
+            self.add_pair( values['x'], values['y'] )
+
+    def get_buffers( self ):
+        if len( self._xdata ) == 0:
+            return {}
+        return { 'x' : array( self._xdata ),
+                 'y' : array( self._ydata ) }
+
+    def set_buffers( self, buffers ):
+        if 'x' in buffers:
+            self._xdata = list( buffers['x'] )
+            self._ydata = list( buffers['y'] )
+
     @on_trait_change( 'idx_x,idx_y' )
     def redraw( self, e = None ):
         if ( ( self.idx_x < 0 and len( self.idx_x_arr ) == 0 ) or
@@ -26,7 +26,7 @@ from enthought.traits.ui.table_filter \
 
 from numpy \
     import array, zeros, \
-    float_
+    float_, arange
 
 from ibvpy.plugins.mayavi.pipelines \
     import MVUnstructuredGrid
@@ -100,6 +100,14 @@ class RTraceDomainField( RTraceDomain ):
 
         sd = self.sd
 
+        if not ( args or kw ):
+            field_arr = self.eval_batch( sctx, U_k, self.var_eval,
+                                         self.fets_eval.vtk_r_arr,
+                                         self.dots.get_vtk_pnt_ip_map( 0 ) )
+            if field_arr is not None:
+                self.field_arr = field_arr
+                return
+
         #loc_coords = self.dots.vtk_r_arr
 
 #        try: loc_coords = self.fets_eval.vtk_r_arr
@@ -153,6 +161,15 @@ class RTraceDomainField( RTraceDomain ):
         # evaluation to improve the performance 
         sd = self.sd
         sctx.fets_eval = self.fets_eval
+
+        if not ( args or kw ):
+            ip_coords = self.fets_eval.ip_coords
+            field_arr = self.eval_batch( sctx, U_k, self.var_eval,
+                                         ip_coords, arange( ip_coords.shape[0] ) )
+            if field_arr is not None:
+                self.field_arr = field_arr
+                return
+
         field = []
         dim_slice = self.fets_eval.dim_slice
         e_arr_size = self.fets_eval.get_state_array_size()
@@ -179,6 +196,29 @@ class RTraceDomainField( RTraceDomain ):
             field += field_entry
         self.field_arr = array( field )
 
+    def eval_batch( self, sctx, U_k, var_eval, r_arr, ip_map ):
+        '''
+        Evaluate the variable in the local points r_arr of all elements
+        at once (see RTraceEval.call_batch). The state variables are taken
+        from the integration points ip_map associated with the points.
+        Return the field array ( n_elems * n_pnts, ... ) or None if the bulk
+        evaluation is not available (e.g. enriched or redefined elements)
+        so that the element-by-element evaluation must be used.
+        '''
+        call_batch = getattr( var_eval, 'call_batch', None )
+        if call_batch == None:
+            return None
+        n_elems = len( self.sd.elements )
+        if n_elems == 0:
+            return None
+        sctx.e_arr = arange( n_elems )
+        sctx.r_arr = r_arr
+        sctx.ip_map = ip_map
+        val_arr = call_batch( sctx, U_k )
+        if val_arr is None:
+            return None
+        return val_arr.reshape( ( n_elems * r_arr.shape[0], ) + val_arr.shape[2:] )
+
     def add_current_displ( self, sctx, U_k ):
 
 #        if  self.var_eval == None or \
@@ -186,6 +226,13 @@ class RTraceDomainField( RTraceDomain ):
 #            return
 
         warp_var_eval = self.warp_var_eval
+        vector_arr = self.eval_batch( sctx, U_k, warp_var_eval,
+                                      self.fets_eval.vtk_r_arr,
+                                      self.dots.get_vtk_pnt_ip_map( 0 ) )
+        if vector_arr is not None:
+            self.vector_arr = vector_arr
+            return
+
 #        if self.position == 'int_pnts':
 #            loc_coords = self.fets_eval.ip_coords
 #        elif self.position == 'nodes':
@@ -261,6 +308,29 @@ class RTraceDomainField( RTraceDomain ):
         #self.changed = True
         pass
 
+    def get_store_values( self, key ):
+        '''Current field and warp vectors to be stored under the key.
+        '''
+        values = {}
+        if self.skip_domain:
+            return values
+        field_arr = getattr( self, 'field_arr', None )
+        if field_arr is not None:
+            values[ key ] = field_arr
+        vector_arr = getattr( self, 'vector_arr', None )
+        if vector_arr is not None:
+            values[ key + '.warp' ] = vector_arr
+        return values
+
+    def load_store_values( self, store, step, key ):
+        field_arr = store.get_values( key, step )
+        if field_arr is not None:
+            self.field_arr = field_arr
+        if key + '.warp' in store.keys:
+            vector_arr = store.get_values( key + '.warp', step )
+            if vector_arr is not None:
+                self.vector_arr = vector_arr
+
     def clear( self ):
         pass
 
@@ -178,6 +178,35 @@ class RTraceDomainListField( RTrace, RTraceDomainList ):
         for sf in self.subfields:
             sf.clear()
 
+    def get_store_values( self ):
+        values = {}
+        for i, sf in enumerate( self.subfields ):
+            values.update( sf.get_store_values( '%s.%d' % ( self.name, i ) ) )
+        return values
+
+    def load_store_values( self, store, step ):
+        for i, sf in enumerate( self.subfields ):
+            sf.load_store_values( store, step, '%s.%d' % ( self.name, i ) )
+
+    supports_async = Bool( True )
+
+    def get_current_values( self ):
+        return self.get_store_values()
+
+    def set_current_values( self, values ):
+        self.set_buffers( values )
+
+    def get_buffers( self ):
+        return self.get_store_values()
+
+    def set_buffers( self, buffers ):
+        for i, sf in enumerate( self.subfields ):
+            key = '%s.%d' % ( self.name, i )
+            if key in buffers:
+                sf.field_arr = buffers[ key ]
+            if key + '.warp' in buffers:
+                sf.vector_arr = buffers[ key + '.warp' ]
+
     def _get_warp_data( self ):
         vectors_arr_list = []
         for sf in self.subfields:
@@ -5,9 +5,10 @@ from numpy import array, zeros, arange, array_equal, sqrt
 from sys_mtx_assembly import SysMtxAssembly
 from coo_mtx import COOSparseMtx
 from dense_mtx import DenseMtx
+from lin_solver import LinSolverLU, LinSolverIterative
 from scipy.linalg import solve, norm
 import unittest
-from numpy import array, zeros, arange, array_equal, hstack, dot
+from numpy import array, zeros, arange, array_equal, hstack, dot, allclose
 
 # bar clamped at the left end and loaded at the right end
 
@@ -83,6 +84,87 @@ class TestSysMtxSolver(unittest.TestCase):
         u = self.sys_K.solve(self.rhs, matrix_type = 'dense' )
         self.assertTrue( array_equal( u, self.la_u ) )
 
+    def test_csr_sparse_mtx(self):
+        '''Construct the CSR pattern, scatter the values and solve it.
+        '''
+        u = self.sys_K.solve(self.rhs, matrix_type = 'csr' )
+        self.assertTrue( allclose( u, self.la_u ) )
+
+    def test_csr_pattern_reuse(self):
+        '''The pattern is kept between the calls of solve and 
+        discarded only after the change of the structure.
+        '''
+        self.sys_K.solve(self.rhs, matrix_type = 'csr' )
+        mtx = self.sys_K.get_sys_mtx()
+        pattern = mtx.pattern
+        self.sys_K.solve(self.rhs)
+        self.assertTrue( mtx.pattern is pattern )
+        self.sys_K.changed_structure = True
+        self.assertFalse( mtx.pattern is pattern )
+
+    def test_csr_dof_map_change(self):
+        '''The pattern is reconstructed if the dof map of a matrix
+        array changes without changing its shape.
+        '''
+        self.sys_K.solve(self.rhs, matrix_type = 'csr' )
+        mtx = self.sys_K.get_sys_mtx()
+        pattern = mtx.pattern
+        # exchange the dofs 1 and 2 - the load acts in the middle node
+        self.sys_K.sys_mtx_arrays[0].dof_map_arr = array( [[ 0, 2 ],
+                                                           [ 2, 1 ]], dtype = int )
+        u = self.sys_K.solve(self.rhs)
+        self.assertFalse( mtx.pattern is pattern )
+        self.assertTrue( allclose( u, [ 0., 1., 1. ] ) )
+
+    def test_lu_solver_reuse(self):
+        '''Reuse the factorization until the refresh is requested.
+        '''
+        solver = LinSolverLU()
+        self.sys_K.solver = solver
+        u = self.sys_K.solve(self.rhs, matrix_type = 'csr' )
+        self.assertTrue( allclose( u, self.la_u ) )
+        u = self.sys_K.solve()
+        self.assertTrue( allclose( u, self.la_u ) )
+        self.assertEqual( solver.n_factorizations, 1 )
+        self.sys_K.refresh_solver()
+        u = self.sys_K.solve()
+        self.assertEqual( solver.n_factorizations, 2 )
+
+    def assert_iterative_solver(self, preconditioner):
+        '''Solve the system using the preconditioned gmres.
+        '''
+        self.sys_K.solver = LinSolverIterative( preconditioner = preconditioner )
+        u = self.sys_K.solve( self.rhs, matrix_type = 'csr' )
+        self.assertTrue( allclose( u, self.la_u ) )
+
+    def test_iterative_solver_jacobi(self):
+        '''Solve the system using the gmres with the Jacobi preconditioner.
+        '''
+        self.assert_iterative_solver( 'jacobi' )
+
+    def test_iterative_solver_ilu(self):
+        '''Solve the system using the gmres with the incomplete LU preconditioner.
+        '''
+        self.assert_iterative_solver( 'ilu' )
+
+    def test_ordering(self):
+        '''Solve the bar with scattered dof numbers using
+        the reverse Cuthill-McKee ordering of the unknowns.
+        '''
+        el_dof_map, el_mtx_arr = get_bar_mtx_array( shape = 20 )
+        dof_perm = ( arange( 21 ) * 8 ) % 21
+        rhs = zeros( 21 )
+        rhs[ dof_perm[-1] ] = 1.
+        u_list = []
+        for solver in [ LinSolverLU(), LinSolverLU( ordering = 'rcm' ) ]:
+            K = SysMtxAssembly( solver = solver )
+            K.add_mtx_array( dof_map_arr = dof_perm[ el_dof_map ], mtx_arr = el_mtx_arr )
+            K.register_constraint( a = 0, u_a = 0. )
+            u_list.append( K.solve( rhs.copy(), matrix_type = 'csr' ) )
+        self.assertTrue( allclose( u_list[0], u_list[1] ) )
+        self.assertAlmostEqual( u_list[1][ dof_perm[-1] ], 2.0 )
+        stats = dict( [ ( s[0], s[1:] ) for s in K.get_ordering_stats() ] )
+        self.assertTrue( stats[ 'rcm' ][0] < stats[ 'natural' ][0] )
 
 class TestSysMtxConstraints(unittest.TestCase):
     '''
@@ -217,6 +299,25 @@ class TestSysMtxConstraints(unittest.TestCase):
                       dtype = float )
         difference = sqrt( norm( u-u_ex ) )
         self.assertAlmostEqual( difference, 0 )
+
+    def test_bar4_csr( self ):
+        '''The same as test_bar4 using the CSR matrix with link matrices
+        [0]-[1]-[2] [3]-[4]-[5] [6]-[7]-[8]
+        u[0] = 0, u[2] = u[3], u[5] = u[6], u[8] = 1'''
+        K = SysMtxAssembly( matrix_type = 'csr' )
+        for offset in [0, 3, 6]:
+            dof_map, mtx_arr = get_bar_mtx_array( shape = 2 )
+            K.add_mtx_array( dof_map_arr = dof_map+offset, mtx_arr = mtx_arr )
+        K.register_constraint( a = 0, u_a = 0. ) # clamped end
+        K.register_constraint( a = 2, alpha = [1], ix_a = [3] )
+        K.register_constraint( a = 5, alpha = [1], ix_a = [6] )
+        K.register_constraint( a = 8, u_a = 1. ) # loaded end
+        R = zeros( K.n_dofs )
+        u = K.solve( R )
+        u_ex = array([0., 1/6.,  1/3., 1/3., 1/2. , 2/3., 2/3.,  5/6.,  1. ],
+                      dtype = float )
+        difference = sqrt( norm( u-u_ex ) )
+        self.assertAlmostEqual( difference, 0 )
     
     def test_bar5( self ):
         '''Clamped bar with 4 elements. Elements 2-4 are reinforced
@@ -400,3 +501,82 @@ class TestSysMtxConstraints(unittest.TestCase):
                       dtype = float )
         for uu, ue in zip( u, u_ex ):
             self.assertAlmostEqual( uu, ue )        
+
+    def test_bar12( self ):
+        '''Bar with multiple prescribed displacements and a link 
+        to a prescribed dof (ordering of the constraints)
+        [0]-[1]-[2]-[3]-[4]-[5]-[6]-[7]-[8]-[9]-[10]
+        u[0] = 0, u[10] = 1, u[5] = 0.5, u[1] = 0.4 * u[5], u[4] = u[5]'''
+        K = SysMtxAssembly()
+        dof_map, mtx_arr = get_bar_mtx_array( shape = 10 )
+        K.add_mtx_array( dof_map_arr = dof_map, mtx_arr = mtx_arr )
+        # the link referring to a constrained dof is registered last
+        K.register_constraint( a = 0, u_a = 0. ) # clamped end
+        K.register_constraint( a = 10, u_a = 1. ) # loaded end
+        K.register_constraint( a = 5, u_a = 0.5 )
+        K.register_constraint( a = 1, alpha = [0.4], ix_a = [5] )
+        K.register_constraint( a = 4, alpha = [1], ix_a = [5] )
+        self.assertEqual( [ c.a for c in K.sorted_constraints ],
+                          [ 0, 10, 1, 4, 5 ] )
+        R = zeros( K.n_dofs )
+        u = K.solve( R )
+        u_ex = array( [ 0., 0.2, 0.3, 0.4, 0.5, 0.5,
+                        0.6, 0.7, 0.8, 0.9, 1. ], dtype = float )
+        for uu, ue in zip( u, u_ex ):
+            self.assertAlmostEqual( uu, ue )
+
+    def test_cyclic_constraints( self ):
+        '''Cyclic link constraints cannot be ordered.
+        '''
+        K = SysMtxAssembly()
+        dof_map, mtx_arr = get_bar_mtx_array( shape = 3 )
+        K.add_mtx_array( dof_map_arr = dof_map, mtx_arr = mtx_arr )
+        K.register_constraint( a = 1, alpha = [1], ix_a = [2] )
+        K.register_constraint( a = 2, alpha = [1], ix_a = [1] )
+        self.assertRaises( ValueError, lambda : K.sorted_constraints )
+
+    def test_elimination( self ):
+        '''Eliminated constraints (load in the middle, displ at right end)
+        [0]-[1]-[2]-[3] [4]-[5]-[6]
+        u[0] = 0, u[3] = u[4], u[6] = 1, R[2] = 1'''
+        u_ex = array( [ 0., 0.26, 0.52, 0.68, 0.68, 0.84, 1. ], dtype = float )
+        for handling, solver in [ ( 'modify', None ),
+                                  ( 'eliminate', None ),
+                                  ( 'eliminate', LinSolverIterative( method = 'cg' ) ) ]:
+            K = SysMtxAssembly( constraint_handling = handling, solver = solver )
+            dof_map1, mtx_arr1 = get_bar_mtx_array( shape = 3 )
+            K.add_mtx_array( dof_map_arr = dof_map1, mtx_arr = mtx_arr1 )
+            dof_map2, mtx_arr2 = get_bar_mtx_array( shape = 2 )
+            K.add_mtx_array( dof_map_arr = dof_map2 + 4, mtx_arr = mtx_arr2 )
+            K.register_constraint( a = 0, u_a = 0. ) # clamped end
+            K.register_constraint( a = 3, alpha = [1], ix_a = [4] )
+            K.register_constraint( a = 6, u_a = 1. ) # loaded end
+            R = zeros( K.n_dofs )
+            R[2] = 1.
+            u = K.solve( R )
+            for uu, ue in zip( u, u_ex ):
+                self.assertAlmostEqual( uu, ue )
+            # the element matrices are not modified by the elimination
+            if handling == 'eliminate':
+                self.assertTrue( array_equal( K.sys_mtx_arrays[0].mtx_arr,
+                                              mtx_arr1 ) )
+
+    def test_solve_additional( self ):
+        '''Solution for a further right hand side with the constrained matrix
+        [0]-[1]-[2]-[3]
+        u[0] = 0, u[1] = 0.5 * u[2], u[2] = u[3], R[3] = 1'''
+        for handling in [ 'modify', 'eliminate' ]:
+            K = SysMtxAssembly( constraint_handling = handling )
+            dof_map, mtx_arr = get_bar_mtx_array( shape = 3 )
+            K.add_mtx_array( dof_map_arr = dof_map, mtx_arr = mtx_arr )
+            K.register_constraint( a = 0, u_a = 0. ) # clamped end
+            K.register_constraint( a = 1, alpha = [0.5], ix_a = [2] )
+            K.register_constraint( a = 2, alpha = [1], ix_a = [3] )
+            K.apply_constraints( zeros( K.n_dofs ) )
+            R = zeros( K.n_dofs )
+            R[3] = 1
+            u = K.solve_additional( R )
+            self.assertEqual( R[3], 1 )
+            u_ex = array( [ 0., 0.1, 0.2, 0.2 ], dtype = float )
+            for uu, ue in zip( u, u_ex ):
+                self.assertAlmostEqual( uu, ue )
@@ -59,16 +59,20 @@ class COOSparseMtx( HasTraits ):
         return hstack( [ sm_arr.mtx_arr.ravel()
                          for sm_arr in self.assemb.get_sys_mtx_arrays() ] )
 
-    def solve( self, rhs ):
-        '''Construct the matrix and use the solver to get 
-        the solution for the supplied rhs. 
+    mtx = Property
+    def _get_mtx( self ):
+        '''Construct the sparse matrix in the coordinate format.
         '''
         ij = vstack( ( self.x_l, self.y_l ) )
 
         # Assemble the system matrix from the flattened data and 
         # sparsity map containing two rows - first one are the row
         # indices and second one are the column indices.
-        mtx = sparse.coo_matrix( ( self.data_l, ij ) )
+        return sparse.coo_matrix( ( self.data_l, ij ) )
 
-        u_vct = linsolve.spsolve( mtx, rhs )
+    def solve( self, rhs ):
+        '''Construct the matrix and use the solver to get 
+        the solution for the supplied rhs. 
+        '''
+        u_vct = linsolve.spsolve( self.mtx, rhs )
         return u_vct
@@ -0,0 +1,130 @@
+
+from enthought.traits.api import HasTraits, Property, cached_property, Any
+from numpy import zeros, hstack, unique, bincount, cumsum, argsort, \
+    array_equal, add
+from scipy import sparse
+from scipy.sparse.linalg.dsolve import linsolve
+
+class CSRSparseMtx( HasTraits ):
+    '''Compressed sparse row matrix with a cached sparsity pattern.
+
+    In contrast to the COOSparseMtx, the row and column indices of the
+    system matrix are derived only once for a given layout of the
+    matrix arrays. Every value of every element matrix gets assigned
+    the position within the data array of the CSR matrix (scatter index).
+    The assembly of the matrix in a subsequent iteration reduces then
+    to the summation of the element values into the data array
+    (the values sorted by the scatter index are summed by add.reduceat
+    using buffers allocated together with the pattern).
+
+    The instance is retained by the SysMtxAssembly between the calls
+    of solve. The pattern is discarded upon the change of the structure
+    (event changed_structure of the assembly) or if the dof maps
+    of the matrix arrays do not match the ones used for its construction.
+    '''
+    # the instance should be kept alive by the assembly
+    #
+    persistent = True
+
+    assemb = Any
+
+    pattern = Property( depends_on = 'assemb.changed_structure' )
+    @cached_property
+    def _get_pattern( self ):
+        '''
+        Construct the CSR structure (indptr, indices) and the scatter index
+        mapping the raveled values of the element matrices to the data array.
+        '''
+        sys_mtx_arrays = self.assemb.get_sys_mtx_arrays()
+        n_dofs = self.assemb.n_dofs
+
+        # global row and column index of each value in the element matrices
+        # (the same layout as in DenseMtx: mtx[i,j] -> K[dof_map[i],dof_map[j]])
+        #
+        ij_keys = []
+        for sys_mtx_arr in sys_mtx_arrays:
+            dof_map = sys_mtx_arr.dof_map_arr.astype( 'int64' )
+            ij_keys.append( ( dof_map[:, :, None] * n_dofs +
+                              dof_map[:, None, :] ).ravel() )
+        ij_keys = hstack( ij_keys )
+
+        # sorted unique keys correspond to the row-major CSR ordering
+        #
+        ij_unique, scatter_idx = unique( ij_keys, return_inverse = True )
+        rows = ij_unique // n_dofs
+        indices = ( ij_unique % n_dofs ).astype( 'int32' )
+        indptr = zeros( ( n_dofs + 1, ), dtype = 'int32' )
+        indptr[1:] = cumsum( bincount( rows, minlength = n_dofs ) )
+
+        # order of the values sorted by the scatter index and the start
+        # of the values summed into each entry of the data array
+        #
+        scatter_order = argsort( scatter_idx, kind = 'mergesort' )
+        scatter_starts = zeros( ( ij_unique.shape[0], ), dtype = 'int_' )
+        scatter_starts[1:] = cumsum( bincount( scatter_idx ) )[:-1]
+
+        # copies of the dof maps to detect a change of the layout
+        #
+        dof_maps = [ sys_mtx_arr.dof_map_arr.copy()
+                     for sys_mtx_arr in sys_mtx_arrays ]
+
+        return dof_maps, n_dofs, indptr, indices, scatter_order, scatter_starts
+
+    def _get_current_pattern( self ):
+        '''Return the pattern, reconstruct it if the dof maps have changed.
+        '''
+        sys_mtx_arrays = self.assemb.get_sys_mtx_arrays()
+        pattern = self.pattern
+        dof_maps = pattern[0]
+        if pattern[1] != self.assemb.n_dofs or \
+            len( dof_maps ) != len( sys_mtx_arrays ) or \
+            not all( [ array_equal( dof_map, sys_mtx_arr.dof_map_arr )
+                       for dof_map, sys_mtx_arr in zip( dof_maps, sys_mtx_arrays ) ] ):
+            self.assemb.changed_structure = True
+            pattern = self.pattern
+        return pattern
+
+    data = Property( depends_on = 'assemb.changed_structure' )
+    @cached_property
+    def _get_data( self ):
+        '''Value buffer of the CSR matrix (reused in every iteration).
+        '''
+        indptr = self.pattern[2]
+        return zeros( ( indptr[-1], ), dtype = 'float_' )
+
+    scatter_buffers = Property( depends_on = 'assemb.changed_structure' )
+    @cached_property
+    def _get_scatter_buffers( self ):
+        '''Buffers of the raveled values of the element matrices
+        in the original and in the scatter order.
+        '''
+        n_values = self.pattern[4].shape[0]
+        return ( zeros( ( n_values, ), dtype = 'float_' ),
+                 zeros( ( n_values, ), dtype = 'float_' ) )
+
+    mtx = Property
+    def _get_mtx( self ):
+        '''Scatter the values of the element matrices into the data
+        buffer and return the CSR matrix sharing the buffer.
+        '''
+        dof_maps, n_dofs, indptr, indices, scatter_order, scatter_starts = \
+            self._get_current_pattern()
+        data = self.data
+        values, sorted_values = self.scatter_buffers
+        offset = 0
+        for sys_mtx_arr in self.assemb.get_sys_mtx_arrays():
+            mtx_arr = sys_mtx_arr.mtx_arr
+            values[ offset:offset + mtx_arr.size ].reshape( mtx_arr.shape )[...] = mtx_arr
+            offset += mtx_arr.size
+        if data.shape[0] > 0:
+            values.take( scatter_order, out = sorted_values )
+            add.reduceat( sorted_values, scatter_starts, out = data )
+        return sparse.csr_matrix( ( data, indices, indptr ),
+                                  shape = ( n_dofs, n_dofs ) )
+
+    def solve( self, rhs ):
+        '''Assemble the values and use the solver to get
+        the solution for the supplied rhs.
+        '''
+        u_vct = linsolve.spsolve( self.mtx, rhs )
+        return u_vct
@@ -0,0 +1,254 @@
+
+from enthought.traits.api import HasTraits, Enum, Float, Int, Any, Bool, Property
+from numpy import ones, fabs, arange, empty_like, abs as arr_abs
+from scipy import sparse
+from scipy.sparse.linalg import splu, spilu, cg, gmres, LinearOperator
+from scipy.sparse.linalg.dsolve import linsolve
+from scipy.sparse.csgraph import reverse_cuthill_mckee
+from time import time
+
+def get_bandwidth( mtx ):
+    '''Return the maximum distance of a nonzero entry from the diagonal.
+    '''
+    mtx = sparse.coo_matrix( mtx )
+    if mtx.nnz == 0:
+        return 0
+    return int( arr_abs( mtx.row - mtx.col ).max() )
+
+def get_tol_name( krylov ):
+    '''Return the name of the relative tolerance argument 
+    of the scipy Krylov solver (tol was renamed to rtol in scipy 1.12).
+    '''
+    try:
+        from inspect import signature
+        arg_names = signature( krylov ).parameters
+    except ImportError:
+        from inspect import getargspec
+        arg_names = getargspec( krylov ).args
+    if 'rtol' in arg_names:
+        return 'rtol'
+    return 'tol'
+
+def get_ordering_stats( mtx, orderings = ( 'natural', 'rcm', 'colamd', 'mmd_at_plus_a' ) ):
+    '''Factorize the matrix with several orderings of the unknowns.
+
+    Returns a list of tuples ( ordering, bandwidth, fill_in, factorization_time )
+    with the bandwidth of the reordered matrix and the ratio between 
+    the nonzero entries of the LU factors and of the matrix.
+    '''
+    stats = []
+    for ordering in orderings:
+        solver = LinSolverLU( ordering = ordering )
+        solver.factorize( mtx )
+        stats.append( ( ordering, solver.bandwidth, solver.fill_in,
+                        solver.factorization_time ) )
+    return stats
+
+class LinSolver( HasTraits ):
+    '''Strategy for the solution of the linear system of equations.
+
+    The solver is associated with a SysMtxAssembly and is invoked
+    from SysMtxAssembly.solve with the matrix object of the current
+    matrix_type (DenseMtx, COOSparseMtx, CSRSparseMtx). The matrix
+    itself is obtained through the attribute mtx of the matrix object.
+    It is only accessed if the solver needs the current values
+    so that the assembly of the values can be skipped if a previously
+    obtained factorization is reused.
+
+    Data derived from the matrix values (factorization, preconditioner)
+    are kept until refresh is requested. The time loop requests
+    the refresh in every iteration of the full Newton-Raphson scheme.
+    '''
+    # flag indicating that the cached data must be recomputed
+    #
+    _refresh = Bool( True )
+
+    # Ordering of the unknowns applied before the factorization 
+    # (the numbering of the dofs in the domain is not changed)
+    # 'colamd' - column approximate minimum degree (default of SuperLU)
+    # 'mmd_at_plus_a' - minimum degree of the symmetric structure A^T + A
+    # 'rcm' - reverse Cuthill-McKee ordering reducing the bandwidth
+    # 'natural' - the numbering of the dofs given by the domain
+    #
+    ordering = Enum( 'colamd', 'mmd_at_plus_a', 'rcm', 'natural' )
+
+    # column permutation performed by SuperLU for the chosen ordering
+    #
+    permc_spec = Property( depends_on = 'ordering' )
+    def _get_permc_spec( self ):
+        return { 'colamd' : 'COLAMD',
+                 'mmd_at_plus_a' : 'MMD_AT_PLUS_A',
+                 'rcm' : 'NATURAL',
+                 'natural' : 'NATURAL' }[ self.ordering ]
+
+    # permutation of the unknowns for the 'rcm' ordering, depends 
+    # on the sparsity structure only and is kept until refresh_structure
+    #
+    _perm = Any
+
+    def refresh( self ):
+        '''Discard the data derived from the matrix values.'''
+        self._refresh = True
+
+    def refresh_structure( self ):
+        '''Discard the data derived from the sparsity structure.'''
+        self._perm = None
+        self.refresh()
+
+    def permute_mtx( self, mtx ):
+        '''Reorder the rows and columns of the sparse matrix 
+        for the 'rcm' ordering.
+        '''
+        if self.ordering != 'rcm':
+            return mtx
+        n_dofs = mtx.shape[0]
+        if self._perm is None or self._perm.shape[0] != n_dofs:
+            self._perm = reverse_cuthill_mckee( mtx.tocsr(), symmetric_mode = False )
+        P = sparse.csr_matrix( ( ones( ( n_dofs, ), dtype = 'float_' ),
+                                 ( arange( n_dofs ), self._perm ) ),
+                               shape = ( n_dofs, n_dofs ) )
+        return P * mtx * P.T
+
+    def permute_vct( self, vct ):
+        '''Reorder the right hand side according to permute_mtx.'''
+        if self.ordering != 'rcm':
+            return vct
+        return vct[ self._perm ]
+
+    def unpermute_vct( self, vct ):
+        '''Return the solution of the reordered system 
+        in the numbering of the dofs.
+        '''
+        if self.ordering != 'rcm':
+            return vct
+        u_vct = empty_like( vct )
+        u_vct[ self._perm ] = vct
+        return u_vct
+
+    def get_sparse_mtx( self, sys_mtx ):
+        '''Return the matrix of the matrix object in a sparse format.'''
+        mtx = sys_mtx.mtx
+        if not sparse.issparse( mtx ):
+            mtx = sparse.csr_matrix( mtx )
+        return mtx
+
+    def solve( self, sys_mtx, rhs ):
+        raise NotImplementedError
+
+class LinSolverDirect( LinSolver ):
+    '''Sparse direct solver factorizing the matrix in every call.
+    '''
+    def solve( self, sys_mtx, rhs ):
+        mtx = self.permute_mtx( self.get_sparse_mtx( sys_mtx ) ).tocsc()
+        u_vct = linsolve.spsolve( mtx, self.permute_vct( rhs ),
+                                  permc_spec = self.permc_spec )
+        return self.unpermute_vct( u_vct )
+
+class LinSolverLU( LinSolver ):
+    '''Sparse LU decomposition reused until refresh is requested.
+
+    Used for the modified Newton-Raphson scheme (see TLoop.modified_newton_k)
+    and for repeated solutions with an unchanged matrix.
+    '''
+    _lu = Any
+
+    # statistics of the factorization
+    #
+    n_factorizations = Int( 0 )
+    factorization_time = Float( 0.0 )
+
+    # bandwidth of the (reordered) matrix and the ratio between the 
+    # nonzero entries of the factors and of the matrix in the last 
+    # factorization - to choose the ordering (see get_ordering_stats)
+    #
+    bandwidth = Int( 0 )
+    fill_in = Float( 0.0 )
+
+    def factorize( self, mtx ):
+        '''Construct the LU decomposition of the sparse matrix.
+        '''
+        mtx = self.permute_mtx( mtx ).tocsc()
+        t_start = time()
+        self._lu = splu( mtx, permc_spec = self.permc_spec )
+        self.factorization_time += time() - t_start
+        self.n_factorizations += 1
+        self.bandwidth = get_bandwidth( mtx )
+        self.fill_in = float( self._lu.nnz ) / max( mtx.nnz, 1 )
+        self._refresh = False
+
+    def solve( self, sys_mtx, rhs ):
+        if self._refresh or self._lu == None or \
+            self._lu.shape[0] != rhs.shape[0]:
+            self.factorize( self.get_sparse_mtx( sys_mtx ) )
+        return self.unpermute_vct( self._lu.solve( self.permute_vct( rhs ) ) )
+
+class LinSolverIterative( LinSolver ):
+    '''Preconditioned Krylov solver.
+
+    The conjugate gradient method (cg) requires a symmetric positive
+    definite matrix. The constraints included by zeroing the rows and
+    columns of the element matrices (the default handling in SysMtxAssembly)
+    yield negative diagonal terms so that gmres should be used in that case.
+    With the elimination of the constraints (constraint_handling = 'eliminate')
+    the reduced matrix remains positive definite and cg can be used.
+
+    The preconditioner is constructed from the current matrix
+    when refresh is requested and reused otherwise.
+    '''
+    method = Enum( 'gmres', 'cg' )
+
+    preconditioner = Enum( 'jacobi', 'ilu', 'none' )
+
+    tolerance = Float( 1e-10 )
+
+    max_iter = Int( 1000 )
+
+    # parameters of the incomplete LU decomposition
+    #
+    ilu_drop_tol = Float( 1e-4 )
+    ilu_fill_factor = Float( 10. )
+
+    _M = Any
+
+    # number of Krylov iterations in the last call
+    #
+    n_iter = Int( 0 )
+
+    def _get_preconditioner( self, mtx ):
+        n_dofs = mtx.shape[0]
+        if self.preconditioner == 'jacobi':
+            diag = mtx.diagonal()
+            inv_diag = ones( ( n_dofs, ), dtype = 'float_' )
+            nz_diag = fabs( diag ) > 0.0
+            inv_diag[ nz_diag ] = 1.0 / diag[ nz_diag ]
+            return LinearOperator( ( n_dofs, n_dofs ),
+                                   matvec = lambda x: inv_diag * x )
+        elif self.preconditioner == 'ilu':
+            ilu = spilu( mtx.tocsc(), drop_tol = self.ilu_drop_tol,
+                         fill_factor = self.ilu_fill_factor,
+                         permc_spec = self.permc_spec )
+            return LinearOperator( ( n_dofs, n_dofs ), matvec = ilu.solve )
+        return None
+
+    def solve( self, sys_mtx, rhs ):
+        mtx = self.permute_mtx( self.get_sparse_mtx( sys_mtx ) ).tocsr()
+        rhs = self.permute_vct( rhs )
+        if self._refresh or self._M == None or self._M.shape[0] != rhs.shape[0]:
+            self._M = self._get_preconditioner( mtx )
+            self._refresh = False
+
+        self.n_iter = 0
+        def count_iter( xk ):
+            self.n_iter += 1
+
+        krylov = { 'cg' : cg, 'gmres' : gmres }[ self.method ]
+        tol_kw = { get_tol_name( krylov ) : self.tolerance }
+        u_vct, info = krylov( mtx, rhs, maxiter = self.max_iter, M = self._M,
+                              callback = count_iter, **tol_kw )
+        if info > 0:
+            raise ValueError, \
+                '%s did not converge within %d iterations' % \
+                ( self.method, info )
+        elif info < 0:
+            raise ValueError, '%s: illegal input or breakdown' % self.method
+        return self.unpermute_vct( u_vct )
@@ -0,0 +1,40 @@
+
+from enthought.traits.api import HasTraits, Property, Any
+from scipy import sparse
+from scipy.sparse.linalg.dsolve import linsolve
+
+class ReducedSparseMtx( HasTraits ):
+    '''System matrix with eliminated constraints.
+
+    The reduced matrix T^T K T is obtained from the matrix K assembled
+    in the matrix format of the assembly (SysMtxAssembly.matrix_type)
+    and from the transformation matrix T expressing all the dofs
+    in terms of the free ones (see SysMtxAssembly.get_elimination_map).
+    The constrained equations are not included so that the matrix
+    remains symmetric positive definite for a positive definite K.
+    '''
+    assemb = Any
+
+    # transformation matrix [n_dofs, n_free_dofs]
+    #
+    T = Any
+
+    mtx = Property
+    def _get_mtx( self ):
+        '''Assemble the full matrix and transform it to the free dofs.
+        '''
+        K = self.assemb.get_sys_mtx().mtx
+        if sparse.issparse( K ):
+            K = K.tocsr()
+        else:
+            K = sparse.csr_matrix( K )
+        # dofs not contained in any matrix array are not coupled
+        T = self.T[ :K.shape[0], : ]
+        return ( T.transpose() * K * T ).tocsr()
+
+    def solve( self, rhs ):
+        '''Construct the matrix and use the solver to get
+        the solution for the supplied rhs.
+        '''
+        u_vct = linsolve.spsolve( self.mtx, rhs )
+        return u_vct
@@ -2,7 +2,8 @@
 from enthought.traits.api import \
     HasTraits, Int, Array, Property, cached_property, List, Trait, Dict, \
     Any
-from numpy import array, where, append
+from numpy import array, where, argsort, bincount, zeros, cumsum, \
+    ones
 
 class SysMtxArray( HasTraits ):
     '''Class managing an array of equally sized matrices with 
@@ -24,38 +25,76 @@ class SysMtxArray( HasTraits ):
             return 0
         return self.dof_map_arr.max() + 1
 
+    # Inverse of the dof map - positions of the flattened dof map 
+    # sorted by the dof number and the offsets of the dofs in the 
+    # sorted array. The positions of a dof are in ascending order
+    # (element-wise), i.e. in the order delivered by numpy.where.
+    #
+    dof_ix_index = Property( depends_on = 'dof_map_arr' )
+    @cached_property
+    def _get_dof_ix_index( self ):
+        dofs = self.dof_map_arr.ravel()
+        order = argsort( dofs, kind = 'mergesort' )
+        offsets = zeros( ( self.n_dofs + 1, ), dtype = 'int_' )
+        if dofs.shape[0] > 0:
+            offsets[1:] = cumsum( bincount( dofs, minlength = self.n_dofs ) )
+        return order, offsets
+
     def get_dof_ix_array( self, dof ):
         '''Return the element number and index of the dof within the element
         '''
-        return where( self.dof_map_arr == dof )
+        if len( self.dof_map_arr.shape ) != 2:
+            return where( self.dof_map_arr == dof )
+        order, offsets = self.dof_ix_index
+        if dof < 0 or dof >= self.n_dofs:
+            pos = order[:0]
+        else:
+            pos = order[ offsets[dof]:offsets[dof + 1] ]
+        n_e_dofs = self.dof_map_arr.shape[1]
+        return ( pos // n_e_dofs, pos % n_e_dofs )
+
+    def get_first_dof_ix( self, dofs ):
+        '''Return the element number and index of the first occurrence 
+        of each dof in the array dofs. The elements of the dofs
+        not included in the array are marked by -1.
+        '''
+        el_arr = -ones( dofs.shape, dtype = 'int_' )
+        row_arr = -ones( dofs.shape, dtype = 'int_' )
+        if len( self.dof_map_arr.shape ) != 2:
+            return el_arr, row_arr
+        order, offsets = self.dof_ix_index
+        in_map = ( dofs >= 0 ) & ( dofs < self.n_dofs )
+        in_map[ in_map ] = offsets[ dofs[ in_map ] + 1 ] > offsets[ dofs[ in_map ] ]
+        pos = order[ offsets[ dofs[ in_map ] ] ]
+        n_e_dofs = self.dof_map_arr.shape[1]
+        el_arr[ in_map ] = pos // n_e_dofs
+        row_arr[ in_map ] = pos % n_e_dofs
+        return el_arr, row_arr
 
     def _zero_rc( self, dof_ix_array ):
         '''Set row column values associated with dof a
         to zero.  
         '''
         el_arr, row_arr = dof_ix_array
-        for el, i_dof in zip( el_arr, row_arr ):
-            k_diag = self.mtx_arr[el, i_dof, i_dof]
-            self.mtx_arr[el, i_dof, :] = 0.0
-            self.mtx_arr[el, :, i_dof] = 0.0
+        self.mtx_arr[el_arr, row_arr, :] = 0.0
+        self.mtx_arr[el_arr, :, row_arr] = 0.0
 
     def _add_col_to_vector( self, dof_ix_array, F, factor ):
         '''Get the slice of the a-th column.
         (used for the implementation of the essential boundary conditions)
         '''
         el_arr, row_arr = dof_ix_array
-        for el, i_dof in zip( el_arr, row_arr ):
-            rows = self.dof_map_arr[el]
-            F[ rows ] += factor * self.mtx_arr[ el, :, i_dof ]
+        if el_arr.shape[0] == 0:
+            return
+        idx_arr, val_arr = self._get_col_subvector( dof_ix_array )
+        F += factor * bincount( idx_arr, weights = val_arr,
+                                minlength = F.shape[0] )
 
     def _get_diag_elem( self, dof_ix_array ):
         '''Get the value of diagonal element at a-ths dof. 
         '''
-        K_aa = 0.
         el_arr, row_arr = dof_ix_array
-        for el, i_dof in zip( el_arr, row_arr ):
-            K_aa += self.mtx_arr[el, i_dof, i_dof ]
-        return K_aa
+        return self.mtx_arr[el_arr, row_arr, row_arr].sum()
 
     def _add_diag_elem( self, dof_ix_array, K_aa ):
         '''Get the value of diagonal element at a-ths dof. 
@@ -66,12 +105,11 @@ class SysMtxArray( HasTraits ):
         self.mtx_arr[el, i_dof, i_dof ] = K_aa
 
     def _get_col_subvector( self, dof_ix_array ):
-        idx_arr = array( [], dtype = int )
-        val_arr = array( [], dtype = float )
+        '''Get the dofs and values of the a-th column in all the elements
+        containing the dof a.
+        '''
         el_arr, row_arr = dof_ix_array
-        for el, i_dof in zip( el_arr, row_arr ):
-            r_dofs = self.dof_map_arr[el]
-            idx_arr = append( idx_arr, r_dofs )
-            val_arr = append( val_arr, self.mtx_arr[ el, :, i_dof ] )
-
+        idx_arr = self.dof_map_arr[ el_arr ].ravel()
+        # the slice between the advanced indices puts the element axis first
+        val_arr = self.mtx_arr[ el_arr, :, row_arr ].ravel()
         return idx_arr, val_arr
@@ -1,14 +1,20 @@
 
 from enthought.traits.api import \
     HasTraits, Int, Array, Property, cached_property, List, Trait, Dict, \
-    Any, Bool, Float
+    Any, Bool, Float, Event, Instance, Enum, on_trait_change
 from numpy import allclose, arange, eye, linalg, ones, ix_, array, zeros, \
                 hstack, meshgrid, vstack, dot, newaxis, c_, r_, copy, where, \
-                ones, append, unique, compress, array_equal, allclose
+                ones, append, unique, compress, array_equal, allclose, \
+                bincount, einsum, argsort, searchsorted, in1d, fabs as arr_fabs
 from types import ListType
+from heapq import heapify, heappush, heappop
+from scipy import sparse
 from coo_mtx import COOSparseMtx
+from csr_mtx import CSRSparseMtx
 from dense_mtx import DenseMtx
+from reduced_mtx import ReducedSparseMtx
 from sys_mtx_array import SysMtxArray
+from lin_solver import LinSolver, get_ordering_stats
 from math import fabs
 
 class Constraint( HasTraits ):
@@ -52,31 +58,39 @@ class SysMtxAssembly( HasTraits ):
     the system matrix are stored in several sys_mtx_arrays. Therefore, the
     constraint must be included in all matrix arrays currently included.
     
-    Such an operation requires a search throuth the matrices, which is realized
-    using the
+    The positions of a dof in the matrix arrays are obtained from
+    the inverse index of the dof map kept by each sys_mtx_array 
+    (SysMtxArray.dof_ix_index), built once for the layout of the array.
+    The addresses of the format
+
+        [el, row]
+
+    are cached in the property attributes
     
-        numpy.where
-        
-    method. In order to avoid repeated invokation of where the acccess to the
-    affected positions in the sys_mtx_array can be cached. The state management
-    recognizes the attributes
+        cached_addresses = Property() (link constraints)
+        dirichlet_addresses = Property() (constraints of a single dof)
+
+    The link constraints are applied one by one in the topological 
+    order (see sorted_constraints) so that a link constraint is applied
+    before the constraints of the dofs it refers to. The constraints 
+    prescribing the value of a single dof (no links) are then applied
+    in a single masked operation on the value arrays of all the matrix
+    arrays, including the link matrices. The result is equivalent to 
+    the one-by-one application of the constraints.
     
-        value_changed = Bool
-        structure_changed = Bool
-        
-    Thus, an adaptive strategy or spatial domain mut indicate the change in 
-    the structure explicitly by setting
+    The adaptive strategy or spatial domain must indicate the change 
+    in the structure explicitly by resetting the assembly.
 
-        sys_assembly = True
-        
-    The sys_assembly maintains a property attribute
-    
-        cached_constraints = Property()
-        
-    containing the result of the where operations delivering the addresses
-    of the format
+    Alternatively, the constraints can be eliminated from the system
+    (constraint_handling = 'eliminate'). Then, the element matrices 
+    remain untouched and the reduced system 
 
-        [el, row]
+        T^T K T u_f = T^T ( R - K u_0 )
+
+    is solved for the free dofs u_f. The transformation matrix T 
+    expresses all the dofs in terms of the free ones (including
+    the link constraints) and u_0 contains the prescribed values.
+    The solution is expanded back as u = T u_f + u_0.
     '''
     # list of matrix arrays
     #
@@ -98,7 +112,76 @@ class SysMtxAssembly( HasTraits ):
     #
     matrix_type = Trait( 'coord',
                          {'dense' : DenseMtx,
-                          'coord' : COOSparseMtx } )
+                          'coord' : COOSparseMtx,
+                          'csr' : CSRSparseMtx } )
+
+    # Event signalizing the change of the layout of the matrix arrays
+    # (different dof maps or number of elements). It must be fired by
+    # the owner of the assembly (e.g. the time stepper) to invalidate
+    # the sparsity patterns cached in the persistent matrix instances.
+    #
+    changed_structure = Event
+
+    # Matrix instances retained between the calls of solve
+    # (only the types declaring the class attribute persistent = True)
+    #
+    _mtx_cache = Dict
+
+    # Strategy for the solution of the linear system. If not specified,
+    # the solve method of the matrix object is used (factorization
+    # of the matrix in every call).
+    #
+    solver = Instance( LinSolver )
+
+    # Handling of the constraints
+    # 'modify' - the rows and columns of the constrained dofs
+    #            in the element matrices are zeroed and the constrained 
+    #            equations are kept in the system (see apply_constraints)
+    # 'eliminate' - the constrained dofs are eliminated from the system
+    #            (see get_elimination_map)
+    #
+    constraint_handling = Enum( 'modify', 'eliminate' )
+
+    def refresh_solver( self ):
+        '''Let the solver discard the data derived from the matrix values
+        (factorization, preconditioner). To be called after the values
+        of the system matrix have changed substantially.
+        '''
+        if self.solver != None:
+            self.solver.refresh()
+
+    @on_trait_change( 'changed_structure' )
+    def _refresh_solver_structure( self ):
+        if self.solver != None:
+            self.solver.refresh_structure()
+
+    def get_ordering_stats( self, orderings = None ):
+        '''Factorize the current system matrix with several orderings 
+        of the unknowns and return the bandwidth, fill-in and 
+        factorization time for each of them (see lin_solver.get_ordering_stats).
+        Must be called after apply_constraints.
+        '''
+        if self.constraint_handling == 'eliminate':
+            R_f, u_0 = self._reduced_rhs
+            free_dofs, c_dofs, T, C = self.get_elimination_map( u_0.shape[0] )
+            mtx = ReducedSparseMtx( assemb = self, T = T ).mtx
+        else:
+            mtx = self.get_sys_mtx().mtx
+        if not sparse.issparse( mtx ):
+            mtx = sparse.csr_matrix( mtx )
+        if orderings == None:
+            return get_ordering_stats( mtx )
+        return get_ordering_stats( mtx, orderings )
+
+    def get_sys_mtx( self ):
+        '''Return the matrix object of the current matrix type.
+        '''
+        mtx = self._mtx_cache.get( self.matrix_type, None )
+        if mtx == None:
+            mtx = self.matrix_type_( assemb = self )
+            if getattr( mtx, 'persistent', False ):
+                self._mtx_cache[ self.matrix_type ] = mtx
+        return mtx
 
     # number of degrees of freedom
     #
@@ -195,49 +278,189 @@ class SysMtxAssembly( HasTraits ):
     sorted_constraints = Property( depends_on = 'constraints[]' )
     @cached_property
     def _get_sorted_constraints( self ):
-
-        sorted_c = self.constraints
-        for i in range( 1000 ):
-            sorted_c, swapped_values = self._get_simply_sorted_c( sorted_c )
-            if swapped_values == False:
-                return sorted_c
-        # exception - the cyclic specification of constraints
-        raise ValueError, 'maximum number of reorderings (1000) reached\n' \
-            'this is probably due to cyclic constraints specification'
-
-    def _get_simply_sorted_c( self, constraints ):
-        # first test if one of the indices in ix_a is already in _c
-        sorted_a = []
+        '''Sort the constraints topologically so that a link constraint
+        precedes the constraints of the dofs in its ix_a. Independent 
+        constraints keep the order of registration.
+        '''
+        constraints = self.constraints
+        n_c = len( constraints )
+        c_idx = dict( [ ( c.a, i ) for i, c in enumerate( constraints ) ] )
+        n_pred = zeros( ( n_c, ), dtype = int )
+        succ = [ [] for i in range( n_c ) ]
+        for i, constraint in enumerate( constraints ):
+            for ix in unique( constraint.ix_a ):
+                j = c_idx.get( ix, None )
+                if j != None and j != i:
+                    succ[i].append( j )
+                    n_pred[j] += 1
+
+        # Kahn's algorithm with the registration order as priority
+        #
+        heap = list( where( n_pred == 0 )[0] )
+        heapify( heap )
         sorted_c = []
-        swapped_values = False
-        for constraint in constraints:
-            # suggest the last position in the traversed elements
-            pos = len( sorted_a )
-            for ix in constraint.ix_a:
-                try:
-                    found_pos = sorted_a.index( ix )
-                    if found_pos < pos:
-                        # The found position is below the last one
-                        # swap required. Insert the current constraint
-                        # before the found one
-                        pos = found_pos
-                        swapped_values = True
-                except ValueError:
-                    pass
-            sorted_a.insert( pos, constraint.a )
-            sorted_c.insert( pos, constraint )
-
-        return sorted_c, swapped_values
+        while len( heap ) > 0:
+            i = heappop( heap )
+            sorted_c.append( constraints[i] )
+            for j in succ[i]:
+                n_pred[j] -= 1
+                if n_pred[j] == 0:
+                    heappush( heap, j )
+
+        if len( sorted_c ) < n_c:
+            # exception - the cyclic specification of constraints
+            raise ValueError, 'constraints cannot be ordered\n' \
+                'this is probably due to cyclic constraints specification'
+        return sorted_c
+
+    link_constraints = Property( depends_on = 'constraints[]' )
+    @cached_property
+    def _get_link_constraints( self ):
+        return [ c for c in self.sorted_constraints if c.alpha.shape[0] > 0 ]
+
+    dirichlet_constraints = Property( depends_on = 'constraints[]' )
+    @cached_property
+    def _get_dirichlet_constraints( self ):
+        return [ c for c in self.sorted_constraints if c.alpha.shape[0] == 0 ]
 
     cached_addresses = Property( depends_on = 'constraints[]' )
     @cached_property
     def _get_cached_addresses( self ):
         cached_addresses = []
-        for constraint in self.sorted_constraints:
+        for constraint in self.link_constraints:
             ix_maps = self._get_ix_maps( constraint )
             cached_addresses.append( ix_maps )
         return cached_addresses
 
+    dirichlet_addresses = Property( depends_on = 'constraints[]' )
+    @cached_property
+    def _get_dirichlet_addresses( self ):
+        '''Positions of the dofs prescribed by the constraints without
+        links in the matrix arrays.
+
+        For each matrix array the indices of the affected elements and 
+        the mask of the constrained rows within these elements is 
+        returned. Further, the position (array, element, row) of the first 
+        occurrence of each dof is returned - the diagonal value of the 
+        constrained equation is put there.
+        '''
+        # the link matrices are created with the link addresses
+        #
+        self.cached_addresses
+
+        c_dofs = array( [ c.a for c in self.dirichlet_constraints ], dtype = int )
+        mtx_arrays = self.get_sys_mtx_arrays()
+        n_dofs = self.n_dofs
+        for mtx_array in self.link_matrices:
+            n_dofs = max( n_dofs, mtx_array.n_dofs )
+        if c_dofs.shape[0] > 0:
+            n_dofs = max( n_dofs, c_dofs.max() + 1 )
+        is_constrained = zeros( ( n_dofs, ), dtype = bool )
+        is_constrained[ c_dofs ] = True
+
+        el_masks = []
+        for mtx_array in mtx_arrays:
+            dof_map = mtx_array.dof_map_arr
+            if len( dof_map.shape ) != 2:
+                el_masks.append( ( array( [], dtype = int ),
+                                   zeros( ( 0, 0 ), dtype = bool ) ) )
+                continue
+            mask = is_constrained[ dof_map ]
+            el_idx = where( mask.any( axis = 1 ) )[0]
+            el_masks.append( ( el_idx, mask[ el_idx ] ) )
+
+        diag_mtx = -ones( c_dofs.shape, dtype = int )
+        diag_el = zeros( c_dofs.shape, dtype = int )
+        diag_row = zeros( c_dofs.shape, dtype = int )
+        for k, mtx_array in enumerate( mtx_arrays ):
+            el_arr, row_arr = mtx_array.get_first_dof_ix( c_dofs )
+            first = ( diag_mtx < 0 ) & ( el_arr >= 0 )
+            diag_mtx[ first ] = k
+            diag_el[ first ] = el_arr[ first ]
+            diag_row[ first ] = row_arr[ first ]
+
+        return c_dofs, el_masks, ( diag_mtx, diag_el, diag_row )
+
+    # Elimination maps for the particular numbers of dofs, 
+    # kept until the constraints change (i.e. until the next 
+    # registration of the boundary conditions).
+    #
+    _elimination_maps = Property( Dict, depends_on = 'constraints[]' )
+    @cached_property
+    def _get__elimination_maps( self ):
+        return {}
+
+    def get_elimination_map( self, n_dofs ):
+        '''Return the partition of the dofs into free and constrained ones
+        and the sparse matrices T [n_dofs, n_free] and C [n_dofs, n_constraints]
+        such that
+
+            u = T * u_f + C * u_c
+
+        where u_f are the values of the free dofs and u_c the values
+        u_a of the constraints in the order of sorted_constraints.
+        '''
+        elimination_map = self._elimination_maps.get( n_dofs, None )
+        if elimination_map != None:
+            return elimination_map
+
+        constraints = self.sorted_constraints
+        n_c = len( constraints )
+        c_dofs = array( [ c.a for c in constraints ], dtype = int )
+        is_free = ones( ( n_dofs, ), dtype = bool )
+        is_free[ c_dofs ] = False
+        free_dofs = where( is_free )[0]
+        n_f = free_dofs.shape[0]
+        f_idx = zeros( ( n_dofs, ), dtype = int )
+        f_idx[ free_dofs ] = arange( n_f )
+
+        # Express the constrained dofs in terms of the free dofs 
+        # and of the prescribed values. The constraints are traversed 
+        # in the reversed order so that the dofs referred to by a link
+        # are resolved before the link itself.
+        #
+        T_rows, C_rows = {}, {}
+        for k in range( n_c - 1, -1, -1 ):
+            c = constraints[k]
+            t_cols, t_vals = [ array( [], dtype = int ) ], [ array( [], dtype = float ) ]
+            c_cols, c_vals = [ array( [k], dtype = int ) ], [ array( [1.], dtype = float ) ]
+            for alpha, ix in zip( c.alpha, c.ix_a ):
+                if is_free[ ix ]:
+                    t_cols.append( f_idx[ [ix] ] )
+                    t_vals.append( array( [ alpha ], dtype = float ) )
+                elif T_rows.has_key( ix ):
+                    cols, vals = T_rows[ ix ]
+                    t_cols.append( cols )
+                    t_vals.append( alpha * vals )
+                    cols, vals = C_rows[ ix ]
+                    c_cols.append( cols )
+                    c_vals.append( alpha * vals )
+                else:
+                    raise ValueError, \
+                        'constraint of dof %d refers to itself' % c.a
+            T_rows[ c.a ] = ( hstack( t_cols ), hstack( t_vals ) )
+            C_rows[ c.a ] = ( hstack( c_cols ), hstack( c_vals ) )
+
+        def get_sparse_mtx( rows_dict, n_cols, diag_cols ):
+            rows = [ diag_cols[0] ]
+            cols = [ diag_cols[1] ]
+            vals = [ ones( diag_cols[0].shape, dtype = float ) ]
+            for a, ( r_cols, r_vals ) in rows_dict.items():
+                rows.append( a * ones( r_cols.shape, dtype = int ) )
+                cols.append( r_cols )
+                vals.append( r_vals )
+            return sparse.coo_matrix( ( hstack( vals ),
+                                        ( hstack( rows ), hstack( cols ) ) ),
+                                      shape = ( n_dofs, n_cols ) ).tocsr()
+
+        empty = array( [], dtype = int )
+        T = get_sparse_mtx( T_rows, n_f, ( free_dofs, arange( n_f ) ) )
+        C = get_sparse_mtx( C_rows, n_c, ( empty, empty ) )
+
+        elimination_map = ( free_dofs, c_dofs, T, C )
+        self._elimination_maps[ n_dofs ] = elimination_map
+        return elimination_map
+
     def solve( self, rhs = None, matrix_type = None ):
         '''Solve the system of equations using a specified 
         type of matrix format
@@ -255,14 +478,62 @@ class SysMtxAssembly( HasTraits ):
         if matrix_type:
             self.matrix_type = matrix_type
 
-        mtx = self.matrix_type_( assemb = self )
+        if self.constraint_handling == 'eliminate':
+            return self._solve_reduced()
+
+        mtx = self.get_sys_mtx()
+        if self.solver != None:
+            return self.solver.solve( mtx, self._rhs )
         return mtx.solve( self._rhs )
 
+    def _solve_reduced( self ):
+        '''Solve the system with eliminated constraints and expand
+        the solution to all dofs.
+        '''
+        R_f, u_0 = self._reduced_rhs
+        free_dofs, c_dofs, T, C = self.get_elimination_map( u_0.shape[0] )
+        mtx = ReducedSparseMtx( assemb = self, T = T )
+        return T * self._solve_mtx( mtx, R_f ) + u_0
+
+    def _solve_mtx( self, mtx, rhs ):
+        if self.solver != None:
+            return self.solver.solve( mtx, rhs )
+        return mtx.solve( rhs )
+
+    def solve_additional( self, rhs ):
+        '''Solve the system with the current matrix for a further 
+        right hand side (e.g. a reference load vector).
+
+        Must be called after apply_constraints. The constraints are 
+        included in rhs with zero values, the matrix arrays are not
+        modified again. The rhs is not changed.
+        '''
+        rhs = rhs.copy()
+        if self.constraint_handling == 'eliminate':
+            free_dofs, c_dofs, T, C = self.get_elimination_map( rhs.shape[0] )
+            mtx = ReducedSparseMtx( assemb = self, T = T )
+            return T * self._solve_mtx( mtx, T.transpose() * rhs )
+
+        # redistribute the loads of the linked dofs
+        #
+        for constraint, ix_maps in zip( self.link_constraints,
+                                          self.cached_addresses ):
+            ix_layout = ix_maps[5]
+            P_a = rhs[ constraint.a ]
+            rhs[ constraint.a ] = 0
+            rhs[ ix_layout ] += self._get_link_coeffs( constraint, ix_maps ) * P_a
+
+        c_dofs = self.dirichlet_addresses[0]
+        rhs[ c_dofs ] = 0
+        return self._solve_mtx( self.get_sys_mtx(), rhs )
+
     def reset( self ):
         self.sys_mtx_arrays = []
         self.constraints = []
         self.link_matrices = []
         self._c = {}
+        self._mtx_cache = {}
+        self.refresh_solver()
         self.rhs = None
 
     def reset_mtx( self ):
@@ -276,17 +547,88 @@ class SysMtxAssembly( HasTraits ):
         for constraint in self.constraints:
             print constraint
 
+    # right hand side of the reduced system and the prescribed 
+    # values (constraint_handling = 'eliminate')
+    #
+    _reduced_rhs = Any
+
     def apply_constraints( self, rhs ):
-        # apply the constraints
-        for constraint, ix_maps in zip( self.sorted_constraints,
+        if self.constraint_handling == 'eliminate':
+            self._apply_elimination( rhs )
+            return
+
+        # apply the link constraints
+        for constraint, ix_maps in zip( self.link_constraints,
                                           self.cached_addresses ):
             if self.debug:
                 print 'applying constraint', constraint
 
             self._apply_constraint( rhs, constraint, ix_maps )
 
+        # apply the constraints of single dofs at once
+        self._apply_dirichlet_constraints( rhs )
+
         self._rhs = rhs # rhs that should be used for solving the system
 
+    def _apply_elimination( self, rhs ):
+        '''Prepare the right hand side of the reduced system 
+
+            R_f = T^T ( R - K u_0 )
+
+        The rhs is modified in place - it gets the values of R_f at 
+        the free dofs and the values -K_aa * u_0 at the constrained
+        dofs so that its norm vanishes only if the prescribed values
+        have been reached and the free equations are in equilibrium.
+        '''
+        n_dofs = rhs.shape[0]
+        free_dofs, c_dofs, T, C = self.get_elimination_map( n_dofs )
+
+        u_c = array( [ c.u_a for c in self.sorted_constraints ], dtype = float )
+        u_0 = C * u_c
+
+        R = rhs
+        K_a_a = zeros( c_dofs.shape, dtype = float )
+        if u_0.any():
+            R = rhs - self._get_mtx_vct_product( u_0 )
+            K_a_a = self._get_diag( n_dofs )[ c_dofs ]
+            K_a_a[ arr_fabs( K_a_a ) < ( 1.0e-5 ) ] = 1.
+        R_f = T.transpose() * R
+
+        rhs[ free_dofs ] = R_f
+        rhs[ c_dofs ] = -K_a_a * u_0[ c_dofs ]
+
+        self._reduced_rhs = ( R_f, u_0 )
+        self._rhs = rhs
+
+    def _get_mtx_vct_product( self, u ):
+        '''Multiply the system matrix with a vector using the element
+        matrices.
+        '''
+        n_dofs = u.shape[0]
+        K_u = zeros( ( n_dofs, ), dtype = float )
+        for mtx_array in self.get_sys_mtx_arrays():
+            dof_map = mtx_array.dof_map_arr
+            if mtx_array.mtx_arr.size == 0:
+                continue
+            el_K_u = einsum( 'eij,ej->ei', mtx_array.mtx_arr, u[ dof_map ] )
+            K_u += bincount( dof_map.ravel(), weights = el_K_u.ravel(),
+                             minlength = n_dofs )
+        return K_u
+
+    def _get_diag( self, n_dofs ):
+        '''Get the diagonal of the system matrix.
+        '''
+        K_diag = zeros( ( n_dofs, ), dtype = float )
+        for mtx_array in self.get_sys_mtx_arrays():
+            dof_map = mtx_array.dof_map_arr
+            if mtx_array.mtx_arr.size == 0:
+                continue
+            n_e_dofs = dof_map.shape[1]
+            diag = mtx_array.mtx_arr[ :, arange( n_e_dofs ), arange( n_e_dofs ) ]
+            K_diag += bincount( dof_map.ravel(), weights = diag.ravel(),
+                                minlength = n_dofs )
+        return K_diag
+
     def get_sys_mtx_arrays( self ):
         '''Return the complete list of matrix arrays including constraints.
         '''
@@ -336,23 +678,23 @@ class SysMtxAssembly( HasTraits ):
 
         ix_mask = ix_orig_layout != a # deactivate the constrained dof
 
-        prev_same_i_list = []
-        alpha_same_i_list = []
-        for i, ix in enumerate( ix_K ):
-            prev_same_i = where( ix_K == ix )[0][0]
-            prev_same_i_list.append( prev_same_i )
-            if prev_same_i < i:
-#                    K_n_a2[prev_same_i] += K_n_a2[i]
-                ix_mask[i] = False # deactivate the added value
-
-            if ix in ix_a:
-                alpha_same_i = where( ix_a == ix )[0][0]
-                alpha_same_i_list.append( alpha_same_i )
-                alpha_same_i += ix_K.shape[0]
-#                    alpha2[i] = alpha2[ alpha_same_i ]
-                ix_mask[ alpha_same_i ] = False
-            else:
-                alpha_same_i_list.append( 0 )
+        # deactivate the repeated occurrences of the dofs in ix_K
+        # (the values are accumulated in the first occurrence)
+        #
+        n_K = ix_K.shape[0]
+        ix_K_unique, first_i = unique( ix_K, return_index = True )
+        prev_same_i_array = first_i[ searchsorted( ix_K_unique, ix_K ) ]
+        ix_mask[:n_K][ prev_same_i_array < arange( n_K ) ] = False
+
+        # deactivate the dofs of ix_a included in ix_K
+        # (the coefficient is moved to the occurrence in ix_K)
+        #
+        in_a = in1d( ix_K, ix_a )
+        a_order = argsort( ix_a, kind = 'mergesort' )
+        alpha_same_i_array = zeros( ( n_K, ), dtype = 'int_' )
+        alpha_same_i_array[ in_a ] = \
+            a_order[ searchsorted( ix_a[ a_order ], ix_K[ in_a ] ) ]
+        ix_mask[ n_K + alpha_same_i_array[ in_a ] ] = False
 
 #            K_n_a     = compress( ix_mask, K_n_a2 )
         ix_layout = compress( ix_mask, ix_orig_layout )
@@ -404,7 +746,7 @@ class SysMtxAssembly( HasTraits ):
 
         return ( alpha, ix_a, dof_ix_array, link_dof_map,
                  ix_orig_layout, ix_layout, ix_mask, link_mtx,
-                 array( prev_same_i_list, dtype = 'int_' ), array( alpha_same_i_list, dtype = 'int_' ) )
+                 prev_same_i_array, alpha_same_i_array )
 
     def _apply_constraint( self, rhs, constraint, ix_map ):
         '''
@@ -451,27 +793,15 @@ class SysMtxAssembly( HasTraits ):
             ix_K, K_n_a = self._get_col_subvector( dof_ix_array )
 
             K_n_a2 = zeros( ix_orig_layout.shape[0], dtype = float )
-            K_n_a2[:ix_K.shape[0]] = K_n_a
-
-            alpha2 = zeros( ix_orig_layout.shape[0], dtype = float )
-            alpha2[ix_K.shape[0]:] = alpha
-
-            #ix_mask = ix_layout != a # deactivate the constrained dof
 
-            for i, ix in enumerate( ix_K ):
-                #prev_same_i = where( ix_K == ix )[0][0]
-                prev_same_i = prev_same_i_array[i]
-                if prev_same_i < i:
-                    K_n_a2[prev_same_i] += K_n_a2[i]
-
-                if ix in ix_a:
-                    #alpha_same_i = where( ix_a == ix )[0][0]
-                    alpha_same_i = alpha_same_i_array[i]
-                    alpha_same_i += ix_K.shape[0]
-                    alpha2[i] = alpha2[ alpha_same_i ]
+            # accumulate the values of the repeated dofs in the first occurrence
+            #
+            n_K = ix_K.shape[0]
+            K_n_a2[:n_K] = bincount( prev_same_i_array, weights = K_n_a,
+                                     minlength = n_K )
 
             K_n_a = compress( ix_mask, K_n_a2 )
-            alpha = compress( ix_mask, alpha2 )
+            alpha = self._get_link_coeffs( constraint, ix_map )
 
             # Get the size of the link matrix
             link_mtx_sz = alpha.shape[0] + 1
@@ -523,6 +853,83 @@ class SysMtxAssembly( HasTraits ):
 
         return
 
+    def _apply_dirichlet_constraints( self, rhs ):
+        '''Apply the constraints without links at once.
+
+        The columns of the constrained dofs multiplied with the prescribed
+        values are subtracted from the right hand side, the rows and 
+        columns are zeroed and the negative diagonal value is put 
+        to the first occurrence of the dof. The equation of the dof 
+        then reads -K_aa * u_a = -K_aa * u_a.
+        '''
+        constraints = self.dirichlet_constraints
+        if len( constraints ) == 0:
+            return
+
+        c_dofs, el_masks, diag_addresses = self.dirichlet_addresses
+        n_dofs = rhs.shape[0]
+
+        u_vct = zeros( ( n_dofs, ), dtype = float )
+        u_c = array( [ c.u_a for c in constraints ], dtype = float )
+        u_vct[ c_dofs ] = u_c
+
+        K_diag = zeros( ( n_dofs, ), dtype = float )
+        mtx_arrays = self.get_sys_mtx_arrays()
+        for mtx_array, ( el_idx, mask ) in zip( mtx_arrays, el_masks ):
+            if el_idx.shape[0] == 0:
+                continue
+            mtx_arr = mtx_array.mtx_arr[ el_idx ]
+            dof_map = mtx_array.dof_map_arr[ el_idx ]
+            n_e_dofs = dof_map.shape[1]
+
+            # subtract the columns multiplied with the prescribed values
+            # and sum up the diagonal values of the constrained dofs
+            #
+            K_u = einsum( 'eij,ej->ei', mtx_arr, u_vct[ dof_map ] )
+            rhs -= bincount( dof_map.ravel(), weights = K_u.ravel(),
+                             minlength = n_dofs )
+            diag = mtx_arr[ :, arange( n_e_dofs ), arange( n_e_dofs ) ]
+            K_diag += bincount( dof_map[ mask ], weights = diag[ mask ],
+                                minlength = n_dofs )
+
+            # zero the constrained rows and columns
+            #
+            free = ( ~mask ).astype( float )
+            mtx_arr *= free[:, :, None] * free[:, None, :]
+            mtx_array.mtx_arr[ el_idx ] = mtx_arr
+
+        K_a_a = K_diag[ c_dofs ]
+        rhs[ c_dofs ] = -u_c * K_a_a
+        zero_diag = arr_fabs( K_a_a ) < ( 1.0e-5 )
+        K_a_a[ zero_diag ] = 1.
+        rhs[ c_dofs[ zero_diag ] ] = -u_c[ zero_diag ]
+
+        diag_mtx, diag_el, diag_row = diag_addresses
+        for k, mtx_array in enumerate( mtx_arrays ):
+            first = diag_mtx == k
+            if first.any():
+                mtx_array.mtx_arr[ diag_el[ first ], diag_row[ first ],
+                                   diag_row[ first ] ] = -K_a_a[ first ]
+
+    def _get_link_coeffs( self, constraint, ix_map ):
+        '''Get the coefficients of the link constraint in the layout
+        of the link matrix (ix_layout).
+        '''
+        alpha, ix_a, dof_ix_array, link_dof_map, ix_orig_layout, ix_layout, \
+            ix_mask, link_mtx, prev_same_i_array, alpha_same_i_array = ix_map
+        alpha, ix_a = constraint.alpha, constraint.ix_a
+        n_K = prev_same_i_array.shape[0]
+
+        alpha2 = zeros( ix_orig_layout.shape[0], dtype = float )
+        alpha2[n_K:] = alpha
+
+        # take over the coefficients of the dofs included in ix_K
+        #
+        in_a = in1d( ix_orig_layout[:n_K], ix_a )
+        alpha2[:n_K][ in_a ] = alpha[ alpha_same_i_array[ in_a ] ]
+
+        return compress( ix_mask, alpha2 )
+
     def get_dof_ix_array( self, dof ):
         '''Get the access to the posisions containing values
         related to the dof
@@ -539,13 +946,13 @@ class SysMtxAssembly( HasTraits ):
             mtx_array._add_col_to_vector( dof_ix_array, F, factor )
 
     def _get_col_subvector( self, dof_ix_arrays ):
-        idx_arr = array( [], dtype = int )
-        val_arr = array( [], dtype = float )
+        idx_list = [ array( [], dtype = int ) ]
+        val_list = [ array( [], dtype = float ) ]
         for mtx_array, dof_ix_array in zip( self.get_sys_mtx_arrays(), dof_ix_arrays ):
             idx_seg, val_seg = mtx_array._get_col_subvector( dof_ix_array )
-            idx_arr = append( idx_arr, idx_seg )
-            val_arr = append( val_arr, val_seg )
-        return idx_arr, val_arr
+            idx_list.append( idx_seg )
+            val_list.append( val_seg )
+        return hstack( idx_list ), hstack( val_list )
 
     def _get_diag_elem( self, dof_ix_arrays ):
         K_dof_dof = 0
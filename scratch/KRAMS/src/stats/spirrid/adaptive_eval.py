@@ -0,0 +1,211 @@
+#-------------------------------------------------------------------------------
+#
+# Copyright (c) 2009, IMB, RWTH Aachen.
+# All rights reserved.
+#
+# This software is provided without warranty under the terms of the BSD
+# license included in simvisage/LICENSE.txt and may be redistributed only
+# under the conditions described in the aforementioned license.  The license
+# is also available online at http://www.simvisage.com/licenses/BSD.txt
+#
+# Thanks for using Simvisage open source!
+#
+# Created on Nov 28, 2011 by: rch
+
+from enthought.traits.api import \
+    HasTraits, Float, Int, Bool, List
+
+from sampling import IrregularSampling, QuasiMonteCarlo, SparseGrid
+
+import numpy as np
+
+import platform
+if platform.system() == 'Linux':
+    from time import time as sysclock
+elif platform.system() == 'Windows':
+    from time import clock as sysclock
+
+#===============================================================================
+# Adaptive evaluation of the integral
+#===============================================================================
+class AdaptiveEval(HasTraits):
+    '''
+    Refine the sampling of the random domain until the estimated error
+    of the mean response is below the tolerance.
+
+    The error is measured as the maximum over the control variables
+    normalized by the peak of the mean response (see ErrorEval.eval_error_max).
+
+    Irregular samplings (MCS, LHS, Sobol, Halton) are refined by adding
+    batches of n_sim samples (given by n_int of the integrated SPIRRID),
+    the number of batches is doubled in every step. The mean values of
+    the evaluated batches are kept - only the new batches are evaluated.
+    With n_procs > 1, the new batches of a step are distributed over
+    the worker processes of the parallel evaluation (the pool is started
+    once per step, not for each batch).
+    The quasi Monte Carlo batches are consecutive segments of a single
+    scrambled sequence. For Monte Carlo sampling with the numpy code,
+    the error is the standard error given by the sample variance,
+    otherwise it is the difference between the successive estimates.
+
+    Regular grids (TGrid, PGrid, GaussGrid) are refined by doubling n_int,
+    the sparse grid by increasing its level. Since their points are not
+    nested, the whole grid is evaluated and the previous estimate
+    is used to estimate the error.
+    '''
+
+    # relative tolerance of the mean response
+    rtol = Float(1e-3)
+
+    # maximum number of samples
+    max_n_sim = Int(10 ** 7)
+
+    #===========================================================================
+    # Report of the last evaluation
+    #===========================================================================
+    # achieved error estimate
+    error = Float
+
+    # total number of samples
+    n_sim = Int
+
+    # number of refinement steps
+    n_steps = Int
+
+    converged = Bool(False)
+
+    exec_time = Float
+
+    # (n_sim, error, exec_time) of the refinement steps
+    history = List
+
+    def eval(self, spirrid, e_orth):
+        '''Return the mean response and variance of spirrid in e_orth.
+        '''
+        self.history = []
+        self.converged = False
+        start_time = sysclock()
+        if isinstance(spirrid.sampling, IrregularSampling) and \
+            not isinstance(spirrid.sampling, SparseGrid):
+            steps = self._refine_batches(spirrid, e_orth)
+        else:
+            steps = self._refine_grid(spirrid, e_orth)
+
+        for n_sim, mu_q_arr, var_q_arr, error in steps:
+            self.n_sim = n_sim
+            self.error = error
+            self.exec_time = sysclock() - start_time
+            self.history.append((n_sim, error, self.exec_time))
+            if error <= self.rtol:
+                self.converged = True
+                break
+        self.n_steps = len(self.history)
+        return mu_q_arr, var_q_arr
+
+    def __str__(self):
+        return 'adaptive( rtol = %g, error = %g, n_sim = %d, steps = %d, converged = %s )' % \
+            (self.rtol, self.error, self.n_sim, self.n_steps, `self.converged`)
+
+    #===========================================================================
+    # Implementation
+    #===========================================================================
+    def _get_clone(self, spirrid, **kw):
+        '''Return a copy of spirrid with the same integration setup.
+        '''
+        clone = spirrid.__class__(q = spirrid.q,
+                                  evars = spirrid.evars,
+                                  tvars = spirrid.tvars,
+                                  n_int = spirrid.n_int,
+                                  sampling_type = spirrid.sampling_type,
+                                  codegen_type = spirrid.codegen_type,
+                                  n_procs = spirrid.n_procs,
+                                  parallel_eval = spirrid.parallel_eval)
+        clone.set(**kw)
+        if isinstance(spirrid.sampling, QuasiMonteCarlo):
+            clone.sampling.set(**spirrid.sampling.trait_get('seed', 'scramble', 'offset'))
+        clone.codegen.set(**spirrid.codegen.trait_get(codegen_option = True))
+        clone.codegen.set(**spirrid.codegen.trait_get(codegen_setting = True))
+        return clone
+
+    def _get_error(self, mu_q_arr, delta_arr):
+        return np.max(np.fabs(delta_arr)) / max(np.max(np.fabs(mu_q_arr)), 1e-100)
+
+    def _refine_batches(self, spirrid, e_orth):
+        '''Generate the estimates for the doubled number of batches.
+        '''
+        base = self._get_clone(spirrid)
+        n_batch = base.sampling.n_sim
+        use_var = spirrid.codegen_type == 'numpy' and spirrid.sampling_type == 'MCS'
+        if use_var:
+            base.codegen.implicit_var_eval = True
+        is_qmc = isinstance(base.sampling, QuasiMonteCarlo)
+
+        sum_mu = 0.0
+        sum_m2 = 0.0
+        has_var = True
+        n_batches = 0
+        n_target = 1
+        mu_prev = None
+        while True:
+            if n_batches == 0:
+                results = [ base.eval_mu_q(base.mu_q_method, e_orth) ]
+            else:
+                # keep the batches alive - the methods refer to them
+                batches = []
+                for i in range(n_batches, n_target):
+                    batch = self._get_clone(base)
+                    if is_qmc:
+                        batch.sampling.offset = base.sampling.offset + i * n_batch
+                    batches.append(batch)
+                methods = [ batch.mu_q_method for batch in batches ]
+                if base.n_procs > 1:
+                    results = base.parallel_eval.eval_list(methods, e_orth)
+                else:
+                    results = [ method(*e_orth) for method in methods ]
+            for mu_b, var_b in results:
+                sum_mu = sum_mu + mu_b
+                if var_b is None:
+                    has_var = False
+                else:
+                    sum_m2 = sum_m2 + var_b + mu_b ** 2
+            n_batches = n_target
+
+            n_sim = n_batches * n_batch
+            mu_q_arr = sum_mu / n_batches
+            var_q_arr = None
+            if has_var:
+                var_q_arr = sum_m2 / n_batches - mu_q_arr ** 2
+            if use_var:
+                error = self._get_error(mu_q_arr, np.sqrt(np.fabs(var_q_arr) / n_sim))
+            elif mu_prev is None:
+                error = np.inf
+            else:
+                error = self._get_error(mu_q_arr, mu_q_arr - mu_prev)
+            yield n_sim, mu_q_arr, var_q_arr, error
+
+            if 2 * n_sim > self.max_n_sim:
+                return
+            mu_prev = mu_q_arr
+            n_target *= 2
+
+    def _refine_grid(self, spirrid, e_orth):
+        '''Generate the estimates for the refined grids.
+        '''
+        grid = self._get_clone(spirrid)
+        mu_prev = None
+        while True:
+            mu_q_arr, var_q_arr = grid.eval_mu_q(grid.mu_q_method, e_orth)
+            if mu_prev is None:
+                error = np.inf
+            else:
+                error = self._get_error(mu_q_arr, mu_q_arr - mu_prev)
+            yield grid.sampling.n_sim, mu_q_arr, var_q_arr, error
+
+            if isinstance(grid.sampling, SparseGrid):
+                n_int = grid.n_int + 2
+            else:
+                n_int = grid.n_int * 2
+            grid = self._get_clone(spirrid, n_int = n_int)
+            if grid.sampling.n_sim > self.max_n_sim:
+                return
+            mu_prev = mu_q_arr
@@ -49,6 +49,11 @@ class CodeGen(HasStrictTraits):
     def set_codegen_option_changed(self):
         self.spirrid.codegen_option = True
 
+    def precompile(self):
+        '''Prepare the compiled code (nothing to do for scripted code).
+        '''
+        pass
+
 if __name__ == '__main__':
 
     from spirrid import SPIRRID
@@ -29,6 +29,7 @@ import inspect
 
 import platform
 from code_gen import CodeGen
+from kernel_cache import KernelCache, get_kernel_cache
 
 class ICodeGenLangDict(Interface):
     pass
@@ -37,7 +38,7 @@ class CodeGenLangDictC(HasStrictTraits):
 
     implements(ICodeGenLangDict)
 
-    LD_BEGIN_EPS_LOOP_ACTIVE = 'for( int i_eps = 0; i_eps < %(i)i; i_eps++){\n'
+    LD_BEGIN_EPS_LOOP_ACTIVE = 'for( int i_eps = 0; i_eps < Ne_arr[0]; i_eps++){\n'
     LD_END_EPS_LOOP_ACTIVE = '};\n'
     LD_ACCESS_EPS_IDX = '\tdouble eps = e_arr( i_eps );\n'
     LD_ACCESS_EPS_PTR = '\tdouble eps = *( e_arr + i_eps );\n'
@@ -61,6 +62,8 @@ class CodeGenLangDictC(HasStrictTraits):
     LD_BEGIN_THETA_FLAT_LOOP = 'for( int i = 0; i < %i; i++){\n'
     LD_ACCESS_THETA_FLAT_IDX = '\tdouble %s = %s_flat( i);\n'
     LD_ACCESS_THETA_FLAT_PTR = '\tdouble %s = *( %s_flat + i );\n'
+    LD_ACCESS_DG_FLAT_IDX = '\tdouble dG = dG_flat( i );\n'
+    LD_ACCESS_DG_FLAT_PTR = '\tdouble dG = *( dG_flat + i );\n'
     LD_END_THETA_FLAT_LOOP = '};\n'
 
     LD_DECLARE_DG_IDX = '\tdouble dG = dG_grid('
@@ -75,7 +78,7 @@ class CodeGenLangDictCython(HasStrictTraits):
 
     implements(ICodeGenLangDict)
 
-    LD_BEGIN_EPS_LOOP_ACTIVE = '\tcdef np.ndarray mu_q_arr = np.zeros_like( e_arr )\n\tfor i_eps from 0 <= i_eps < %(i)i:\n\t\teps = e_arr[i_eps]\n'
+    LD_BEGIN_EPS_LOOP_ACTIVE = '\tcdef np.ndarray mu_q_arr = np.zeros_like( e_arr )\n\tfor i_eps from 0 <= i_eps < e_arr.shape[0]:\n\t\teps = e_arr[i_eps]\n'
     LD_END_EPS_LOOP_ACTIVE = '\n'
     LD_ACCESS_EPS_IDX = ''
     LD_ACCESS_EPS_PTR = ''
@@ -99,6 +102,8 @@ class CodeGenLangDictCython(HasStrictTraits):
     LD_BEGIN_THETA_FLAT_LOOP = '\tfor i from 0 <= i < %i:\n'
     LD_ACCESS_THETA_FLAT_IDX = '\t\t%s = %s_flat[i]\n'
     LD_ACCESS_THETA_FLAT_PTR = '\t\t%s = %s_flat[i]\n'
+    LD_ACCESS_DG_FLAT_IDX = '\t\tdG = dG_flat[i]\n'
+    LD_ACCESS_DG_FLAT_PTR = '\t\tdG = dG_flat[i]\n'
     LD_END_THETA_FLAT_LOOP = '\n'
 
     LD_DECLARE_DG_IDX = '%(t)s\tdG = dG_grid['
@@ -247,7 +252,7 @@ class CodeGenCompiled(CodeGen):
 
     LD_N_TAB = Property
     def _get_LD_N_TAB(self):
-        if self.spirrid.sampling_type == 'LHS' or self.spirrid.sampling_type == 'MCS':
+        if isinstance(self, CodeGenCompiledIrregular):
             if self.compiled_eps_loop:
                 return 3
             else:
@@ -269,9 +274,10 @@ class CodeGenCompiled(CodeGen):
         if self.compiled_eps_loop:
 
             # create code string for inline function
+            # (the length of e_arr is taken at runtime so that the code
+            # can be applied to chunks of the control variable)
             #
-            n_eps = len(self.spirrid.evar_list[0])
-            code_str += self.LD_BEGIN_EPS_LOOP % {'i':n_eps}
+            code_str += self.LD_BEGIN_EPS_LOOP
             code_str += self.LD_ACCESS_EPS
 
         else:
@@ -323,8 +329,10 @@ class CodeGenCompiled(CodeGen):
             code_str += self.ld_.LD_RETURN_MU_Q
         return code_str
 
-    compiler_verbose = Int(1)
-    compiler = Str('gcc')
+    # settings of the compiler (codegen_setting - copied to the clones
+    # of spirrid in the adaptive evaluation, no effect on the code)
+    compiler_verbose = Int(1, codegen_setting = True)
+    compiler = Str('gcc', codegen_setting = True)
 
     def get_code(self):
         if self.ld == 'c':
@@ -332,49 +340,93 @@ class CodeGenCompiled(CodeGen):
         elif self.ld == 'cython':
             return self.get_cython_code()
 
+    #===========================================================================
+    # Compiled kernels
+    #===========================================================================
+    # cache of the compiled kernels (None - the code is compiled by 
+    # weave.inline and pyximport in the current directory).
+    # The shared cache is used by default only if SPIRRID_CACHE_DIR is set.
+    kernel_cache = Instance(KernelCache, codegen_setting = True)
+    def _kernel_cache_default(self):
+        return get_kernel_cache()
+
+    def precompile(self):
+        '''Build the compiled code for the current configuration
+        (or load it from the kernel cache) without evaluating it.
+        '''
+        if self.compiled_eps_loop:
+            e = np.zeros((1,), dtype = float)
+        else:
+            e = 0.0
+        if self.ld == 'c':
+            self.get_c_kernel(self.get_c_arg_values(e, np.zeros_like(e)))
+        elif self.ld == 'cython':
+            self.get_cython_kernel(self.get_cython_arg_values(e))
+
+    def get_cython_arg_values(self, e):
+        '''Return the arguments of the cython function.
+        '''
+        arg_values = {}
+        arg_values['e_arr'] = e
+        for name, theta_arr in zip(self.rand_var_names, self.theta_arrs):
+            arg_values[ '%s_flat' % name ] = theta_arr
+        arg_values.update(self._get_arg_values_dG())
+        return arg_values
+
+    def get_cython_source(self, arg_values):
+        '''Return the source of the cython module defining the function mu_q.
+        '''
+        cython_header = 'import numpy as np\ncimport numpy as np\nctypedef np.double_t DTYPE_t\ncimport cython\n\n@cython.boundscheck(False)\n@cython.wraparound(False)\n@cython.cdivision(True)\ndef mu_q(%s):\n\tcdef double mu_q\n'
+        #@todo - for Cython cdef variables and generalize function def() 
+        def_dec = 'np.ndarray[DTYPE_t, ndim=1] '
+        def_dec += ', np.ndarray[DTYPE_t, ndim=1] '.join(arg_values)
+        cython_header = cython_header % def_dec
+        cython_header += '    cdef double '
+        cython_header += ', '.join(self.var_names) + ', eps, dG, q\n'
+        cython_header += '    cdef int i_'
+        cython_header += ', i_'.join(self.var_names) + '\n'
+        if self.cached_dG:
+            cython_header = cython_header.replace(r'1] dG_grid', r'%i] dG_grid' % self.n_rand_vars)
+        if self.compiled_eps_loop == False:
+            cython_header = cython_header.replace(r'np.ndarray[DTYPE_t, ndim=1] e_arr', r'double e_arr')
+            cython_header = cython_header.replace(r'eps,', r'eps = e_arr,')
+        return (cython_header + self.code).replace('\t', '    ')
+
+    def get_cython_kernel(self, arg_values):
+        '''Return the compiled cython function mu_q.
+        '''
+        cython_code = self.get_cython_source(arg_values)
+        if self.kernel_cache != None:
+            compiler_args, linker_args = self.extra_args
+            return self.kernel_cache.get_cython_kernel(cython_code,
+                                                       compiler_args, linker_args,
+                                                       self.spirrid.sampling_type)
+        cython_file_name = 'spirrid_cython.pyx'
+
+        regenerate_code = True
+        if os.path.exists(cython_file_name):
+            f_in = open(cython_file_name, 'r').read()
+            if f_in == cython_code:
+                regenerate_code = False
+
+        if regenerate_code:
+            infile = open('spirrid_cython.pyx', 'w')
+            infile.write(cython_code)
+            infile.close()
+            print 'pyx file updated'
+
+        import pyximport
+        pyximport.install(reload_support = True)
+        import spirrid_cython
+        if regenerate_code:
+            reload(spirrid_cython)
+        return spirrid_cython.mu_q
+
     def get_cython_code(self):
         def mu_q_method(e):
-            cython_header = 'import numpy as np\ncimport numpy as np\nctypedef np.double_t DTYPE_t\ncimport cython\n\n@cython.boundscheck(False)\n@cython.wraparound(False)\n@cython.cdivision(True)\ndef mu_q(%s):\n\tcdef double mu_q\n'
-            #@todo - for Cython cdef variables and generalize function def() 
-            arg_values = {}
             eps_arr = e
-            arg_values['e_arr'] = eps_arr
-            for name, theta_arr in zip(self.rand_var_names, self.theta_arrs):
-                arg_values[ '%s_flat' % name ] = theta_arr
-            arg_values.update(self._get_arg_values_dG())
-            def_dec = 'np.ndarray[DTYPE_t, ndim=1] '
-            def_dec += ', np.ndarray[DTYPE_t, ndim=1] '.join(arg_values)
-            cython_header = cython_header % def_dec
-            cython_header += '    cdef double '
-            cython_header += ', '.join(self.var_names) + ', eps, dG, q\n'
-            cython_header += '    cdef int i_'
-            cython_header += ', i_'.join(self.var_names) + '\n'
-            if self.cached_dG:
-                cython_header = cython_header.replace(r'1] dG_grid', r'%i] dG_grid' % self.n_rand_vars)
-            if self.compiled_eps_loop == False:
-                cython_header = cython_header.replace(r'np.ndarray[DTYPE_t, ndim=1] e_arr', r'double e_arr')
-                cython_header = cython_header.replace(r'eps,', r'eps = e_arr,')
-            cython_code = (cython_header + self.code).replace('\t', '    ')
-            cython_file_name = 'spirrid_cython.pyx'
-
-            regenerate_code = True
-            if os.path.exists(cython_file_name):
-                f_in = open(cython_file_name, 'r').read()
-                if f_in == cython_code:
-                    regenerate_code = False
-
-            if regenerate_code:
-                infile = open('spirrid_cython.pyx', 'w')
-                infile.write(cython_code)
-                infile.close()
-                print 'pyx file updated'
-
-            import pyximport
-            pyximport.install(reload_support = True)
-            import spirrid_cython
-            if regenerate_code:
-                reload(spirrid_cython)
-            mu_q = spirrid_cython.mu_q
+            arg_values = self.get_cython_arg_values(eps_arr)
+            mu_q = self.get_cython_kernel(arg_values)
             if self.compiled_eps_loop:
                 mu_q_arr = mu_q(**arg_values)
             else:
@@ -391,6 +443,57 @@ class CodeGenCompiled(CodeGen):
             return  mu_q_arr, None
         return mu_q_method
 
+    def get_c_arg_values(self, e, mu_q_arr = None):
+        '''Return the arguments of the C code for the control value
+        (the arrays of control values and results for compiled_eps_loop).
+        '''
+        arg_values = {}
+
+        if self.compiled_eps_loop:
+
+            # for compiled eps_loop the whole input and output array must be passed to c
+            #
+            arg_values['e_arr'] = e
+            arg_values['mu_q_arr'] = mu_q_arr
+        else:
+            arg_values['e'] = e
+
+        # prepare the lengths of the arrays to set the iteration bounds
+        #
+        for name, theta_arr in zip(self.rand_var_names, self.theta_arrs):
+            arg_values[ '%s_flat' % name ] = theta_arr
+
+        arg_values.update(self._get_arg_values_dG())
+        return arg_values
+
+    def get_c_kernel(self, arg_values):
+        '''Return the function evaluating the C code,
+        the arguments are passed in the order of arg_names.
+        '''
+        self._set_compiler()
+
+        compiler_args, linker_args = self.extra_args
+
+        if self.kernel_cache != None:
+            return self.kernel_cache.get_c_kernel(self.code, self.arg_names, arg_values,
+                                                  self.cached_dG, self.compiler,
+                                                  compiler_args, linker_args,
+                                                  self.spirrid.sampling_type,
+                                                  self.compiler_verbose)
+        if self.cached_dG:
+            conv = weave.converters.blitz
+        else:
+            conv = weave.converters.default
+
+        def kernel(*args):
+            return weave.inline(self.code, self.arg_names,
+                                local_dict = dict(zip(self.arg_names, args)),
+                                extra_compile_args = compiler_args,
+                                extra_link_args = linker_args,
+                                type_converters = conv, compiler = self.compiler,
+                                verbose = self.compiler_verbose)
+        return kernel
+
     def get_c_code(self):
         '''
             Return the code for the given sampling of the rand domain.
@@ -398,68 +501,35 @@ class CodeGenCompiled(CodeGen):
         def mu_q_method(e):
             '''Template for the evaluation of the mean response.
             '''
-            self._set_compiler()
-
-            compiler_args, linker_args = self.extra_args
-            print compiler_args
-
             # prepare the array of the control variable discretization
             #
             eps_arr = e
             mu_q_arr = np.zeros_like(eps_arr)
 
-            # prepare the parameters for the compiled function in 
-            # a separate dictionary
-            arg_values = {}
-
-            if self.compiled_eps_loop:
-
-                # for compiled eps_loop the whole input and output array must be passed to c
-                #
-                arg_values['e_arr'] = eps_arr
-                arg_values['mu_q_arr'] = mu_q_arr
-
-            # prepare the lengths of the arrays to set the iteration bounds
-            #
-            for name, theta_arr in zip(self.rand_var_names, self.theta_arrs):
-                arg_values[ '%s_flat' % name ] = theta_arr
-
-            arg_values.update(self._get_arg_values_dG())
-
-            if self.cached_dG:
-                conv = weave.converters.blitz
-            else:
-                conv = weave.converters.default
-
             if self.compiled_eps_loop:
 
                 # C loop over eps, all inner loops must be compiled as well
                 #
-                weave.inline(self.code, self.arg_names, local_dict = arg_values,
-                             extra_compile_args = compiler_args,
-                             extra_link_args = linker_args,
-                             type_converters = conv, compiler = self.compiler,
-                             verbose = self.compiler_verbose)
+                arg_values = self.get_c_arg_values(eps_arr, mu_q_arr)
+                kernel = self.get_c_kernel(arg_values)
+                kernel(*[ arg_values[name] for name in self.arg_names ])
 
             else:
 
-                # Python loop over eps
+                # Python loop over eps - the kernel is obtained only once
                 #
+                arg_values = self.get_c_arg_values(0.0)
+                kernel = self.get_c_kernel(arg_values)
+                args = [ arg_values[name] for name in self.arg_names ]
+                e_idx = list(self.arg_names).index('e')
                 for idx, e in enumerate(eps_arr):
 
                     # C loop over random dimensions
                     #
-                    arg_values['e'] = e # prepare the parameter
-                    mu_q = weave.inline(self.code, self.arg_names,
-                                         local_dict = arg_values,
-                                         extra_compile_args = compiler_args,
-                                         extra_link_args = linker_args,
-                                         type_converters = conv,
-                                         compiler = self.compiler,
-                                         verbose = self.compiler_verbose)
+                    args[e_idx] = float(e) # prepare the parameter
 
                     # add the value to the return array
-                    mu_q_arr[idx] = mu_q
+                    mu_q_arr[idx] = kernel(*args)
 
             var_q_arr = np.zeros_like(mu_q_arr)
 
@@ -673,3 +743,24 @@ class CodeGenCompiledIrregular(CodeGenCompiled):
         code_str += self.ld_.LD_END_THETA_FLAT_LOOP
 
         return code_str
+
+class CodeGenCompiledWeighted(CodeGenCompiledIrregular):
+    '''Irregular sampling with nonuniform weights dG (sparse grid).
+    '''
+    def _get_code_dG_declare(self):
+        return ''
+
+    def _get_arg_names_dG(self):
+        return [ 'dG_flat' ]
+
+    def _get_arg_values_dG(self):
+        return { 'dG_flat' : self.spirrid.sampling.dG }
+
+    def _get_code_dG_access(self):
+        if self.cached_dG:
+            code_str = self.ld_.LD_ACCESS_DG_FLAT_IDX
+        else:
+            code_str = self.ld_.LD_ACCESS_DG_FLAT_PTR
+        if self.compiled_eps_loop:
+            code_str = '\t' + code_str
+        return code_str
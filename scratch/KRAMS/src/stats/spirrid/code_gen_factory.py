@@ -16,7 +16,7 @@ from enthought.traits.api import HasStrictTraits, Dict
 from code_gen_numpy import CodeGenNumpy
 from code_gen_compiled import \
     CodeGenCompiledTGrid, CodeGenCompiledPGrid, \
-    CodeGenCompiledIrregular
+    CodeGenCompiledIrregular, CodeGenCompiledWeighted
 
 #===============================================================================
 # Factory classes to capture the dependency of C-code on the sampling type
@@ -34,7 +34,11 @@ class CodeGenCompiledFactory(HasStrictTraits):
     mapping_table = Dict(value = {'TGrid' : CodeGenCompiledTGrid,
                                   'PGrid' : CodeGenCompiledPGrid,
                                   'MCS' : CodeGenCompiledIrregular,
-                                  'LHS' : CodeGenCompiledIrregular
+                                  'LHS' : CodeGenCompiledIrregular,
+                                  'Sobol' : CodeGenCompiledIrregular,
+                                  'Halton' : CodeGenCompiledIrregular,
+                                  'GaussGrid' : CodeGenCompiledTGrid,
+                                  'SparseGrid' : CodeGenCompiledWeighted
                                   })
 
 class CodeGenCFactory(CodeGenCompiledFactory):
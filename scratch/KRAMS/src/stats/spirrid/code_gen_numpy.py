@@ -12,9 +12,31 @@
 #
 # Created on Nov 8, 2011 by: rch
 
+from enthought.traits.api import Int
+
 from code_gen import CodeGen
 import numpy as np
 
+#===============================================================================
+# Helper methods for the chunked evaluation
+#===============================================================================
+def take_flat(arr, multi_idx):
+    '''Return the values of the orthogonal array (or scalar) arr 
+    in the points of the random domain given by the multi-index.
+    '''
+    if not isinstance(arr, np.ndarray) or arr.ndim == 0:
+        return arr
+    idx = tuple([ m if n > 1 else 0 for m, n in zip(multi_idx, arr.shape) ])
+    return arr[idx]
+
+def domain_shape(args):
+    '''Return the shape of the domain spanned by the orthogonal arrays.
+    '''
+    arrs = [ arg for arg in args if isinstance(arg, np.ndarray) ]
+    if len(arrs) == 0:
+        return ()
+    return np.broadcast(*arrs).shape
+
 #===============================================================================
 # Generator of the numpy code
 #===============================================================================
@@ -23,10 +45,23 @@ class CodeGenNumpy(CodeGen):
         Numpy code is identical for all types of sampling, 
         no special treatment needed. 
     '''
+    #===========================================================================
+    # Configuration of the chunked evaluation
+    #===========================================================================
+    # Size of the block of the evaluated responses in bytes. 
+    # If zero, the response is evaluated over the whole random domain
+    # for each control value. Otherwise, the control values and the 
+    # random domain are tiled into blocks of the given size (the response 
+    # function must accept arrays of control values).
+    chunk_size = Int(0, codegen_option = True)
+
     def get_code(self):
         '''
             Return the code for the given sampling of the random domain.
         '''
+        if self.chunk_size > 0:
+            return self.get_chunked_code()
+
         s = self.spirrid
         n = len(s.evar_list)
         targs = dict(zip(s.tvar_names, s.sampling.theta))
@@ -70,6 +105,90 @@ class CodeGenNumpy(CodeGen):
         otypes = [ float for i in range(n * 2)]
         return np.vectorize(mu_q_method, otypes = otypes)
 
+    def get_chunked_code(self):
+        '''
+            Return the method evaluating the random domain in blocks.
+
+            The block contains the responses for a subset of control values
+            (rows) and a subset of the sampling points (columns). The 
+            weighted sums of the blocks are accumulated so that the memory
+            stays bounded by chunk_size independently of the number of 
+            samples. The weights need not be positive (sparse grids).
+            The squared responses are summed relative to the response
+            in the first sampling point (shifted sums) in order to avoid
+            the cancellation in the variance.
+        '''
+        s = self.spirrid
+        implicit_var_eval = self.implicit_var_eval
+        chunk_elems = max(1, self.chunk_size / 8)
+
+        theta = s.sampling.theta
+        dG_factors = s.sampling.dG_factors
+        t_shape = domain_shape(list(theta) + list(dG_factors))
+        if t_shape == ():
+            # deterministic case - single sampling point
+            t_shape = (1,)
+        n_theta = int(np.prod(t_shape))
+
+        def mu_q_method(*e):
+            '''Template for the chunked evaluation of the mean response.
+            '''
+            e_arrs = np.broadcast_arrays(*e)
+            e_shape = e_arrs[0].shape if len(e_arrs) else ()
+            e_flat = [ e_arr.flatten() for e_arr in e_arrs ]
+            n_e = int(np.prod(e_shape))
+
+            n_tb = min(n_theta, chunk_elems)
+            n_eb = max(1, min(n_e, chunk_elems / n_tb))
+
+            # weighted sums: weight, response, shifted response
+            # and squared shifted response
+            W = 0.0
+            S = np.zeros((n_e,), dtype = float)
+            S_c = np.zeros((n_e,), dtype = float)
+            S2_c = np.zeros((n_e,), dtype = float)
+            # shift - the response in the first sampling point
+            c = np.zeros((n_e,), dtype = float)
+
+            for t0 in range(0, n_theta, n_tb):
+                t_idx = np.unravel_index(np.arange(t0, min(t0 + n_tb, n_theta)),
+                                         t_shape)
+                targs = {}
+                for nm, t in zip(s.tvar_names, theta):
+                    t_val = take_flat(t, t_idx)
+                    if isinstance(t_val, np.ndarray):
+                        t_val = t_val[None, :]
+                    targs[nm] = t_val
+                dG = reduce(lambda x, y: x * y,
+                            [ take_flat(f, t_idx) for f in dG_factors ], 1.0)
+                dG = dG * np.ones((len(t_idx[0]),))
+                W += np.sum(dG)
+                for e0 in range(0, n_e, n_eb):
+                    e_slice = slice(e0, min(e0 + n_eb, n_e))
+                    eargs = dict([ (nm, e_arr[e_slice, None])
+                                   for nm, e_arr in zip(s.evar_names, e_flat) ])
+                    args = dict(eargs, **targs)
+
+                    Q = s.q(**args) * np.ones((e_slice.stop - e_slice.start, len(dG)))
+                    S[e_slice] += np.dot(Q, dG)
+                    if implicit_var_eval:
+                        if t0 == 0:
+                            c[e_slice] = Q[:, 0]
+                        Q -= c[e_slice, None] # in-place evaluation of deviations
+                        S_c[e_slice] += np.dot(Q, dG)
+                        Q **= 2
+                        S2_c[e_slice] += np.dot(Q, dG)
+
+            mu_q = S
+            if not implicit_var_eval:
+                return mu_q.reshape(e_shape), None
+            # sum( q**2 * dG ) - mu_q**2 expressed by the shifted sums
+            var_q = S2_c - S_c ** 2 + (2.0 * c * S_c + c ** 2 * W) * (1.0 - W)
+            return mu_q.reshape(e_shape), var_q.reshape(e_shape)
+
+        return mu_q_method
+
     def __str__(self):
-        return 'numpy\nvar_eval: %s\n' % `self.implicit_var_eval`
+        return 'numpy\nvar_eval: %s\nchunk_size: %d\n' % \
+            (`self.implicit_var_eval`, self.chunk_size)
 
@@ -0,0 +1,185 @@
+#-------------------------------------------------------------------------------
+#
+# Copyright (c) 2009, IMB, RWTH Aachen.
+# All rights reserved.
+#
+# This software is provided without warranty under the terms of the BSD
+# license included in simvisage/LICENSE.txt and may be redistributed only
+# under the conditions described in the aforementioned license.  The license
+# is also available online at http://www.simvisage.com/licenses/BSD.txt
+#
+# Thanks for using Simvisage open source!
+#
+# Created on Dec 2, 2011 by: rch
+
+from enthought.traits.api import HasTraits, Str, Dict
+
+import numpy as np
+import hashlib
+import tempfile
+import shutil
+import imp
+import os
+import sys
+import platform
+
+def arg_signature(arg_names, arg_values):
+    '''Return the types of the arguments of the kernel
+    (the converters of the compiled code depend on them).
+    '''
+    sig = []
+    for name in arg_names:
+        value = arg_values[name]
+        if isinstance(value, np.ndarray):
+            sig.append((name, value.dtype.str, value.ndim))
+        else:
+            sig.append((name, type(value).__name__))
+    return sig
+
+def ext_suffix():
+    '''Return the file suffix of the extension modules.
+    '''
+    for suffix, mode, kind in imp.get_suffixes():
+        if kind == imp.C_EXTENSION:
+            return suffix
+    return '.so'
+
+#===============================================================================
+# Cache of the compiled integration kernels
+#===============================================================================
+class KernelCache(HasTraits):
+    '''
+    Persistent cache of the compiled integration kernels.
+
+    The kernels generated by CodeGenCompiled are built as extension modules
+    named by the hash of the code, of the types of the arguments, of the
+    compiler setup and of the sampling type. The hash includes the version
+    of python and numpy and the platform, so that the modules built for
+    a different interpreter are not loaded. The modules are stored in
+    the cache directory and loaded directly in the subsequent sessions
+    without invoking the compiler. The modules are built in a temporary
+    directory and moved into the cache, so that several processes
+    may share the cache directory.
+
+    The cache directory is given by the environment variable
+    SPIRRID_CACHE_DIR, the default is ~/.spirrid_kernels.
+    The code generators use the shared cache only if SPIRRID_CACHE_DIR
+    is set (see get_kernel_cache), otherwise the cache must be assigned
+    explicitly.
+    '''
+
+    cache_dir = Str
+    def _cache_dir_default(self):
+        return os.environ.get('SPIRRID_CACHE_DIR',
+                              os.path.join(os.path.expanduser('~'), '.spirrid_kernels'))
+
+    # kernels loaded in this session
+    _kernels = Dict
+
+    def get_key(self, *items):
+        '''Return the hash identifying the kernel.
+        '''
+        abi = (sys.version, np.__version__, platform.platform(), ext_suffix())
+        return hashlib.sha1(repr(abi + items)).hexdigest()
+
+    def get_module_file(self, name):
+        return os.path.join(self.cache_dir, name + ext_suffix())
+
+    def clear(self):
+        '''Remove the stored modules.
+        '''
+        self._kernels = {}
+        if os.path.exists(self.cache_dir):
+            shutil.rmtree(self.cache_dir)
+
+    def get_c_kernel(self, code, arg_names, arg_values, blitz,
+                     compiler, compile_args, link_args, sampling_type, verbose = 0):
+        '''Return the kernel for the C code compiled using scipy.weave
+        (with blitz or default type converters). The kernel is called
+        with the arguments in the order of arg_names.
+        '''
+        key = self.get_key('c', code, arg_signature(arg_names, arg_values),
+                           blitz, compiler,
+                           compile_args, link_args, os.environ.get('OPT', ''),
+                           sampling_type)
+        name = 'spirrid_c_' + key
+        if name not in self._kernels:
+            if not os.path.exists(self.get_module_file(name)):
+
+                from scipy.weave import ext_tools, converters
+                if blitz:
+                    type_converters = converters.blitz
+                else:
+                    type_converters = converters.default
+
+                def build(build_dir):
+                    mod = ext_tools.ext_module(name)
+                    mod.add_function(ext_tools.ext_function('mu_q', code, arg_names,
+                                                            local_dict = arg_values,
+                                                            type_converters = type_converters))
+                    mod.compile(location = build_dir, compiler = compiler,
+                                verbose = verbose,
+                                extra_compile_args = compile_args,
+                                extra_link_args = link_args)
+                    return os.path.join(build_dir, name + ext_suffix())
+
+                self._store(name, build)
+            self._kernels[name] = self._load(name).mu_q
+        return self._kernels[name]
+
+    def get_cython_kernel(self, code, compile_args, link_args, sampling_type):
+        '''Return the function mu_q defined by the cython code.
+        '''
+        key = self.get_key('cython', code, compile_args, link_args,
+                           os.environ.get('CFLAGS', ''), os.environ.get('OPT', ''),
+                           sampling_type)
+        name = 'spirrid_cython_' + key
+        if name not in self._kernels:
+            if not os.path.exists(self.get_module_file(name)):
+
+                from distutils.extension import Extension
+                from pyximport import pyxbuild
+
+                def build(build_dir):
+                    pyx_file = os.path.join(build_dir, name + '.pyx')
+                    f = open(pyx_file, 'w')
+                    f.write(code)
+                    f.close()
+                    ext = Extension(name, [ pyx_file ],
+                                    include_dirs = [ np.get_include() ],
+                                    extra_compile_args = compile_args,
+                                    extra_link_args = link_args)
+                    return pyxbuild.pyx_to_dll(pyx_file, ext, pyxbuild_dir = build_dir)
+
+                self._store(name, build)
+            self._kernels[name] = self._load(name).mu_q
+        return self._kernels[name]
+
+    def _store(self, name, build):
+        '''Build the module in a temporary directory and move it into the cache.
+        '''
+        if not os.path.exists(self.cache_dir):
+            try:
+                os.makedirs(self.cache_dir)
+            except OSError:
+                # created by another process
+                pass
+        build_dir = tempfile.mkdtemp(prefix = name, dir = self.cache_dir)
+        try:
+            os.rename(build(build_dir), self.get_module_file(name))
+        finally:
+            shutil.rmtree(build_dir, ignore_errors = True)
+
+    def _load(self, name):
+        return imp.load_dynamic(name, self.get_module_file(name))
+
+# cache shared by the code generators
+kernel_cache = KernelCache()
+
+def get_kernel_cache():
+    '''Return the shared cache if the cache directory is specified
+    by SPIRRID_CACHE_DIR, None otherwise (no files written by default).
+    '''
+    if 'SPIRRID_CACHE_DIR' in os.environ:
+        return kernel_cache
+    return None
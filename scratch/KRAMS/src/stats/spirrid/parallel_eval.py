@@ -0,0 +1,184 @@
+#-------------------------------------------------------------------------------
+#
+# Copyright (c) 2009, IMB, RWTH Aachen.
+# All rights reserved.
+#
+# This software is provided without warranty under the terms of the BSD
+# license included in simvisage/LICENSE.txt and may be redistributed only
+# under the conditions described in the aforementioned license.  The license
+# is also available online at http://www.simvisage.com/licenses/BSD.txt
+#
+# Thanks for using Simvisage open source!
+#
+# Created on Nov 21, 2011 by: rch
+
+from enthought.traits.api import HasTraits, Int, Any
+
+import numpy as np
+import multiprocessing
+import os
+
+#===============================================================================
+# Integration methods shared with the worker processes
+#===============================================================================
+#
+# The workers are forked from the main process so that they inherit
+# the generated integration method together with the sampling
+# of the random domain and the compiled extension modules. Only the
+# chunks of the control variables and the resulting arrays are
+# transferred between the processes.
+#
+_methods = {}
+
+def _eval_chunk(task):
+    '''Evaluate the integration method for a chunk
+    of the control variables in the worker process.
+    '''
+    key, e_args = task
+    return _methods[key](*e_args)
+
+def _eval_method(task):
+    '''Evaluate one of the integration methods
+    for all control variables in the worker process.
+    '''
+    key, i, e_orth = task
+    return _methods[key][i](*e_orth)
+
+def first_point(e_orth):
+    '''Return the orthogonalized control variables
+    reduced to their first point.
+    '''
+    return [ e.flat[:1].reshape((1,) * e.ndim)
+             if isinstance(e, np.ndarray) else e
+             for e in e_orth ]
+
+def split_evars(e_orth, n_chunks):
+    '''Split the orthogonalized control variables into chunks along
+    the longest of them. Return the axis of the split and the list
+    of argument lists (None if there is nothing to split).
+    '''
+    arr_idx = [ i for i, e in enumerate(e_orth) if isinstance(e, np.ndarray) ]
+    if len(arr_idx) == 0:
+        return None, None
+    lengths = [ e_orth[i].size for i in arr_idx ]
+    axis = int(np.argmax(lengths))
+    n_chunks = min(n_chunks, lengths[axis])
+    if n_chunks < 2:
+        return None, None
+    i_split = arr_idx[axis]
+    chunk_args = []
+    for e_chunk in np.array_split(e_orth[i_split], n_chunks, axis = axis):
+        args = list(e_orth)
+        args[i_split] = e_chunk
+        chunk_args.append(args)
+    return axis, chunk_args
+
+def join_results(results, axis):
+    '''Concatenate the mean and variance arrays of the chunks.
+    '''
+    mu_q_arr = np.concatenate([ mu_q for mu_q, var_q in results ], axis = axis)
+    if any([ var_q is None for mu_q, var_q in results ]):
+        return mu_q_arr, None
+    var_q_arr = np.concatenate([ var_q for mu_q, var_q in results ], axis = axis)
+    return mu_q_arr, var_q_arr
+
+class ParallelEval(HasTraits):
+    '''
+    Evaluate the integration method of SPIRRID in a pool of worker processes.
+
+    The control variables are split into n_procs contiguous chunks along
+    the longest of them and every chunk is integrated over the whole random
+    domain by a worker. Since the mean value (and variance) in a control
+    point does not depend on the other control points, the concatenated
+    result is identical to the serial evaluation for all code generators
+    (numpy, c, cython).
+
+    The worker processes are kept alive and reused for the repeated
+    evaluations with the same integration method. Once the method has
+    been regenerated (change of the response function, of the random
+    variables, of the sampling or of the code generator options), the
+    pool is restarted so that the workers inherit the new method.
+    Before the fork, the method is evaluated in the first control point
+    within the main process - the random samples are drawn and the
+    compiled code is built only once and shared by all the workers.
+
+    Several independent methods (e.g. the batches of the adaptive
+    evaluation) may be evaluated at once by eval_list - each worker
+    integrates one method over all control variables, the pool
+    is started only once for the whole list.
+
+    Without fork (e.g. on Windows) the method is evaluated serially.
+    '''
+
+    # number of worker processes
+    #
+    n_procs = Int
+    def _n_procs_default(self):
+        return multiprocessing.cpu_count()
+
+    _pool = Any
+
+    _method = Any
+
+    # number of processes in the running pool
+    #
+    _n_running = Int(0)
+
+    def stop(self):
+        '''Terminate the worker processes.
+        '''
+        if self._pool != None:
+            self._pool.terminate()
+            self._pool.join()
+            self._pool = None
+        self._n_running = 0
+        _methods.pop(id(self), None)
+        self._method = None
+
+    def eval(self, method, e_orth):
+        '''Evaluate the method for the orthogonalized control variables.
+        '''
+        if self.n_procs < 2 or not hasattr(os, 'fork'):
+            return method(*e_orth)
+        axis, chunk_args = split_evars(e_orth, self.n_procs)
+        if chunk_args == None:
+            return method(*e_orth)
+
+        key = id(self)
+        if self._method is not method or self._n_running != self.n_procs:
+            self.stop()
+            # draw the samples and compile the code before the fork
+            #
+            method(*first_point(e_orth))
+            _methods[key] = method
+            self._method = method
+            self._pool = multiprocessing.Pool(self.n_procs)
+            self._n_running = self.n_procs
+
+        results = self._pool.map(_eval_chunk,
+                                 [ (key, args) for args in chunk_args ])
+        return join_results(results, axis)
+
+    def eval_list(self, methods, e_orth):
+        '''Evaluate the methods for the orthogonalized control variables.
+        Return the list of the results.
+        '''
+        if len(methods) == 1:
+            return [ self.eval(methods[0], e_orth) ]
+        if self.n_procs < 2 or not hasattr(os, 'fork'):
+            return [ method(*e_orth) for method in methods ]
+
+        key = id(self)
+        self.stop()
+        for method in methods:
+            method(*first_point(e_orth))
+        _methods[key] = methods
+        self._pool = multiprocessing.Pool(self.n_procs)
+        self._n_running = self.n_procs
+        try:
+            results = self._pool.map(_eval_method,
+                                     [ (key, i, e_orth) for i in range(len(methods)) ])
+        finally:
+            # release the samples of the methods
+            self.stop()
+        return results
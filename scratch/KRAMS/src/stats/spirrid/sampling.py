@@ -14,7 +14,7 @@
 
 from enthought.traits.api import \
     HasStrictTraits, Array, Property, Float, cached_property, Callable, Tuple, \
-    List, Str, Enum, Int, Instance, Trait, WeakRef, Any, Dict, Event
+    List, Str, Enum, Int, Instance, Trait, WeakRef, Any, Dict, Event, Bool
 
 import numpy as np
 from stats.spirrid.rv import RV
@@ -46,6 +46,14 @@ def orthogonalize(args):
             oargs.append(arg)
     return oargs
 
+def comb_int(n, k):
+    '''Binomial coefficient.
+    '''
+    c = 1
+    for i in range(k):
+        c = c * (n - i) / (i + 1)
+    return c
+
 def orthogonalize_full(args):
     '''Orthogonalize a list of one-dimensional arrays.\
     including scalar values in args.
@@ -63,6 +71,101 @@ def orthogonalize_full(args):
         oargs.append(oarg)
     return oargs
 
+#===============================================================================
+# Low-discrepancy sequences
+#===============================================================================
+# Primitive polynomials and initial direction numbers of the Sobol sequence
+# for the dimensions 2, 3, ... (degree s, coefficients a, numbers m_k)
+# according to Joe and Kuo. The first dimension is the van der Corput
+# sequence in base 2.
+SOBOL_DIRECTIONS = [(1, 0, (1,)),
+                    (2, 1, (1, 3)),
+                    (3, 1, (1, 3, 1)),
+                    (3, 2, (1, 1, 1)),
+                    (4, 1, (1, 1, 3, 3)),
+                    (4, 4, (1, 3, 5, 13)),
+                    (5, 2, (1, 1, 5, 5, 17)),
+                    (5, 4, (1, 1, 5, 5, 5)),
+                    (5, 7, (1, 1, 7, 11, 19)),
+                    (5, 11, (1, 1, 5, 1, 1)),
+                    (5, 13, (1, 1, 1, 3, 11)),
+                    (5, 14, (1, 3, 5, 5, 31)),
+                    (6, 1, (1, 3, 3, 9, 7, 49)),
+                    (6, 13, (1, 1, 1, 15, 21, 21)),
+                    (6, 16, (1, 3, 1, 13, 27, 49))]
+
+SOBOL_BITS = 32
+
+def sobol_direction_numbers(n_dims):
+    '''Return the direction numbers of the Sobol sequence (n_dims, SOBOL_BITS).
+    '''
+    if n_dims > len(SOBOL_DIRECTIONS) + 1:
+        raise ValueError, 'Sobol sequence available for max. %d dimensions' % \
+            (len(SOBOL_DIRECTIONS) + 1)
+    V = np.zeros((n_dims, SOBOL_BITS), dtype = np.int64)
+    V[0] = [ 1 << (SOBOL_BITS - 1 - k) for k in range(SOBOL_BITS) ]
+    for d in range(1, n_dims):
+        s, a, m = SOBOL_DIRECTIONS[d - 1]
+        v = [ m[k] << (SOBOL_BITS - 1 - k) for k in range(s) ]
+        for k in range(s, SOBOL_BITS):
+            v_k = v[k - s] ^ (v[k - s] >> s)
+            for i in range(1, s):
+                if (a >> (s - 1 - i)) & 1:
+                    v_k ^= v[k - i]
+            v.append(v_k)
+        V[d] = v
+    return V
+
+def sobol_points(n, n_dims, scramble = True, offset = 0, random_state = np.random):
+    '''Return n points of the Sobol sequence starting at the offset
+    in the unit cube (n_dims, n). The scrambling is done by a random
+    digital shift. The point 0 (origin) is kept also without the
+    scrambling - the first 2^m points form a net with a single point
+    in each elementary interval of the size 2^-m. Due to the centering,
+    the origin is mapped to 2^-33 and the point probability
+    functions remain finite.
+    '''
+    V = sobol_direction_numbers(n_dims)
+    idx = np.arange(offset, offset + n, dtype = np.int64)
+    X = np.zeros((n_dims, n), dtype = np.int64)
+    for k in range(SOBOL_BITS):
+        X ^= V[:, k:k + 1] * ((idx >> k) & 1)[None, :]
+    if scramble:
+        shift = (random_state.random_sample(n_dims) * 2.0 ** SOBOL_BITS).astype(np.int64)
+        X ^= shift[:, None]
+    # centered in the elementary interval to avoid 0 and 1
+    return (X + 0.5) / 2.0 ** SOBOL_BITS
+
+def first_primes(n):
+    '''Return the list of the first n prime numbers.
+    '''
+    primes = []
+    k = 2
+    while len(primes) < n:
+        if all([ k % p != 0 for p in primes ]):
+            primes.append(k)
+        k += 1
+    return primes
+
+def halton_points(n, n_dims, scramble = True, offset = 0, random_state = np.random):
+    '''Return the points offset + 1, ..., offset + n of the Halton sequence
+    in the unit cube (n_dims, n). The scrambling is done by random 
+    permutations of the nonzero digits in each dimension.
+    '''
+    U = np.zeros((n_dims, n), dtype = float)
+    idx = np.arange(offset + 1, offset + n + 1, dtype = np.int64)
+    for d, base in enumerate(first_primes(n_dims)):
+        perm = np.arange(base)
+        if scramble:
+            perm[1:] = random_state.permutation(perm[1:])
+        i = idx.copy()
+        f = 1.0 / base
+        while i.any():
+            U[d] += perm[i % base] * f
+            i //= base
+            f /= base
+    return U
+
 #===============================================================================
 # Function randomization
 #===============================================================================
@@ -206,6 +309,12 @@ class RandomSampling(HasStrictTraits):
 
     theta = Property()
 
+    # factors of dG (orthogonal arrays or scalars) - their product
+    # gives dG without expanding it over the whole random domain
+    dG_factors = Property()
+    def _get_dG_factors(self):
+        return [self.dG]
+
     def get_samples(self, n):
         '''Get the fully expanded samples (for plotting)
         '''
@@ -287,6 +396,9 @@ class TGrid(RegularGrid):
                 dG_ogrid[i] = tvar.pdf(theta) * d_theta
         return dG_ogrid
 
+    def _get_dG_factors(self):
+        return self.dG_ogrid
+
 class PGrid(RegularGrid):
     '''
         Regular grid of probabilities
@@ -308,6 +420,43 @@ class PGrid(RegularGrid):
     def _get_dG(self):
         return 1.0 / self.n_sim
 
+def gauss_rule_01(n):
+    '''Return the points and weights of the n-point Gauss-Legendre rule
+    in the range of probabilities (0,1).
+    '''
+    x, w = np.polynomial.legendre.leggauss(n)
+    return (x + 1.0) / 2.0, w / 2.0
+
+class GaussGrid(TGrid):
+    '''
+        Tensor product of the Gauss-Legendre rules in the range 
+        of probabilities - the points are obtained using the point
+        probability function of the random variables.
+    '''
+    def get_gauss_rule(self, tvar):
+        '''Return the points and weights of the Gauss-Legendre rule
+        mapped to the variable.
+        '''
+        if tvar.n_int != None:
+            n_int = tvar.n_int
+        else:
+            n_int = self.randomization.n_int
+        pi, w = gauss_rule_01(n_int)
+        return tvar.ppf(pi), w
+
+    def get_theta_for_distrib(self, tvar):
+        return self.get_gauss_rule(tvar)[0]
+
+    dG_ogrid = Property(Array(float), depends_on = 'recalc')
+    @cached_property
+    def _get_dG_ogrid(self):
+        dG_ogrid = [ 1.0 for i in range(len(self.theta)) ]
+        for i, (tvar, theta) in \
+            enumerate(zip(self.randomization.tvar_list, self.theta)):
+            if not isinstance(tvar, float):
+                dG_ogrid[i] = self.get_gauss_rule(tvar)[1].reshape(theta.shape)
+        return dG_ogrid
+
 class IrregularSampling(RandomSampling):
     '''Irregular sampling based on Monte Carlo concept
     '''
@@ -373,6 +522,154 @@ class LatinHypercubeSampling(IrregularSampling):
                 theta_list.append(np.random.permutation(theta_arr))
         return theta_list
 
+class QuasiMonteCarlo(IrregularSampling):
+    '''
+        Quasi Monte Carlo sampling: the points of a low-discrepancy 
+        sequence in the unit cube are transformed using the point 
+        probability functions of the random variables.
+    '''
+    # randomize the sequence
+    scramble = Bool(True)
+
+    # seed of the scrambling - the samplings with the same seed 
+    # and consecutive offsets are segments of the same sequence
+    seed = Int
+    def _seed_default(self):
+        return np.random.randint(0, 2 ** 31 - 1)
+
+    # index of the first point within the sequence
+    offset = Int(0)
+
+    def get_unit_points(self, n, n_dims):
+        '''Return n points in the unit cube (n_dims, n).
+        '''
+        raise NotImplementedError
+
+    random_state = Property
+    def _get_random_state(self):
+        return np.random.RandomState(self.seed)
+
+    theta = Property(Array(float), depends_on = 'recalc')
+    @cached_property
+    def _get_theta(self):
+
+        U = self.get_unit_points(self.n_sim, self.n_rand_vars)
+        theta_list = []
+        d = 0
+        for tvar in self.randomization.tvar_list:
+            if isinstance(tvar, float):
+                theta_list.append(tvar)
+            else:
+                theta_list.append(tvar.ppf(U[d]))
+                d += 1
+        return theta_list
+
+class SobolSampling(QuasiMonteCarlo):
+    '''
+        Scrambled Sobol sequence. The unscrambled sequence starts
+        with the (centered) origin.
+    '''
+    def get_unit_points(self, n, n_dims):
+        return sobol_points(n, n_dims, self.scramble, self.offset, self.random_state)
+
+class HaltonSampling(QuasiMonteCarlo):
+    '''
+        Scrambled Halton sequence.
+    '''
+    def get_unit_points(self, n, n_dims):
+        return halton_points(n, n_dims, self.scramble, self.offset, self.random_state)
+
+class SparseGrid(IrregularSampling):
+    '''
+        Smolyak sparse grid constructed from the Gauss-Legendre rules 
+        with 1, 3, 5, ... points in the range of probabilities (see GaussGrid).
+        The level is chosen so that the finest one-dimensional rule
+        does not exceed n_int points. The coinciding points of the
+        combined tensor rules are merged, the weights (dG) are
+        nonuniform and might be negative.
+    '''
+    level = Property(Int)
+    def _get_level(self):
+        return max(1, (self.randomization.n_int + 1) / 2)
+
+    def get_multi_indices(self, n_dims, max_sum):
+        '''Return the multi-indices (i_1, ..., i_n_dims), i_k >= 1,
+        with sum(i) <= max_sum.
+        '''
+        if n_dims == 0:
+            return [()]
+        mi_list = []
+        for i in range(1, max_sum - n_dims + 2):
+            mi_list += [ (i,) + mi for mi in
+                         self.get_multi_indices(n_dims - 1, max_sum - i) ]
+        return mi_list
+
+    grid = Property(depends_on = 'recalc')
+    @cached_property
+    def _get_grid(self):
+        '''Return the points (list of arrays) and weights of the sparse grid.
+        '''
+        rvs = [ tvar for tvar in self.randomization.tvar_list
+                if not isinstance(tvar, float) ]
+        d = len(rvs)
+        if d == 0:
+            return [], np.array([1.0])
+        L = self.level
+
+        # one-dimensional Gauss rules in the range of probabilities;
+        # the points are numbered uniquely over all levels
+        rules = [ gauss_rule_01(2 * l - 1) for l in range(1, L + 1) ]
+        pi_ref, pi_ids = np.unique(np.round(np.hstack([ pi for pi, w in rules ]), 12),
+                                   return_inverse = True)
+        offsets = np.cumsum([0] + [ len(pi) for pi, w in rules ])
+        n_x = len(pi_ref)
+        theta_ref = [ tvar.ppf(pi_ref) for tvar in rvs ]
+
+        # combination technique - collect the points (linear index 
+        # in the grid of all one-dimensional points) and weights
+        # of the tensor rules
+        q = d + L - 1
+        pnt_list, w_list = [], []
+        for mi in self.get_multi_indices(d, q):
+            k = q - sum(mi)
+            if k > d - 1:
+                continue
+            coeff = (-1) ** k * comb_int(d - 1, k)
+            ids = np.ix_(*[ pi_ids[offsets[i - 1]:offsets[i]] for i in mi ])
+            w = coeff * reduce(lambda x, y: x * y,
+                               np.ix_(*[ rules[i - 1][1] for i in mi ]))
+            pnt_list.append(np.ravel_multi_index(ids, (n_x,) * d).flatten())
+            w_list.append(w.flatten())
+
+        # merge the coinciding points
+        pnts, pnt_idx = np.unique(np.hstack(pnt_list), return_inverse = True)
+        W = np.bincount(pnt_idx, np.hstack(w_list))
+        nonzero = np.where(np.fabs(W) > 1e-14)[0]
+        idx = np.unravel_index(pnts[nonzero], (n_x,) * d)
+        theta = [ t[i] for t, i in zip(theta_ref, idx) ]
+        return theta, W[nonzero]
+
+    n_sim = Property
+    def _get_n_sim(self):
+        return len(self.grid[1])
+
+    theta = Property(Array(float), depends_on = 'recalc')
+    @cached_property
+    def _get_theta(self):
+        rv_theta = list(self.grid[0])
+        theta_list = []
+        for tvar in self.randomization.tvar_list:
+            if isinstance(tvar, float):
+                theta_list.append(tvar)
+            else:
+                theta_list.append(rv_theta.pop(0))
+        return theta_list
+
+    dG = Property(Array(float), depends_on = 'recalc')
+    @cached_property
+    def _get_dG(self):
+        return self.grid[1]
+
 if __name__ == '__main__':
 
     from stats.spirrid import SPIRRID, Heaviside
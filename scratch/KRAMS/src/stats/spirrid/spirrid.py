@@ -20,7 +20,11 @@ from code_gen_factory import \
     CodeGenNumpyFactory, CodeGenCFactory, CodeGenCythonFactory
 
 from sampling import \
-    FunctionRandomization, TGrid, PGrid, MonteCarlo, LatinHypercubeSampling, orthogonalize
+    FunctionRandomization, TGrid, PGrid, MonteCarlo, LatinHypercubeSampling, \
+    SobolSampling, HaltonSampling, GaussGrid, SparseGrid, orthogonalize
+
+from parallel_eval import ParallelEval
+from adaptive_eval import AdaptiveEval
 
 import string
 import types
@@ -43,7 +47,11 @@ class SPIRRID(FunctionRandomization):
     sampling_type = Trait('TGrid', {'TGrid' : TGrid,
                                       'PGrid' : PGrid,
                                       'MCS' : MonteCarlo,
-                                      'LHS': LatinHypercubeSampling },
+                                      'LHS': LatinHypercubeSampling,
+                                      'Sobol' : SobolSampling,
+                                      'Halton' : HaltonSampling,
+                                      'GaussGrid' : GaussGrid,
+                                      'SparseGrid' : SparseGrid },
                           input_change = True)
 
     sampling = Property(depends_on = 'input_change')
@@ -77,7 +85,7 @@ class SPIRRID(FunctionRandomization):
     #===========================================================================
     # Template for the integration of a response function in the time loop
     #===========================================================================
-    mu_q_method = Property(Callable, depends_on = 'input_change,alg_option')
+    mu_q_method = Property(Callable, depends_on = 'input_change,alg_option,codegen_option')
     @cached_property
     def _get_mu_q_method(self):
         '''Generate an integrator method for the particular data type
@@ -85,6 +93,42 @@ class SPIRRID(FunctionRandomization):
         '''
         return self.codegen.get_code()
 
+    def precompile(self):
+        '''Build the compiled code for the current configuration
+        in advance (e.g. before starting the batch workers). With a kernel
+        cache (codegen.kernel_cache), the code is reused in later sessions.
+        '''
+        self.codegen.precompile()
+
+    #===========================================================================
+    # Parallel evaluation
+    #===========================================================================
+    # number of processes sharing the evaluation of the control variables
+    # (1 - serial evaluation in the current process)
+    n_procs = Int(1)
+
+    parallel_eval = Instance(ParallelEval)
+    def _parallel_eval_default(self):
+        return ParallelEval(n_procs = self.n_procs)
+
+    def _n_procs_changed(self):
+        self.parallel_eval.n_procs = self.n_procs
+
+    def eval_mu_q(self, mu_q_method, e_orth):
+        '''Evaluate the integration method serially or in parallel.
+        '''
+        if self.n_procs > 1:
+            return self.parallel_eval.eval(mu_q_method, e_orth)
+        return mu_q_method(*e_orth)
+
+    #===========================================================================
+    # Adaptive evaluation
+    #===========================================================================
+    # if specified, the sampling is refined until the tolerance
+    # of the adaptive evaluation is reached (the achieved error,
+    # number of samples and timing are reported by adaptive_eval)
+    adaptive_eval = Instance(AdaptiveEval, input_change = True)
+
     #===========================================================================
     # Run the estimation of the mean response
     #===========================================================================
@@ -94,9 +138,14 @@ class SPIRRID(FunctionRandomization):
         '''Estimate the mean value function given the randomization pattern.
         '''
         e_orth = orthogonalize(self.evar_list)
+        if self.adaptive_eval != None:
+            start_time = sysclock()
+            mu_q_arr, var_q_arr = self.adaptive_eval.eval(self, e_orth)
+            exec_time = sysclock() - start_time
+            return mu_q_arr, var_q_arr, exec_time
         self.mu_q_method
         start_time = sysclock()
-        mu_q_arr, var_q_arr = self.mu_q_method(*e_orth)
+        mu_q_arr, var_q_arr = self.eval_mu_q(self.mu_q_method, e_orth)
         exec_time = sysclock() - start_time
         return mu_q_arr, var_q_arr, exec_time
 
@@ -171,4 +220,6 @@ class SPIRRID(FunctionRandomization):
         s += '** sampling: %s\n' % self.sampling_type
         s += '** codegen: %s\n ' % self.codegen_type
         s += str(self.codegen)
+        if self.adaptive_eval != None:
+            s += '\n** %s' % str(self.adaptive_eval)
         return s
@@ -179,8 +179,10 @@ class SPIRRIDLAB(HasTraits):
         run_estimation_vct([5], ['PGrid'])
 
         # studied samplingetization methods
-        sampling_types = np.array(['TGrid', 'PGrid', 'MCS', 'LHS'], dtype = str)
-        sampling_colors = np.array(['blue', 'green', 'red', 'magenta'], dtype = str)
+        sampling_types = np.array(['TGrid', 'PGrid', 'MCS', 'LHS',
+                                   'Sobol', 'Halton', 'GaussGrid', 'SparseGrid'], dtype = str)
+        sampling_colors = np.array(['blue', 'green', 'red', 'magenta',
+                                    'cyan', 'orange', 'brown', 'olive'], dtype = str)
 
         # run the estimation on all combinations of n_int and sampling_types
         mu_q, exec_time, n_sim_range = run_estimation_vct(n_int_range[:, None],
@@ -30,9 +30,20 @@ import nose
 from stats.spirrid import \
     SPIRRID, RV, RF, IRF
 from stats.spirrid import SPIRRIDLAB, Heaviside
+from stats.spirrid.adaptive_eval import AdaptiveEval
+from stats.spirrid.kernel_cache import KernelCache
+from stats.spirrid.sampling import sobol_points
 import numpy as np
+import tempfile
+import os
 from enthought.traits.api import implements, Str
 
+class StoredKernelCache(KernelCache):
+    '''Kernel cache loading only the stored modules.
+    '''
+    def _store(self, name, build):
+        raise AssertionError, 'kernel %s is not stored' % name
+
 #===========================================================================
 # Response function
 #===========================================================================
@@ -135,6 +146,86 @@ class SPIRRIDAlgTest(unittest.TestCase):
         max_mu_q = np.max(self.s.mu_q_arr)
         self.assertAlmostEqual(max_mu_q, 0.11999999999999995, 10)
 
+    def test_numpy_qmc_sparse(self):
+        '''Check the result of the computation for QMC and Gauss sampling'''
+        self.s.codegen_type = 'numpy'
+        for sampling_type, places in [('Sobol', 3), ('Halton', 3),
+                                      ('GaussGrid', 10), ('SparseGrid', 10)]:
+            self.s.sampling_type = sampling_type
+            max_mu_q = np.max(self.s.mu_q_arr)
+            self.assertAlmostEqual(max_mu_q, 0.12, places)
+
+    def test_sobol_origin(self):
+        '''Check that the unscrambled Sobol points start with the origin
+        and form a net in each direction'''
+        U = sobol_points(8, 3, scramble = False)
+        self.assertTrue(np.allclose(U[:, 0], 0.5 / 2.0 ** 32))
+        for U_d in U:
+            self.assertEqual(sorted(np.floor(U_d * 8).astype(int)), range(8))
+
+    def test_numpy_adaptive(self):
+        '''Check the adaptive refinement of the QMC sampling'''
+        self.s.codegen_type = 'numpy'
+        self.s.sampling_type = 'Halton'
+        self.s.adaptive_eval = AdaptiveEval(rtol = 1e-3)
+        max_mu_q = np.max(self.s.mu_q_arr)
+        adaptive_eval = self.s.adaptive_eval
+        self.s.adaptive_eval = None
+        self.assertTrue(adaptive_eval.converged)
+        self.assertTrue(adaptive_eval.n_sim >= 200)
+        self.assertAlmostEqual(max_mu_q, 0.12, 3)
+
+    def test_numpy_adaptive_parallel(self):
+        '''Check the parallel evaluation of the adaptive batches against the serial one'''
+        self.s.codegen_type = 'numpy'
+        self.s.sampling_type = 'Halton'
+        self.s.sampling.seed = 1234
+        self.s.adaptive_eval = AdaptiveEval(rtol = 1e-3)
+        mu_q_arr = self.s.mu_q_arr
+        self.s.n_procs = 2
+        self.s.recalc = True
+        mu_q_par = self.s.mu_q_arr
+        self.s.parallel_eval.stop()
+        self.s.n_procs = 1
+        self.s.adaptive_eval = None
+        self.assertTrue(np.allclose(mu_q_par, mu_q_arr, rtol = 1e-12))
+
+    def test_numpy_chunked_tgrid(self):
+        '''Check the chunked evaluation for TGrid'''
+        self.s.codegen_type = 'numpy'
+        self.s.sampling_type = 'TGrid'
+        self.s.codegen.chunk_size = 4096
+        max_mu_q = np.max(self.s.mu_q_arr)
+        max_var_q = np.max(self.s.var_q_arr)
+        self.s.codegen.chunk_size = 0
+        self.assertAlmostEqual(max_mu_q, 0.11999724956278124, 10)
+        self.assertAlmostEqual(max_var_q, 0.00014429189095519629, 10)
+
+    def test_numpy_chunked_sparse(self):
+        '''Check the chunked evaluation for the signed weights of SparseGrid'''
+        self.s.codegen_type = 'numpy'
+        self.s.sampling_type = 'SparseGrid'
+        mu_q_arr = self.s.mu_q_arr.copy()
+        var_q_arr = self.s.var_q_arr.copy()
+        self.s.codegen.chunk_size = 512
+        chunked_mu_q_arr = self.s.mu_q_arr
+        chunked_var_q_arr = self.s.var_q_arr
+        self.s.codegen.chunk_size = 0
+        self.assertTrue(np.allclose(mu_q_arr, chunked_mu_q_arr, rtol = 1e-10))
+        self.assertTrue(np.allclose(var_q_arr, chunked_var_q_arr, rtol = 1e-8, atol = 1e-14))
+
+    def test_numpy_parallel_tgrid(self):
+        '''Check the parallel evaluation against the serial one'''
+        self.s.codegen_type = 'numpy'
+        self.s.sampling_type = 'TGrid'
+        mu_q_arr = self.s.mu_q_arr
+        self.s.n_procs = 2
+        self.s.recalc = True
+        mu_q_par = self.s.mu_q_arr
+        self.s.parallel_eval.stop()
+        self.s.n_procs = 1
+        self.assertTrue(np.all(mu_q_par == mu_q_arr))
+
     #===========================================================================
     # Test C-code implementation
     #===========================================================================
@@ -170,6 +261,37 @@ class SPIRRIDAlgTest(unittest.TestCase):
         max_mu_q = np.max(self.s.mu_q_arr)
         self.assertAlmostEqual(max_mu_q, 0.11999724956278124, 10)
 
+    def test_c_kernel_cache(self):
+        '''Check the C-implementation with the kernel cache'''
+        cache = KernelCache(cache_dir = tempfile.mkdtemp())
+        self.s.codegen_type = 'c'
+        self.s.sampling_type = 'TGrid'
+        self.s.codegen.set(cached_dG = True, compiled_eps_loop = True,
+                           kernel_cache = cache)
+        self.s.precompile()
+        n_modules = len(os.listdir(cache.cache_dir))
+        max_mu_q = np.max(self.s.mu_q_arr)
+        cache.clear()
+        self.assertEqual(n_modules, 1)
+        self.assertAlmostEqual(max_mu_q, 0.11999724956278124, 10)
+
+    def test_c_kernel_cache_cold(self):
+        '''Check the loading of the stored kernel by a new cache'''
+        cache = KernelCache(cache_dir = tempfile.mkdtemp())
+        self.s.codegen_type = 'c'
+        self.s.sampling_type = 'TGrid'
+        self.s.codegen.set(cached_dG = True, compiled_eps_loop = True,
+                           kernel_cache = cache)
+        self.s.precompile()
+        cold_cache = StoredKernelCache(cache_dir = cache.cache_dir)
+        self.s.codegen.kernel_cache = cold_cache
+        self.s.recalc = True
+        max_mu_q = np.max(self.s.mu_q_arr)
+        n_kernels = len(cold_cache._kernels)
+        cache.clear()
+        self.assertEqual(n_kernels, 1)
+        self.assertAlmostEqual(max_mu_q, 0.11999724956278124, 10)
+
     def test_randomization_change(self):
         '''Check the C-implementation for TGrid'''
         self.s.codegen_type = 'numpy'